@@ -4,13 +4,23 @@
 # --------------------------------------------------------------------------
 from __future__ import annotations
 
+import asyncio
 import collections
 import collections.abc
+import contextlib
+import copy
 import os
+import queue
+import threading
+import time
 import typing
 import warnings
+import weakref
+from concurrent.futures import Future
 from typing import Any, Sequence
 
+import numpy as np
+
 from onnxruntime.capi import _pybind_state as C
 
 if typing.TYPE_CHECKING:
@@ -123,6 +133,8 @@ class Session:
         # self._sess is managed by the derived class and relies on bindings from C.InferenceSession
         self._sess = None
         self._enable_fallback = True
+        self._max_concurrent_async_runs = None
+        self._async_run_semaphores = weakref.WeakKeyDictionary()
 
     def get_session_options(self):
         "Return the session options. See :class:`onnxruntime.SessionOptions`."
@@ -228,6 +240,37 @@ class Session:
                 return self._sess.run(output_names, input_feed, run_options)
             raise
 
+    def prepare_run(self, output_names=None, input_names=None) -> PreparedRun:
+        """
+        Validate the names of the inputs and outputs of a call once, for calls with minimal overhead.
+
+        :param output_names: name of the outputs, all the outputs if not provided.
+        :param input_names: name of the inputs given to each call, in order. All the inputs if not provided.
+        :return: a :class:`PreparedRun`, called with the input values in the order of `input_names`.
+
+        ::
+
+            run = sess.prepare_run([output_name], [input_name])
+            for x in inputs:
+                results = run(x)
+        """
+        if input_names is None:
+            input_names = [model_input.name for model_input in self._inputs_meta]
+        self._validate_input(input_names)
+        all_input_names = [model_input.name for model_input in self._inputs_meta]
+        unknown_names = [name for name in input_names if name not in all_input_names]
+        if unknown_names:
+            raise ValueError(f"Inputs ({unknown_names}) are not inputs of the model.")
+
+        all_output_names = [output.name for output in self._outputs_meta]
+        if not output_names:
+            output_names = all_output_names
+        unknown_names = [name for name in output_names if name not in all_output_names]
+        if unknown_names:
+            raise ValueError(f"Outputs ({unknown_names}) are not outputs of the model.")
+
+        return PreparedRun(self, list(output_names), list(input_names))
+
     def run_async(self, output_names, input_feed, callback, user_data, run_options=None):
         """
         Compute the predictions asynchronously in a separate cxx thread from ort intra-op threadpool.
@@ -258,6 +301,99 @@ class Session:
             output_names = [output.name for output in self._outputs_meta]
         return self._sess.run_async(output_names, input_feed, callback, user_data, run_options)
 
+    def set_max_concurrent_async_runs(self, max_runs: int | None):
+        """
+        Limit the number of runs started by :meth:`run_coro` and :meth:`run_coro_batch` that are in flight
+        at the same time in an event loop. Other coroutines wait for a run to complete before starting theirs.
+
+        :param max_runs: maximum number of runs in flight, unlimited if None.
+        """
+        if max_runs is not None and max_runs < 1:
+            raise ValueError(f"max_runs must be positive, got {max_runs}.")
+        self._max_concurrent_async_runs = max_runs
+        self._async_run_semaphores = weakref.WeakKeyDictionary()
+
+    async def run_coro(self, output_names, input_feed, run_options=None, timeout: float | None = None):
+        """
+        Compute the predictions in the intra-op thread pool without blocking the running asyncio event loop.
+
+        :param output_names: name of the outputs
+        :param input_feed: dictionary ``{ input_name: input_value }``
+        :param run_options: See :class:`onnxruntime.RunOptions`.
+        :param timeout: Maximum number of seconds to wait for the results, unlimited if None.
+        :return: list of results, see :meth:`run`.
+        :raises asyncio.TimeoutError: if the results are not available within `timeout`.
+
+        If the coroutine is cancelled or times out, the run is terminated by setting `terminate` on a copy of
+        `run_options`, the other runs using `run_options` go on.
+
+        ::
+
+            results = await sess.run_coro([output_name], {input_name: x})
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = None
+        if self._max_concurrent_async_runs is not None:
+            semaphore = self._async_run_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self._max_concurrent_async_runs)
+                self._async_run_semaphores[loop] = semaphore
+            await semaphore.acquire()
+
+        future = loop.create_future()
+        run_options = C.RunOptions() if run_options is None else copy.copy(run_options)
+
+        def set_result(results, err):
+            # the run is over, even if the coroutine was cancelled or timed out it no longer uses the thread pool
+            if semaphore is not None:
+                semaphore.release()
+            if future.done():
+                return
+            if err:
+                future.set_exception(C.Fail(err))
+            else:
+                future.set_result(results)
+
+        def callback(results, user_data, err):
+            # invoked by a thread of the intra-op thread pool, the event loop is closed if nobody waits for the results
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(set_result, results, err)
+
+        try:
+            self.run_async(output_names, input_feed, callback, None, run_options)
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # nobody waits for the results anymore, stop the run to free the thread pool
+            run_options.terminate = True
+            raise
+
+    async def run_coro_batch(self, output_names, input_feeds, run_options=None, timeout: float | None = None):
+        """
+        Compute the predictions of several feeds concurrently, see :meth:`run_coro`.
+        If a run fails, the other runs are cancelled.
+
+        :param output_names: name of the outputs
+        :param input_feeds: sequence of dictionaries ``{ input_name: input_value }``
+        :param run_options: See :class:`onnxruntime.RunOptions`. Shared by the runs of the batch.
+        :param timeout: Maximum number of seconds to wait for the results of each run, unlimited if None.
+        :return: list of the results of every feed, in order.
+        """
+        tasks = [
+            asyncio.ensure_future(self.run_coro(output_names, input_feed, run_options, timeout))
+            for input_feed in input_feeds
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
     def run_with_ort_values(self, output_names, input_dict_ort_values, run_options=None):
         """
         Compute the predictions.
@@ -350,6 +486,36 @@ class Session:
         self._sess.run_with_ortvaluevector(run_options, feed_names, feeds, fetch_names, fetches, fetch_devices)
 
 
+class PreparedRun:
+    """
+    A call to :meth:`Session.run` with validated input and output names, see :meth:`Session.prepare_run`.
+    """
+
+    def __init__(self, session: Session, output_names: list[str], input_names: list[str]) -> None:
+        self._session = session
+        self.output_names = output_names
+        self.input_names = input_names
+
+    def __call__(self, *inputs, run_options=None):
+        """
+        Compute the predictions.
+
+        :param inputs: value of each input, in the order of `input_names`.
+        :param run_options: See :class:`onnxruntime.RunOptions`.
+        :return: list of results, see :meth:`Session.run`.
+        """
+        if len(inputs) != len(self.input_names):
+            raise ValueError(f"Expected {len(self.input_names)} inputs {self.input_names}, got {len(inputs)}.")
+        input_feed = dict(zip(self.input_names, inputs))
+        try:
+            return self._session._sess.run(self.output_names, input_feed, run_options)
+        except C.EPFail:
+            if not self._session._enable_fallback:
+                raise
+            # Session.run falls back to the fallback providers
+            return self._session.run(self.output_names, input_feed, run_options)
+
+
 class InferenceSession(Session):
     """
     This is the main class used to run a model.
@@ -414,6 +580,7 @@ class InferenceSession(Session):
 
         # internal parameters that we don't expect to be used in general so aren't documented
         disabled_optimizers = kwargs.get("disabled_optimizers")
+        self._prepacked_weights_container = kwargs.get("prepacked_weights_container")
 
         try:
             self._create_inference_session(providers, provider_options, disabled_optimizers)
@@ -479,6 +646,9 @@ class InferenceSession(Session):
             # convert to set. assumes iterable
             disabled_optimizers = set(disabled_optimizers)
 
+        if self._prepacked_weights_container is not None:
+            sess.add_prepacked_weights_container(self._prepacked_weights_container)
+
         # initialize the C++ InferenceSession
         sess.initialize_session(providers, provider_options, disabled_optimizers)
 
@@ -522,6 +692,581 @@ class InferenceSession(Session):
                 C.register_tensorrt_plugins_as_custom_ops(session_options, providers[i][1])
 
 
+def _load_shared_initializers(path_or_bytes: str | bytes | os.PathLike) -> dict[str, OrtValue]:
+    """Load the initializers of the main graph of an ONNX model once, to be shared by several sessions."""
+    try:
+        import onnx
+        from onnx import numpy_helper
+    except ImportError:
+        warnings.warn("onnx is not installed, the sessions of the pool do not share their initializers.")
+        return {}
+
+    if isinstance(path_or_bytes, bytes):
+        model = onnx.load_model_from_string(path_or_bytes)
+    else:
+        model = onnx.load(os.fspath(path_or_bytes))
+    # element types numpy has no dtype for, loaded from their bit patterns as unsigned integers of the same size
+    storage_types = {
+        onnx.TensorProto.BFLOAT16: np.uint16,
+        onnx.TensorProto.FLOAT8E4M3FN: np.uint8,
+        onnx.TensorProto.FLOAT8E4M3FNUZ: np.uint8,
+        onnx.TensorProto.FLOAT8E5M2: np.uint8,
+        onnx.TensorProto.FLOAT8E5M2FNUZ: np.uint8,
+    }
+    numpy_types = {
+        onnx.TensorProto.FLOAT,
+        onnx.TensorProto.DOUBLE,
+        onnx.TensorProto.FLOAT16,
+        onnx.TensorProto.BOOL,
+        onnx.TensorProto.INT8,
+        onnx.TensorProto.INT16,
+        onnx.TensorProto.INT32,
+        onnx.TensorProto.INT64,
+        onnx.TensorProto.UINT8,
+        onnx.TensorProto.UINT16,
+        onnx.TensorProto.UINT32,
+        onnx.TensorProto.UINT64,
+    }
+
+    # initializers that are also graph inputs can be overridden by the feeds, they are not constant
+    graph_inputs = {graph_input.name for graph_input in model.graph.input}
+    shared_initializers = {}
+    for initializer in model.graph.initializer:
+        if initializer.name in graph_inputs:
+            continue
+        if initializer.data_type in numpy_types:
+            shared_initializers[initializer.name] = OrtValue.ortvalue_from_numpy(numpy_helper.to_array(initializer))
+        elif initializer.data_type in storage_types:
+            storage_type = storage_types[initializer.data_type]
+            if initializer.HasField("raw_data"):
+                data = np.frombuffer(initializer.raw_data, dtype=storage_type)
+            else:
+                data = np.array(initializer.int32_data, dtype=storage_type)
+            shared_initializers[initializer.name] = OrtValue.ortvalue_from_numpy_with_onnx_type(
+                data.reshape(tuple(initializer.dims)), initializer.data_type
+            )
+        # the other initializers (strings, 4-bit integers...) are left to the sessions, each loads its own copy
+    return shared_initializers
+
+
+def _is_ort_format_model(path_or_bytes: str | bytes | os.PathLike, sess_options) -> bool:
+    try:
+        if sess_options.get_session_config_entry("session.load_model_format") == "ORT":
+            return True
+    except RuntimeError:
+        # the entry is not set
+        pass
+    if isinstance(path_or_bytes, bytes):
+        # the flatbuffers file identifier of an ORT format model
+        return path_or_bytes[4:8] == b"ORTM"
+    return os.fspath(path_or_bytes).endswith(".ort")
+
+
+def _percentiles(values) -> dict[str, float]:
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p99": 0.0}
+    values = sorted(values)
+    return {
+        "mean": sum(values) / len(values),
+        "p50": values[(len(values) - 1) // 2],
+        "p99": values[min(len(values) - 1, (len(values) * 99) // 100)],
+    }
+
+
+class InferenceSessionPool:
+    """
+    A fixed set of sessions of the same model, shared by concurrent callers.
+
+    Every call gets a session of its own for its duration, so that concurrent requests run in parallel on separate
+    sessions with a few intra-op threads each, rather than taking turns on the threads of a single session. Callers
+    wait when all the sessions are busy.
+
+    ::
+
+        pool = onnxruntime.InferenceSessionPool("model.onnx", num_sessions=4, providers=["CPUExecutionProvider"])
+
+        # from any number of threads
+        results = pool.run([output_name], {input_name: x})
+
+        with pool.session() as sess:
+            results = sess.run_with_ort_values([output_name], {input_name: ort_value})
+    """
+
+    def __init__(
+        self,
+        path_or_bytes: str | bytes | os.PathLike,
+        num_sessions: int,
+        sess_options: onnxruntime.SessionOptions | None = None,
+        providers: Sequence[str | tuple[str, dict[Any, Any]]] | None = None,
+        provider_options: Sequence[dict[Any, Any]] | None = None,
+        max_waiting: int | None = None,
+        latency_window: int = 1024,
+        **kwargs,
+    ) -> None:
+        """
+        :param path_or_bytes: Filename or serialized ONNX or ORT format model in a byte string.
+        :param num_sessions: Number of sessions of the pool.
+        :param sess_options: Session options shared by the sessions. When not provided, the cores of the machine
+            are divided between the sessions with ``intra_op_num_threads``.
+        :param providers: See :class:`onnxruntime.InferenceSession`.
+        :param provider_options: See :class:`onnxruntime.InferenceSession`.
+        :param max_waiting: Maximum number of callers waiting for a session. A call made when this many callers
+            are already waiting raises a RuntimeError instead of waiting. Unbounded if not provided.
+        :param latency_window: Number of most recent calls the latency metrics are computed on.
+
+        When only the CPU execution provider is used, the initializers of an ONNX model are loaded once and
+        added to the session options with :meth:`onnxruntime.SessionOptions.add_initializer`, and the sessions
+        share a single copy of the weights and of their pre-packed versions. This requires the onnx package.
+        The given `sess_options` are copied and left unchanged.
+        """
+        if num_sessions < 1:
+            raise ValueError(f"num_sessions must be positive, got {num_sessions}.")
+
+        if sess_options is None:
+            sess_options = C.SessionOptions()
+            sess_options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // num_sessions)
+        else:
+            sess_options = copy.copy(sess_options)
+
+        normalized_providers, _ = check_and_normalize_provider_args(
+            providers, provider_options, C.get_available_providers()
+        )
+        # sessions created without providers only register the CPU execution provider
+        session_providers = normalized_providers or ["CPUExecutionProvider"]
+        if session_providers == ["CPUExecutionProvider"] and not _is_ort_format_model(path_or_bytes, sess_options):
+            self._shared_initializers = _load_shared_initializers(path_or_bytes)
+        else:
+            self._shared_initializers = {}
+        for name, value in self._shared_initializers.items():
+            sess_options.add_initializer(name, value)
+        self._prepacked_weights_container = C.PrepackedWeightsContainer() if self._shared_initializers else None
+
+        self._sessions = [
+            InferenceSession(
+                path_or_bytes,
+                sess_options,
+                providers,
+                provider_options,
+                prepacked_weights_container=self._prepacked_weights_container,
+                **kwargs,
+            )
+            for _ in range(num_sessions)
+        ]
+        # the most recently used session is handed out first as its memory is the most likely to be in cache
+        self._idle_sessions = queue.LifoQueue()
+        for sess in self._sessions:
+            self._idle_sessions.put(sess)
+
+        self._max_waiting = max_waiting
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._max_waiting_seen = 0
+        self._rejected = 0
+        self._completed = 0
+        self._wait_latencies_ms = collections.deque(maxlen=latency_window)
+        self._run_latencies_ms = collections.deque(maxlen=latency_window)
+
+    @property
+    def num_sessions(self) -> int:
+        return len(self._sessions)
+
+    def get_inputs(self):
+        "Return the inputs metadata as a list of :class:`onnxruntime.NodeArg`."
+        return self._sessions[0].get_inputs()
+
+    def get_outputs(self):
+        "Return the outputs metadata as a list of :class:`onnxruntime.NodeArg`."
+        return self._sessions[0].get_outputs()
+
+    def get_providers(self):
+        "Return list of registered execution providers."
+        return self._sessions[0].get_providers()
+
+    def acquire(self, timeout: float | None = None) -> InferenceSession:
+        """
+        Take an idle session out of the pool, waiting until one is released if they are all busy.
+        The session must be given back with :meth:`release`.
+
+        :param timeout: Maximum number of seconds to wait for a session. Waits indefinitely if not provided.
+        :raises TimeoutError: if no session was released within `timeout`.
+        :raises RuntimeError: if `max_waiting` callers are already waiting for a session.
+        """
+        with self._lock:
+            if self._max_waiting is not None and self._waiting >= self._max_waiting and self._idle_sessions.empty():
+                self._rejected += 1
+                raise RuntimeError(f"{self._waiting} callers are already waiting for a session of the pool.")
+            self._waiting += 1
+            self._max_waiting_seen = max(self._max_waiting_seen, self._waiting)
+
+        start = time.perf_counter()
+        try:
+            sess = self._idle_sessions.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No session of the pool was released within {timeout} seconds.") from None
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        with self._lock:
+            self._wait_latencies_ms.append((time.perf_counter() - start) * 1000)
+        return sess
+
+    def release(self, sess: InferenceSession):
+        "Give back a session taken with :meth:`acquire`."
+        self._idle_sessions.put(sess)
+
+    @contextlib.contextmanager
+    def session(self, timeout: float | None = None):
+        """
+        Context manager holding a session of the pool. See :meth:`acquire`.
+
+        ::
+
+            with pool.session() as sess:
+                sess.run([output_name], {input_name: x})
+        """
+        sess = self.acquire(timeout)
+        start = time.perf_counter()
+        try:
+            yield sess
+        finally:
+            run_latency_ms = (time.perf_counter() - start) * 1000
+            self.release(sess)
+            with self._lock:
+                self._run_latencies_ms.append(run_latency_ms)
+                self._completed += 1
+
+    def run(self, output_names, input_feed, run_options=None, timeout: float | None = None):
+        """
+        Compute the predictions on an idle session. See :meth:`onnxruntime.InferenceSession.run`
+        and :meth:`acquire`.
+        """
+        with self.session(timeout) as sess:
+            return sess.run(output_names, input_feed, run_options)
+
+    def get_metrics(self) -> dict[str, Any]:
+        """
+        Return the state of the pool and the latencies in milliseconds of the most recent calls:
+
+        * ``idle_sessions``, ``waiting``: number of idle sessions and of callers waiting for one (queue depth),
+        * ``max_waiting``: largest number of callers that waited at the same time,
+        * ``rejected``, ``completed``: number of calls rejected because of `max_waiting` and completed,
+        * ``wait_ms``, ``run_ms``: mean, median and 99th percentile of the time spent waiting for a session
+          and holding it.
+        """
+        with self._lock:
+            metrics = {
+                "num_sessions": self.num_sessions,
+                "idle_sessions": self._idle_sessions.qsize(),
+                "waiting": self._waiting,
+                "max_waiting": self._max_waiting_seen,
+                "rejected": self._rejected,
+                "completed": self._completed,
+            }
+            wait_latencies_ms = list(self._wait_latencies_ms)
+            run_latencies_ms = list(self._run_latencies_ms)
+        metrics["wait_ms"] = _percentiles(wait_latencies_ms)
+        metrics["run_ms"] = _percentiles(run_latencies_ms)
+        return metrics
+
+
+_NO_REQUEST = object()
+
+_MASK_TYPES = {
+    "tensor(bool)": np.bool_,
+    "tensor(float)": np.float32,
+    "tensor(int32)": np.int32,
+    "tensor(int64)": np.int64,
+}
+
+
+class DynamicBatcher:
+    """
+    Runs the requests made by concurrent callers of a session in batches.
+
+    The feeds of every request have the same inputs with a batch dimension, usually of size 1. Requests are collected
+    until `max_batch_size` samples or `max_latency_ms` after the first one, concatenated along `batch_axis` and run
+    at once, and the outputs are split back per request. This lets small requests use the efficiency of batched
+    kernels such as GEMM.
+
+    The symbolic dimensions of the inputs, e.g. a sequence length, may differ between requests. The feeds are padded
+    to the largest value of each dimension with `pad_value`, and the outputs are cropped back to the values of the
+    request for the dimensions with the same symbolic name. If `mask_input` is given, the batcher feeds this input,
+    of shape ``[batch, dim]``, with 1 for the valid positions of each request along the symbolic dimension `dim`
+    and 0 for the padding.
+
+    ::
+
+        batcher = onnxruntime.DynamicBatcher(sess, max_batch_size=32, max_latency_ms=2)
+
+        # from any number of threads
+        results = batcher.run({input_name: x[None, :]})
+    """
+
+    def __init__(
+        self,
+        sess: Session,
+        max_batch_size: int = 32,
+        max_latency_ms: float = 2.0,
+        output_names: Sequence[str] | None = None,
+        batch_axis: int = 0,
+        pad_value: float | dict[str, float] = 0,
+        mask_input: str | None = None,
+        run_options=None,
+    ) -> None:
+        """
+        :param sess: Session to run the batches, see :class:`onnxruntime.InferenceSession`.
+        :param max_batch_size: Maximum number of samples in a batch. A request larger than this is run alone.
+        :param max_latency_ms: Maximum time to wait for other requests after the first request of a batch.
+        :param output_names: Name of the outputs computed for every request, all the outputs if None.
+        :param batch_axis: Batch dimension of all the inputs and outputs.
+        :param pad_value: Value used to pad the feeds, or dictionary ``{ input_name: pad_value }``.
+        :param mask_input: Name of an input of shape ``[batch, dim]`` computed by the batcher.
+        :param run_options: See :class:`onnxruntime.RunOptions`.
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}.")
+
+        self._sess = sess
+        self._max_batch_size = max_batch_size
+        self._max_latency = max_latency_ms / 1000
+        self._output_names = list(output_names) if output_names else [output.name for output in sess.get_outputs()]
+        self._batch_axis = batch_axis
+        self._pad_value = pad_value
+        self._run_options = run_options
+
+        self._input_shapes = {}
+        for model_input in sess.get_inputs():
+            if not model_input.shape or isinstance(model_input.shape[batch_axis], int):
+                raise ValueError(
+                    f"Input {model_input.name} of shape {model_input.shape} has no dynamic dimension {batch_axis}."
+                )
+            self._input_shapes[model_input.name] = model_input.shape
+        self._output_shapes = {output.name: output.shape for output in sess.get_outputs()}
+
+        self._mask_input = mask_input
+        if mask_input is not None:
+            mask = next((model_input for model_input in sess.get_inputs() if model_input.name == mask_input), None)
+            if mask is None or len(mask.shape) != 2 or not isinstance(mask.shape[1 - batch_axis], str):
+                raise ValueError(f"mask_input must be an input of shape [batch, dim] with a symbolic dim: {mask}.")
+            if mask.type not in _MASK_TYPES:
+                raise ValueError(f"Unsupported type {mask.type} of the mask input {mask_input}.")
+            self._mask_dim = mask.shape[1 - batch_axis]
+            self._mask_dtype = _MASK_TYPES[mask.type]
+
+        self._requests = queue.Queue()
+        self._lock = threading.Lock()
+        self._num_requests = 0
+        self._num_batches = 0
+        self._closed = False
+        self._worker = threading.Thread(target=self._run_batches, daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, input_feed: dict[str, Any]) -> Future:
+        """
+        Add a request to the next batch.
+
+        :param input_feed: dictionary ``{ input_name: input_value }``
+        :return: a :class:`concurrent.futures.Future` of the list of outputs of the request.
+        """
+        missing_input_names = [
+            name for name in self._input_shapes if name not in input_feed and name != self._mask_input
+        ]
+        if missing_input_names:
+            raise ValueError(f"Required inputs ({missing_input_names}) are missing from input feed.")
+        # the requests of a batch are concatenated input by input, they must all have the same inputs
+        unexpected_input_names = [
+            name for name in input_feed if name not in self._input_shapes or name == self._mask_input
+        ]
+        if unexpected_input_names:
+            raise ValueError(f"Inputs ({unexpected_input_names}) are not batched inputs of the model.")
+
+        feed = {name: np.asarray(value) for name, value in input_feed.items()}
+        for name, value in feed.items():
+            if value.ndim != len(self._input_shapes[name]):
+                raise ValueError(
+                    f"Input {name} of shape {value.shape} does not match the shape {self._input_shapes[name]} of the "
+                    "model."
+                )
+        batch_sizes = {name: value.shape[self._batch_axis] for name, value in feed.items()}
+        if len(set(batch_sizes.values())) > 1:
+            raise ValueError(f"Inputs have different batch sizes: {batch_sizes}.")
+
+        future = Future()
+        # under the lock of close() so that no request is queued after the worker was told to stop
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The batcher is closed.")
+            self._requests.put((feed, future))
+        return future
+
+    def run(self, input_feed: dict[str, Any], timeout: float | None = None):
+        """
+        Compute the outputs of a request in the next batch, see :meth:`submit`.
+
+        :param input_feed: dictionary ``{ input_name: input_value }``
+        :param timeout: Maximum number of seconds to wait for the outputs, unlimited if None.
+        :return: list of outputs.
+        """
+        return self.submit(input_feed).result(timeout)
+
+    def close(self):
+        "Run the pending requests and stop the batching thread."
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._requests.put(None)
+        self._worker.join()
+
+    def get_metrics(self) -> dict[str, Any]:
+        "Return the number of requests and batches run, and the mean batch size in requests."
+        with self._lock:
+            return {
+                "requests": self._num_requests,
+                "batches": self._num_batches,
+                "mean_batch_size": self._num_requests / self._num_batches if self._num_batches else 0.0,
+            }
+
+    def _batch_size(self, feed) -> int:
+        return next(iter(feed.values())).shape[self._batch_axis]
+
+    @staticmethod
+    def _feed_types(feed) -> dict[str, np.dtype]:
+        return {name: value.dtype for name, value in feed.items()}
+
+    def _run_batches(self):
+        request = self._requests.get()
+        # None is queued by close()
+        while request is not None:
+            batch = [request]
+            request = _NO_REQUEST
+            try:
+                request = self._collect_batch(batch)
+                self._run_batch(batch)
+            except Exception as e:
+                # fail the requests of this batch only, the batcher keeps running the next ones
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            with self._lock:
+                self._num_requests += len(batch)
+                self._num_batches += 1
+            if request is _NO_REQUEST:
+                request = self._requests.get()
+
+    def _collect_batch(self, batch):
+        """
+        Add the requests following the first request of `batch` to it. Return the first request of the next batch,
+        or _NO_REQUEST if it was not made yet.
+
+        A request with inputs of other types than the first request cannot be concatenated with it, so it starts
+        the next batch.
+        """
+        batch_size = self._batch_size(batch[0][0])
+        feed_types = self._feed_types(batch[0][0])
+        deadline = time.perf_counter() + self._max_latency
+        while batch_size < self._max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                return _NO_REQUEST
+            if (
+                request is None
+                or batch_size + self._batch_size(request[0]) > self._max_batch_size
+                or self._feed_types(request[0]) != feed_types
+            ):
+                return request
+            batch.append(request)
+            batch_size += self._batch_size(request[0])
+        return _NO_REQUEST
+
+    def _run_batch(self, batch):
+        # skip the requests cancelled by their caller
+        batch = [(feed, future) for feed, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        feeds = [feed for feed, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            # values of the symbolic dimensions of every request, used to crop its outputs
+            dims = [{} for _ in feeds]
+            for feed, request_dims in zip(feeds, dims):
+                for name, value in feed.items():
+                    for axis, dim in enumerate(self._input_shapes.get(name, [])):
+                        if isinstance(dim, str) and axis != self._batch_axis and axis < value.ndim:
+                            request_dims[dim] = max(request_dims.get(dim, 0), value.shape[axis])
+
+            batch_feed = {name: self._concatenate(name, [feed[name] for feed in feeds]) for name in feeds[0]}
+            if self._mask_input is not None:
+                batch_feed[self._mask_input] = self._make_mask(feeds, dims)
+            outputs = self._sess.run(self._output_names, batch_feed, self._run_options)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for feed, request_dims, future in zip(feeds, dims, futures):
+            size = self._batch_size(feed)
+            future.set_result(
+                [
+                    self._split(name, output, offset, size, request_dims)
+                    for name, output in zip(self._output_names, outputs)
+                ]
+            )
+            offset += size
+
+    def _concatenate(self, name, values):
+        ndim = values[0].ndim
+        max_shape = [max(value.shape[axis] for value in values) for axis in range(ndim)]
+        pad_value = self._pad_value.get(name, 0) if isinstance(self._pad_value, dict) else self._pad_value
+        padded = []
+        for value in values:
+            pad_width = [
+                (0, 0) if axis == self._batch_axis else (0, max_shape[axis] - value.shape[axis]) for axis in range(ndim)
+            ]
+            if any(after for _, after in pad_width):
+                padded.append(np.pad(value, pad_width, constant_values=pad_value))
+            else:
+                padded.append(value)
+        return np.concatenate(padded, axis=self._batch_axis)
+
+    def _make_mask(self, feeds, dims):
+        length_axis = 1 - self._batch_axis
+        max_length = max(request_dims.get(self._mask_dim, 0) for request_dims in dims)
+        masks = []
+        for feed, request_dims in zip(feeds, dims):
+            shape = [0, 0]
+            shape[self._batch_axis] = self._batch_size(feed)
+            shape[length_axis] = max_length
+            mask = np.zeros(shape, dtype=self._mask_dtype)
+            index = [slice(None), slice(None)]
+            index[length_axis] = slice(0, request_dims.get(self._mask_dim, 0))
+            mask[tuple(index)] = 1
+            masks.append(mask)
+        return np.concatenate(masks, axis=self._batch_axis)
+
+    def _split(self, name, output, offset, size, request_dims):
+        if not isinstance(output, np.ndarray):
+            # e.g. a sequence of maps with an element per sample
+            return output[offset : offset + size]
+        index = [slice(None)] * output.ndim
+        index[self._batch_axis] = slice(offset, offset + size)
+        shape = self._output_shapes.get(name) or []
+        for axis, dim in enumerate(shape):
+            if axis != self._batch_axis and axis < output.ndim and dim in request_dims:
+                index[axis] = slice(0, request_dims[dim])
+        return output[tuple(index)]
+
+
 class IOBinding:
     """
     This class provides API to bind input/output to a specified device, e.g. GPU.
@@ -703,6 +1448,19 @@ class OrtValue:
             numpy_obj if device_type.lower() == "cpu" else None,
         )
 
+    @staticmethod
+    def ortvalue_from_numpy_with_onnx_type(numpy_obj, onnx_element_type: int):
+        """
+        Factory method to construct an OrtValue (which holds a Tensor) on cpu from a given Numpy object whose
+        items are reinterpreted as an ONNX element type of the same size, for the types numpy does not support,
+        e.g. bfloat16 from the uint16 bit patterns. The OrtValue is backed directly by the data buffer of the
+        Numpy object.
+
+        :param numpy_obj: The contiguous Numpy object to construct the OrtValue from
+        :param onnx_element_type: The ONNX element type, a value of onnx.TensorProto.DataType
+        """
+        return OrtValue(C.OrtValue.ortvalue_from_numpy_with_onnx_type(numpy_obj, onnx_element_type), numpy_obj)
+
     @staticmethod
     def ortvalue_from_shape_and_type(shape=None, element_type=None, device_type="cpu", device_id=0):
         """
@@ -191,6 +191,30 @@ void addOrtValueMethods(pybind11::module& m) {
         Tensor::InitOrtValue(ml_type, gsl::make_span(shape), std::move(allocator), *ml_value);
         return ml_value;
       })
+      // Factory method to create an OrtValue (Tensor) on CPU backed by the data buffer of the given Numpy array,
+      // whose items are reinterpreted as the given ONNX element type of the same size (e.g. bfloat16 from uint16)
+      .def_static("ortvalue_from_numpy_with_onnx_type", [](const py::array& data, int32_t onnx_element_type) {
+        if (!ONNX_NAMESPACE::TensorProto_DataType_IsValid(onnx_element_type)) {
+          throw std::runtime_error("Not a valid ONNX tensor element type: " + std::to_string(onnx_element_type));
+        }
+        if (!IsNumericNumpyArray(data)) {
+          throw std::runtime_error("Creation of OrtValues is currently only supported from non-string numpy arrays");
+        }
+        if (!(data.flags() & py::array::c_style)) {
+          throw std::runtime_error("The numpy array must be contiguous.");
+        }
+
+        auto ml_type = DataTypeImpl::TensorTypeFromONNXEnum(onnx_element_type)->GetElementType();
+        if (static_cast<size_t>(data.itemsize()) != ml_type->Size()) {
+          throw std::runtime_error("The item size of the numpy array does not match the size of the ONNX element type.");
+        }
+
+        auto ml_value = std::make_unique<OrtValue>();
+        std::vector<int64_t> shape(data.shape(), data.shape() + data.ndim());
+        Tensor::InitOrtValue(ml_type, gsl::make_span(shape), const_cast<void*>(data.data()), GetAllocator()->Info(),
+                             *ml_value);
+        return ml_value;
+      })
 
 #if !defined(DISABLE_SPARSE_TENSORS)
       .def_static("ort_value_from_sparse_tensor", [](const PySparseTensor* py_sparse_tensor) -> std::unique_ptr<OrtValue> {
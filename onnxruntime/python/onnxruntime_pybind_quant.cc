@@ -44,26 +44,31 @@ void QuantizeMatMul4BitsBlockwise(
     int32_t N,
     int32_t K,
     bool is_symmetric) {
-  OrtThreadPoolParams to;
-  auto tp = concurrency::CreateThreadPool(&onnxruntime::Env::Default(), to,
-                                          concurrency::ThreadPoolType::INTRA_OP);
-
   py::buffer_info dst_buf = dst.request();
   py::buffer_info src_buf = src.request();
   py::buffer_info scale_buf = scale.request();
   py::buffer_info zp_buf = zero_points.request();
 
-  MlasQuantizeBlockwise<T, 4>(
-      reinterpret_cast<uint8_t*>(dst_buf.ptr),
-      reinterpret_cast<T*>(scale_buf.ptr),
-      is_symmetric ? nullptr : reinterpret_cast<uint8_t*>(zp_buf.ptr),
-      reinterpret_cast<const T*>(src_buf.ptr),
-      block_size,
-      true,
-      K,
-      N,
-      N,
-      tp.get());
+  {
+    // Only raw buffers are touched below, so let other Python threads quantize weights concurrently.
+    py::gil_scoped_release release;
+
+    OrtThreadPoolParams to;
+    auto tp = concurrency::CreateThreadPool(&onnxruntime::Env::Default(), to,
+                                            concurrency::ThreadPoolType::INTRA_OP);
+
+    MlasQuantizeBlockwise<T, 4>(
+        reinterpret_cast<uint8_t*>(dst_buf.ptr),
+        reinterpret_cast<T*>(scale_buf.ptr),
+        is_symmetric ? nullptr : reinterpret_cast<uint8_t*>(zp_buf.ptr),
+        reinterpret_cast<const T*>(src_buf.ptr),
+        block_size,
+        true,
+        K,
+        N,
+        N,
+        tp.get());
+  }
 }
 
 template <typename T>
@@ -75,23 +80,27 @@ void QuantizeMatMulBnb4Blockwise(
     int32_t quant_type,
     int32_t N,
     int32_t K) {
-  OrtThreadPoolParams to;
-  auto tp = concurrency::CreateThreadPool(&onnxruntime::Env::Default(), to,
-                                          concurrency::ThreadPoolType::INTRA_OP);
-
   py::buffer_info dst_buf = dst.request();
   py::buffer_info src_buf = src.request();
   py::buffer_info absmax_buf = absmax.request();
 
-  contrib::QuantizeBlockwiseBnb4<T>(
-      static_cast<uint8_t*>(dst_buf.ptr),
-      static_cast<const T*>(src_buf.ptr),
-      static_cast<T*>(absmax_buf.ptr),
-      block_size,
-      quant_type,
-      N,
-      K,
-      tp.get());
+  {
+    py::gil_scoped_release release;
+
+    OrtThreadPoolParams to;
+    auto tp = concurrency::CreateThreadPool(&onnxruntime::Env::Default(), to,
+                                            concurrency::ThreadPoolType::INTRA_OP);
+
+    contrib::QuantizeBlockwiseBnb4<T>(
+        static_cast<uint8_t*>(dst_buf.ptr),
+        static_cast<const T*>(src_buf.ptr),
+        static_cast<T*>(absmax_buf.ptr),
+        block_size,
+        quant_type,
+        N,
+        K,
+        tp.get());
+  }
 }
 
 void CreateQuantPybindModule(py::module& m) {
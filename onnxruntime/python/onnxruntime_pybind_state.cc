@@ -18,6 +18,7 @@
 #include "core/framework/arena_extend_strategy.h"
 #include "core/framework/data_transfer_utils.h"
 #include "core/framework/data_types_internal.h"
+#include "core/framework/prepacked_weights_container.h"
 #include "core/framework/provider_options_utils.h"
 #include "core/framework/random_seed.h"
 #include "core/framework/sparse_tensor.h"
@@ -1455,6 +1456,15 @@ void addObjectMethods(py::module& m, ExecutionProviderRegistrationFn ep_registra
       sess(m, "SessionOptions", R"pbdoc(Configuration information for a session.)pbdoc");
   sess
       .def(py::init())
+      .def(
+          "__copy__",
+          [](const PySessionOptions* options) -> std::unique_ptr<PySessionOptions> {
+            auto copy = std::make_unique<PySessionOptions>(*options);
+            // the custom op domains live as long as their libraries, whose handles are shared with the copy
+            copy->custom_op_domains_ = options->custom_op_domains_;
+            return copy;
+          },
+          R"pbdoc(Return a copy of the session options. The initializers added with add_initializer are shared.)pbdoc")
       .def_property(
           "enable_cpu_mem_arena",
           [](const PySessionOptions* options) -> bool { return options->value.enable_cpu_mem_arena; },
@@ -1689,6 +1699,12 @@ Applies to session load, initialization, etc. Default is 0.)pbdoc")
 
   py::class_<RunOptions>(m, "RunOptions", R"pbdoc(Configuration information for a single Run.)pbdoc")
       .def(py::init())
+      .def(
+          "__copy__",
+          [](const RunOptions* options) -> std::unique_ptr<RunOptions> {
+            return std::make_unique<RunOptions>(*options);
+          },
+          R"pbdoc(Return a copy of the run options, to terminate a run without terminating the others.)pbdoc")
       .def_readwrite("log_severity_level", &RunOptions::run_log_severity_level,
                      R"pbdoc(Log severity level for a particular Run() invocation. 0:Verbose, 1:Info, 2:Warning. 3:Error, 4:Fatal. Default is 2.)pbdoc")
       .def_readwrite("log_verbosity_level", &RunOptions::run_log_verbosity_level,
@@ -1798,6 +1814,10 @@ including arg name, arg type (contains both type and shape).)pbdoc")
           "node shape (assuming the node holds a tensor)");
 
   py::class_<SessionObjectInitializer> sessionObjectInitializer(m, "SessionObjectInitializer");
+  py::class_<PrepackedWeightsContainer>(m, "PrepackedWeightsContainer",
+                                        R"pbdoc(Storage for the pre-packed weights of the initializers shared by several
+sessions through :meth:`SessionOptions.add_initializer`. It must outlive the sessions it is added to.)pbdoc")
+      .def(py::init());
   py::class_<PyInferenceSession>(m, "InferenceSession", R"pbdoc(This is the main class used to run a model.)pbdoc")
       // In Python3, a Python bytes object will be passed to C++ functions that accept std::string or char*
       // without any conversion. So this init method can be used for model file path (string) and model content (bytes)
@@ -1846,6 +1866,14 @@ including arg name, arg type (contains both type and shape).)pbdoc")
                               disabled_optimizer_names);
           },
           R"pbdoc(Load a model saved in ONNX or ORT format.)pbdoc")
+      .def(
+          "add_prepacked_weights_container",
+          [](PyInferenceSession* sess, PrepackedWeightsContainer* prepacked_weights_container) {
+            OrtPybindThrowIfError(sess->GetSessionHandle()->AddPrePackedWeightsContainer(prepacked_weights_container));
+          },
+          py::keep_alive<1, 2>(),
+          R"pbdoc(Share the pre-packed weights of shared initializers with the other sessions using the container.
+Must be called before initialize_session.)pbdoc")
       .def("run",
            [](PyInferenceSession* sess, std::vector<std::string> output_names,
               std::map<std::string, py::object> pyfeeds, RunOptions* run_options = nullptr)
@@ -2,12 +2,19 @@
 
 import argparse
 import fnmatch
-import json
+import os
 import subprocess as sp
+import sys
 from collections import defaultdict
 
 import pandas as pd
 
+try:
+    from onnxruntime.tools.profile_trace import ColumnarTable, iter_trace_events
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+    from profile_trace import ColumnarTable, iter_trace_events
+
 
 def _demangle(name, demangler="c++filt"):
     try:
@@ -91,14 +98,23 @@ def _shape_to_string(shape):
 
 
 def _json_to_df(data, filter_matcher):
-    cpu_entries = []
-    gpu_entries = []
+    """
+    Builds the CPU and GPU entries in a single pass over the trace events, stored by column to bound the memory of
+    multi-GB traces. The "run" column of an entry is the number of "model_run" events up to it.
+    Returns the CPU and GPU frames and the number of model runs.
+    """
+    cpu_table = ColumnarTable(["duration", "run"], ["name", "input_type_shape", "output_type_shape"])
+    gpu_table = ColumnarTable(["duration", "run"], ["name", "dimensions", "op_name", "input_type_shape"])
 
+    num_model_runs = 0
     most_recent_kernel_launch_event = None
+    most_recent_kernel_launch_shape = None
     num_missing_kernel_launch_events = 0
     total_kernel_events = 0
 
     for item in data:
+        if item.get("name") == "model_run":
+            num_model_runs += 1
         cat = item.get("cat")
         if cat is None:
             continue
@@ -119,39 +135,39 @@ def _json_to_df(data, filter_matcher):
             continue
         if name.endswith("kernel_time"):
             most_recent_kernel_launch_event = item
-
-        block_x = arg.get("block_x", -1)
-        block_y = arg.get("block_y", -1)
-        block_z = arg.get("block_z", -1)
-        grid_x = arg.get("grid_x", -1)
-        grid_y = arg.get("grid_y", -1)
-        grid_z = arg.get("grid_z", -1)
+            most_recent_kernel_launch_shape = None
 
         if cat == "Kernel":
-            gpu_entries.append(
-                {
-                    "name": name,
-                    "duration": dur,
-                    "dimensions": f"b{block_x}x{block_y}x{block_z},g{grid_x}x{grid_y}x{grid_z}",
-                    "op_name": op_name,
-                    "input_type_shape": (
-                        _shape_to_string(most_recent_kernel_launch_event["args"]["input_type_shape"])
-                        if most_recent_kernel_launch_event is not None
-                        else "unknown"
-                    ),
-                }
+            if most_recent_kernel_launch_event is None:
+                input_type_shape = "unknown"
+            else:
+                # kernels launched by the same node share the shapes of the node
+                if most_recent_kernel_launch_shape is None:
+                    most_recent_kernel_launch_shape = _shape_to_string(
+                        most_recent_kernel_launch_event["args"]["input_type_shape"]
+                    )
+                input_type_shape = most_recent_kernel_launch_shape
+
+            block = f"b{arg.get('block_x', -1)}x{arg.get('block_y', -1)}x{arg.get('block_z', -1)}"
+            grid = f"g{arg.get('grid_x', -1)}x{arg.get('grid_y', -1)}x{arg.get('grid_z', -1)}"
+            gpu_table.append(
+                name=name,
+                duration=dur,
+                run=num_model_runs,
+                dimensions=f"{block},{grid}",
+                op_name=op_name,
+                input_type_shape=input_type_shape,
             )
             total_kernel_events += 1
-            if gpu_entries[-1]["input_type_shape"] == "unknown" and "hipMem" not in gpu_entries[-1]["name"]:
+            if input_type_shape == "unknown" and "hipMem" not in name:
                 num_missing_kernel_launch_events += 1
         else:
-            cpu_entries.append(
-                {
-                    "name": item["args"]["op_name"],
-                    "duration": dur,
-                    "input_type_shape": _shape_to_string(item["args"]["input_type_shape"]),
-                    "output_type_shape": _shape_to_string(item["args"]["output_type_shape"]),
-                }
+            cpu_table.append(
+                name=op_name,
+                duration=dur,
+                run=num_model_runs,
+                input_type_shape=_shape_to_string(arg["input_type_shape"]),
+                output_type_shape=_shape_to_string(arg["output_type_shape"]),
             )
 
     if num_missing_kernel_launch_events > 0:
@@ -159,11 +175,7 @@ def _json_to_df(data, filter_matcher):
             f"WARNING: Could not resolve shapes for {num_missing_kernel_launch_events} of {total_kernel_events} kernels."
         )
 
-    cpu_df = pd.DataFrame(cpu_entries)
-    gpu_df = pd.DataFrame(gpu_entries)
-    cpu_df["count"] = 1
-    gpu_df["count"] = 1
-    return cpu_df, gpu_df
+    return cpu_table.to_pandas(), gpu_table.to_pandas(), num_model_runs
 
 
 def _print_top_hitters(frame, args, target="cpu"):
@@ -271,52 +283,48 @@ def _construct_filter_matcher(args):
     return _match_item
 
 
-def _split_data_across_runs(data, start=1, end=None):
+def _split_data_across_runs(cpu_df, gpu_df, total_num_runs, start=1, end=None):
     """
-    Splits the traces according to model runs they belong to.
+    Selects the entries of the model runs to analyze, using the "run" column of the entries.
     By default, we skip the first model run (run 0) and consider all subsequent runs.
     """
-    # Here we assume that the traces are properly ordered, so we can simplify the splitting logic.
-    model_run_splits = [i for i, item in enumerate(data) if item.get("name") == "model_run"]
-    if not model_run_splits:
+    if not total_num_runs:
         print('WARNING: Could not find "model_run" event in trace. Using entire traces.')
-        return data
-    total_num_runs = len(model_run_splits)
-    print(f"Found {total_num_runs} model_run events in trace.")
-
-    assert -total_num_runs <= start < total_num_runs, f"Invalid start index {start}."
-    if start < 0:
-        start += total_num_runs
-    if end is None:
-        end = total_num_runs
+        start, end, num_runs = 0, 1, 1
     else:
-        assert -total_num_runs <= end < total_num_runs, f"Invalid end index {end}."
-        if end < 0:
-            end += total_num_runs
-    num_runs = end - start
-    assert num_runs > 0, "No valid model runs are included in the split."
-    print(f"Analyzing {num_runs} model run(s): {start}-{end - 1}.")
+        print(f"Found {total_num_runs} model_run events in trace.")
 
-    # Add index 0 in case user wants to include the first model run.
-    model_run_splits = [0, *model_run_splits]
-    return data[model_run_splits[start] : model_run_splits[end]], num_runs
+        assert -total_num_runs <= start < total_num_runs, f"Invalid start index {start}."
+        if start < 0:
+            start += total_num_runs
+        if end is None:
+            end = total_num_runs
+        else:
+            assert -total_num_runs <= end < total_num_runs, f"Invalid end index {end}."
+            if end < 0:
+                end += total_num_runs
+        num_runs = end - start
+        assert num_runs > 0, "No valid model runs are included in the split."
+        print(f"Analyzing {num_runs} model run(s): {start}-{end - 1}.")
 
+    # Here we assume that the traces are properly ordered, so the entries of run i (i > 0) are those after the
+    # i-th "model_run" event, up to the next one.
+    def _select(frame):
+        if len(frame) > 0:
+            frame = frame[(frame["run"] >= start) & (frame["run"] < end)].reset_index(drop=True)
+        frame = frame.drop(columns="run")
+        frame["count"] = 1
+        return frame
 
-def _load_json(profile_path):
-    with open(profile_path, encoding="utf-8") as file_obj:
-        data = json.load(file_obj)
-    if isinstance(data, dict):
-        data = data["traceEvents"]
-    return data
+    return _select(cpu_df), _select(gpu_df), num_runs
 
 
 def main():
     args = _get_args()
     filter_matcher = _construct_filter_matcher(args)
 
-    data = _load_json(args.input)
-    data, num_runs = _split_data_across_runs(data, args.start, args.end)
-    cpu_df, gpu_df = _json_to_df(data, filter_matcher)
+    cpu_df, gpu_df, total_num_runs = _json_to_df(iter_trace_events(args.input), filter_matcher)
+    cpu_df, gpu_df, num_runs = _split_data_across_runs(cpu_df, gpu_df, total_num_runs, args.start, args.end)
 
     pd.set_option("display.max_colwidth", 120)
     _print_top_hitters(cpu_df, args, target="cpu")
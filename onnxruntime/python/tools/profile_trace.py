@@ -0,0 +1,252 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+# Streaming reader of the JSON traces written by the onnxruntime profiler, shared by
+# transformers/profiler.py and profile_explorer/profile_explorer.py.
+# Traces of long runs can be several GB: events are decoded one at a time from a bounded buffer, and aggregated
+# or stored by column in a single pass, instead of loading the whole list of events with json.load.
+
+import array
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+
+import numpy as np
+
+NODES_TYPE_CONTAINING_SUBGRAPH = ["Scan", "Loop", "If"]
+
+_DECODER = json.JSONDecoder()
+_SEPARATORS = re.compile(r"[\s,]*")
+_TRACE_EVENTS_KEY = '"traceEvents"'
+_DEVICES = {"CPUExecutionProvider": "CPU", "CUDAExecutionProvider": "CUDA", "DmlExecutionProvider": "DML"}
+
+
+def iter_trace_events(profile_file: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Yield the events of a profiling trace one at a time.
+
+    The trace is either a JSON array of events, as written by onnxruntime, or a JSON object with the events in
+    its "traceEvents" array. Only about `chunk_size` characters of the file are held in memory at any time,
+    besides the event being decoded.
+    """
+    with open(profile_file, encoding="utf-8") as file_obj:
+        buffer = file_obj.read(chunk_size)
+        pos = _SEPARATORS.match(buffer).end()
+        if buffer[pos : pos + 1] == "{":
+            # Skip to the array of events. Only the keys before it are held in memory.
+            key_pos = buffer.find(_TRACE_EVENTS_KEY, pos)
+            while key_pos < 0:
+                more = file_obj.read(chunk_size)
+                if not more:
+                    raise ValueError(f"{profile_file} has no traceEvents.")
+                buffer += more
+                key_pos = buffer.find(_TRACE_EVENTS_KEY, pos)
+            pos = key_pos + len(_TRACE_EVENTS_KEY)
+            while buffer.find("[", pos) < 0:
+                more = file_obj.read(chunk_size)
+                if not more:
+                    raise ValueError(f"{profile_file} has no traceEvents.")
+                buffer += more
+            pos = buffer.find("[", pos)
+        elif buffer[pos : pos + 1] != "[":
+            raise ValueError(f"{profile_file} is not a profiling trace.")
+        pos += 1
+
+        # Lines before this position cannot be decoded at once, e.g. in an indented trace.
+        line_decoding_start = 0
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                buffer = file_obj.read(chunk_size)
+                pos = line_decoding_start = 0
+                if not buffer:
+                    # The trace of a process that did not end profiling is not terminated.
+                    return
+                continue
+            if buffer[pos] == "]":
+                return
+
+            # onnxruntime writes an event per line: decode all the complete lines of the buffer in one call.
+            line_end = buffer.rfind("\n", pos)
+            if line_end > max(pos, line_decoding_start):
+                try:
+                    events = json.loads("[" + buffer[pos:line_end].rstrip().rstrip(",") + "]")
+                except json.JSONDecodeError:
+                    line_decoding_start = line_end
+                else:
+                    yield from events
+                    pos = line_end
+                    continue
+
+            try:
+                event, end = _DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The event is split across chunks.
+                more = file_obj.read(chunk_size)
+                if not more:
+                    raise
+                buffer = buffer[pos:] + more
+                line_decoding_start = max(0, line_decoding_start - pos)
+                pos = 0
+                continue
+
+            yield event
+            pos = end
+            if pos >= chunk_size:
+                buffer = buffer[pos:]
+                line_decoding_start = max(0, line_decoding_start - pos)
+                pos = 0
+
+
+class ProfileAggregates:
+    """Kernel, node and operator durations of a trace, accumulated one event at a time with add()."""
+
+    def __init__(self, skip_op_types: Sequence[str] = NODES_TYPE_CONTAINING_SUBGRAPH):
+        self.skip_op_types = set(skip_op_types)
+        self._session_initialized = False
+
+        # "Kernel" events after session initialization, by kernel name.
+        self.kernel_time: Dict[str, int] = {}
+        self.kernel_calls: Dict[str, int] = {}
+        self.kernel_op_name: Dict[str, str] = {}
+
+        # "Node" events by node name. Events with a provider measure the kernel time, the others the fences.
+        self.node_kernel_time: Dict[str, int] = {}
+        self.node_kernel_calls: Dict[str, int] = {}
+        self.node_other_time: Dict[str, int] = {}
+        self.node_other_calls: Dict[str, int] = {}
+        self.node_provider: Dict[str, str] = {}
+        # Node names in the order of their first event, and of their first event with a provider.
+        self.node_order: Dict[str, None] = {}
+        self.node_kernel_order: Dict[str, None] = {}
+
+        # "Node" events by operator, and by provider and operator.
+        self.op_kernel_time: Dict[str, int] = {}
+        self.op_kernel_calls: Dict[str, int] = {}
+        self.op_fence_time: Dict[str, int] = {}
+        self.provider_op_kernel_time: Dict[str, int] = {}
+        self.provider_op_kernel_calls: Dict[str, int] = {}
+        self.provider_kernel_time: Dict[str, int] = {}
+
+    def add(self, event: Dict[str, Any]):
+        cat = event.get("cat")
+        if cat == "Session" and event.get("name") == "session_initialization":
+            # Skip all MemcpyHostToDevice before session_initialization
+            self._session_initialized = True
+            return
+
+        args = event.get("args")
+        if "dur" not in event or not args or "op_name" not in args:
+            return
+        op_name = args["op_name"]
+        if op_name in self.skip_op_types:
+            return
+        dur = event["dur"]
+
+        if cat == "Kernel" and self._session_initialized:
+            kernel_name = event["name"]
+            if kernel_name in self.kernel_time:
+                self.kernel_time[kernel_name] += dur
+                self.kernel_calls[kernel_name] += 1
+            else:
+                self.kernel_time[kernel_name] = dur
+                self.kernel_calls[kernel_name] = 1
+                # Handle MemcpyHostToDevice and MemcpyDeviceToHost here
+                self.kernel_op_name[kernel_name] = op_name or f"({kernel_name})"
+        elif cat == "Node":
+            self._add_node(event["name"], op_name, args.get("provider"), dur)
+
+    def _add_node(self, name: str, op_name: str, provider, dur: int):
+        node_name = name.replace("_kernel_time", "").replace("_fence_before", "").replace("_fence_after", "")
+        self.node_order.setdefault(node_name)
+
+        if provider is None:
+            _accumulate(self.node_other_time, self.node_other_calls, node_name, dur)
+            if "fence" in name:
+                self.op_fence_time[op_name] = self.op_fence_time.get(op_name, 0) + dur
+            return
+
+        device = _DEVICES.get(provider, provider.replace("ExecutionProvider", ""))
+        assert self.node_provider.setdefault(node_name, device) == device
+        self.node_kernel_order.setdefault(node_name)
+        _accumulate(self.node_kernel_time, self.node_kernel_calls, node_name, dur)
+        _accumulate(self.op_kernel_time, self.op_kernel_calls, op_name, dur)
+        key = f"{provider}:{op_name}"
+        _accumulate(self.provider_op_kernel_time, self.provider_op_kernel_calls, key, dur)
+        self.provider_kernel_time[provider] = self.provider_kernel_time.get(provider, 0) + dur
+
+    def node_results(self, kernel_time_only: bool) -> List[tuple]:
+        """Return (node name, duration, calls, device) of the nodes in the order of their first event."""
+        results = []
+        for node_name in self.node_kernel_order if kernel_time_only else self.node_order:
+            duration = self.node_kernel_time.get(node_name, 0)
+            calls = self.node_kernel_calls.get(node_name, 0)
+            if not kernel_time_only:
+                duration += self.node_other_time.get(node_name, 0)
+                calls += self.node_other_calls.get(node_name, 0)
+            results.append((node_name, duration, calls, self.node_provider.get(node_name, "")))
+        return results
+
+
+def _accumulate(time: Dict[str, int], calls: Dict[str, int], key: str, dur: int):
+    if key in time:
+        time[key] += dur
+        calls[key] += 1
+    else:
+        time[key] = dur
+        calls[key] = 1
+
+
+def aggregate_profile(events: Iterable[Dict[str, Any]], **kwargs) -> ProfileAggregates:
+    """Aggregate a list of events, or the events of iter_trace_events() in a single pass."""
+    aggregates = ProfileAggregates(**kwargs)
+    for event in events:
+        aggregates.add(event)
+    return aggregates
+
+
+class ColumnarTable:
+    """A table filled one row at a time and stored by column.
+
+    Integer columns are stored in compact arrays, and string columns are dictionary encoded, so that the memory of
+    a row is a few bytes per column rather than a dictionary of Python objects. None is a valid string value.
+    """
+
+    def __init__(self, int_columns: Sequence[str] = (), str_columns: Sequence[str] = ()):
+        self._ints = {name: array.array("q") for name in int_columns}
+        self._codes = {name: array.array("i") for name in str_columns}
+        self._categories: Dict[str, Dict[str, int]] = {name: {} for name in str_columns}
+
+    def __len__(self):
+        for values in (*self._ints.values(), *self._codes.values()):
+            return len(values)
+        return 0
+
+    def append(self, **row):
+        for name, values in self._ints.items():
+            values.append(row[name])
+        for name, codes in self._codes.items():
+            value = row[name]
+            if value is None:
+                codes.append(-1)
+                continue
+            categories = self._categories[name]
+            code = categories.get(value)
+            if code is None:
+                code = categories[value] = len(categories)
+            codes.append(code)
+
+    def to_numpy(self) -> Dict[str, np.ndarray]:
+        """Return the columns as int64 arrays, and object arrays for the string columns."""
+        columns = {name: np.frombuffer(values, dtype=np.int64).copy() for name, values in self._ints.items()}
+        for name, codes in self._codes.items():
+            # code -1 of None selects the last element
+            categories = np.array([*self._categories[name], None], dtype=object)
+            columns[name] = categories[np.frombuffer(codes, dtype=np.int32)]
+        return columns
+
+    def to_pandas(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.to_numpy())
@@ -5,10 +5,11 @@
 # license information.
 # --------------------------------------------------------------------------
 import abc
-import copy
 import itertools
 import os
+import threading
 import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Enum
 from pathlib import Path
 from typing import Dict, Optional, Sequence, Tuple, Union
@@ -186,6 +187,8 @@ class CalibraterBase:
 
         self.augment_model = None
         self.infer_session = None
+        self.infer_sessions = []
+        self.num_sessions = 1
         self.execution_providers = ["CPUExecutionProvider"]
 
     def set_execution_providers(self, execution_providers=["CPUExecutionProvider"]):  # noqa: B006
@@ -195,17 +198,56 @@ class CalibraterBase:
         self.execution_providers = execution_providers
         self.create_inference_session()
 
+    def set_num_sessions(self, num_sessions=1):
+        """
+        set the number of inference sessions to execute the collect_data in parallel. Each session runs in its own
+        thread with a share of the CPU cores. It triggers to re-creating inference sessions.
+        """
+        if num_sessions < 1:
+            raise ValueError(f"num_sessions={num_sessions} must be a positive integer.")
+        self.num_sessions = num_sessions
+        self.create_inference_session()
+
     def create_inference_session(self):
         """
-        create an OnnxRuntime InferenceSession.
+        create OnnxRuntime InferenceSessions, one for each thread collecting data.
         """
         sess_options = onnxruntime.SessionOptions()
         sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
-        self.infer_session = onnxruntime.InferenceSession(
-            self.augmented_model_path,
-            sess_options=sess_options,
-            providers=self.execution_providers,
-        )
+        if self.num_sessions > 1:
+            sess_options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // self.num_sessions)
+        self.infer_sessions = [
+            onnxruntime.InferenceSession(
+                self.augmented_model_path,
+                sess_options=sess_options,
+                providers=self.execution_providers,
+            )
+            for _ in range(self.num_sessions)
+        ]
+        self.infer_session = self.infer_sessions[0]
+
+    def run_sessions(self, data_reader: CalibrationDataReader, process_outputs):
+        """
+        run the inputs of data_reader with all inference sessions in parallel, one thread per session.
+        Threads take inputs in turn under a lock, so data_reader does not need to be thread safe.
+        process_outputs(session_index, outputs) is called in the thread of the session, so it shall only
+        update the state owned by that session.
+        """
+        lock = threading.Lock()
+
+        def run(session_index):
+            session = self.infer_sessions[session_index]
+            while True:
+                with lock:
+                    inputs = data_reader.get_next()
+                if not inputs:
+                    break
+                process_outputs(session_index, session.run(None, inputs))
+
+        with ThreadPoolExecutor(max_workers=len(self.infer_sessions)) as executor:
+            futures = [executor.submit(run, i) for i in range(len(self.infer_sessions))]
+            for future in futures:
+                future.result()
 
     def select_tensors_to_calibrate(self, model: ModelProto):
         """
@@ -359,16 +401,22 @@ class MinMaxCalibrater(CalibraterBase):
         self.intermediate_outputs = []
 
     def collect_data(self, data_reader: CalibrationDataReader):
-        while True:
-            inputs = data_reader.get_next()
-            if not inputs:
-                break
-            self.intermediate_outputs.append(self.infer_session.run(None, inputs))
-            if (
-                self.max_intermediate_outputs is not None
-                and len(self.intermediate_outputs) == self.max_intermediate_outputs
-            ):
-                self.clear_collected_data()
+        # Moving average depends on the order of data, so it is always computed in one session.
+        if len(self.infer_sessions) > 1 and not self.moving_average:
+            self.collect_data_in_parallel(data_reader)
+        else:
+            while True:
+                inputs = data_reader.get_next()
+                if not inputs:
+                    break
+                self.intermediate_outputs.append(self.infer_session.run(None, inputs))
+                if (
+                    self.max_intermediate_outputs is not None
+                    and len(self.intermediate_outputs) == self.max_intermediate_outputs
+                ):
+                    # Merge range of the outputs collected so far, so that memory usage does not grow with data size.
+                    self.compute_data()
+                    self.clear_collected_data()
 
         if len(self.intermediate_outputs) == 0 and self.calibrate_tensors_range is None:
             raise ValueError("No data is collected.")
@@ -378,18 +426,43 @@ class MinMaxCalibrater(CalibraterBase):
             raise TypeError(f"compute_data must return a TensorsData not {type(t)}.")
         self.clear_collected_data()
 
-    def merge_range(self, old_range, new_range):
+    def collect_data_in_parallel(self, data_reader: CalibrationDataReader):
+        """
+        Each session keeps the element-wise min of ReduceMin outputs and max of ReduceMax outputs of its runs.
+        The result of each session is added to intermediate outputs, so compute_data gets the same range as
+        collecting all outputs in one session.
+        """
+        reduced_outputs = [None] * len(self.infer_sessions)
+
+        def reduce_outputs(session_index, outputs):
+            reduced = reduced_outputs[session_index]
+            if reduced is None:
+                reduced_outputs[session_index] = list(outputs)
+                return
+            # Added outputs are pairs of ReduceMin and ReduceMax after the original outputs of model.
+            for i in range(self.num_model_outputs, len(outputs)):
+                if (i - self.num_model_outputs) % 2 == 0:
+                    reduced[i] = np.minimum(reduced[i], outputs[i])
+                else:
+                    reduced[i] = np.maximum(reduced[i], outputs[i])
+
+        self.run_sessions(data_reader, reduce_outputs)
+        self.intermediate_outputs.extend(reduced for reduced in reduced_outputs if reduced is not None)
+
+    def merge_range(self, old_range: TensorsData, new_range: TensorsData) -> TensorsData:
         if not old_range:
             return new_range
 
-        for key, value in old_range.items():
+        for key, value in old_range.data.items():
+            old_min, old_max = value.range_value
+            new_min, new_max = new_range.data[key].range_value
             if self.moving_average:
-                min_value = value[0] + self.averaging_constant * (new_range[key][0] - value[0])
-                max_value = value[1] + self.averaging_constant * (new_range[key][1] - value[1])
+                min_value = old_min + self.averaging_constant * (new_min - old_min)
+                max_value = old_max + self.averaging_constant * (new_max - old_max)
             else:
-                min_value = min(value[0], new_range[key][0])
-                max_value = max(value[1], new_range[key][1])
-            new_range[key] = (min_value, max_value)
+                min_value = min(old_min, new_min)
+                max_value = max(old_max, new_max)
+            new_range.data[key] = TensorData(lowest=min_value, highest=max_value)
 
         return new_range
 
@@ -457,6 +530,8 @@ class HistogramCalibrater(CalibraterBase):
         num_quantized_bins=2048,
         percentile=99.999,
         scenario="same",
+        max_intermediate_outputs=None,
+        num_processes=1,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path.
@@ -469,6 +544,8 @@ class HistogramCalibrater(CalibraterBase):
         :param num_quantized_bins: number of quantized bins. Default 128.
         :param percentile: A float number between [0, 100]. Default 99.99.
         :param scenario: see :class:`DistributionCalibrater`
+        :param max_intermediate_outputs: maximum number of intermediate outputs before they are merged into histograms.
+        :param num_processes: number of processes to compute the entropy thresholds of tensors in parallel.
         """
         super().__init__(
             model_path,
@@ -488,6 +565,8 @@ class HistogramCalibrater(CalibraterBase):
         self.percentile = percentile
         self.tensors_to_calibrate = None
         self.scenario = scenario
+        self.max_intermediate_outputs = max_intermediate_outputs
+        self.num_processes = num_processes
 
     def augment_graph(self):
         """
@@ -511,41 +590,107 @@ class HistogramCalibrater(CalibraterBase):
     def collect_data(self, data_reader: CalibrationDataReader):
         """
         Entropy Calibrator collects operators' tensors as well as generates tensor histogram for each operator.
+        When max_intermediate_outputs is set, histograms are updated after every max_intermediate_outputs runs,
+        and the collected tensors are released.
         """
+        if len(self.infer_sessions) > 1:
+            self.collect_data_in_parallel(data_reader)
+            return
+
+        output_names = [output.name for output in self.infer_session.get_outputs()]
         while True:
             inputs = data_reader.get_next()
             if not inputs:
                 break
-            self.intermediate_outputs.append(self.infer_session.run(None, inputs))
+            # Only keep the tensors to calibrate.
+            outputs = self.infer_session.run(None, inputs)
+            self.intermediate_outputs.append(
+                {name: output for name, output in zip(output_names, outputs) if name in self.tensors_to_calibrate}
+            )
+            if (
+                self.max_intermediate_outputs is not None
+                and len(self.intermediate_outputs) == self.max_intermediate_outputs
+            ):
+                self.collect_histograms()
 
-        if len(self.intermediate_outputs) == 0:
+        if len(self.intermediate_outputs) == 0 and not self.collector:
             raise ValueError("No data is collected.")
 
-        output_names = [self.infer_session.get_outputs()[i].name for i in range(len(self.intermediate_outputs[0]))]
-        output_dicts_list = [
-            dict(zip(output_names, intermediate_output)) for intermediate_output in self.intermediate_outputs
-        ]
+        self.collect_histograms()
 
+    def collect_data_in_parallel(self, data_reader: CalibrationDataReader):
+        """
+        Each session builds histograms of its own share of data, then the histograms are merged.
+        """
+        output_names = [output.name for output in self.infer_session.get_outputs()]
+        num_sessions = len(self.infer_sessions)
+        shard_outputs = [[] for _ in range(num_sessions)]
+        shard_collectors = [self.create_collector() for _ in range(num_sessions)]
+
+        def collect_shard(session_index):
+            if shard_outputs[session_index]:
+                shard_collectors[session_index].collect(self.merge_outputs(shard_outputs[session_index]))
+                shard_outputs[session_index] = []
+
+        def collect_outputs(session_index, outputs):
+            shard_outputs[session_index].append(
+                {name: output for name, output in zip(output_names, outputs) if name in self.tensors_to_calibrate}
+            )
+            if (
+                self.max_intermediate_outputs is not None
+                and len(shard_outputs[session_index]) == self.max_intermediate_outputs
+            ):
+                collect_shard(session_index)
+
+        self.run_sessions(data_reader, collect_outputs)
+        with ThreadPoolExecutor(max_workers=num_sessions) as executor:
+            list(executor.map(collect_shard, range(num_sessions)))
+
+        collectors = [collector for collector in shard_collectors if collector.get_histogram_dict()]
+        if not collectors and not self.collector:
+            raise ValueError("No data is collected.")
+        for collector in collectors:
+            if self.collector:
+                self.collector.merge(collector)
+            else:
+                self.collector = collector
+
+    @staticmethod
+    def merge_outputs(intermediate_outputs):
+        """
+        Convert a list of {tensor name: output} into {tensor name: list of outputs}.
+        """
         merged_dict = {}
-        for d in output_dicts_list:
+        for d in intermediate_outputs:
             for k, v in d.items():
                 merged_dict.setdefault(k, []).append(v)
+        return merged_dict
+
+    def create_collector(self):
+        return HistogramCollector(
+            method=self.method,
+            symmetric=self.symmetric,
+            num_bins=self.num_bins,
+            num_quantized_bins=self.num_quantized_bins,
+            percentile=self.percentile,
+            scenario=self.scenario,
+            num_processes=self.num_processes,
+        )
+
+    def collect_histograms(self):
+        """
+        Update histograms with the collected intermediate outputs, then release them.
+        """
+        if len(self.intermediate_outputs) == 0:
+            return
 
-        clean_merged_dict = {i: merged_dict[i] for i in merged_dict if i in self.tensors_to_calibrate}
+        clean_merged_dict = self.merge_outputs(self.intermediate_outputs)
+        self.clear_collected_data()
 
         if not self.collector:
-            self.collector = HistogramCollector(
-                method=self.method,
-                symmetric=self.symmetric,
-                num_bins=self.num_bins,
-                num_quantized_bins=self.num_quantized_bins,
-                percentile=self.percentile,
-                scenario=self.scenario,
-            )
+            self.collector = self.create_collector()
         self.collector.collect(clean_merged_dict)
 
-        self.clear_collected_data()
-
     def compute_data(self) -> TensorsData:
         """
         Compute the min-max range of tensor
@@ -576,6 +721,8 @@ class EntropyCalibrater(HistogramCalibrater):
         symmetric=False,
         num_bins=128,
         num_quantized_bins=128,
+        max_intermediate_outputs=None,
+        num_processes=1,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -586,6 +733,8 @@ class EntropyCalibrater(HistogramCalibrater):
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param num_bins: number of bins to create a new histogram for collecting tensor values.
         :param num_quantized_bins: number of quantized bins. Default 128.
+        :param max_intermediate_outputs: maximum number of intermediate outputs before they are merged into histograms.
+        :param num_processes: number of processes to compute the entropy thresholds of tensors in parallel.
         """
         super().__init__(
             model_path,
@@ -596,6 +745,8 @@ class EntropyCalibrater(HistogramCalibrater):
             symmetric=symmetric,
             num_bins=num_bins,
             num_quantized_bins=num_quantized_bins,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_processes=num_processes,
         )
 
 
@@ -610,6 +761,7 @@ class PercentileCalibrater(HistogramCalibrater):
         symmetric=False,
         num_bins=2048,
         percentile=99.999,
+        max_intermediate_outputs=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -620,6 +772,7 @@ class PercentileCalibrater(HistogramCalibrater):
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param num_quantized_bins: number of quantized bins. Default 128.
         :param percentile: A float number between [0, 100]. Default 99.99.
+        :param max_intermediate_outputs: maximum number of intermediate outputs before they are merged into histograms.
         """
         super().__init__(
             model_path,
@@ -630,6 +783,7 @@ class PercentileCalibrater(HistogramCalibrater):
             symmetric=symmetric,
             num_bins=num_bins,
             percentile=percentile,
+            max_intermediate_outputs=max_intermediate_outputs,
         )
 
 
@@ -643,6 +797,7 @@ class DistributionCalibrater(HistogramCalibrater):
         method="distribution",
         num_bins=128,
         scenario="same",
+        max_intermediate_outputs=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -656,6 +811,7 @@ class DistributionCalibrater(HistogramCalibrater):
             the algorithm weights and float 8 follow the same distribution,
             if `scenario="p3"`, it assumes the weights follow
             a gaussian law and float 8 ~ X^3 where X is a gaussian law
+        :param max_intermediate_outputs: maximum number of intermediate outputs before they are merged into histograms.
         """
         super().__init__(
             model_path,
@@ -665,6 +821,7 @@ class DistributionCalibrater(HistogramCalibrater):
             method=method,
             num_bins=num_bins,
             scenario=scenario,
+            max_intermediate_outputs=max_intermediate_outputs,
         )
 
 
@@ -699,7 +856,7 @@ class HistogramCollector(CalibrationDataCollector):
                  pytorch_quantization/calib/histogram.html
     """
 
-    def __init__(self, method, symmetric, num_bins, num_quantized_bins, percentile, scenario):
+    def __init__(self, method, symmetric, num_bins, num_quantized_bins, percentile, scenario, num_processes=1):
         self.histogram_dict = {}
         self.method = method
         self.symmetric = symmetric
@@ -707,6 +864,7 @@ class HistogramCollector(CalibrationDataCollector):
         self.num_quantized_bins = num_quantized_bins
         self.percentile = percentile
         self.scenario = scenario
+        self.num_processes = num_processes
 
     def get_histogram_dict(self):
         return self.histogram_dict
@@ -791,8 +949,11 @@ class HistogramCollector(CalibrationDataCollector):
         Collect histogram on real value
         """
         for tensor, data_arr in name_to_arr.items():
-            data_arr = np.asarray(data_arr)  # noqa: PLW2901
-            data_arr = data_arr.flatten()  # noqa: PLW2901
+            if isinstance(data_arr, list) and len(data_arr) > 0:
+                # Same as np.asarray(data_arr).flatten() without making an intermediate copy.
+                data_arr = np.concatenate([np.asarray(arr).ravel() for arr in data_arr])  # noqa: PLW2901
+            else:
+                data_arr = np.asarray(data_arr).flatten()  # noqa: PLW2901
 
             if data_arr.size > 0:
                 min_value = np.min(data_arr)
@@ -850,6 +1011,31 @@ class HistogramCollector(CalibrationDataCollector):
                 new_threshold,
             )
 
+    def merge(self, other):
+        """
+        Merge histograms collected by another collector with the same settings, like the one of another shard of
+        calibration data. For each tensor, the histogram with the smaller range is re-binned into the bins of the
+        other one by its bin centers. The merge is commutative and associative up to this re-binning.
+        """
+        for tensor, histogram in other.get_histogram_dict().items():
+            if tensor not in self.histogram_dict:
+                self.histogram_dict[tensor] = histogram
+                continue
+
+            old_histogram = self.histogram_dict[tensor]
+            # Histogram of real value has threshold as the last item. Histogram of absolute value starts at 0.
+            if old_histogram[1][-1] >= histogram[1][-1]:
+                base, extra = old_histogram, histogram
+            else:
+                base, extra = histogram, old_histogram
+            base_hist, base_edges = base[0], base[1]
+            extra_hist, extra_edges = extra[0], extra[1]
+            extra_centers = (extra_edges[:-1].astype(np.float64) + extra_edges[1:]) * 0.5
+            rebinned, _ = np.histogram(extra_centers, bins=base_edges.astype(np.float64), weights=extra_hist)
+            hist = base_hist + rebinned.astype(base_hist.dtype)
+            merged = (hist, base_edges, min(old_histogram[2], histogram[2]), max(old_histogram[3], histogram[3]))
+            self.histogram_dict[tensor] = (*merged, base[4]) if len(base) > 4 else merged
+
     def compute_collection_result(self):
         if not self.histogram_dict or len(self.histogram_dict) == 0:
             raise ValueError("Histogram has not been collected. Please run collect() first.")
@@ -920,9 +1106,22 @@ class HistogramCollector(CalibrationDataCollector):
         print(f"Number of histogram bins : {self.num_bins} (The number may increase depends on the data it collects)")
         print(f"Number of quantized bins : {self.num_quantized_bins}")
 
-        for tensor, histogram in histogram_dict.items():
-            optimal_threshold = self.get_entropy_threshold(histogram, num_quantized_bins)
-            thresholds_dict[tensor] = optimal_threshold
+        if self.num_processes > 1 and len(histogram_dict) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.num_processes, len(histogram_dict))) as executor:
+                optimal_thresholds = list(
+                    executor.map(
+                        get_entropy_threshold,
+                        histogram_dict.values(),
+                        itertools.repeat(num_quantized_bins),
+                        chunksize=max(1, len(histogram_dict) // (4 * self.num_processes)),
+                    )
+                )
+        else:
+            optimal_thresholds = [
+                self.get_entropy_threshold(histogram, num_quantized_bins) for histogram in histogram_dict.values()
+            ]
+
+        for (tensor, histogram), optimal_threshold in zip(histogram_dict.items(), optimal_thresholds):
             thresholds_dict[tensor] = (*optimal_threshold, *histogram[:2])
 
             # Plot histogram for debug only
@@ -999,89 +1198,105 @@ class HistogramCollector(CalibrationDataCollector):
         `q` is a truncated version of the original distribution.
         Ref: http://on-demand.gputechconf.com/gtc/2017/presentation/s7310-8-bit-inference-with-tensorrt.pdf
         """
-        hist = histogram[0]
-        hist_edges = histogram[1]
-        num_bins = hist.size
-        zero_bin_index = num_bins // 2
-        num_half_quantized_bin = num_quantized_bins // 2
-
-        dtype = histogram[1].dtype
-        kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
-        thresholds = [(np.array(0, dtype=dtype), np.array(0, dtype=dtype)) for i in range(kl_divergence.size)]
-
-        # <------------ num bins ---------------->
-        #        <--- quantized bins ---->
-        # |======|===========|===========|=======|
-        #              zero bin index
-        #        ^                       ^
-        #        |                       |
-        #   start index               end index          (start of iteration)
-        #     ^                             ^
-        #     |                             |
-        #  start index                  end index               ...
-        # ^                                      ^
-        # |                                      |
-        # start index                    end index       (end of iteration)
-
-        for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
-            start_index = zero_bin_index - i
-            end_index = zero_bin_index + i + 1 if (zero_bin_index + i + 1) <= num_bins else num_bins
-
-            thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
-
-            sliced_distribution = copy.deepcopy(hist[start_index:end_index])
-
-            # reference distribution p
-            p = sliced_distribution.copy()  # a copy of np array
-            left_outliers_count = sum(hist[:start_index])
-            right_outliers_count = sum(hist[end_index:])
-            p[0] += left_outliers_count
-            p[-1] += right_outliers_count
-
-            # nonzeros[i] incidates whether p[i] is non-zero
-            nonzeros = (p != 0).astype(np.int64)
-
-            # quantize p.size bins into quantized bins (default 128 bins)
-            quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
-            num_merged_bins = sliced_distribution.size // num_quantized_bins
-
-            # merge bins into quantized bins
-            for index in range(num_quantized_bins):
-                start = index * num_merged_bins
-                end = start + num_merged_bins
-                quantized_bins[index] = sum(sliced_distribution[start:end])
-            quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
-
-            # in order to compare p and q, we need to make length of q equals to length of p
-            # expand quantized bins into p.size bins
-            q = np.zeros(p.size, dtype=np.int64)
-            for index in range(num_quantized_bins):
-                start = index * num_merged_bins
-                end = start + num_merged_bins
-
-                norm = sum(nonzeros[start:end])
-                if norm != 0:
-                    q[start:end] = quantized_bins[index] / norm
-
-            p = smooth_distribution(p)
-            q = smooth_distribution(q)
-            if p is None or q is None:
-                div = np.array(np.inf, dtype=dtype)
-            else:
-                div = np.array(entropy(p, q), dtype=dtype)
-            kl_divergence[i - num_half_quantized_bin] = div
-
-        min_kl_divergence_idx = np.argmin(kl_divergence)
-        optimal_threshold = thresholds[min_kl_divergence_idx]
-        min_value = histogram[2]
-        max_value = histogram[3]
-        if optimal_threshold[0] < min_value:
-            optimal_threshold = (min_value, optimal_threshold[1])
-        if optimal_threshold[1] > max_value:
-            optimal_threshold = (optimal_threshold[0], max_value)
-        assert hasattr(optimal_threshold[0], "dtype")
-        assert hasattr(optimal_threshold[1], "dtype")
-        return optimal_threshold
+        return get_entropy_threshold(histogram, num_quantized_bins)
+
+
+def get_entropy_threshold(histogram, num_quantized_bins):
+    """
+    Find the threshold with minimal KL divergence between the histogram and its quantized version.
+    See HistogramCollector.get_entropy_threshold. It is a module level function so that it can run in a process pool.
+
+    The integer parts (outliers, quantized bins and expanded q) of all candidate thresholds are computed at once
+    with cumulative sums. The smoothing and KL divergence of each candidate use the same float operations on the
+    same arrays as computing each candidate separately, so the threshold is bit-compatible with that.
+    """
+    hist = histogram[0]
+    hist_edges = histogram[1]
+    num_bins = hist.size
+    zero_bin_index = num_bins // 2
+    num_half_quantized_bin = num_quantized_bins // 2
+    dtype = hist_edges.dtype
+
+    # <------------ num bins ---------------->
+    #        <--- quantized bins ---->
+    # |======|===========|===========|=======|
+    #              zero bin index
+    #        ^                       ^
+    #        |                       |
+    #   start index               end index          (first candidate)
+    #     ^                             ^
+    #     |                             |
+    #  start index                  end index               ...
+    # ^                                      ^
+    # |                                      |
+    # start index                    end index       (last candidate)
+    half_widths = np.arange(num_half_quantized_bin, zero_bin_index + 1)
+    start_index = zero_bin_index - half_widths
+    end_index = np.minimum(zero_bin_index + half_widths + 1, num_bins)
+    length = end_index - start_index
+    num_merged_bins = length // num_quantized_bins
+
+    hist_cumsum = np.concatenate(([0], np.cumsum(hist)))
+    left_outliers_count = hist_cumsum[start_index]
+    right_outliers_count = hist_cumsum[-1] - hist_cumsum[end_index]
+
+    # Bins in [block_start, block_end) are merged into a quantized bin. Remaining bins go to the last quantized bin.
+    block_start = start_index[:, np.newaxis] + np.arange(num_quantized_bins) * num_merged_bins[:, np.newaxis]
+    block_end = block_start + num_merged_bins[:, np.newaxis]
+    quantized_bins = hist_cumsum[block_end] - hist_cumsum[block_start]
+    quantized_bins[:, -1] += hist_cumsum[end_index] - hist_cumsum[block_end[:, -1]]
+
+    # Count non-zero bins of reference distribution p in each block. p is the sliced histogram with outliers
+    # added to its first and last bins, so non-zero state of those two bins might differ from the histogram.
+    is_nonzero = hist != 0
+    nonzero_cumsum = np.concatenate(([0], np.cumsum(is_nonzero)))
+    norm = nonzero_cumsum[block_end] - nonzero_cumsum[block_start]
+    first_bin = hist[start_index] + left_outliers_count + np.where(length == 1, right_outliers_count, 0)
+    first_fix = (first_bin != 0).astype(np.int64) - is_nonzero[start_index]
+    norm[:, 0] += np.where(num_merged_bins > 0, first_fix, 0)
+    last_bin = hist[end_index - 1] + right_outliers_count
+    last_fix = (last_bin != 0).astype(np.int64) - is_nonzero[end_index - 1]
+    norm[:, -1] += np.where((length == num_merged_bins * num_quantized_bins) & (length > 1), last_fix, 0)
+
+    # Value of q in each block, truncated to integer like assigning it to an int64 array.
+    has_norm = norm != 0
+    q_values = np.where(has_norm, quantized_bins / np.where(has_norm, norm, 1), 0).astype(np.int64)
+
+    kl_divergence = np.zeros(half_widths.size)
+    for k in range(half_widths.size):
+        start, end, merged = start_index[k], end_index[k], num_merged_bins[k]
+
+        # reference distribution p
+        p = hist[start:end].copy()
+        p[0] += left_outliers_count[k]
+        p[-1] += right_outliers_count[k]
+
+        # expand quantized bins into p.size bins
+        q = np.zeros(p.size, dtype=np.int64)
+        q[: num_quantized_bins * merged] = np.repeat(q_values[k], merged)
+
+        p = smooth_distribution(p)
+        q = smooth_distribution(q)
+        if p is None or q is None:
+            div = np.array(np.inf, dtype=dtype)
+        else:
+            div = np.array(entropy(p, q), dtype=dtype)
+        kl_divergence[k] = div
+
+    min_kl_divergence_idx = np.argmin(kl_divergence)
+    optimal_threshold = (
+        hist_edges[start_index[min_kl_divergence_idx]],
+        hist_edges[end_index[min_kl_divergence_idx]],
+    )
+    min_value = histogram[2]
+    max_value = histogram[3]
+    if optimal_threshold[0] < min_value:
+        optimal_threshold = (min_value, optimal_threshold[1])
+    if optimal_threshold[1] > max_value:
+        optimal_threshold = (optimal_threshold[0], max_value)
+    assert hasattr(optimal_threshold[0], "dtype")
+    assert hasattr(optimal_threshold[1], "dtype")
+    return optimal_threshold
 
 
 def create_calibrator(
@@ -1093,12 +1308,13 @@ def create_calibrator(
     extra_options={},  # noqa: B006
 ):
     calibrator = None
+    max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
+    num_sessions = extra_options.get("num_sessions", 1)
     if calibrate_method == CalibrationMethod.MinMax:
         # default settings for min-max algorithm
         symmetric = extra_options.get("symmetric", False)
         moving_average = extra_options.get("moving_average", False)
         averaging_constant = extra_options.get("averaging_constant", 0.01)
-        max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
         calibrator = MinMaxCalibrater(
             model,
             op_types_to_calibrate,
@@ -1114,6 +1330,7 @@ def create_calibrator(
         num_bins = extra_options.get("num_bins", 128)
         num_quantized_bins = extra_options.get("num_quantized_bins", 128)
         symmetric = extra_options.get("symmetric", False)
+        num_processes = extra_options.get("num_processes", 1)
         calibrator = EntropyCalibrater(
             model,
             op_types_to_calibrate,
@@ -1122,6 +1339,8 @@ def create_calibrator(
             symmetric=symmetric,
             num_bins=num_bins,
             num_quantized_bins=num_quantized_bins,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_processes=num_processes,
         )
     elif calibrate_method == CalibrationMethod.Percentile:
         # default settings for percentile algorithm
@@ -1136,6 +1355,7 @@ def create_calibrator(
             symmetric=symmetric,
             num_bins=num_bins,
             percentile=percentile,
+            max_intermediate_outputs=max_intermediate_outputs,
         )
 
     elif calibrate_method == CalibrationMethod.Distribution:
@@ -1150,11 +1370,12 @@ def create_calibrator(
             use_external_data_format=use_external_data_format,
             num_bins=num_bins,
             scenario=scenario,
+            max_intermediate_outputs=max_intermediate_outputs,
         )
 
     if calibrator:
         calibrator.augment_graph()
-        calibrator.create_inference_session()
+        calibrator.set_num_sessions(num_sessions)
         return calibrator
 
     raise ValueError(f"Unsupported calibration method {calibrate_method}")
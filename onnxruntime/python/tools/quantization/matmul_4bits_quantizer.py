@@ -11,10 +11,13 @@ import copy
 import importlib
 import logging
 import os
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 
 import numpy as np
 import numpy.typing as npt
 import onnx
+from onnx.external_data_helper import ExternalDataInfo, uses_external_data
 from onnx.onnx_pb import GraphProto, ModelProto, NodeProto, TensorProto
 from packaging import version
 
@@ -287,23 +290,10 @@ class HQQWeightOnlyQuantizer:
 
         return w_q, scale.to(tensor.dtype), zero.to(tensor.dtype)
 
-    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]):
-        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new node"""
-        if node.op_type != "MatMul":
-            return node  # only care about MatMul for now
+    def quantize_weight(self, b_array: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Quantize a 2D MatMul weight. It doesn't touch the graph, so weights can be quantized concurrently."""
         import torch
 
-        logger.info(f"start to quantize {node.name} ...")
-        inputB = node.input[1]  # noqa: N806
-        b_pb, bs_graph = get_initializer(inputB, graph_stack)
-        if b_pb is None:
-            logger.info("MatMul doesn't have const weight. Skip to quantize")
-            return node  # only care about constant weight
-
-        b_array = onnx.numpy_helper.to_array(b_pb)
-        if len(b_array.shape) != 2:
-            logger.info("MatMul weight is not 2D. Skip to quantize")
-            return node  # can only process 2-D matrix
         b_array_torch = torch.from_numpy(b_array)
         if torch.cuda.is_available():
             b_array_torch = b_array_torch.cuda()
@@ -331,7 +321,21 @@ class HQQWeightOnlyQuantizer:
         k_blocks = (rows + block_size - 1) // block_size
         packed_torch = packed_torch.reshape(cols, k_blocks, blob_size)
 
-        b_quant = onnx.numpy_helper.from_array(packed_torch.cpu().numpy())
+        return packed_torch.cpu().numpy(), scales, zero_points
+
+    def make_quantized_node(
+        self,
+        node: NodeProto,
+        b_pb: TensorProto,
+        bs_graph: GraphProto,
+        b_shape: tuple[int, ...],
+        quantized_weight: tuple[np.ndarray, np.ndarray, np.ndarray],
+    ) -> NodeProto:
+        """Add the quantized weight to the graph of the weight, and return the MatMulNBits node replacing node"""
+        packed, scales, zero_points = quantized_weight
+        inputB = node.input[1]  # noqa: N806
+
+        b_quant = onnx.numpy_helper.from_array(packed)
         b_quant.name = b_pb.name + "_Q4"
         for input in bs_graph.input:
             if input.name == inputB:
@@ -349,7 +353,7 @@ class HQQWeightOnlyQuantizer:
         input_names.append(zp_tensor.name)
 
         kwargs = {}
-        rows, cols = b_array.shape
+        rows, cols = b_shape
         kwargs["K"] = rows
         kwargs["N"] = cols
         kwargs["bits"] = self.config.bits
@@ -364,6 +368,20 @@ class HQQWeightOnlyQuantizer:
             **kwargs,
         )
 
+        return matmul_q4_node
+
+    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]):
+        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new node"""
+        if node.op_type != "MatMul":
+            return node  # only care about MatMul for now
+
+        logger.info(f"start to quantize {node.name} ...")
+        b_pb, bs_graph, b_array = get_matmul_weight(node, graph_stack)
+        if b_array is None:
+            return node
+
+        matmul_q4_node = self.make_quantized_node(node, b_pb, bs_graph, b_array.shape, self.quantize_weight(b_array))
+
         logger.info(f"complete quantization of {node.name} ...")
 
         return matmul_q4_node
@@ -378,6 +396,104 @@ def get_initializer(name, graph_path: list[GraphProto]) -> tuple[TensorProto, Gr
     return None, None
 
 
+def load_external_array(tensor: TensorProto, base_dir: str) -> np.ndarray:
+    """Memory-map the data of a tensor stored in an external data file, without loading it into memory.
+    The mapping is copy-on-write, so the array is writable but the file is never modified."""
+    info = ExternalDataInfo(tensor)
+    dtype = onnx.helper.tensor_dtype_to_np_dtype(tensor.data_type).newbyteorder("<")
+    return np.memmap(
+        os.path.join(base_dir, info.location), dtype=dtype, mode="c", offset=info.offset or 0, shape=tuple(tensor.dims)
+    )
+
+
+def get_matmul_weight(
+    node: NodeProto, graph_path: list[GraphProto], base_dir: str | None = None
+) -> tuple[TensorProto, GraphProto, np.ndarray]:
+    """Return the weight initializer of a MatMul, the graph holding it and its value.
+    The value is None if the weight is not a constant 2D matrix. If base_dir is given, a weight stored in an external
+    data file is memory-mapped from the file in base_dir instead of being loaded into the initializer."""
+    b_pb, bs_graph = get_initializer(node.input[1], graph_path)
+    if b_pb is None:
+        logger.info("MatMul doesn't have const weight. Skip to quantize")
+        return None, None, None  # only care about constant weight
+
+    if len(b_pb.dims) != 2:
+        logger.info("MatMul weight is not 2D. Skip to quantize")
+        return None, None, None  # can only process 2-D matrix
+
+    if base_dir is not None and uses_external_data(b_pb):
+        return b_pb, bs_graph, load_external_array(b_pb, base_dir)
+    return b_pb, bs_graph, onnx.numpy_helper.to_array(b_pb)
+
+
+class ExternalDataWriter:
+    """Append tensor data to the external data file of a model, as soon as the tensors are created"""
+
+    def __init__(self, model_path: str, size_threshold: int = 1024, chunk_size: int = 64 * 1024 * 1024):
+        """
+        Args:
+            model_path: path of the model referencing the data file. The data file is <model_path>.data.
+            size_threshold: tensors smaller than size_threshold bytes are kept in the model.
+            chunk_size: number of bytes copied at once from other external data files.
+        """
+        self.location = os.path.basename(model_path) + ".data"
+        self.path = os.path.join(os.path.dirname(model_path), self.location)
+        self.size_threshold = size_threshold
+        self.chunk_size = chunk_size
+        self._file = open(self.path, "wb")  # noqa: SIM115
+
+    def _set_external_data(self, tensor: TensorProto, offset: int, length: int):
+        del tensor.external_data[:]
+        tensor.data_location = TensorProto.EXTERNAL
+        for key, value in [("location", self.location), ("offset", offset), ("length", length)]:
+            entry = tensor.external_data.add()
+            entry.key = key
+            entry.value = str(value)
+
+    def write(self, tensor: TensorProto):
+        """Move the raw data of the tensor to the data file, unless it is smaller than size_threshold."""
+        if not tensor.HasField("raw_data") or len(tensor.raw_data) < self.size_threshold:
+            return
+        offset = self._file.tell()
+        self._file.write(tensor.raw_data)
+        tensor.ClearField("raw_data")
+        self._set_external_data(tensor, offset, self._file.tell() - offset)
+
+    def copy(self, tensor: TensorProto, base_dir: str):
+        """Copy the data of a tensor from another external data file to the data file, chunk by chunk."""
+        info = ExternalDataInfo(tensor)
+        with open(os.path.join(base_dir, info.location), "rb") as f:
+            f.seek(info.offset or 0)
+            remaining = info.length if info.length is not None else os.fstat(f.fileno()).st_size - f.tell()
+            offset = self._file.tell()
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise ValueError(f"External data of tensor {tensor.name} is out of the range of {info.location}")
+                self._file.write(chunk)
+                remaining -= len(chunk)
+        self._set_external_data(tensor, offset, self._file.tell() - offset)
+
+    def close(self):
+        self._file.close()
+
+
+def iterate_tensors(graph: GraphProto):
+    """Yield the initializers and tensor attributes of a graph and its sub-graphs"""
+    yield from graph.initializer
+    for node in graph.node:
+        for attr in node.attribute:
+            if attr.type == onnx.AttributeProto.TENSOR:
+                yield attr.t
+            elif attr.type == onnx.AttributeProto.TENSORS:
+                yield from attr.tensors
+            elif attr.type == onnx.AttributeProto.GRAPH:
+                yield from iterate_tensors(attr.g)
+            elif attr.type == onnx.AttributeProto.GRAPHS:
+                for subgraph in attr.graphs:
+                    yield from iterate_tensors(subgraph)
+
+
 class DefaultWeightOnlyQuantizer:
     def __init__(self, config: DefaultWeightOnlyQuantConfig):
         self.config = config
@@ -405,45 +521,42 @@ class DefaultWeightOnlyQuantizer:
 
         return (packed, scales, zero_point)
 
-    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]) -> NodeProto:
-        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new node"""
-
-        if node.op_type != "MatMul":
-            return node  # only care about MatMul for now
+    def quantize_weight(self, b_array: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Quantize a 2D MatMul weight. It doesn't touch the graph, so weights can be quantized concurrently."""
+        return self.int4_block_quant(b_array)
 
-        logger.info(f"start to quantize {node.name} ...")
+    def make_quantized_node(
+        self,
+        node: NodeProto,
+        b_pb: TensorProto,
+        bs_graph: GraphProto,
+        b_shape: tuple[int, ...],
+        quantized_weight: tuple[np.ndarray, np.ndarray, np.ndarray],
+    ) -> NodeProto:
+        """Add the quantized weight to the graph of the weight, and return the MatMulNBits node replacing node"""
+        packed, scales, zero_points = quantized_weight
         inputB = node.input[1]  # noqa: N806
-        B, Bs_graph = get_initializer(inputB, graph_stack)  # noqa: N806
-        if B is None:
-            logger.info("MatMul doesn't have const weight. Skip to quantize")
-            return node  # only care about constant weight
-
-        B_array = onnx.numpy_helper.to_array(B)  # noqa: N806
-        if len(B_array.shape) != 2:
-            logger.info("MatMul weight is not 2D. Skip to quantize")
-            return node  # can only process 2-D matrix
 
-        packed, scales, zero_points = self.int4_block_quant(B_array)
         B_quant = onnx.numpy_helper.from_array(packed)  # noqa: N806
-        B_quant.name = B.name + "_Q4"
-        for input in Bs_graph.input:
+        B_quant.name = b_pb.name + "_Q4"
+        for input in bs_graph.input:
             if input.name == inputB:
-                Bs_graph.input.remove(input)
+                bs_graph.input.remove(input)
                 break
 
         scales_tensor = onnx.numpy_helper.from_array(scales)
-        scales_tensor.name = B.name + "_scales"
-        Bs_graph.initializer.extend([B_quant, scales_tensor])
+        scales_tensor.name = b_pb.name + "_scales"
+        bs_graph.initializer.extend([B_quant, scales_tensor])
 
         input_names = [node.input[0], B_quant.name, scales_tensor.name]
         if not self.config.is_symmetric:
             zp_tensor = onnx.numpy_helper.from_array(zero_points)
-            zp_tensor.name = B.name + "_zero_points"
-            Bs_graph.initializer.extend([zp_tensor])
+            zp_tensor.name = b_pb.name + "_zero_points"
+            bs_graph.initializer.extend([zp_tensor])
             input_names.append(zp_tensor.name)
 
         kwargs = {}
-        rows, cols = B_array.shape
+        rows, cols = b_shape
         kwargs["K"] = rows
         kwargs["N"] = cols
         kwargs["bits"] = 4
@@ -460,13 +573,35 @@ class DefaultWeightOnlyQuantizer:
             **kwargs,
         )
 
+        return matmul_q4_node
+
+    def quantize(self, node: NodeProto, graph_stack: list[GraphProto]) -> NodeProto:
+        """If the node is MatMul with fp32 const weight, quantize the weight with int4, and return the new node"""
+
+        if node.op_type != "MatMul":
+            return node  # only care about MatMul for now
+
+        logger.info(f"start to quantize {node.name} ...")
+        B, Bs_graph, B_array = get_matmul_weight(node, graph_stack)  # noqa: N806
+        if B_array is None:
+            return node
+
+        matmul_q4_node = self.make_quantized_node(node, B, Bs_graph, B_array.shape, self.quantize_weight(B_array))
+
         logger.info(f"complete quantization of {node.name} ...")
 
         return matmul_q4_node
 
 
 class MatMul4BitsQuantizer:
-    """Perform 4b quantization of constant MatMul weights"""
+    """Perform 4b quantization of constant MatMul weights
+
+    With num_workers > 1, the weights of the HQQ and DEFAULT algorithms are quantized by a pool of num_workers threads,
+    with at most num_workers weights in flight. The graph is still updated in node order, so the quantized model is the
+    same as the one quantized with a single worker.
+
+    The external data of a model given by path is loaded by process(). process_out_of_core() never loads it, see there.
+    """
 
     def __init__(
         self,
@@ -476,15 +611,20 @@ class MatMul4BitsQuantizer:
         accuracy_level: int | None = None,
         nodes_to_exclude=None,
         algo_config: WeightOnlyQuantConfig = None,
+        num_workers: int = 1,
     ):
         if nodes_to_exclude is None:
             nodes_to_exclude = []
-        self.model = ONNXModel(onnx.load(model)) if isinstance(model, str) else ONNXModel(model)
+        # external data of the model is loaded by process()
+        self.model = ONNXModel(onnx.load(model, load_external_data=False) if isinstance(model, str) else model)
         self.model_path = model if isinstance(model, str) else None
+        self._external_data_dir = None
+        self._external_data_writer = None
         self.block_size = block_size
         self.is_symmetric = is_symmetric
         self.accuracy_level = accuracy_level
         self.nodes_to_exclude = set(nodes_to_exclude)
+        self.num_workers = num_workers
         self.node_quantizer = None
         if algo_config is None:
             algo_config = DefaultWeightOnlyQuantConfig(
@@ -496,9 +636,28 @@ class MatMul4BitsQuantizer:
         elif algo_config.algorithm == "DEFAULT":
             self.node_quantizer = DefaultWeightOnlyQuantizer(self.algo_config)
 
-    def _process_subgraph(self, graph_stack: list[GraphProto]):
+    def _finish_pending_nodes(self, pending: deque, new_nodes: list[NodeProto], max_pending: int = 0):
+        """Add the weights quantized by the pool to the graph, oldest first, until at most max_pending are left."""
+        while len(pending) > max_pending:
+            index, node, b_pb, bs_graph, b_shape, future = pending.popleft()
+            new_node = self.node_quantizer.make_quantized_node(node, b_pb, bs_graph, b_shape, future.result())
+            if self._external_data_writer is not None:
+                quantized_names = set(new_node.input[1:])
+                # the quantized weights are the last initializers of their graph
+                for tensor in reversed(bs_graph.initializer):
+                    if tensor.name in quantized_names:
+                        self._external_data_writer.write(tensor)
+                        quantized_names.remove(tensor.name)
+                        if not quantized_names:
+                            break
+            new_nodes[index] = new_node
+            logger.info(f"complete quantization of {node.name} ...")
+
+    def _process_subgraph(self, graph_stack: list[GraphProto], executor: Executor | None = None):
         new_nodes = []
         graph = graph_stack[-1]
+        # (index in new_nodes, node, weight, graph of weight, weight shape, future of the quantized weight)
+        pending: deque[tuple[int, NodeProto, TensorProto, GraphProto, tuple[int, ...], Future]] = deque()
 
         for node in graph.node:
             graph_attrs = [
@@ -507,18 +666,20 @@ class MatMul4BitsQuantizer:
                 if attr.type == onnx.AttributeProto.GRAPH or attr.type == onnx.AttributeProto.GRAPHS
             ]
             if len(graph_attrs):
+                # sub-graphs may quantize weights of this graph, so keep the order of graph updates
+                self._finish_pending_nodes(pending, new_nodes)
                 kwargs = {}
                 for attr in node.attribute:
                     if attr.type == onnx.AttributeProto.GRAPH:
                         # recursive call to take care of sub-graph
                         graph_stack.append(attr.g)
-                        kv = {attr.name: self._process_subgraph(graph_stack)}
+                        kv = {attr.name: self._process_subgraph(graph_stack, executor)}
                     elif attr.type == onnx.AttributeProto.GRAPHS:
                         value = []
                         for subgraph in attr.graphs:
                             # recursive call to take care of sub-graph
                             graph_stack.append(subgraph)
-                            value.extend([self._process_subgraph(graph_stack)])
+                            value.extend([self._process_subgraph(graph_stack, executor)])
                         kv = {attr.name: value}
                     else:
                         kv = attribute_to_kwarg(attr)
@@ -530,12 +691,24 @@ class MatMul4BitsQuantizer:
             if node.name in self.nodes_to_exclude:
                 logger.info(f"exclude to quantize {node.name} as specified by nodes_to_exclude...")
                 out_node = node
+            elif executor is not None and node.op_type == "MatMul":
+                logger.info(f"start to quantize {node.name} ...")
+                b_pb, bs_graph, b_array = get_matmul_weight(node, graph_stack, self._external_data_dir)
+                if b_array is None:
+                    out_node = node
+                else:
+                    # bound the weights held in memory by the pool
+                    self._finish_pending_nodes(pending, new_nodes, self.num_workers - 1)
+                    future = executor.submit(self.node_quantizer.quantize_weight, b_array)
+                    pending.append((len(new_nodes), node, b_pb, bs_graph, b_array.shape, future))
+                    out_node = None  # replaced by the MatMulNBits node when the weight is quantized
             elif self.algo_config is not None and self.algo_config.algorithm == "HQQ":
                 out_node = self.node_quantizer.quantize(node, graph_stack)
             else:
                 out_node = self.node_quantizer.quantize(node, graph_stack)
             new_nodes.append(out_node)
 
+        self._finish_pending_nodes(pending, new_nodes)
         graph.ClearField("node")
         graph.node.extend(new_nodes)
         graph_stack.pop()
@@ -602,20 +775,31 @@ class MatMul4BitsQuantizer:
             )
         logger.info(f"complete quantization of model with {algorithm} algorithm.")
 
+    def _quantize_graph(self, executor: Executor | None = None):
+        # use a stack to keep track of sub-graphs
+        graph_stack = [self.model.graph()]
+        opset_import = self.model.opset_import()
+
+        has_ms_domain = False
+        for opset in opset_import:
+            if opset.domain == "com.microsoft":
+                has_ms_domain = True
+        if not has_ms_domain:
+            opset_import.extend([onnx.helper.make_opsetid("com.microsoft", 1)])
+        self._process_subgraph(graph_stack, executor)
+        self.model.clean_initializers()
+
     def process(self):
         if self.algo_config.algorithm in ["HQQ", "DEFAULT"]:
-            # use a stack to keep track of sub-graphs
-            graph_stack = [self.model.graph()]
-            opset_import = self.model.opset_import()
-
-            has_ms_domain = False
-            for opset in opset_import:
-                if opset.domain == "com.microsoft":
-                    has_ms_domain = True
-            if not has_ms_domain:
-                opset_import.extend([onnx.helper.make_opsetid("com.microsoft", 1)])
-            self._process_subgraph(graph_stack)
-            self.model.clean_initializers()
+            if self.model_path is not None:
+                onnx.external_data_helper.load_external_data_for_model(
+                    self.model.model, os.path.dirname(self.model_path)
+                )
+            if self.num_workers > 1:
+                with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                    self._quantize_graph(executor)
+            else:
+                self._quantize_graph()
         else:
             # use Intel® Neural Compressor for RTN or GPTQ weight-only quantize algorithm
             try:
@@ -634,6 +818,40 @@ class MatMul4BitsQuantizer:
 
             self.int4_quant_algo()
 
+    def process_out_of_core(self, output_model_path: str):
+        """Quantize the model given by path with the HQQ or DEFAULT algorithm, and save it to output_model_path,
+        without loading the external data of the model into memory.
+
+        Weights are memory-mapped from the external data files and quantized num_workers at a time (at least one), so
+        the memory in use is bounded by the largest weights rather than by the model size. Quantized weights are
+        written to <output_model_path>.data as soon as they are added to the graph, and the data of other tensors is
+        copied there in chunks when the model is saved. The model is left with its data in <output_model_path>.data.
+        """
+        if self.model_path is None:
+            raise ValueError("Out-of-core quantization requires the model to be given by path.")
+        if self.algo_config.algorithm not in ["HQQ", "DEFAULT"]:
+            raise ValueError(f"Out-of-core quantization is not supported by {self.algo_config.algorithm} algorithm.")
+        if os.path.abspath(output_model_path) == os.path.abspath(self.model_path):
+            raise ValueError("Out-of-core quantization cannot overwrite the input model.")
+
+        self._external_data_dir = os.path.dirname(self.model_path)
+        self._external_data_writer = ExternalDataWriter(output_model_path)
+        try:
+            with ThreadPoolExecutor(max_workers=max(self.num_workers, 1)) as executor:
+                self._quantize_graph(executor)
+
+            for tensor in iterate_tensors(self.model.graph()):
+                if uses_external_data(tensor):
+                    self._external_data_writer.copy(tensor, self._external_data_dir)
+                else:
+                    self._external_data_writer.write(tensor)
+        finally:
+            self._external_data_writer.close()
+            self._external_data_writer = None
+            self._external_data_dir = None
+
+        onnx.save_model(self.model.model, output_model_path)
+
 
 def ort_convert_str_to_bool(value):
     return value.lower() in ("true", "1")
@@ -688,6 +906,21 @@ set of 4b integers with a scaling factor and an optional offset.
         default=[],
         help="Specify the nodes to be excluded from quantization with node names",
     )
+    parser.add_argument(
+        "--num_workers",
+        required=False,
+        default=1,
+        type=int,
+        help="Number of threads quantizing weights in parallel, for the default and hqq algorithms",
+    )
+    parser.add_argument(
+        "--out_of_core",
+        required=False,
+        action="store_true",
+        help="Quantize weights of the input model without loading its external data into memory, "
+        "for the default and hqq algorithms. The output model is saved with external data.",
+    )
+    parser.set_defaults(out_of_core=False)
 
     return parser.parse_args()
 
@@ -708,7 +941,6 @@ if __name__ == "__main__":
         logger.warning("symmetric is not supportted by hqq, will force to symmetric=False")
         args.symmetric = False
 
-    model = onnx.load(input_model_path)
     if args.quant_method == "hqq":
         quant_config = HQQWeightOnlyQuantConfig(block_size=args.block_size, bits=args.bits)
     elif args.quant_method == "default":
@@ -723,10 +955,14 @@ if __name__ == "__main__":
         raise ValueError(f"Unsupported quantization method: {args.quant_method}")
 
     quant = MatMul4BitsQuantizer(
-        model=model,
+        model=input_model_path,
         accuracy_level=args.accuracy_level,
         nodes_to_exclude=args.nodes_to_exclude,
         algo_config=quant_config,
+        num_workers=args.num_workers,
     )
-    quant.process()
-    quant.model.save_model_to_file(output_model_path, True)
+    if args.out_of_core:
+        quant.process_out_of_core(output_model_path)
+    else:
+        quant.process()
+        quant.model.save_model_to_file(output_model_path, True)
@@ -3,11 +3,12 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 from pathlib import Path
+from typing import Dict, Optional
 
 import onnx
 import onnx.helper as onnx_helper
 import onnx.numpy_helper as onnx_numpy_helper
-from onnx.onnx_pb import ModelProto
+from onnx.onnx_pb import GraphProto, ModelProto, TensorProto
 
 from .quant_utils import attribute_to_kwarg, find_by_name
 
@@ -86,9 +87,66 @@ def _clean_initializers_helper(graph, model):
     return graph, requesting_tensor_names
 
 
+class _InitializerIndex:
+    """Index of the initializers of a graph by name.
+
+    Initializers added or removed with add() and remove() are updated in the index. The index is rebuilt when the
+    number of initializers changes otherwise, for example after graph.initializer.extend() in a quantizer.
+    """
+
+    def __init__(self, graph: GraphProto):
+        self.graph = graph
+        self.size = -1
+        self.name_to_initializer: Dict[str, TensorProto] = {}
+
+    def _build(self):
+        self.name_to_initializer = {}
+        for tensor in self.graph.initializer:
+            # Keep the first one when names are duplicated, like find_by_name.
+            self.name_to_initializer.setdefault(tensor.name, tensor)
+        self.size = len(self.graph.initializer)
+
+    def get(self, name: str) -> Optional[TensorProto]:
+        if len(self.graph.initializer) != self.size:
+            self._build()
+        return self.name_to_initializer.get(name)
+
+    def names(self):
+        if len(self.graph.initializer) != self.size:
+            self._build()
+        return self.name_to_initializer.keys()
+
+    def add(self, tensor: TensorProto):
+        self.get(tensor.name)
+        self.graph.initializer.extend([tensor])
+        # The graph holds a copy of the tensor.
+        self.name_to_initializer.setdefault(tensor.name, self.graph.initializer[-1])
+        self.size += 1
+
+    def remove(self, tensor: TensorProto):
+        self.get(tensor.name)
+        self.graph.initializer.remove(tensor)
+        self.name_to_initializer.pop(tensor.name, None)
+        self.size -= 1
+
+
 class ONNXModel:
     def __init__(self, model: ModelProto):
         self.model = model
+        # Index of initializers of the main graph, built on first use. Changes of graph.initializer done
+        # without this class, other than adding or removing initializers, shall call invalidate_initializer_index().
+        self._initializer_index: Optional[_InitializerIndex] = None
+        self._indexed_model: Optional[ModelProto] = None
+        self._model_initializers_checked = False
+
+    def _get_initializer_index(self) -> _InitializerIndex:
+        if self._initializer_index is None or self._indexed_model is not self.model:
+            self._initializer_index = _InitializerIndex(self.model.graph)
+            self._indexed_model = self.model
+        return self._initializer_index
+
+    def invalidate_initializer_index(self):
+        self._initializer_index = None
 
     def nodes(self):
         return self.model.graph.node
@@ -99,11 +157,15 @@ class ONNXModel:
     def initializer_extend(self, inits):
         if len(inits) == 0:
             raise ValueError("Can add an empty list.")
-        for init in self.initializer():
-            self._check_init(init, "gain")
+        if not self._model_initializers_checked:
+            # Initializers added by this class are checked when added, so the ones of the model are checked once.
+            for init in self.initializer():
+                self._check_init(init, "gain")
+            self._model_initializers_checked = True
+        index = self._get_initializer_index()
         for init in inits:
             self._check_init(init)
-            self.model.graph.initializer.append(init)
+            index.add(init)
 
     def graph(self):
         return self.model.graph
@@ -138,15 +200,13 @@ class ONNXModel:
             self.add_node(node)
 
     def add_initializer(self, tensor):
-        if find_by_name(tensor.name, self.model.graph.initializer) is None:
+        index = self._get_initializer_index()
+        if index.get(tensor.name) is None:
             self._check_init(tensor)
-            self.model.graph.initializer.extend([tensor])
+            index.add(tensor)
 
     def get_initializer(self, name):
-        for tensor in self.model.graph.initializer:
-            if tensor.name == name:
-                return tensor
-        return None
+        return self._get_initializer_index().get(name)
 
     def find_graph_input(self, input_name):
         for input in self.model.graph.input:
@@ -192,11 +252,13 @@ class ONNXModel:
         return None
 
     def get_initializer_name_set(self):
-        return {initializer.name for initializer in self.model.graph.initializer}
+        return set(self._get_initializer_index().names())
 
     def remove_initializer(self, tensor):
-        if tensor in self.model.graph.initializer:
-            self.model.graph.initializer.remove(tensor)
+        index = self._get_initializer_index()
+        initializer = index.get(tensor.name)
+        if initializer is not None and (initializer is tensor or initializer == tensor):
+            index.remove(tensor)
             for input in self.model.graph.input:
                 if input.name == tensor.name:
                     self.model.graph.input.remove(input)
@@ -308,16 +370,19 @@ class ONNXModel:
         return nodes
 
     @staticmethod
-    def __get_initializer(name, graph_path):
+    def __get_initializer(name, graph_path, indexes):
+        """Finds the initializer in the innermost graph of graph_path, and returns it with the index of its graph.
+        `indexes` holds an _InitializerIndex for each graph in graph_path, keyed by depth of the graph."""
         for gid in range(len(graph_path) - 1, -1, -1):
-            graph = graph_path[gid]
-            for tensor in graph.initializer:
-                if tensor.name == name:
-                    return tensor, graph
+            if gid not in indexes or indexes[gid].graph is not graph_path[gid]:
+                indexes[gid] = _InitializerIndex(graph_path[gid])
+            tensor = indexes[gid].get(name)
+            if tensor is not None:
+                return tensor, indexes[gid]
         return None, None
 
     @staticmethod
-    def __replace_gemm_with_matmul(graph_path):
+    def __replace_gemm_with_matmul(graph_path, indexes):
         new_nodes = []
         graph = graph_path[-1]
         for node in graph.node:
@@ -327,12 +392,12 @@ class ONNXModel:
                 for attr in node.attribute:
                     if attr.type == 5:
                         graph_path.append(attr.g)
-                        kv = {attr.name: ONNXModel.__replace_gemm_with_matmul(graph_path)}
+                        kv = {attr.name: ONNXModel.__replace_gemm_with_matmul(graph_path, indexes)}
                     elif attr.type == 10:
                         value = []
                         for subgraph in attr.graphs:
                             graph_path.append(subgraph)
-                            value.extend([ONNXModel.__replace_gemm_with_matmul(graph_path)])
+                            value.extend([ONNXModel.__replace_gemm_with_matmul(graph_path, indexes)])
                         kv = {attr.name: value}
                     else:
                         kv = attribute_to_kwarg(attr)
@@ -358,18 +423,18 @@ class ONNXModel:
                 if alpha == 1.0 and beta == 1.0 and transA == 0:
                     inputB = node.input[1]  # noqa: N806
                     if transB == 1:
-                        B, Bs_graph = ONNXModel.__get_initializer(node.input[1], graph_path)  # noqa: N806
+                        B, Bs_index = ONNXModel.__get_initializer(node.input[1], graph_path, indexes)  # noqa: N806
                         if B:
                             # assume B is not used by any other node
                             B_array = onnx_numpy_helper.to_array(B)  # noqa: N806
                             B_trans = onnx_numpy_helper.from_array(B_array.T)  # noqa: N806
                             B_trans.name = B.name
-                            Bs_graph.initializer.remove(B)
-                            for input in Bs_graph.input:
+                            Bs_index.remove(B)
+                            for input in Bs_index.graph.input:
                                 if input.name == inputB:
-                                    Bs_graph.input.remove(input)
+                                    Bs_index.graph.input.remove(input)
                                     break
-                            Bs_graph.initializer.extend([B_trans])
+                            Bs_index.add(B_trans)
                         else:
                             inputB += "_Transposed"  # noqa: N806
                             transpose_node = onnx_helper.make_node(
@@ -411,8 +476,8 @@ class ONNXModel:
         return graph
 
     def replace_gemm_with_matmul(self):
-        graph_path = [self.graph()]
-        ONNXModel.__replace_gemm_with_matmul(graph_path)
+        index = self._get_initializer_index()
+        ONNXModel.__replace_gemm_with_matmul([index.graph], {0: index})
 
     def save_model_to_file(self, output_path, use_external_data_format=False):
         """
@@ -550,6 +615,7 @@ class ONNXModel:
         self.graph().node.extend(sorted_nodes)
 
     def clean_initializers(self):
+        self.invalidate_initializer_index()
         return _clean_initializers_helper(self.graph(), self.model)
 
     def _check_init(self, init, test=None):
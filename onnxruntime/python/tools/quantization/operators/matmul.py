@@ -220,7 +220,7 @@ class QDQMatMul(QDQOperatorBase):
 
         for tensor_name in nodes_to_iterate:
             # only support per-channel quantization on weight
-            if self.quantizer.is_per_channel() and find_by_name(tensor_name, self.quantizer.model.initializer()):
+            if self.quantizer.is_per_channel() and self.quantizer.model.get_initializer(tensor_name):
                 channel_axis = self.quantizer.qdq_op_type_per_channel_support_to_axis.get(node.op_type, 1)
                 self.quantizer.quantize_weight_tensor_per_channel(tensor_name, channel_axis)
             else:
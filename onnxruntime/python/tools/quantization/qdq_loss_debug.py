@@ -32,13 +32,28 @@ Example Usage:
 `tensor_dict` points to a dictionary where the keys are tensor names and each value
 is a list of tensors, one from each model run
 
+For large models or long input sets, keeping the activations of every run in memory is
+not feasible. `compute_activation_error_streaming` runs the augmented float and QDQ
+models in lockstep and accumulates the error metrics batch by batch, optionally spilling
+the activations to an `ActivationStore`, which memory-maps them back:
+
+```python
+    modify_model_output_intermediate_tensors(float_model_path, augmented_float_model_path)
+    modify_model_output_intermediate_tensors(qdq_model_path, augmented_qdq_model_path)
+
+    errors = compute_activation_error_streaming(
+        augmented_float_model_path, augmented_qdq_model_path, input_data_reader
+    )
+    print(errors['activation1']['xmodel_err'])
+```
+
 """
 
 import logging
 import math
 import time
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Sequence, Union
+from typing import BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy
 import onnx
@@ -112,11 +127,91 @@ def modify_model_output_intermediate_tensors(
     )
 
 
+class ActivationStore:
+    """Spill activations to files in a directory, one file per tensor, and memory-map them back.
+
+    A store keeps no activation in memory, so activations of long input sets on large models
+    can be collected and compared tensor by tensor.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._paths: Dict[str, Path] = {}
+        self._files: Dict[str, BinaryIO] = {}
+        # tensor name -> (offset, shape, dtype) of each batch
+        self._batches: Dict[str, List[Tuple[int, Tuple[int, ...], numpy.dtype]]] = {}
+
+    def append(self, name: str, tensor: numpy.ndarray) -> None:
+        """Append the tensor of one batch to the activations of the tensor name."""
+        if name not in self._files:
+            # tensor names are not valid file names in general
+            self._paths[name] = self._directory / f"activation_{len(self._paths)}.bin"
+            self._files[name] = open(self._paths[name], "wb")  # noqa: SIM115
+            self._batches[name] = []
+        file = self._files[name]
+        tensor = numpy.ascontiguousarray(tensor)
+        self._batches[name].append((file.tell(), tensor.shape, tensor.dtype))
+        tensor.tofile(file)
+
+    def names(self) -> List[str]:
+        return list(self._batches)
+
+    def get(self, name: str) -> List[numpy.ndarray]:
+        """Return the read-only memory-mapped tensors of the tensor name, one from each batch."""
+        if not self._files[name].closed:
+            self._files[name].flush()
+        path = self._paths[name]
+        return [
+            (
+                numpy.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+                if numpy.prod(shape, dtype=numpy.int64) > 0
+                else numpy.empty(shape, dtype=dtype)
+            )
+            for offset, shape, dtype in self._batches[name]
+        ]
+
+    def activations(self) -> Dict[str, List[numpy.ndarray]]:
+        """Return the activations in the format of `collect_activations`."""
+        return {name: self.get(name) for name in self._batches}
+
+    def close(self) -> None:
+        for file in self._files.values():
+            file.close()
+
+
+def _create_inference_session(
+    augmented_model: str, session_options=None, execution_providers: Optional[Sequence[str]] = None
+) -> onnxruntime.InferenceSession:
+    if session_options is None:
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+    if execution_providers is None:
+        execution_providers = ["CPUExecutionProvider"]
+
+    return onnxruntime.InferenceSession(
+        augmented_model,
+        sess_options=session_options,
+        providers=execution_providers,
+    )
+
+
+def _run_batch(inference_session: onnxruntime.InferenceSession, input_d) -> Dict[str, numpy.ndarray]:
+    """Run augmented model on a batch, and return the saved activation of each tensor."""
+    batch = inference_session.run(None, input_d)
+    return {
+        output.name[:-_TENSOR_SAVE_POSTFIX_LEN]: output_data
+        for output, output_data in zip(inference_session.get_outputs(), batch)
+        if output.name.endswith(_TENSOR_SAVE_POSTFIX)
+    }
+
+
 def collect_activations(
     augmented_model: str,
     input_reader: CalibrationDataReader,
     session_options=None,
     execution_providers: Optional[Sequence[str]] = None,
+    activation_store: Optional[ActivationStore] = None,
 ) -> Dict[str, List[numpy.ndarray]]:
     """Run augmented model and collect activations tensors.
 
@@ -128,37 +223,30 @@ def collect_activations(
             By default graph optimization is turned off
         execution_providers: Collection of execution providers for running the model.
             Only CPU EP is used by default.
+        activation_store: Optional store that the activations of each batch are spilled to,
+            instead of being kept in memory.
 
     Returns:
-        A dictionary where the key is tensor name and values are list of tensors from each batch
+        A dictionary where the key is tensor name and values are list of tensors from each batch.
+        With activation_store, the tensors are memory-mapped from the store.
     """
 
-    if session_options is None:
-        session_options = onnxruntime.SessionOptions()
-        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
-    if execution_providers is None:
-        execution_providers = ["CPUExecutionProvider"]
-
-    inference_session = onnxruntime.InferenceSession(
-        augmented_model,
-        sess_options=session_options,
-        providers=execution_providers,
-    )
-
-    intermediate_outputs = []
-    for input_d in input_reader:
-        intermediate_outputs.append(inference_session.run(None, input_d))
-    if not intermediate_outputs:
-        raise RuntimeError("No data is collected while running augmented model!")
+    inference_session = _create_inference_session(augmented_model, session_options, execution_providers)
 
     output_dict = {}
-    output_info = inference_session.get_outputs()
-    for batch in intermediate_outputs:
-        for output, output_data in zip(output_info, batch):
-            if output.name.endswith(_TENSOR_SAVE_POSTFIX):
-                output_name = output.name[:-_TENSOR_SAVE_POSTFIX_LEN]
+    batch_count = 0
+    for input_d in input_reader:
+        for output_name, output_data in _run_batch(inference_session, input_d).items():
+            if activation_store is not None:
+                activation_store.append(output_name, output_data)
+            else:
                 output_dict.setdefault(output_name, []).append(output_data)
+        batch_count += 1
+    if batch_count == 0:
+        raise RuntimeError("No data is collected while running augmented model!")
 
+    if activation_store is not None:
+        return activation_store.activations()
     return output_dict
 
 
@@ -387,3 +475,109 @@ def compute_activation_error(
             err_result["xmodel_err"] = err_func(float_activation, match["post_qdq"])
         result[name] = err_result
     return result
+
+
+class ErrorAccumulator:
+    """Accumulate the error between two tensors batch by batch, without keeping the batches.
+
+    `sqnr()` of the accumulated batches equals `compute_signal_to_quantization_noice_ratio`
+    of the batches concatenated.
+    """
+
+    def __init__(self):
+        self.signal_power = 0.0
+        self.noise_power = 0.0
+        self.max_abs_error = 0.0
+        self.size = 0
+
+    def update(self, x: numpy.ndarray, y: numpy.ndarray) -> None:
+        left = numpy.asarray(x, dtype=numpy.float64).reshape(-1)
+        right = numpy.asarray(y, dtype=numpy.float64).reshape(-1)
+        diff = left - right
+        self.signal_power += float(numpy.dot(left, left))
+        self.noise_power += float(numpy.dot(diff, diff))
+        if diff.size > 0:
+            self.max_abs_error = max(self.max_abs_error, float(numpy.abs(diff).max()))
+        self.size += diff.size
+
+    def sqnr(self) -> float:
+        epsilon = numpy.finfo("float").eps
+        tensor_norm = max(math.sqrt(self.signal_power), epsilon)
+        diff_norm = max(math.sqrt(self.noise_power), epsilon)
+        return 20 * math.log10(tensor_norm / diff_norm)
+
+    def mse(self) -> float:
+        return self.noise_power / self.size if self.size > 0 else 0.0
+
+
+def compute_activation_error_streaming(
+    float_augmented_model: str,
+    qdq_augmented_model: str,
+    input_reader: CalibrationDataReader,
+    session_options=None,
+    execution_providers: Optional[Sequence[str]] = None,
+    float_activation_store: Optional[ActivationStore] = None,
+    qdq_activation_store: Optional[ActivationStore] = None,
+) -> Dict[str, Dict[str, float]]:
+    """Run the augmented float and QDQ models in lockstep and compute activation errors batch by batch.
+
+    Only the activations of the current batch are in memory, so this works with large models and
+    long input sets, where `collect_activations` followed by `compute_activation_error` does not.
+
+    Args:
+        float_augmented_model: Path to the float model augmented by modify_model_output_intermediate_tensors ()
+        qdq_augmented_model: Path to the QDQ model augmented by modify_model_output_intermediate_tensors ()
+        input_reader: Logic for reading input for the models. Both models are run on each input.
+        session_options: Optional OnnxRuntime session options for controlling model runs.
+            By default graph optimization is turned off
+        execution_providers: Collection of execution providers for running the models.
+            Only CPU EP is used by default.
+        float_activation_store: Optional store that the activations of the float model are spilled to.
+        qdq_activation_store: Optional store that the activations of the QDQ model are spilled to.
+
+    Returns:
+        Dict of activation errors like `compute_activation_error`: SQNR before vs after QDQ in
+        "qdq_err", and float model vs QDQ model in "xmodel_err". Mean squared errors and maximum
+        absolute errors are in "qdq_mse", "qdq_max_abs_err", "xmodel_mse" and "xmodel_max_abs_err".
+    """
+
+    float_session = _create_inference_session(float_augmented_model, session_options, execution_providers)
+    qdq_session = _create_inference_session(qdq_augmented_model, session_options, execution_providers)
+
+    qdq_errors: Dict[str, ErrorAccumulator] = {}
+    xmodel_errors: Dict[str, ErrorAccumulator] = {}
+    batch_count = 0
+    for input_d in input_reader:
+        float_activations = _run_batch(float_session, input_d)
+        qdq_activations = _run_batch(qdq_session, input_d)
+        stores = [(float_activation_store, float_activations), (qdq_activation_store, qdq_activations)]
+        for store, activations in stores:
+            if store is not None:
+                for name, tensor in activations.items():
+                    store.append(name, tensor)
+
+        activations_match = create_activation_matching(
+            {name: [tensor] for name, tensor in qdq_activations.items()},
+            {name: [tensor] for name, tensor in float_activations.items()},
+        )
+        for name, match in activations_match.items():
+            qdq_errors.setdefault(name, ErrorAccumulator()).update(match["pre_qdq"][0], match["post_qdq"][0])
+            if "float" in match:
+                xmodel_errors.setdefault(name, ErrorAccumulator()).update(match["float"][0], match["post_qdq"][0])
+        batch_count += 1
+    if batch_count == 0:
+        raise RuntimeError("No data is collected while running augmented models!")
+
+    result: Dict[str, Dict[str, float]] = {}
+    for name, qdq_error in qdq_errors.items():
+        err_result: Dict[str, float] = {}
+        err_result["qdq_err"] = qdq_error.sqnr()
+        err_result["qdq_mse"] = qdq_error.mse()
+        err_result["qdq_max_abs_err"] = qdq_error.max_abs_error
+        xmodel_error = xmodel_errors.get(name)
+        if xmodel_error is not None:
+            err_result["xmodel_err"] = xmodel_error.sqnr()
+            err_result["xmodel_mse"] = xmodel_error.mse()
+            err_result["xmodel_max_abs_err"] = xmodel_error.max_abs_error
+        result[name] = err_result
+    return result
@@ -384,8 +384,21 @@ def quantize_static(
                     when CalibMovingAverage is set to True.
                 CalibMaxIntermediateOutputs = Optional[int] :
                     Default is None. If set to an integer, during calculation of the min-max range of the tensors
-                    it will load at max value number of outputs before computing and merging the range. This will
-                    produce the same result as all computing with None, but is more memory efficient.
+                    it will load at max value number of outputs before computing and merging the range, which is
+                    more memory efficient. The min-max range is the same as with None, except with
+                    CalibMovingAverage where the averages of the chunks are merged with the averaging constant.
+                    For the Entropy, Percentile and Distribution methods, histograms are updated after every
+                    value number of outputs, so that memory usage does not grow with the number of samples. The
+                    histograms are re-binned when a later chunk has a wider range, so they could be slightly
+                    different.
+                CalibNumSessions = int :
+                    Default is 1. Number of inference sessions that run calibration data in parallel threads. Each
+                    session computes the range or histograms of its share of data, then they are merged. The range
+                    of MinMax is the same as using one session (moving average always uses one session), while
+                    histograms are merged by re-binning, so the results could be slightly different.
+                CalibNumProcesses = int :
+                    Default is 1. Number of processes to compute the thresholds of tensors in parallel for the
+                    Entropy method. The thresholds are the same as using one process.
                 SmoothQuant = True/False :
                     Default is False. If enabled, SmoothQuant algorithm will be applied before quantization to do
                     fake input channel quantization.
@@ -458,6 +471,8 @@ def quantize_static(
         ("CalibMovingAverage", "moving_average"),
         ("CalibMovingAverageConstant", "averaging_constant"),
         ("CalibMaxIntermediateOutputs", "max_intermediate_outputs"),
+        ("CalibNumSessions", "num_sessions"),
+        ("CalibNumProcesses", "num_processes"),
     ]
     calib_extra_options = {
         key: extra_options.get(name) for (name, key) in calib_extra_options_keys if name in extra_options
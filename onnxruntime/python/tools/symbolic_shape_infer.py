@@ -3,6 +3,7 @@
 
 # -*- coding: UTF-8 -*-
 import argparse
+import copy
 import logging
 
 import numpy as np
@@ -123,7 +124,7 @@ def sympy_reduce_product(x):
 
 
 class SymbolicShapeInference:
-    def __init__(self, int_max, auto_merge, guess_output_rank, verbose, prefix=""):
+    def __init__(self, int_max, auto_merge, guess_output_rank, verbose, prefix="", fast=False):
         self.dispatcher_ = {
             "Add": self._infer_symbolic_compute_ops,
             "ArrayFeatureExtractor": self._infer_ArrayFeatureExtractor,
@@ -254,6 +255,16 @@ class SymbolicShapeInference:
         self.int_max_ = int_max
         self.subgraph_id_ = 0
         self.prefix_ = prefix
+        # In fast mode, ONNX shape inference runs once for each run of consecutive standard ops that are not handled by
+        # symbolic shape inference, and results of single node inference are cached by node signature.
+        # Inferred output types and sympy data of a node are also replayed for following nodes with the same signature,
+        # like nodes in repeated layers of transformers.
+        self.fast_ = fast
+        self.onnx_infer_cache_ = {}
+        self.onnx_infer_results_ = {}
+        self.node_memo_ = {}
+        self.initializer_signatures_ = {}
+        self.num_new_symbolic_dim_requests_ = 0
 
     def _add_suggested_merge(self, symbols, apply=False):
         assert all([(type(s) == str and s in self.symbolic_dims_) or is_literal(s) for s in symbols])  # noqa: E721
@@ -443,9 +454,9 @@ class SymbolicShapeInference:
                     if str(new_dim) not in self.symbolic_dims_:
                         self.symbolic_dims_[str(new_dim)] = new_dim
 
-    def _onnx_infer_single_node(self, node):
+    def _skip_onnx_infer(self, node):
         # skip onnx shape inference for some ops, as they are handled in _infer_*
-        skip_infer = node.op_type in [
+        return node.op_type in [
             "If",
             "Loop",
             "Scan",
@@ -481,6 +492,9 @@ class SymbolicShapeInference:
             "RotaryEmbedding",
         ]
 
+    def _onnx_infer_single_node(self, node):
+        skip_infer = self._skip_onnx_infer(node)
+
         if not skip_infer:
             # Only pass initializers that satisfy the following condition:
             # (1) Operator need value of some input for shape inference.
@@ -517,29 +531,193 @@ class SymbolicShapeInference:
                         if len(in_dims) > 1:
                             self._check_merged_dims(in_dims, allow_broadcast=True)
 
-            # run single node inference with self.known_vi_ shapes
-            tmp_graph = helper.make_graph(
-                [node],
-                "tmp",
-                [self.known_vi_[i] for i in node.input if i],
-                [make_named_value_info(i) for i in node.output],
-                initializers,
-            )
+            output_types = None
+            cache_key = None
+            if self.fast_:
+                if all(o in self.onnx_infer_results_ for o in node.output if o):
+                    output_types = [self.onnx_infer_results_.pop(o) if o else None for o in node.output]
+                elif not initializers:
+                    cache_key = self._get_onnx_infer_cache_key(node)
+                    output_types = self.onnx_infer_cache_.get(cache_key)
+
+            if output_types is None:
+                # run single node inference with self.known_vi_ shapes
+                tmp_graph = helper.make_graph(
+                    [node],
+                    "tmp",
+                    [self.known_vi_[i] for i in node.input if i],
+                    [make_named_value_info(i) for i in node.output],
+                    initializers,
+                )
 
-            self.tmp_mp_.graph.CopyFrom(tmp_graph)
+                self.tmp_mp_.graph.CopyFrom(tmp_graph)
 
-            self.tmp_mp_ = shape_inference.infer_shapes(self.tmp_mp_)
+                self.tmp_mp_ = shape_inference.infer_shapes(self.tmp_mp_)
+                output_types = [o.type for o in self.tmp_mp_.graph.output]
+                if cache_key is not None:
+                    self.onnx_infer_cache_[cache_key] = [
+                        onnx.TypeProto.FromString(t.SerializeToString()) for t in output_types
+                    ]
 
         for i_o in range(len(node.output)):
             o = node.output[i_o]
             if o:  # skip optional output
                 vi = self.out_mp_.graph.value_info.add()
+                vi.name = o
                 if not skip_infer:
-                    vi.CopyFrom(self.tmp_mp_.graph.output[i_o])
-                else:
-                    vi.name = o
+                    vi.type.CopyFrom(output_types[i_o])
                 self.known_vi_[o] = vi
 
+    def _get_onnx_infer_cache_key(self, node):
+        # ONNX shape inference of a node only depends on the op, its attributes and the types of its inputs
+        return (
+            node.domain,
+            node.op_type,
+            tuple(attr.SerializeToString() for attr in node.attribute),
+            tuple(self.known_vi_[i].type.SerializeToString() if i else b"" for i in node.input),
+            tuple(bool(o) for o in node.output),
+        )
+
+    def _get_value_signature(self, value):
+        if isinstance(value, np.ndarray):
+            return (str(value.dtype), value.shape, value.tobytes())
+        if isinstance(value, (list, tuple)):
+            return tuple(self._get_value_signature(v) for v in value)
+        return str(value)
+
+    def _get_initializer_signature(self, name):
+        # Symbolic shape inference only reads values of small initializers like shape or axes,
+        # so the value of large initializers (like weights) is not part of signature.
+        if name not in self.initializer_signatures_:
+            tensor = self.initializers_[name]
+            signature = (tensor.data_type, tuple(tensor.dims))
+            if int(np.prod(tensor.dims)) <= 1024:
+                signature += (self._get_value_signature(numpy_helper.to_array(tensor)),)
+            self.initializer_signatures_[name] = signature
+        return self.initializer_signatures_[name]
+
+    def _get_node_memo_key(self, node):
+        """Returns signature of node for looking up the result of a previous node, or None if the node cannot be
+        replayed. The signature contains op, attributes, and types and known values of inputs.
+        """
+        if any(attr.type in [onnx.AttributeProto.GRAPH, onnx.AttributeProto.GRAPHS] for attr in node.attribute):
+            return None
+
+        inputs = []
+        has_unknown_value = False
+        for name in node.input:
+            if not name:
+                inputs.append(None)
+                continue
+            if name in self.sympy_data_:
+                value = self._get_value_signature(self.sympy_data_[name])
+            elif name in self.initializers_:
+                value = self._get_initializer_signature(name)
+            else:
+                value = None
+                has_unknown_value = True
+            inputs.append((self.known_vi_[name].type.SerializeToString(), value))
+
+        # Nodes with all inputs known are computed on values, which are seldom repeated.
+        if not has_unknown_value:
+            return None
+
+        return (
+            node.domain,
+            node.op_type,
+            tuple(attr.SerializeToString() for attr in node.attribute),
+            tuple(inputs),
+            tuple(bool(o) for o in node.output),
+        )
+
+    def _memoize_node(self, memo_key, node):
+        outputs = []
+        for o in node.output:
+            if not o:
+                continue
+            vi = self.known_vi_[o]
+            out_shape = get_shape_from_value_info(vi)
+            if (
+                vi.type.WhichOneof("value") == "tensor_type"
+                and vi.type.tensor_type.elem_type == onnx.TensorProto.UNDEFINED
+            ) or (out_shape is not None and (None in out_shape or self._is_shape_contains_none_dim(out_shape))):
+                return  # incomplete shape could be merged or guessed in next run
+            out_type = onnx.TypeProto.FromString(vi.type.SerializeToString())
+            outputs.append((out_type, copy.deepcopy(self.sympy_data_.get(o))))
+        self.node_memo_[memo_key] = outputs
+
+    def _replay_node(self, node, outputs):
+        if self.verbose_ > 2:
+            logger.debug(f"Replay inferred result of {node.op_type}: {node.name}")
+        out_names = [o for o in node.output if o]
+        for o, (out_type, sympy_data) in zip(out_names, outputs):
+            vi = self.out_mp_.graph.value_info.add()
+            vi.name = o
+            vi.type.CopyFrom(out_type)
+            self.known_vi_[o] = vi
+            if sympy_data is not None:
+                self.sympy_data_[o] = copy.deepcopy(sympy_data)
+            self.onnx_infer_results_.pop(o, None)
+
+    def _is_onnx_infer_batchable(self, node):
+        # Nodes in a batch shall only get shape from ONNX shape inference, and do not need check or merge of dims
+        return (
+            node.domain in ["", "ai.onnx"]
+            and node.op_type not in self.dispatcher_
+            and node.op_type not in ["ConvTranspose", "MatMulInteger", "Sum"]
+            and not self._skip_onnx_infer(node)
+            and not any(attr.type in [onnx.AttributeProto.GRAPH, onnx.AttributeProto.GRAPHS] for attr in node.attribute)
+        )
+
+    def _onnx_infer_batch(self, sorted_nodes, start):
+        """Run ONNX shape inference once for consecutive batchable nodes from sorted_nodes[start], and store the
+        output types in self.onnx_infer_results_ for _onnx_infer_single_node to use.
+        """
+        end = start
+        while end < len(sorted_nodes) and self._is_onnx_infer_batchable(sorted_nodes[end]):
+            end += 1
+        if end - start < 2:
+            return
+
+        batch = sorted_nodes[start:end]
+        batch_outputs = [o for node in batch for o in node.output if o]
+        produced = set(batch_outputs)
+        batch_inputs = []
+        for node in batch:
+            for i in node.input:
+                if i and i not in produced and i not in batch_inputs:
+                    batch_inputs.append(i)
+
+        tmp_graph = helper.make_graph(
+            list(batch),
+            "tmp",
+            [self.known_vi_[i] for i in batch_inputs],
+            [make_named_value_info(o) for o in batch_outputs],
+        )
+        self.tmp_mp_.graph.CopyFrom(tmp_graph)
+        self.tmp_mp_ = shape_inference.infer_shapes(self.tmp_mp_)
+        output_types = {o.name: o.type for o in self.tmp_mp_.graph.output}
+
+        # Incomplete shape could be changed by merge or guess in _infer_impl, which affects the following nodes.
+        # Only keep results up to the first node that has incomplete output shape.
+        for node in batch:
+            complete = True
+            for o in node.output:
+                if not o:
+                    continue
+                self.onnx_infer_results_[o] = output_types[o]
+                vi = helper.make_value_info(o, output_types[o])
+                out_shape = get_shape_from_value_info(vi)
+                if (
+                    output_types[o].tensor_type.elem_type == onnx.TensorProto.UNDEFINED
+                    or out_shape is None
+                    or None in out_shape
+                    or self._is_shape_contains_none_dim(out_shape)
+                ):
+                    complete = False
+            if not complete:
+                break
+
     def _onnx_infer_subgraph(self, node, subgraph, use_node_input=True, inc_subgraph_id=True):
         if self.verbose_ > 2:
             logger.debug(f"Inferencing subgraph of node {node.name} with output({node.output[0]}...): {node.op_type}")
@@ -565,6 +743,7 @@ class SymbolicShapeInference:
             self.guess_output_rank_,
             self.verbose_,
             prefix=self.prefix_ + "_" + str(self.subgraph_id_),
+            fast=self.fast_,
         )
         if inc_subgraph_id:
             self.subgraph_id_ += 1
@@ -671,6 +850,7 @@ class SymbolicShapeInference:
         )
 
     def _new_symbolic_dim(self, prefix, dim):
+        self.num_new_symbolic_dim_requests_ += 1
         new_dim = f"{prefix}_d{dim}"
         if new_dim in self.suggested_merge_:
             v = self.suggested_merge_[new_dim]
@@ -2657,8 +2837,19 @@ class SymbolicShapeInference:
                 ):
                     raise Exception("Invalid model with cyclic graph")
 
-        for node in sorted_nodes:
+        self.onnx_infer_results_ = {}
+        self.node_memo_ = {}
+        for i_node, node in enumerate(sorted_nodes):
             assert all([i in self.known_vi_ for i in node.input if i])
+            memo_key = self._get_node_memo_key(node) if self.fast_ else None
+            if memo_key is not None and memo_key in self.node_memo_:
+                self._replay_node(node, self.node_memo_[memo_key])
+                continue
+            if self.fast_:
+                num_new_symbolic_dim_requests = self.num_new_symbolic_dim_requests_
+                suggested_merge = self.suggested_merge_.copy()
+            if self.fast_ and not any(o in self.onnx_infer_results_ for o in node.output):
+                self._onnx_infer_batch(sorted_nodes, i_node)
             self._onnx_infer_single_node(node)
             known_aten_op = False
             if node.op_type in self.dispatcher_:
@@ -2880,6 +3071,15 @@ class SymbolicShapeInference:
                             logger.debug("Merging: " + str(self.suggested_merge_))  # noqa: G003
                     return False
 
+            if self.fast_:
+                if self.suggested_merge_ != suggested_merge:
+                    # merged dims make the results of previous nodes stale
+                    self.node_memo_ = {}
+                elif memo_key is not None and self.num_new_symbolic_dim_requests_ == num_new_symbolic_dim_requests:
+                    # Nodes asking for new dims are data dependent, and the dims are named after the node. They might
+                    # be merged to existing dims in a rerun, so the result cannot be replayed for other nodes.
+                    self._memoize_node(memo_key, node)
+
         self.run_ = False
         return True
 
@@ -2889,12 +3089,12 @@ class SymbolicShapeInference:
                 output.CopyFrom(self.known_vi_[output.name])
 
     @staticmethod
-    def infer_shapes(in_mp, int_max=2**31 - 1, auto_merge=False, guess_output_rank=False, verbose=0):
+    def infer_shapes(in_mp, int_max=2**31 - 1, auto_merge=False, guess_output_rank=False, verbose=0, fast=False):
         onnx_opset = get_opset(in_mp)
         if (not onnx_opset) or onnx_opset < 7:
             logger.warning("Only support models of onnx opset 7 and above.")
             return None
-        symbolic_shape_inference = SymbolicShapeInference(int_max, auto_merge, guess_output_rank, verbose)
+        symbolic_shape_inference = SymbolicShapeInference(int_max, auto_merge, guess_output_rank, verbose, fast=fast)
         all_shapes_inferred = False
         symbolic_shape_inference._preprocess(in_mp)
         while symbolic_shape_inference.run_:
@@ -2934,6 +3134,12 @@ def parse_arguments():
         type=int,
         default=0,
     )
+    parser.add_argument(
+        "--fast",
+        help="Run ONNX shape inference on runs of standard ops at once, and cache results of identical nodes",
+        action="store_true",
+        default=False,
+    )
     parser.add_argument(
         "--save_as_external_data",
         help="Saving an ONNX model to external data",
@@ -2972,6 +3178,7 @@ if __name__ == "__main__":
         args.auto_merge,
         args.guess_output_rank,
         args.verbose,
+        args.fast,
     )
     if args.output and out_mp:
         if args.save_as_external_data:
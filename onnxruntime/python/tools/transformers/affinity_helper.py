@@ -4,11 +4,17 @@
 # --------------------------------------------------------------------------
 
 # Get/Set cpu affinity. Currently only support part of Unix system
+import glob
 import logging
 import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
 
 logger = logging.getLogger(__name__)
 
+_SYSFS_CPU = "/sys/devices/system/cpu"
+_SYSFS_NODE = "/sys/devices/system/node"
+
 
 class AffinitySetting:
     def __init__(self):
@@ -22,7 +28,10 @@ class AffinitySetting:
         if self.is_os_supported:
             self.affinity = os.sched_getaffinity(self.pid)
 
-    def set_affinity(self):
+    def set_affinity(self, affinity: Optional[Set[int]] = None):
+        """Restore the affinity saved by get_affinity(), or pin the process to the given logical CPUs."""
+        if affinity is not None:
+            self.affinity = set(affinity)
         if self.is_os_supported:
             current_affinity = os.sched_getaffinity(self.pid)
             if self.affinity != current_affinity:
@@ -34,6 +43,119 @@ class AffinitySetting:
                 os.sched_setaffinity(self.pid, self.affinity)
 
 
+@dataclass
+class CpuCore:
+    """A physical core, with the logical CPUs of its hardware threads."""
+
+    socket: int
+    numa_node: int
+    core_id: int
+    cpus: List[int]
+
+
+def parse_cpu_list(cpu_list: str) -> List[int]:
+    """Parse a list of CPUs in the format of sysfs and cgroups, like "0-3,8,10-11\"."""
+    cpus = []
+    for cpu_range in cpu_list.strip().split(","):
+        if not cpu_range:
+            continue
+        first, _, last = cpu_range.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def _read_int(path: str, default: int) -> int:
+    try:
+        with open(path) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return default
+
+
+def get_cpu_topology() -> List[CpuCore]:
+    """Return the physical cores the process may run on, ordered by socket, NUMA node and core id.
+
+    The topology is read from sysfs. When it is not available, each logical CPU is reported as a core of a single
+    socket and NUMA node.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        allowed = sorted(os.sched_getaffinity(0))
+    else:
+        allowed = list(range(os.cpu_count() or 1))
+
+    cpu_nodes: Dict[int, int] = {}
+    for node_path in glob.glob(os.path.join(_SYSFS_NODE, "node[0-9]*")):
+        node = int(os.path.basename(node_path)[len("node") :])
+        try:
+            with open(os.path.join(node_path, "cpulist")) as f:
+                cpu_nodes.update((cpu, node) for cpu in parse_cpu_list(f.read()))
+        except OSError:
+            continue
+
+    cores: Dict[tuple, CpuCore] = {}
+    for cpu in allowed:
+        topology = os.path.join(_SYSFS_CPU, f"cpu{cpu}", "topology")
+        socket = _read_int(os.path.join(topology, "physical_package_id"), 0)
+        # Without topology, hardware threads cannot be told apart: the CPU is its own core.
+        core_id = _read_int(os.path.join(topology, "core_id"), -1 - cpu)
+        key = (socket, core_id)
+        if key in cores:
+            cores[key].cpus.append(cpu)
+        else:
+            cores[key] = CpuCore(socket, cpu_nodes.get(cpu, 0), core_id, [cpu])
+    return sorted(cores.values(), key=lambda core: (core.socket, core.numa_node, core.cpus[0]))
+
+
+def plan_placement(
+    num_processes: int,
+    threads_per_process: Optional[int] = None,
+    cores: Optional[List[CpuCore]] = None,
+    use_hyperthreads: bool = False,
+) -> List[List[int]]:
+    """Split physical cores into disjoint sets of threads_per_process cores, one per process.
+
+    Processes are spread over the NUMA nodes in turn, and each set of cores is taken from a single NUMA node when
+    it fits, so that a process does not access the memory of another node. By default threads_per_process is the
+    number of cores divided by the number of processes. Returns the logical CPUs of each process: the first
+    hardware thread of its cores, or all of them with use_hyperthreads.
+    """
+    if num_processes < 1:
+        raise ValueError(f"num_processes must be positive, got {num_processes}.")
+    if cores is None:
+        cores = get_cpu_topology()
+    if threads_per_process is None:
+        threads_per_process = len(cores) // num_processes
+    if threads_per_process < 1 or num_processes * threads_per_process > len(cores):
+        raise ValueError(
+            f"Cannot place {num_processes} processes of {threads_per_process} threads on {len(cores)} cores."
+        )
+
+    node_cores: Dict[int, List[CpuCore]] = {}
+    for core in cores:
+        node_cores.setdefault(core.numa_node, []).append(core)
+    placements = []
+    leftover = []
+    while len(placements) < num_processes:
+        placed = False
+        for node in sorted(node_cores):
+            if len(placements) < num_processes and len(node_cores[node]) >= threads_per_process:
+                placements.append(node_cores[node][:threads_per_process])
+                node_cores[node] = node_cores[node][threads_per_process:]
+                placed = True
+        if not placed:
+            # The remaining processes span NUMA nodes.
+            for node in sorted(node_cores):
+                leftover.extend(node_cores.pop(node))
+            while len(placements) < num_processes:
+                placements.append(leftover[:threads_per_process])
+                leftover = leftover[threads_per_process:]
+
+    return [
+        [cpu for core in placement for cpu in (core.cpus if use_hyperthreads else core.cpus[:1])]
+        for placement in placements
+    ]
+
+
 if __name__ == "__main__":
     affi_helper = AffinitySetting()
     affi_helper.get_affinity()
@@ -5,23 +5,30 @@
 # --------------------------------------------------------------------------
 
 import csv
+import itertools
 import logging
+import math
+import multiprocessing
 import os
+import queue
 import random
+import statistics
 import sys
+import threading
 import time
 import timeit
 from abc import ABC, abstractmethod
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from enum import Enum
 from time import sleep
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import coloredlogs
 import numpy
 import torch
 import transformers
+from affinity_helper import AffinitySetting, get_cpu_topology, plan_placement
 from packaging import version
 
 import onnxruntime
@@ -393,6 +400,466 @@ def allocateOutputBuffers(output_buffers, output_buffer_max_sizes, device):  # n
         output_buffers.append(torch.empty(i, dtype=torch.float32, device=device))
 
 
+class LatencyHistogram:
+    """Histogram of latencies in buckets of bounded relative width, like HdrHistogram.
+
+    Latencies are recorded in nanoseconds. The 2 * 10**significant_figures smallest values have a bucket each, and
+    larger values share buckets whose width is at most 1 / 10**significant_figures of their value, so that percentiles
+    keep that many significant figures at any scale. Recording is a few integer operations, and the memory only
+    depends on the largest latency, not on the number of latencies.
+    """
+
+    def __init__(self, significant_figures: int = 2):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError(f"significant_figures must be between 1 and 5, got {significant_figures}")
+        self.significant_figures = significant_figures
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10**significant_figures))
+        self._half_bucket_count = 1 << (self._sub_bucket_bits - 1)
+        self._counts = [0] * (2 * self._half_bucket_count)
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = 0
+        self.max_ns = 0
+
+    @classmethod
+    def from_latencies(cls, latency_list: Sequence[float], significant_figures: int = 2) -> "LatencyHistogram":
+        """Create a histogram from latencies in seconds, like the ones returned by timeit.repeat."""
+        histogram = cls(significant_figures)
+        for latency in latency_list:
+            histogram.record(round(latency * 1e9))
+        return histogram
+
+    def _index(self, value_ns: int) -> int:
+        # Values of b bits, with b larger than the sub bucket bits, are counted by their top sub bucket bits.
+        # The top bits are at least half the sub bucket count, so each magnitude uses the next half of the buckets.
+        shift = value_ns.bit_length() - self._sub_bucket_bits
+        if shift <= 0:
+            return value_ns
+        return (shift << (self._sub_bucket_bits - 1)) + (value_ns >> shift)
+
+    def _bucket_range(self, index: int) -> Tuple[int, int]:
+        shift = index // self._half_bucket_count - 1
+        if shift <= 0:
+            return index, index
+        top = index - shift * self._half_bucket_count
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, latency_ns: int):
+        latency_ns = max(0, int(latency_ns))
+        index = self._index(latency_ns)
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += 1
+        if self.count == 0 or latency_ns < self.min_ns:
+            self.min_ns = latency_ns
+        self.max_ns = max(self.max_ns, latency_ns)
+        self.count += 1
+        self.total_ns += latency_ns
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add the latencies of another histogram, e.g. of another thread or process."""
+        if other.significant_figures != self.significant_figures:
+            raise ValueError("Histograms with different significant figures cannot be merged.")
+        if other.count == 0:
+            return
+        if len(other._counts) > len(self._counts):
+            self._counts.extend([0] * (len(other._counts) - len(self._counts)))
+        for index, count in enumerate(other._counts):
+            self._counts[index] += count
+        self.min_ns = other.min_ns if self.count == 0 else min(self.min_ns, other.min_ns)
+        self.max_ns = max(self.max_ns, other.max_ns)
+        self.count += other.count
+        self.total_ns += other.total_ns
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ns / self.count / 1e6 if self.count else 0.0
+
+    def percentiles(self, percentiles: Sequence[float]) -> List[float]:
+        """Return the latencies in milliseconds at the given percentiles, between 0 and 100."""
+        if self.count == 0:
+            return [0.0] * len(percentiles)
+        ranks = numpy.clip(numpy.ceil(numpy.asarray(percentiles, dtype=numpy.float64) / 100 * self.count), 1, None)
+        indices = numpy.searchsorted(numpy.cumsum(self._counts), ranks)
+        latencies = []
+        for rank, index in zip(ranks.tolist(), indices.tolist()):
+            if rank >= self.count:
+                latency_ns = self.max_ns
+            elif rank == 1:
+                latency_ns = self.min_ns
+            else:
+                low, high = self._bucket_range(index)
+                # The middle of the bucket, within the exact min and max.
+                latency_ns = min(max((low + high) / 2, self.min_ns), self.max_ns)
+            latencies.append(latency_ns / 1e6)
+        return latencies
+
+    def percentile(self, percentile: float) -> float:
+        return self.percentiles([percentile])[0]
+
+    def percentile_curve(self, ticks_per_half_distance: int = 5) -> List[Tuple[float, float]]:
+        """Return (percentile, latency in milliseconds) pairs for the whole distribution.
+
+        As in the percentile distribution of HdrHistogram, ticks are denser towards 100: there are
+        ticks_per_half_distance ticks between 0 and 50, 50 and 75, 75 and 87.5, and so on, until the remaining
+        distance to 100 is less than one latency.
+        """
+        percentiles = []
+        tick = 0
+        while self.count and 0.5 ** (tick / ticks_per_half_distance) * self.count >= 1:
+            percentiles.append(100 * (1 - 0.5 ** (tick / ticks_per_half_distance)))
+            tick += 1
+        percentiles.append(100.0)
+        return list(zip(percentiles, self.percentiles(percentiles)))
+
+
+_WARMUP, _MEASURE, _STOP = range(3)
+
+
+class LoadBenchmarkResult:
+    """Latencies of the requests of a load benchmark, after its warmup."""
+
+    def __init__(
+        self,
+        histogram: LatencyHistogram,
+        duration_s: float,
+        warmup_s: float,
+        steady_state: bool,
+        concurrency: int,
+        target_qps: Optional[float],
+        num_processes: int = 1,
+        throughput_qps: Optional[float] = None,
+        intra_op_num_threads: Optional[int] = None,
+    ):
+        self.histogram = histogram
+        self.duration_s = duration_s
+        self.warmup_s = warmup_s
+        # False if the latencies were still changing at the end of the warmup
+        self.steady_state = steady_state
+        self.concurrency = concurrency
+        self.target_qps = target_qps
+        self.num_processes = num_processes
+        self.intra_op_num_threads = intra_op_num_threads
+        self.throughput_qps = histogram.count / duration_s if throughput_qps is None else throughput_qps
+
+    @classmethod
+    def merge(cls, results: Sequence["LoadBenchmarkResult"]) -> "LoadBenchmarkResult":
+        """Combine the results of processes that ran at the same time."""
+        histogram = LatencyHistogram(results[0].histogram.significant_figures)
+        for result in results:
+            histogram.merge(result.histogram)
+        return cls(
+            histogram,
+            duration_s=max(result.duration_s for result in results),
+            warmup_s=max(result.warmup_s for result in results),
+            steady_state=all(result.steady_state for result in results),
+            concurrency=sum(result.concurrency for result in results),
+            target_qps=sum(result.target_qps for result in results) if results[0].target_qps else None,
+            num_processes=sum(result.num_processes for result in results),
+            throughput_qps=sum(result.throughput_qps for result in results),
+            intra_op_num_threads=results[0].intra_op_num_threads,
+        )
+
+    def to_benchmark_record(
+        self,
+        model_name: str,
+        precision: str,
+        device: str,
+        batch_size: int = 1,
+        backend: str = "onnxruntime",
+        package_name: str = "onnxruntime",
+        package_version: Optional[str] = None,
+    ):
+        """Return a BenchmarkRecord of metrics.py, with the percentile curve in its customized metrics."""
+        from metrics import BenchmarkRecord
+
+        record = BenchmarkRecord(
+            model_name,
+            precision,
+            backend,
+            device,
+            package_name,
+            package_version or onnxruntime.__version__,
+            batch_size=batch_size,
+            measured_runs=self.histogram.count,
+        )
+        record.config.customized["concurrency"] = self.concurrency
+        record.config.customized["target_qps"] = self.target_qps
+        record.config.customized["num_processes"] = self.num_processes
+        record.config.customized["intra_op_num_threads"] = self.intra_op_num_threads
+        record.config.customized["warmup_s"] = self.warmup_s
+        record.config.customized["steady_state"] = self.steady_state
+        record.metrics.latency_ms_mean = self.histogram.mean_ms
+        record.metrics.throughput_qps = self.throughput_qps
+        percentiles = [50, 90, 95, 99, 99.9, 99.99]
+        for percentile, latency in zip(percentiles, self.histogram.percentiles(percentiles)):
+            record.metrics.customized[f"latency_ms_p{percentile:g}"] = latency
+        record.metrics.customized["latency_ms_max"] = self.histogram.max_ns / 1e6
+        record.metrics.customized["throughput_samples_per_s"] = self.throughput_qps * batch_size
+        record.metrics.customized["latency_ms_percentile_curve"] = self.histogram.percentile_curve()
+        return record
+
+
+class _LoadGenerator:
+    """Runs requests from worker threads, back to back (closed loop) or at a fixed rate (open loop)."""
+
+    def __init__(self, run_fn: Callable[[], Any], concurrency: int, target_qps: Optional[float], significant_figures):
+        self.run_fn = run_fn
+        self.concurrency = concurrency
+        self.target_qps = target_qps
+        self.phase = _WARMUP
+        self.error = None
+        self.start_ns = self.measure_start_ns = self.measure_end_ns = 0
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._next_request = 0
+        # Latencies of each worker in the current warmup window, and after the warmup.
+        self._windows = [[] for _ in range(concurrency)]
+        self._histograms = [LatencyHistogram(significant_figures) for _ in range(concurrency)]
+
+    def _stop(self):
+        self.phase = _STOP
+        self._stopped.set()
+
+    def _work(self, worker: int):
+        histogram = self._histograms[worker]
+        try:
+            while self.phase != _STOP:
+                if self.target_qps:
+                    with self._lock:
+                        request = self._next_request
+                        self._next_request += 1
+                    # The latency is measured from the scheduled time: when all the workers are busy, the time the
+                    # request would have waited is part of its latency (no coordinated omission).
+                    start = self.start_ns + round(request * 1e9 / self.target_qps)
+                    delay = start - time.perf_counter_ns()
+                    if delay > 0 and self._stopped.wait(delay / 1e9):
+                        break
+                else:
+                    start = time.perf_counter_ns()
+                self.run_fn()
+                latency = time.perf_counter_ns() - start
+                phase = self.phase
+                if phase == _WARMUP:
+                    self._windows[worker].append(latency)
+                elif start >= self.measure_start_ns and (phase == _MEASURE or start < self.measure_end_ns):
+                    histogram.record(latency)
+        except Exception as e:
+            self.error = e
+            self._stop()
+
+    def _warm_up(self, max_warmup_s: float, window_s: float, tolerance: float, stable_windows: int) -> bool:
+        """Wait until the median latency of stable_windows consecutive windows changes by at most the tolerance."""
+        deadline = time.perf_counter() + max_warmup_s
+        window = []
+        previous_median = None
+        stable = 0
+        while time.perf_counter() < deadline:
+            if self._stopped.wait(window_s):
+                return False
+            for worker in range(self.concurrency):
+                # A latency appended between these two statements is lost, which does not matter for the warmup.
+                latencies, self._windows[worker] = self._windows[worker], []
+                window.extend(latencies)
+            if not window:
+                # No request completed yet: extend the window.
+                continue
+            median = statistics.median(window)
+            window = []
+            if previous_median is not None and abs(median - previous_median) <= tolerance * previous_median:
+                stable += 1
+                if stable >= stable_windows:
+                    return True
+            else:
+                stable = 0
+            previous_median = median
+        return False
+
+    def run(self, duration_s, max_warmup_s, window_s, tolerance, stable_windows) -> LoadBenchmarkResult:
+        threads = [threading.Thread(target=self._work, args=(i,), daemon=True) for i in range(self.concurrency)]
+        self.start_ns = time.perf_counter_ns()
+        for thread in threads:
+            thread.start()
+        try:
+            steady_state = self._warm_up(max_warmup_s, window_s, tolerance, stable_windows)
+            if not steady_state and self.error is None:
+                logger.warning(f"Latency is not steady after {max_warmup_s}s of warmup.")
+            self.measure_start_ns = time.perf_counter_ns()
+            self.phase = _MEASURE
+            self._stopped.wait(duration_s)
+            self.measure_end_ns = time.perf_counter_ns()
+        finally:
+            self._stop()
+            for thread in threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
+
+        histogram = LatencyHistogram(self._histograms[0].significant_figures)
+        for worker_histogram in self._histograms:
+            histogram.merge(worker_histogram)
+        return LoadBenchmarkResult(
+            histogram,
+            duration_s=(self.measure_end_ns - self.measure_start_ns) / 1e9,
+            warmup_s=(self.measure_start_ns - self.start_ns) / 1e9,
+            steady_state=steady_state,
+            concurrency=self.concurrency,
+            target_qps=self.target_qps,
+        )
+
+
+def _run_load_benchmark_process(run_fn, concurrency, target_qps, significant_figures, *args) -> LoadBenchmarkResult:
+    return _LoadGenerator(run_fn, concurrency, target_qps, significant_figures).run(*args)
+
+
+def run_load_benchmark(
+    run_fn: Callable[[], Any],
+    concurrency: int = 1,
+    target_qps: Optional[float] = None,
+    duration_s: float = 10.0,
+    max_warmup_s: float = 30.0,
+    window_s: float = 0.5,
+    steady_state_tolerance: float = 0.05,
+    stable_windows: int = 3,
+    num_processes: int = 1,
+    significant_figures: int = 2,
+) -> LoadBenchmarkResult:
+    """Measure the latency distribution of run_fn under load, e.g. run_fn=lambda: session.run(None, inputs).
+
+    Without target_qps, each of the concurrency threads runs requests back to back (closed loop), which measures
+    the latency at a given number of requests in flight. With target_qps, requests are sent at that rate whatever
+    their latency (open loop), by up to concurrency threads, and the latency includes the time a request waits for a
+    free thread: this is the latency clients see at that load.
+
+    Requests are first run until the median latency of stable_windows consecutive windows of window_s changes by at
+    most steady_state_tolerance, or for max_warmup_s, then the requests sent during duration_s are measured.
+
+    With num_processes > 1, each process runs concurrency threads, and target_qps is shared by the processes.
+    run_fn is pickled to the processes, so it has to be a picklable callable creating its session in the process,
+    for example on its first call.
+    """
+    if concurrency < 1 or num_processes < 1:
+        raise ValueError("concurrency and num_processes must be positive.")
+    if target_qps is not None and target_qps <= 0:
+        raise ValueError(f"target_qps must be positive, got {target_qps}")
+
+    args = (duration_s, max_warmup_s, window_s, steady_state_tolerance, stable_windows)
+    if num_processes == 1:
+        return _run_load_benchmark_process(run_fn, concurrency, target_qps, significant_figures, *args)
+
+    process_qps = target_qps / num_processes if target_qps else None
+    # Forked processes would inherit the thread pools of the parent in an undefined state.
+    with ProcessPoolExecutor(num_processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(_run_load_benchmark_process, run_fn, concurrency, process_qps, significant_figures, *args)
+            for _ in range(num_processes)
+        ]
+        return LoadBenchmarkResult.merge([future.result() for future in futures])
+
+
+def _run_placed_process(index, model_path, feeds, cpus, providers, barrier, results, benchmark_args):
+    try:
+        # Threads of the session inherit the affinity of the process, so it is set first.
+        AffinitySetting().set_affinity(set(cpus))
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.intra_op_num_threads = len(cpus)
+        session = onnxruntime.InferenceSession(model_path, sess_options, providers=providers)
+        feeds = itertools.cycle(feeds)
+        session.run(None, next(feeds))
+        # Processes start their load together, so that their measurements overlap.
+        barrier.wait()
+        result = run_load_benchmark(lambda: session.run(None, next(feeds)), **benchmark_args)
+    except Exception as e:
+        barrier.abort()
+        results.put((index, e))
+        return
+    results.put((index, result))
+
+
+def run_placed_benchmark(
+    model_path: str,
+    feeds: Sequence[Dict[str, numpy.ndarray]],
+    num_processes: int,
+    threads_per_process: Optional[int] = None,
+    use_hyperthreads: bool = False,
+    providers: Optional[List[str]] = None,
+    **kwargs,
+) -> LoadBenchmarkResult:
+    """Measure the throughput of num_processes processes pinned to disjoint cores, each with its own session.
+
+    Cores are assigned by affinity_helper.plan_placement, and the intra-op thread pool of each session has a thread per
+    logical CPU of its process. Each process runs the feeds in turn with run_load_benchmark, which kwargs are passed
+    to. The result has the latencies of all the processes and the sum of their throughputs.
+    """
+    placements = plan_placement(num_processes, threads_per_process, use_hyperthreads=use_hyperthreads)
+    logger.info(f"Running {num_processes} processes on CPUs {placements}")
+    providers = providers or ["CPUExecutionProvider"]
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(num_processes)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_run_placed_process,
+            args=(index, model_path, list(feeds), cpus, providers, barrier, results, kwargs),
+        )
+        for index, cpus in enumerate(placements)
+    ]
+    for process in processes:
+        process.start()
+    process_results = {}
+    try:
+        while len(process_results) < num_processes:
+            try:
+                index, result = results.get(timeout=1)
+                process_results[index] = result
+            except queue.Empty:
+                for index, process in enumerate(processes):
+                    if process.exitcode and index not in process_results:
+                        raise RuntimeError(f"Benchmark process {index} exited with code {process.exitcode}.") from None
+    finally:
+        for process in processes:
+            if len(process_results) < num_processes:
+                # The other processes would wait for the crashed one.
+                process.terminate()
+            process.join()
+
+    errors = [result for result in process_results.values() if isinstance(result, Exception)]
+    if errors:
+        # Report the failure, rather than the broken barrier of the other processes.
+        raise next((e for e in errors if not isinstance(e, threading.BrokenBarrierError)), errors[0])
+    result = LoadBenchmarkResult.merge([process_results[index] for index in range(num_processes)])
+    result.intra_op_num_threads = len(placements[0])
+    return result
+
+
+def sweep_placements(
+    model_path: str,
+    feeds: Sequence[Dict[str, numpy.ndarray]],
+    num_processes_list: Optional[Sequence[int]] = None,
+    use_hyperthreads: bool = False,
+    **kwargs,
+) -> List[LoadBenchmarkResult]:
+    """Run run_placed_benchmark with the cores split between processes and intra-op threads in different ways.
+
+    By default, the number of processes are the divisors of the number of physical cores, so that all the cores are
+    used. Returns the results from the highest throughput to the lowest.
+    """
+    if num_processes_list is None:
+        num_cores = len(get_cpu_topology())
+        num_processes_list = [n for n in range(1, num_cores + 1) if num_cores % n == 0]
+
+    results = []
+    for num_processes in num_processes_list:
+        result = run_placed_benchmark(model_path, feeds, num_processes, use_hyperthreads=use_hyperthreads, **kwargs)
+        logger.info(
+            f"{num_processes} processes x {result.intra_op_num_threads} threads: {result.throughput_qps:.1f} QPS, "
+            f"latency p50 {result.histogram.percentile(50):.2f} ms, p99 {result.histogram.percentile(99):.2f} ms"
+        )
+        results.append(result)
+    return sorted(results, key=lambda result: result.throughput_qps, reverse=True)
+
+
 def set_random_seed(seed=123):
     """Set random seed manually to get deterministic results"""
     random.seed(seed)
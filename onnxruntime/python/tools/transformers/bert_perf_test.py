@@ -46,6 +46,7 @@ class TestSetting:
     log_severity: int
     average_sequence_length: int
     random_sequence_length: bool
+    sweep_processes: bool = False
 
 
 @dataclass
@@ -328,7 +329,34 @@ def launch_test(model_setting, test_setting, perf_results, all_inputs, intra_op_
     process.join()
 
 
+def run_placement_sweep(model_setting, test_setting, perf_results, all_inputs):
+    from benchmark_helper import sweep_placements
+
+    results = sweep_placements(model_setting.model_path, all_inputs)
+    for result in results:
+        key = f"model={os.path.basename(model_setting.model_path)},num_processes={result.num_processes},"
+        key += f"intra_op_num_threads={result.intra_op_num_threads},"
+        key += f"batch_size={test_setting.batch_size},sequence_length={test_setting.sequence_length},"
+        key += f"average_sequence_length={test_setting.average_sequence_length},"
+        key += f"random_sequence_length={test_setting.random_sequence_length}"
+        perf_results[key] = (
+            result.histogram.mean_ms,
+            *result.histogram.percentiles([50, 75, 90, 95, 99]),
+            test_setting.batch_size * result.throughput_qps,
+        )
+
+    best = results[0]
+    print(
+        f"Best placement: {best.num_processes} processes x {best.intra_op_num_threads} threads, "
+        f"Throughput = {test_setting.batch_size * best.throughput_qps:.2f} QPS"
+    )
+
+
 def run_perf_tests(model_setting, test_setting, perf_results, all_inputs):
+    if test_setting.sweep_processes:
+        run_placement_sweep(model_setting, test_setting, perf_results, all_inputs)
+        return
+
     if test_setting.intra_op_num_threads is not None:
         launch_test(
             model_setting,
@@ -531,6 +559,15 @@ def parse_arguments():
     )
     parser.set_defaults(random_sequence_length=False)
 
+    parser.add_argument(
+        "--sweep_processes",
+        required=False,
+        action="store_true",
+        help="run processes pinned to disjoint physical cores, and find the split of the cores between processes and "
+        "intra-op threads with the highest throughput (CPU only)",
+    )
+    parser.set_defaults(sweep_processes=False)
+
     parser.add_argument(
         "--mask_type",
         required=False,
@@ -555,6 +592,9 @@ def main():
     manager = multiprocessing.Manager()
     perf_results = manager.dict()
 
+    if args.sweep_processes and args.use_gpu:
+        raise Exception("--sweep_processes is only supported on CPU")
+
     batch_size_set = set(args.batch_size)
     if not (min(batch_size_set) >= 1 and max(batch_size_set) <= 128):
         raise Exception("batch_size not in range [1, 128]")
@@ -585,6 +625,7 @@ def main():
             args.log_severity,
             args.average_sequence_length,
             args.random_sequence_length,
+            args.sweep_processes,
         )
 
         print("test setting", test_setting)
@@ -158,6 +158,7 @@ class PackingAttentionBase:
             inferred_model = shape_infer_helper.infer_shapes(self.model.model, auto_merge=True, guess_output_rank=False)
             if inferred_model:
                 self.model.model = inferred_model
+                self.model.invalidate_indexes()
 
 
 class PackingAttention(PackingAttentionBase):
@@ -301,6 +302,7 @@ class PackingMultiHeadAttention(PackingAttentionBase):
                     and len(rel_pos_bias_node.input) == 6
                 ):
                     rel_pos_bias_node.input.append(token_offset)
+                    self.model.invalidate_indexes(edges_only=True)
                     gated_relative_pos_bias_count += 1
 
         logger.info("Converted %d MultiHeadAttention nodes to PackedMultiHeadAttention.", len(self.attention_nodes))
@@ -11,21 +11,27 @@
 # (4) add force_fp16_initializers option
 # (5) handle Resize and GroupNorm with mixed float inputs
 # (6) allow convert_float_to_float16 to accept model path
+# (7) convert initializers in chunks and in parallel, optionally from and to external data
 
 import itertools
 import logging
 import os
 import tempfile
-from typing import Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
 import numpy as np
 import onnx
-from onnx import AttributeProto, GraphProto, ModelProto, NodeProto, TensorProto, helper, numpy_helper
+from onnx import AttributeProto, GraphProto, ModelProto, NodeProto, TensorProto, helper
 from onnx.shape_inference import infer_shapes, infer_shapes_path
 from packaging import version
 
 logger = logging.getLogger(__name__)
 
+# Number of elements converted at a time, so that temporary arrays stay in cache whatever the size of the tensor.
+_CHUNK_SIZE = 1 << 16
+
 
 def _npfloat16_to_int(np_list):
     """
@@ -34,7 +40,32 @@ def _npfloat16_to_int(np_list):
     :param np_list: numpy float16 list
     :return int_list: python int list
     """
-    return [int(bin(_.view("H"))[2:].zfill(16), 2) for _ in np_list]
+    return np.asarray(np_list, dtype=np.float16).view(np.uint16).tolist()
+
+
+def _log_truncation(np_array, min_positive_val, max_finite_val):
+    magnitude = np.abs(np_array)
+    with np.errstate(invalid="ignore"):
+        too_large = np.logical_and(magnitude > max_finite_val, magnitude < np.inf)
+        too_small = np.logical_and(magnitude > 0, magnitude < min_positive_val)
+    if too_large.any():
+        logger.debug(
+            f"{np.count_nonzero(too_large)} float32 numbers will be truncated to {max_finite_val} in magnitude"
+        )
+    if too_small.any():
+        logger.debug(
+            f"{np.count_nonzero(too_small)} float32 numbers will be truncated to {min_positive_val} in magnitude"
+        )
+
+
+def _convert_chunk_to_float16(chunk, out, min_positive_val, max_finite_val):
+    magnitude = np.abs(chunk)
+    # NaN is unchanged by clip.
+    clamped = np.clip(magnitude, min_positive_val, max_finite_val)
+    # 0 and inf are unchanged.
+    np.copyto(clamped, magnitude, where=np.logical_or(magnitude == 0, magnitude == np.inf))
+    np.copysign(clamped, chunk, out=clamped)
+    out[...] = clamped
 
 
 def convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0):
@@ -43,32 +74,24 @@ def convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65
     Positive values less than min_positive_val are mapped to min_positive_val.
     Positive finite values greater than max_finite_val are mapped to max_finite_val.
     Similar for negative values. NaN, 0, inf, and -inf are unchanged.
-    """
-
-    def between(a, b, c):
-        return np.logical_and(a < b, b < c)
 
-    if np_array[np.where(np_array > 0)].shape[0] > 0:
-        positive_max = np_array[np.where(np_array > 0)].max()
-        positive_min = np_array[np.where(np_array > 0)].min()
-        if positive_max >= max_finite_val:
-            logger.debug(f"the float32 number {positive_max} will be truncated to {max_finite_val}")
-        if positive_min <= min_positive_val:
-            logger.debug(f"the float32 number {positive_min} will be truncated to {min_positive_val}")
-
-    if np_array[np.where(np_array < 0)].shape[0] > 0:
-        negative_max = np_array[np.where(np_array < 0)].max()
-        negative_min = np_array[np.where(np_array < 0)].min()
-        if negative_min <= -max_finite_val:
-            logger.debug(f"the float32 number {negative_min} will be truncated to {-max_finite_val}")
-        if negative_max >= -min_positive_val:
-            logger.debug(f"the float32 number {negative_max} will be truncated to {-min_positive_val}")
-
-    np_array = np.where(between(0, np_array, min_positive_val), min_positive_val, np_array)
-    np_array = np.where(between(-min_positive_val, np_array, 0), -min_positive_val, np_array)
-    np_array = np.where(between(max_finite_val, np_array, float("inf")), max_finite_val, np_array)
-    np_array = np.where(between(float("-inf"), np_array, -max_finite_val), -max_finite_val, np_array)
-    return np.float16(np_array)
+    The array is converted by chunks, so that the memory used besides the result does not depend on its size.
+    """
+    np_array = np.asarray(np_array)
+    if logger.isEnabledFor(logging.DEBUG):
+        _log_truncation(np_array, min_positive_val, max_finite_val)
+
+    float16_array = np.empty(np_array.shape, dtype=np.float16)
+    flat_input = np_array.reshape(-1)
+    flat_output = float16_array.reshape(-1)
+    for start in range(0, flat_input.size, _CHUNK_SIZE):
+        _convert_chunk_to_float16(
+            flat_input[start : start + _CHUNK_SIZE],
+            flat_output[start : start + _CHUNK_SIZE],
+            min_positive_val,
+            max_finite_val,
+        )
+    return float16_array[()] if float16_array.ndim == 0 else float16_array
 
 
 def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finite_val=65504.0):
@@ -108,9 +131,41 @@ def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finit
     return tensor
 
 
+def _has_external_data(tensor: TensorProto) -> bool:
+    return tensor.data_location == TensorProto.EXTERNAL and not tensor.HasField("raw_data")
+
+
+def _external_data_info(tensor: TensorProto) -> Dict[str, str]:
+    return {entry.key: entry.value for entry in tensor.external_data}
+
+
+def _convert_external_tensor_to_float16(
+    tensor, base_dir, location, offset, min_positive_val=5.96e-08, max_finite_val=65504.0
+):
+    """Convert a float tensor stored in external data to float16, chunk by chunk, into the file `location` at
+    `offset`. Neither the float nor the float16 data of the whole tensor is held in memory."""
+    info = _external_data_info(tensor)
+    size = int(np.prod(tensor.dims, dtype=np.int64))
+    with open(os.path.join(base_dir, info["location"]), "rb") as source, open(
+        os.path.join(base_dir, location), "r+b"
+    ) as target:
+        source.seek(int(info.get("offset", 0)))
+        target.seek(offset)
+        for start in range(0, size, _CHUNK_SIZE):
+            chunk = np.frombuffer(source.read(4 * min(_CHUNK_SIZE, size - start)), dtype="<f4")
+            target.write(convert_np_to_float16(chunk, min_positive_val, max_finite_val).astype("<f2").tobytes())
+
+    tensor.data_type = TensorProto.FLOAT16
+    del tensor.external_data[:]
+    for key, value in (("location", location), ("offset", offset), ("length", 2 * size)):
+        entry = tensor.external_data.add()
+        entry.key = key
+        entry.value = str(value)
+    return tensor
+
+
 def make_value_info_from_tensor(tensor):
-    shape = numpy_helper.to_array(tensor).shape
-    return helper.make_tensor_value_info(tensor.name, tensor.data_type, shape)
+    return helper.make_tensor_value_info(tensor.name, tensor.data_type, tuple(tensor.dims))
 
 
 DEFAULT_OP_BLOCK_LIST = [
@@ -175,6 +230,10 @@ def convert_float_to_float16(
     force_fp16_initializers=False,
     force_fp16_inputs=None,
     use_bfloat16_as_blocked_nodes_dtype=False,
+    num_threads=None,
+    external_data_dir=None,
+    float16_external_data=None,
+    cast_report=None,
 ):
     """Convert tensor float type in the input ONNX model to tensor float16.
 
@@ -194,6 +253,19 @@ def convert_float_to_float16(
                                        Default to false, which will convert only the one needed to avoid precision loss.
         force_fp16_inputs(Dict[str, List[int]]): Force the conversion of the inputs of some operators to float16, even if
                                                  this script's preference it to keep them in float32.
+        num_threads (int, optional): number of threads converting initializers. Defaults to None, which lets
+                                     ThreadPoolExecutor choose it from the number of CPUs.
+        external_data_dir (str, optional): directory of the external data of the model. Defaults to the directory of
+                                           the model when the model is a path.
+        float16_external_data (str, optional): name of a file in external_data_dir to write the float16 data of
+                                               initializers stored in external data. When set, a model given as a
+                                               path is loaded without its external data, and those initializers are
+                                               converted chunk by chunk from file to file. The converted model shall
+                                               be saved in external_data_dir without save_as_external_data.
+                                               Defaults to None.
+        cast_report (Dict[str, List[str]], optional): dictionary filled with the names of the inserted Cast nodes by
+                                                      reason: "graph input", "graph output", "float input" and
+                                                      "blocked node". Defaults to None.
     Raises:
         ValueError: input type is not ModelProto.
 
@@ -207,18 +279,23 @@ def convert_float_to_float16(
 
     force_fp16_inputs_dict = {} if force_fp16_inputs is None else force_fp16_inputs
 
+    load_external_data = float16_external_data is None
     if isinstance(model, str):
         model_path = model
+        if external_data_dir is None:
+            external_data_dir = os.path.dirname(os.path.abspath(model_path))
         if version.parse(onnx.__version__) >= version.parse("1.8.0") and not disable_shape_infer:
             # shape_infer_model_path should be in the same folder of model_path
             with tempfile.NamedTemporaryFile(dir=os.path.dirname(model_path)) as tmpfile:
                 shape_infer_model_path = tmpfile.name
                 # infer_shapes_path can be used for model >2GB, and infer_shapes cannot.
                 infer_shapes_path(model_path, shape_infer_model_path)
-                model = onnx.load(shape_infer_model_path)
+                model = onnx.load(shape_infer_model_path, load_external_data=load_external_data)
                 disable_shape_infer = True
         else:
-            model = onnx.load(model_path)
+            model = onnx.load(model_path, load_external_data=load_external_data)
+    if float16_external_data is not None and external_data_dir is None:
+        raise ValueError("external_data_dir is required to convert the external data of a ModelProto.")
 
     if not isinstance(model, ModelProto):
         raise ValueError(f"Expected an ONNX ModelProto but got {type(model)}")
@@ -242,8 +319,8 @@ def convert_float_to_float16(
         f"fp16 parameters: min_positive_val={min_positive_val} max_finite_val={max_finite_val} keep_io_types={keep_io_types} disable_shape_infer={disable_shape_infer} op_block_list={op_block_list} node_block_list={node_block_list} force_fp16_initializers={force_fp16_initializers}"
     )
 
-    # create a queue for BFS
-    queue = []
+    # Worklist of the model, graphs and attributes to process in breadth-first order.
+    worklist = deque()
     value_info_list = []
     node_list = []
 
@@ -255,10 +332,17 @@ def convert_float_to_float16(
     # type inference on input model
     if func_infer_shape is not None:
         model = func_infer_shape(model)
-    queue.append(model)
+    worklist.append(model)
     name_mapping = {}
     graph_io_to_skip = set()
     io_casts = set()
+    # Names of the inserted Cast nodes by reason, reported at the end of the conversion.
+    inserted_casts: Dict[str, List[str]] = {
+        "graph input": [],
+        "graph output": [],
+        "float input": [],
+        "blocked node": [],
+    }
 
     fp32_inputs = [n.name for n in model.graph.input if n.type.tensor_type.elem_type == TensorProto.FLOAT]
     fp32_outputs = [n.name for n in model.graph.output if n.type.tensor_type.elem_type == TensorProto.FLOAT]
@@ -285,6 +369,7 @@ def convert_float_to_float16(
             model.graph.node.extend(new_node)
             value_info_list.append(new_value_info)
             io_casts.add(node_name)
+            inserted_casts["graph input"].append(node_name)
 
     for i, n in enumerate(model.graph.output):
         if n.name in fp32_outputs:
@@ -302,138 +387,170 @@ def convert_float_to_float16(
             model.graph.node.extend(new_node)
             value_info_list.append(new_value_info)
             io_casts.add(node_name)
+            inserted_casts["graph output"].append(node_name)
 
     fp32_initializers: Dict[str, InitializerTracker] = {}
-    while queue:
-        next_level = []
-        for q in queue:
-            # if q is model, push q.graph (GraphProto)
-            if isinstance(q, ModelProto):
-                next_level.append(q.graph)
-            # if q is model.graph, push q.node.attribute (AttributeProto)
-            if isinstance(q, GraphProto):
-                for n in q.initializer:  # TensorProto type
-                    if n.data_type == TensorProto.FLOAT:
-                        assert n.name not in fp32_initializers
-                        fp32_initializers[n.name] = InitializerTracker(n)
-
-                for n in q.node:
-                    # if n is in the block list (doesn't support float16), no conversion for the node,
-                    # and save the node for further processing
-                    if n.name in io_casts:
-                        continue
-                    for i in range(len(n.input)):
-                        if n.input[i] in name_mapping:
-                            n.input[i] = name_mapping[n.input[i]]
-                    for i in range(len(n.output)):
-                        if n.output[i] in name_mapping:
-                            n.output[i] = name_mapping[n.output[i]]
-
-                    is_node_blocked = n.op_type in op_block_list or n.name in node_block_list
-                    for i, input_name in enumerate(n.input):
-                        if input_name in fp32_initializers:
-                            # For Resize/GroupNorm, only the first input can be float16
-                            use_fp32_weight = is_node_blocked or (
-                                i in ALWAYS_FLOAT_INPUTS.get(n.op_type, [])
-                                and i not in force_fp16_inputs_dict.get(n.op_type, [])
-                            )
-                            fp32_initializers[input_name].add_node(n, use_fp32_weight)
-
-                    if is_node_blocked:
-                        node_list.append(n)
-                    else:
-                        if n.op_type == "Cast":
-                            for attr in n.attribute:
-                                if attr.name == "to" and attr.i == TensorProto.FLOAT:
+    while worklist:
+        q = worklist.popleft()
+        # if q is model, push q.graph (GraphProto)
+        if isinstance(q, ModelProto):
+            worklist.append(q.graph)
+        # if q is model.graph, push q.node.attribute (AttributeProto)
+        if isinstance(q, GraphProto):
+            for n in q.initializer:  # TensorProto type
+                if n.data_type == TensorProto.FLOAT:
+                    assert n.name not in fp32_initializers
+                    fp32_initializers[n.name] = InitializerTracker(n)
+
+            for n in q.node:
+                # if n is in the block list (doesn't support float16), no conversion for the node,
+                # and save the node for further processing
+                if n.name in io_casts:
+                    continue
+                for i in range(len(n.input)):
+                    if n.input[i] in name_mapping:
+                        n.input[i] = name_mapping[n.input[i]]
+                for i in range(len(n.output)):
+                    if n.output[i] in name_mapping:
+                        n.output[i] = name_mapping[n.output[i]]
+
+                is_node_blocked = n.op_type in op_block_list or n.name in node_block_list
+                for i, input_name in enumerate(n.input):
+                    if input_name in fp32_initializers:
+                        # For Resize/GroupNorm, only the first input can be float16
+                        use_fp32_weight = is_node_blocked or (
+                            i in ALWAYS_FLOAT_INPUTS.get(n.op_type, [])
+                            and i not in force_fp16_inputs_dict.get(n.op_type, [])
+                        )
+                        fp32_initializers[input_name].add_node(n, use_fp32_weight)
+
+                if is_node_blocked:
+                    node_list.append(n)
+                else:
+                    if n.op_type == "Cast":
+                        for attr in n.attribute:
+                            if attr.name == "to" and attr.i == TensorProto.FLOAT:
+                                attr.i = TensorProto.FLOAT16
+                                break
+
+                    if n.op_type in [
+                        "EyeLike",
+                        "Multinomial",
+                        "RandomNormal",
+                        "RandomNormalLike",
+                        "RandomUniform",
+                        "RandomUniformLike",
+                        "SequenceEmpty",
+                        "Bernoulli",
+                    ]:
+                        has_dtype = False
+                        for attr in n.attribute:
+                            if attr.name == "dtype":
+                                has_dtype = True
+                                if attr.i == TensorProto.FLOAT:
                                     attr.i = TensorProto.FLOAT16
-                                    break
-
-                        if n.op_type in [
-                            "EyeLike",
-                            "Multinomial",
-                            "RandomNormal",
-                            "RandomNormalLike",
-                            "RandomUniform",
-                            "RandomUniformLike",
-                            "SequenceEmpty",
-                            "Bernoulli",
-                        ]:
-                            has_dtype = False
-                            for attr in n.attribute:
-                                if attr.name == "dtype":
-                                    has_dtype = True
-                                    if attr.i == TensorProto.FLOAT:
-                                        attr.i = TensorProto.FLOAT16
-
-                            # The dtype attribute is optional and default is FLOAT in the following operators
-                            # so we need add dtype attribute to specify the data type float16
-                            if (n.op_type in ["RandomNormal", "RandomUniform", "SequenceEmpty"]) and not has_dtype:
-                                n.attribute.extend([helper.make_attribute("dtype", TensorProto.FLOAT16)])
-
-                        # For Resize/GroupNorm, attribute data type cannot be changed
-                        if n.op_type not in ALWAYS_FLOAT_INPUTS or n.op_type in force_fp16_inputs_dict:
-                            for attr in n.attribute:
-                                next_level.append(attr)  # noqa: PERF402
-                        else:
-                            mixed_float_type_node_list.append(n)
-
-            # if q is model.graph.node.attribute, push q.g and q.graphs (GraphProto)
-            # and process node.attribute.t and node.attribute.tensors (TensorProto)
-            if isinstance(q, AttributeProto):
-                next_level.append(q.g)
-                for n in q.graphs:
-                    next_level.append(n)  # noqa: PERF402
-                q.t.CopyFrom(convert_tensor_float_to_float16(q.t, min_positive_val, max_finite_val))
-                for n in q.tensors:
-                    n = convert_tensor_float_to_float16(n, min_positive_val, max_finite_val)  # noqa: PLW2901
-            # if q is graph, process input, output and value_info (ValueInfoProto)
-            if isinstance(q, GraphProto):
-                # Note that float initializers tracked by fp32_initializers will be processed later.
-                # for all ValueInfoProto with tensor(float) type in input, output and value_info, convert them to
-                # tensor(float16) except map and seq(map). And save them in value_info_list for further processing
-                for n in itertools.chain(q.input, q.output, q.value_info):
-                    if n.type.tensor_type.elem_type == TensorProto.FLOAT:
+
+                        # The dtype attribute is optional and default is FLOAT in the following operators
+                        # so we need add dtype attribute to specify the data type float16
+                        if (n.op_type in ["RandomNormal", "RandomUniform", "SequenceEmpty"]) and not has_dtype:
+                            n.attribute.extend([helper.make_attribute("dtype", TensorProto.FLOAT16)])
+
+                    # For Resize/GroupNorm, attribute data type cannot be changed
+                    if n.op_type not in ALWAYS_FLOAT_INPUTS or n.op_type in force_fp16_inputs_dict:
+                        worklist.extend(n.attribute)
+                    else:
+                        mixed_float_type_node_list.append(n)
+
+        # if q is model.graph.node.attribute, push q.g and q.graphs (GraphProto)
+        # and process node.attribute.t and node.attribute.tensors (TensorProto)
+        if isinstance(q, AttributeProto):
+            worklist.append(q.g)
+            worklist.extend(q.graphs)
+            q.t.CopyFrom(convert_tensor_float_to_float16(q.t, min_positive_val, max_finite_val))
+            for n in q.tensors:
+                n = convert_tensor_float_to_float16(n, min_positive_val, max_finite_val)  # noqa: PLW2901
+        # if q is graph, process input, output and value_info (ValueInfoProto)
+        if isinstance(q, GraphProto):
+            # Note that float initializers tracked by fp32_initializers will be processed later.
+            # for all ValueInfoProto with tensor(float) type in input, output and value_info, convert them to
+            # tensor(float16) except map and seq(map). And save them in value_info_list for further processing
+            for n in itertools.chain(q.input, q.output, q.value_info):
+                if n.type.tensor_type.elem_type == TensorProto.FLOAT:
+                    if n.name not in graph_io_to_skip:
+                        n.type.tensor_type.elem_type = TensorProto.FLOAT16
+                        value_info_list.append(n)
+                if n.type.HasField("sequence_type"):
+                    if n.type.sequence_type.elem_type.tensor_type.elem_type == TensorProto.FLOAT:
                         if n.name not in graph_io_to_skip:
-                            n.type.tensor_type.elem_type = TensorProto.FLOAT16
+                            n.type.sequence_type.elem_type.tensor_type.elem_type = TensorProto.FLOAT16
                             value_info_list.append(n)
-                    if n.type.HasField("sequence_type"):
-                        if n.type.sequence_type.elem_type.tensor_type.elem_type == TensorProto.FLOAT:
-                            if n.name not in graph_io_to_skip:
-                                n.type.sequence_type.elem_type.tensor_type.elem_type = TensorProto.FLOAT16
-                                value_info_list.append(n)
-
-        queue = next_level
-
-    for value in fp32_initializers.values():
-        # By default, to avoid precision loss, do not convert an initializer to fp16 when it is used only by fp32 nodes.
-        if force_fp16_initializers or value.fp16_nodes:
-            value.initializer = convert_tensor_float_to_float16(value.initializer, min_positive_val, max_finite_val)
+
+    # By default, to avoid precision loss, do not convert an initializer to fp16 when it is used only by fp32 nodes.
+    converted_initializers = [
+        value for value in fp32_initializers.values() if force_fp16_initializers or value.fp16_nodes
+    ]
+    # Offsets of the initializers converted from external data, aligned to 4KB like onnx does.
+    external_data_offsets = {}
+    if float16_external_data is not None:
+        data_size = 0
+        for value in converted_initializers:
+            if _has_external_data(value.initializer):
+                if _external_data_info(value.initializer)["location"] == float16_external_data:
+                    raise ValueError(f"{float16_external_data} is the external data of the model.")
+                external_data_offsets[value.initializer.name] = data_size
+                data_size += (2 * int(np.prod(value.initializer.dims, dtype=np.int64)) + 4095) // 4096 * 4096
+        if external_data_offsets:
+            with open(os.path.join(external_data_dir, float16_external_data), "wb") as f:
+                f.truncate(data_size)
+
+    def convert_initializer(initializer):
+        if initializer.name in external_data_offsets:
+            return _convert_external_tensor_to_float16(
+                initializer,
+                external_data_dir,
+                float16_external_data,
+                external_data_offsets[initializer.name],
+                min_positive_val,
+                max_finite_val,
+            )
+        return convert_tensor_float_to_float16(initializer, min_positive_val, max_finite_val)
+
+    # numpy releases the GIL while converting, so initializers are converted in parallel.
+    with ThreadPoolExecutor(num_threads) as executor:
+        converted = executor.map(convert_initializer, [value.initializer for value in converted_initializers])
+        for value, initializer in zip(converted_initializers, converted):
+            value.initializer = initializer
             value_info_list.append(make_value_info_from_tensor(value.initializer))
             if value.fp32_nodes and not force_fp16_initializers:
                 logger.info(
                     f"initializer is used by both fp32 and fp16 nodes. Consider add these nodes to block list:{value.fp16_nodes}"
                 )
 
+    # Index of the tensor(float16) values: the first value info of each name in value_info_list.
+    float16_value_infos = {}
+    for value_info in value_info_list:
+        float16_value_infos.setdefault(value_info.name, value_info)
+
     # Some operators have data type fixed as float for some input. Add a float16 to float cast for those inputs.
     for node in mixed_float_type_node_list:
         for i, input_name in enumerate(node.input):
             if i not in ALWAYS_FLOAT_INPUTS[node.op_type] or i in force_fp16_inputs_dict.get(node.op_type, []):
                 continue
-            for value_info in value_info_list:
-                if input_name == value_info.name:
-                    # create new value_info for current node's new input name
-                    new_value_info = model.graph.value_info.add()
-                    new_value_info.CopyFrom(value_info)
-                    output_name = node.name + "_input_cast_" + str(i)
-                    new_value_info.name = output_name
-                    new_value_info.type.tensor_type.elem_type = TensorProto.FLOAT
-                    # add Cast node (from tensor(float16) to tensor(float) before current node
-                    node_name = node.name + "_input_cast" + str(i)
-                    new_node = [helper.make_node("Cast", [input_name], [output_name], to=1, name=node_name)]
-                    model.graph.node.extend(new_node)
-                    # change current node's input name
-                    node.input[i] = output_name
-                    break
+            value_info = float16_value_infos.get(input_name)
+            if value_info is not None:
+                # create new value_info for current node's new input name
+                new_value_info = model.graph.value_info.add()
+                new_value_info.CopyFrom(value_info)
+                output_name = node.name + "_input_cast_" + str(i)
+                new_value_info.name = output_name
+                new_value_info.type.tensor_type.elem_type = TensorProto.FLOAT
+                # add Cast node (from tensor(float16) to tensor(float) before current node
+                node_name = node.name + "_input_cast" + str(i)
+                new_node = [helper.make_node("Cast", [input_name], [output_name], to=1, name=node_name)]
+                model.graph.node.extend(new_node)
+                # change current node's input name
+                node.input[i] = output_name
+                inserted_casts["float input"].append(node_name)
 
     accuracy_type = TensorProto.BFLOAT16 if use_bfloat16_as_blocked_nodes_dtype else TensorProto.FLOAT
     # process the nodes in block list that doesn't support tensor(float16)
@@ -443,40 +560,51 @@ def convert_float_to_float16(
         # change current node's input name and create new value_info for the new name
         for i in range(len(node.input)):
             input_name = node.input[i]
-            for value_info in value_info_list:
-                if input_name == value_info.name:
-                    # create new value_info for current node's new input name
-                    new_value_info = model.graph.value_info.add()
-                    new_value_info.CopyFrom(value_info)
-                    output_name = node.name + "_input_cast_" + str(i)
-                    new_value_info.name = output_name
-                    new_value_info.type.tensor_type.elem_type = accuracy_type
-                    # add Cast node (from tensor(float16) to tensor(float) before current node
-                    node_name = node.name + "_input_cast" + str(i)
-                    new_node = [helper.make_node("Cast", [input_name], [output_name], to=accuracy_type, name=node_name)]
-                    model.graph.node.extend(new_node)
-                    # change current node's input name
-                    node.input[i] = output_name
-                    break
+            value_info = float16_value_infos.get(input_name)
+            if value_info is not None:
+                # create new value_info for current node's new input name
+                new_value_info = model.graph.value_info.add()
+                new_value_info.CopyFrom(value_info)
+                output_name = node.name + "_input_cast_" + str(i)
+                new_value_info.name = output_name
+                new_value_info.type.tensor_type.elem_type = accuracy_type
+                # add Cast node (from tensor(float16) to tensor(float) before current node
+                node_name = node.name + "_input_cast" + str(i)
+                new_node = [helper.make_node("Cast", [input_name], [output_name], to=accuracy_type, name=node_name)]
+                model.graph.node.extend(new_node)
+                # change current node's input name
+                node.input[i] = output_name
+                inserted_casts["blocked node"].append(node_name)
         # if output's name is in the value_info_list meaning output is tensor(float16) type, insert a float to
         # float16 Cast node after the node, change current node's output name and create new value_info for the new name
         for i in range(len(node.output)):
             output = node.output[i]
-            for value_info in value_info_list:
-                if output == value_info.name:
-                    # create new value_info for current node's new output
-                    new_value_info = model.graph.value_info.add()
-                    new_value_info.CopyFrom(value_info)
-                    input_name = node.name + "_output_cast_" + str(i)
-                    new_value_info.name = input_name
-                    new_value_info.type.tensor_type.elem_type = accuracy_type
-                    # add Cast node (from tensor(float) to tensor(float16) after current node
-                    node_name = node.name + "_output_cast" + str(i)
-                    new_node = [helper.make_node("Cast", [input_name], [output], to=10, name=node_name)]
-                    model.graph.node.extend(new_node)
-                    # change current node's input name
-                    node.output[i] = input_name
-                    break
+            value_info = float16_value_infos.get(output)
+            if value_info is not None:
+                # create new value_info for current node's new output
+                new_value_info = model.graph.value_info.add()
+                new_value_info.CopyFrom(value_info)
+                input_name = node.name + "_output_cast_" + str(i)
+                new_value_info.name = input_name
+                new_value_info.type.tensor_type.elem_type = accuracy_type
+                # add Cast node (from tensor(float) to tensor(float16) after current node
+                node_name = node.name + "_output_cast" + str(i)
+                new_node = [helper.make_node("Cast", [input_name], [output], to=10, name=node_name)]
+                model.graph.node.extend(new_node)
+                # change current node's input name
+                node.output[i] = input_name
+                inserted_casts["blocked node"].append(node_name)
+
+    logger.info(
+        "Inserted %d Cast nodes: %s",
+        sum(len(names) for names in inserted_casts.values()),
+        ", ".join(f"{len(names)} for {reason}s" for reason, names in inserted_casts.items()),
+    )
+    for reason, names in inserted_casts.items():
+        if names:
+            logger.debug("Cast nodes for %ss: %s", reason, names)
+    if cast_report is not None:
+        cast_report.update(inserted_casts)
     return model
 
 
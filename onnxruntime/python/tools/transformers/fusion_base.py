@@ -49,7 +49,10 @@ class Fusion:
         input_name_to_nodes: Dict[str, List[NodeProto]],
         output_name_to_node: Dict[str, NodeProto],
     ):
-        """Interface for fusion that starts from a node"""
+        """Interface for fusion that starts from a node.
+        Existing nodes in graph shall be changed by methods of OnnxModel (like set_node_input) instead of editing
+        node proto directly, so that the indexes of model are kept up to date.
+        """
         raise NotImplementedError
 
     def apply(self):
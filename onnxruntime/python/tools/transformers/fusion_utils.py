@@ -91,15 +91,19 @@ class FusionUtils:
 
     @staticmethod
     def update_node_input(node, i, new_input_name, input_name_to_nodes):
+        # Lists in input_name_to_nodes might be shared with the index of OnnxModel, so we replace them instead of
+        # changing them in place.
         old_input_reference = 0
         if (node.input[i] in input_name_to_nodes) and node in input_name_to_nodes[node.input[i]]:
-            input_name_to_nodes[node.input[i]].remove(node)
-            old_input_reference = len(input_name_to_nodes[node.input[i]])
+            consumers = list(input_name_to_nodes[node.input[i]])
+            consumers.remove(node)
+            input_name_to_nodes[node.input[i]] = consumers
+            old_input_reference = len(consumers)
 
         node.input[i] = new_input_name
 
         if new_input_name in input_name_to_nodes:
-            input_name_to_nodes[new_input_name].append(node)
+            input_name_to_nodes[new_input_name] = [*input_name_to_nodes[new_input_name], node]
         else:
             input_name_to_nodes[new_input_name] = [node]
 
@@ -121,6 +125,7 @@ class FusionUtils:
         old_input_name = node.input[node_input_index]
         new_input_name = parent_node.input[parent_input_index]
         old_input_reference = FusionUtils.update_node_input(node, node_input_index, new_input_name, input_name_to_nodes)
+        model.invalidate_indexes(edges_only=True)
 
         # We can remove the first Transpose if its output is not used (linked to graph output or other nodes) anymore.
         parent_can_be_removed = (old_input_reference == 0) and not model.find_graph_output(old_input_name)
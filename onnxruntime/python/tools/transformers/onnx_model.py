@@ -3,14 +3,19 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 
+import functools
+import hashlib
+import heapq
 import itertools
 import logging
+import mmap
 import os
 import sys
 from collections import deque
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 from float16 import convert_float_to_float16
 from onnx import (
     AttributeProto,
@@ -23,12 +28,26 @@ from onnx import (
     numpy_helper,
     save_model,
 )
-from onnx.external_data_helper import load_external_data_for_tensor, uses_external_data
+from onnx.external_data_helper import ExternalDataInfo, uses_external_data
 from shape_infer_helper import SymbolicShapeInferenceHelper
 
 logger = logging.getLogger(__name__)
 
 
+class _StaticOrModelMethod:
+    """Decorator of a method that can also be called as a static method of the class, like
+    OnnxModel.replace_node_input(node, old_input_name, new_input_name). The model argument is None in that case,
+    and the indexes of models are not updated.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __get__(self, instance, owner=None):
+        return functools.partial(self.func, instance)
+
+
 class OnnxModel:
     def __init__(self, model):
         self.initialize(model)
@@ -46,6 +65,21 @@ class OnnxModel:
         self._dtype_dict: Optional[Dict[str, int]] = None
         self._shape_dict: Optional[Dict[str, List]] = None
 
+        # Indexes of nodes and initializers in all graphs. They are built on first use, then updated incrementally
+        # by add_node, remove_node, set_node_input, add_initializer etc. so that fusions need not scan the graph.
+        # Code that changes graph proto directly (like node.input[0] = name) shall call invalidate_indexes() after that.
+        # Nodes are keyed by id() since NodeProto is not hashable. The index holds reference to nodes so ids are stable.
+        self._node_to_graph: Optional[Dict[int, Tuple[NodeProto, GraphProto]]] = None
+        self._op_type_to_nodes: Optional[Dict[str, Dict[int, NodeProto]]] = None
+        # Sort keys of nodes in graph order: (index of graph in graphs(), position in graph). Removing nodes does not
+        # change the order of remaining nodes, and appended nodes get the next position of their graph.
+        self._node_order: Optional[Dict[int, Tuple[int, int]]] = None
+        self._graph_next_position: Optional[Dict[int, Tuple[int, int]]] = None
+        self._name_to_initializer: Optional[Dict[str, TensorProto]] = None
+        # Edge indexes. Lists of nodes are replaced instead of changed in place, so that shallow copies are snapshots.
+        self._input_name_to_nodes: Optional[Dict[str, List[NodeProto]]] = None
+        self._output_name_to_node: Optional[Dict[str, NodeProto]] = None
+
     def disable_shape_inference(self):
         self.enable_shape_infer = False
 
@@ -63,24 +97,159 @@ class OnnxModel:
 
         return None
 
-    def input_name_to_nodes(self):
+    def invalidate_indexes(self, edges_only: bool = False):
+        """Drop the cached indexes of graph so that they will be rebuilt on next use.
+        It shall be called after graph proto is changed without using methods of this class.
+
+        Args:
+            edges_only (bool, optional): only drop the index of node inputs and outputs. It is enough when inputs or
+                                         outputs of existing nodes are changed in place. Defaults to False.
+        """
+        self._input_name_to_nodes = None
+        self._output_name_to_node = None
+        if not edges_only:
+            self.all_graphs = None
+            self._node_to_graph = None
+            self._op_type_to_nodes = None
+            self._node_order = None
+            self._name_to_initializer = None
+
+    def _build_node_indexes(self):
+        self._node_to_graph = {}
+        self._op_type_to_nodes = {}
+        for graph in self.graphs():
+            for node in graph.node:
+                self._node_to_graph[id(node)] = (node, graph)
+                if node.op_type not in self._op_type_to_nodes:
+                    self._op_type_to_nodes[node.op_type] = {id(node): node}
+                else:
+                    self._op_type_to_nodes[node.op_type][id(node)] = node
+
+    def _build_node_order(self):
+        self._node_order = {}
+        self._graph_next_position = {}
+        for graph_index, graph in enumerate(self.graphs()):
+            for position, node in enumerate(graph.node):
+                self._node_order[id(node)] = (graph_index, position)
+            self._graph_next_position[id(graph)] = (graph_index, len(graph.node))
+
+    def _build_edge_indexes(self):
+        if self._node_to_graph is None:
+            self._build_node_indexes()
+
         input_name_to_nodes = {}
-        for node in self.nodes():
+        output_name_to_node = {}
+        for node, _ in self._node_to_graph.values():
             for input_name in node.input:
                 if input_name:  # could be empty when it is optional
                     if input_name not in input_name_to_nodes:
                         input_name_to_nodes[input_name] = [node]
                     else:
                         input_name_to_nodes[input_name].append(node)
-        return input_name_to_nodes
-
-    def output_name_to_node(self):
-        output_name_to_node = {}
-        for node in self.nodes():
             for output_name in node.output:
                 if output_name:  # could be empty when it is optional
                     output_name_to_node[output_name] = node
-        return output_name_to_node
+        self._input_name_to_nodes = input_name_to_nodes
+        self._output_name_to_node = output_name_to_node
+
+    def _index_node(self, node, graph, appended=True):
+        """Add a node (shall be the object stored in graph) to indexes.
+        appended tells whether the node is after all the other nodes of graph, or inserted before some of them.
+        """
+        if self._node_order is not None:
+            next_position = self._graph_next_position.get(id(graph)) if appended else None
+            if next_position is None:
+                self._node_order = None
+            else:
+                self._node_order[id(node)] = next_position
+                self._graph_next_position[id(graph)] = (next_position[0], next_position[1] + 1)
+
+        if self._node_to_graph is not None:
+            self._node_to_graph[id(node)] = (node, graph)
+            if node.op_type not in self._op_type_to_nodes:
+                self._op_type_to_nodes[node.op_type] = {id(node): node}
+            else:
+                self._op_type_to_nodes[node.op_type][id(node)] = node
+
+        if self._input_name_to_nodes is not None:
+            for input_name in node.input:
+                if input_name:
+                    consumers = self._input_name_to_nodes.get(input_name)
+                    self._input_name_to_nodes[input_name] = [node] if consumers is None else [*consumers, node]
+            for output_name in node.output:
+                if output_name:
+                    self._output_name_to_node[output_name] = node
+
+    def _unindex_node(self, node):
+        """Remove a node (shall be the object stored in graph) from indexes."""
+        if self._node_order is not None:
+            self._node_order.pop(id(node), None)
+
+        if self._node_to_graph is not None:
+            self._node_to_graph.pop(id(node), None)
+            if node.op_type in self._op_type_to_nodes:
+                self._op_type_to_nodes[node.op_type].pop(id(node), None)
+
+        if self._input_name_to_nodes is not None:
+            for input_name in set(node.input):
+                self._remove_consumer(input_name, node)
+            for output_name in node.output:
+                if output_name and self._output_name_to_node.get(output_name) is node:
+                    del self._output_name_to_node[output_name]
+
+    def _is_indexed(self, node) -> bool:
+        """Whether the node is the object stored in graph that is in the edge indexes."""
+        if self._input_name_to_nodes is None:
+            return False
+        entry = self._node_to_graph.get(id(node))
+        return entry is not None and entry[0] is node
+
+    def _remove_consumer(self, input_name, node):
+        consumers = self._input_name_to_nodes.get(input_name)
+        if consumers is not None:
+            remaining = [n for n in consumers if n is not node]
+            if remaining:
+                self._input_name_to_nodes[input_name] = remaining
+            else:
+                del self._input_name_to_nodes[input_name]
+
+    def _find_indexed_node(self, node) -> Optional[Tuple[NodeProto, GraphProto]]:
+        """Find a node in graphs. Returns the node object stored in graph and the graph that contains it."""
+        if self._node_to_graph is None:
+            self._build_node_indexes()
+
+        entry = self._node_to_graph.get(id(node))
+        if entry is not None and entry[0] is node:
+            return entry
+
+        # The node might be a copy of a node in graph. Fall back to compare the content.
+        for key in self._op_type_to_nodes.get(node.op_type, {}):
+            stored_node, graph = self._node_to_graph[key]
+            if stored_node == node:
+                return stored_node, graph
+        return None
+
+    def _get_input_name_to_nodes(self) -> Dict[str, List[NodeProto]]:
+        """Returns the index of consumers. It is for read only, and caller shall not change it."""
+        if self._input_name_to_nodes is None:
+            self._build_edge_indexes()
+        return self._input_name_to_nodes
+
+    def _get_output_name_to_node(self) -> Dict[str, NodeProto]:
+        """Returns the index of producers. It is for read only, and caller shall not change it."""
+        if self._output_name_to_node is None:
+            self._build_edge_indexes()
+        return self._output_name_to_node
+
+    def input_name_to_nodes(self):
+        """Returns a dictionary with input name as key, and a list of nodes that consume the input as value.
+        The dictionary is a shallow copy of the index. Lists in it are shared, and shall not be changed in place.
+        """
+        return dict(self._get_input_name_to_nodes())
+
+    def output_name_to_node(self):
+        """Returns a dictionary with output name as key, and the node that produces the output as value."""
+        return dict(self._get_output_name_to_node())
 
     def functions(self):
         all_functions = [list(self.model.functions)]
@@ -130,10 +299,8 @@ class OnnxModel:
         return output_names
 
     def get_graph_by_node(self, node):
-        for graph in self.graphs():
-            if node in graph.node:
-                return graph
-        return None
+        entry = self._find_indexed_node(node)
+        return entry[1] if entry is not None else None
 
     def get_graph_by_name(self, graph_name):
         for graph in self.graphs():
@@ -149,27 +316,54 @@ class OnnxModel:
         return len(graph.node)
 
     def remove_node(self, node):
-        for graph in self.graphs():
-            if node in graph.node:
-                graph.node.remove(node)
-                return
-        logger.warning("Failed to remove node %s", node)  # It might be a bug to hit this line.
+        self.remove_nodes([node])
 
     def remove_nodes(self, nodes_to_remove):
+        # Group nodes by graph, then remove them in one pass of each graph. Nodes are located by identity, which is
+        # much faster than `graph.node.remove(node)` that compares the content of nodes one by one.
+        graph_to_node_ids = {}
         for node in nodes_to_remove:
-            self.remove_node(node)
+            entry = self._find_indexed_node(node)
+            if entry is None:
+                logger.warning("Failed to remove node %s", node)  # It might be a bug to hit this line.
+                continue
+            stored_node, graph = entry
+            self._unindex_node(stored_node)
+            if id(graph) not in graph_to_node_ids:
+                graph_to_node_ids[id(graph)] = (graph, {id(stored_node)})
+            else:
+                graph_to_node_ids[id(graph)][1].add(id(stored_node))
+
+        for graph, node_ids in graph_to_node_ids.values():
+            if len(node_ids) == 1:
+                index = next(i for i, n in enumerate(graph.node) if id(n) in node_ids)
+                del graph.node[index]
+            else:
+                # Stable sort moves nodes to remove to the end without copying nodes, then truncate.
+                graph.node.sort(key=lambda n, ids=node_ids: id(n) in ids)
+                del graph.node[len(graph.node) - len(node_ids) :]
 
     def add_node(self, node, graph_name=None):
         if graph_name is None or graph_name == self.model.graph.name:
-            self.model.graph.node.extend([node])
+            graph = self.model.graph
+            graph.node.extend([node])
+            stored_node = graph.node[-1]
         else:
             graph = self.get_graph_by_name(graph_name)
             insert_idx = self.get_topological_insert_id(graph, node.output)
             graph.node.insert(insert_idx, node)
+            stored_node = graph.node[insert_idx]
+
+        # Node is copied when it is added to graph, so we index the object stored in graph.
+        self._index_node(stored_node, graph, appended=stored_node is graph.node[-1])
 
     def add_nodes(self, nodes_to_add, node_name_to_graph_name=None):
         if node_name_to_graph_name is None:
-            self.model.graph.node.extend(nodes_to_add)
+            graph = self.model.graph
+            start = len(graph.node)
+            graph.node.extend(nodes_to_add)
+            for i in range(start, len(graph.node)):
+                self._index_node(graph.node[i], graph)
         else:
             for node in nodes_to_add:
                 graph_name = node_name_to_graph_name[node.name]
@@ -177,10 +371,14 @@ class OnnxModel:
 
     def add_initializer(self, tensor, graph_name=None):
         if graph_name is None or graph_name == self.model.graph.name:
-            self.model.graph.initializer.extend([tensor])
+            graph = self.model.graph
         else:
             graph = self.get_graph_by_name(graph_name)
-            graph.initializer.extend([tensor])
+        graph.initializer.extend([tensor])
+
+        # The first initializer with the name is returned by get_initializer.
+        if self._name_to_initializer is not None and tensor.name not in self._name_to_initializer:
+            self._name_to_initializer[tensor.name] = graph.initializer[-1]
 
     def add_input(self, input, graph_name=None):
         if graph_name is None or graph_name == self.model.graph.name:
@@ -189,23 +387,77 @@ class OnnxModel:
             graph = self.get_graph_by_name(graph_name)
             graph.input.extend([input])
 
-    @staticmethod
-    def replace_node_input(node, old_input_name, new_input_name):
+    @_StaticOrModelMethod
+    def replace_node_input(self, node, old_input_name, new_input_name):
+        """Replace all the inputs of a node that have the old name. Use set_node_input to change one input."""
         assert isinstance(old_input_name, str) and isinstance(new_input_name, str)
+        count = 0
         for j in range(len(node.input)):
             if node.input[j] == old_input_name:
                 node.input[j] = new_input_name
+                count += 1
+
+        # Update index only when the node is in graph. It could be a new node that has not been added.
+        if count > 0 and self is not None and self._is_indexed(node):
+            if old_input_name:
+                self._remove_consumer(old_input_name, node)
+            if new_input_name:
+                consumers = self._input_name_to_nodes.get(new_input_name, [])
+                self._input_name_to_nodes[new_input_name] = consumers + [node] * count
+
+    def set_node_input(self, node, index, new_input_name):
+        """Set the input of a node at an index. Other inputs of the node with the same name are not changed."""
+        assert isinstance(new_input_name, str)
+        old_input_name = node.input[index]
+        node.input[index] = new_input_name
+
+        if old_input_name != new_input_name and self._is_indexed(node):
+            if old_input_name:
+                consumers = list(self._input_name_to_nodes.get(old_input_name, []))
+                index_in_consumers = next((i for i, n in enumerate(consumers) if n is node), None)
+                if index_in_consumers is not None:
+                    del consumers[index_in_consumers]
+                if consumers:
+                    self._input_name_to_nodes[old_input_name] = consumers
+                else:
+                    self._input_name_to_nodes.pop(old_input_name, None)
+            if new_input_name:
+                consumers = self._input_name_to_nodes.get(new_input_name, [])
+                self._input_name_to_nodes[new_input_name] = [*consumers, node]
 
     def replace_input_of_all_nodes(self, old_input_name, new_input_name):
-        for node in self.model.graph.node:
-            OnnxModel.replace_node_input(node, old_input_name, new_input_name)
+        graph = self.model.graph
+        for node in self._get_input_name_to_nodes().get(old_input_name, []):
+            if self._node_to_graph[id(node)][1] is graph:
+                self.replace_node_input(node, old_input_name, new_input_name)
 
-    @staticmethod
-    def replace_node_output(node, old_output_name, new_output_name):
+    @_StaticOrModelMethod
+    def replace_node_output(self, node, old_output_name, new_output_name):
+        """Replace all the outputs of a node that have the old name. Use set_node_output to change one output."""
         assert isinstance(old_output_name, str) and isinstance(new_output_name, str)
+        count = 0
         for j in range(len(node.output)):
             if node.output[j] == old_output_name:
                 node.output[j] = new_output_name
+                count += 1
+
+        if count > 0 and self is not None and self._is_indexed(node):
+            self._update_producer(node, old_output_name, new_output_name)
+
+    def set_node_output(self, node, index, new_output_name):
+        """Set the output of a node at an index."""
+        assert isinstance(new_output_name, str)
+        old_output_name = node.output[index]
+        node.output[index] = new_output_name
+
+        if old_output_name != new_output_name and self._is_indexed(node):
+            self._update_producer(node, old_output_name, new_output_name)
+
+    def _update_producer(self, node, old_output_name, new_output_name):
+        if old_output_name and self._output_name_to_node.get(old_output_name) is node:
+            del self._output_name_to_node[old_output_name]
+        if new_output_name:
+            self._output_name_to_node[new_output_name] = node
 
     def replace_output_of_all_nodes(self, old_output_name, new_output_name):
         # This function shall be used carefully. For example:
@@ -215,25 +467,32 @@ class OnnxModel:
         # If we want to remove the Cast node: replace output of Add to new_name is not enough;
         # The input of Transpose shall also be updated to new_name.
         for node in self.model.graph.node:
-            OnnxModel.replace_node_output(node, old_output_name, new_output_name)
+            self.replace_node_output(node, old_output_name, new_output_name)
 
     def get_initializer(self, name):
-        for graph in self.graphs():
-            for tensor in graph.initializer:
-                if tensor.name == name:
-                    return tensor
-        return None
+        if self._name_to_initializer is None:
+            self._name_to_initializer = {}
+            for graph in self.graphs():
+                for tensor in graph.initializer:
+                    if tensor.name not in self._name_to_initializer:
+                        self._name_to_initializer[tensor.name] = tensor
+        return self._name_to_initializer.get(name)
 
     def get_nodes_by_op_type(self, op_type):
-        nodes = []
-        for node in self.nodes():
-            if node.op_type == op_type:
-                nodes.append(node)
+        """Returns the nodes of an op type in all graphs, in graph order like nodes()."""
+        if self._op_type_to_nodes is None:
+            self._build_node_indexes()
+        nodes = list(self._op_type_to_nodes.get(op_type, {}).values())
+        if len(nodes) > 1:
+            # Nodes might be added to a graph that is not in the order yet.
+            if self._node_order is None or any(id(node) not in self._node_order for node in nodes):
+                self._build_node_order()
+            nodes.sort(key=lambda node: self._node_order[id(node)])
         return nodes
 
     def get_children(self, node, input_name_to_nodes=None):
         if input_name_to_nodes is None:
-            input_name_to_nodes = self.input_name_to_nodes()
+            input_name_to_nodes = self._get_input_name_to_nodes()
 
         children = []
         for output in node.output:
@@ -244,7 +503,7 @@ class OnnxModel:
 
     def get_parents(self, node, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         parents = []
         for input in node.input:
@@ -254,7 +513,7 @@ class OnnxModel:
 
     def get_parent(self, node, i, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         if len(node.input) <= i:
             return None
@@ -317,7 +576,7 @@ class OnnxModel:
         assert input_index is None or input_index >= 0
 
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         if input_index is None:
             parent, index = self.match_first_parent(node, parent_op_type, output_name_to_node, exclude)
@@ -387,7 +646,7 @@ class OnnxModel:
             assert len(parent_input_index) == len(parent_op_types)
 
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         current_node = node
         matched_parents = []
@@ -480,7 +739,7 @@ class OnnxModel:
 
     def find_first_parent_by_type(self, node, parent_type, output_name_to_node=None, recursive=True):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         parents = self.get_parents(node, output_name_to_node)
         dq = deque(parents)
@@ -497,11 +756,11 @@ class OnnxModel:
         return None
 
     def get_constant_value(self, output_name):
-        for node in self.get_nodes_by_op_type("Constant"):
-            if node.output[0] == output_name:
-                for att in node.attribute:
-                    if att.name == "value":
-                        return numpy_helper.to_array(att.t)
+        node = self._get_output_name_to_node().get(output_name)
+        if node is not None and node.op_type == "Constant":
+            for att in node.attribute:
+                if att.name == "value":
+                    return numpy_helper.to_array(att.t)
 
         # Fall back to intializer since constant folding might have been applied.
         initializer = self.get_initializer(output_name)
@@ -542,7 +801,7 @@ class OnnxModel:
 
     def get_children_subgraph_nodes(self, root_node, stop_nodes, input_name_to_nodes=None):
         if input_name_to_nodes is None:
-            input_name_to_nodes = self.input_name_to_nodes()
+            input_name_to_nodes = self._get_input_name_to_nodes()
 
         children = input_name_to_nodes[root_node.output[0]]
 
@@ -654,7 +913,7 @@ class OnnxModel:
             if node.op_type == "Cast":
                 parent = self.get_parent(node, 0, output_name_to_node=output_name_to_node)
                 if parent and parent.op_type == "Cast":
-                    node.input[0] = parent.input[0]
+                    self.set_node_input(node, 0, parent.input[0])
                     removed_count += 1
 
         if removed_count > 0:
@@ -681,7 +940,7 @@ class OnnxModel:
             for node in nodes_to_remove:
                 if bool(set(node.output) & graph_output_names):
                     if (not bool(set(node.input) & graph_input_names)) and len(
-                        self.input_name_to_nodes()[node.input[0]]
+                        self._get_input_name_to_nodes()[node.input[0]]
                     ) == 1:
                         self.replace_output_of_all_nodes(node.input[0], node.output[0])
                     else:
@@ -734,6 +993,9 @@ class OnnxModel:
             max_finite_val (float, optional): maximal finite value. Defaults to 1e4.
             force_fp16_inputs(Dict[str, List[int]]): Force the conversion of the inputs of some operators to float16, even if
                                                      this script's preference it to keep them in float32.
+            num_threads (int, optional): number of threads converting initializers. Defaults to the number of CPUs.
+            cast_report (Dict[str, List[str]], optional): dictionary filled with the names of the inserted Cast nodes
+                                                          by reason. Defaults to None.
         """
         if "keep_io_types" not in kwargs:
             kwargs["keep_io_types"] = True
@@ -786,6 +1048,8 @@ class OnnxModel:
                     "force_fp16_initializers",
                     "force_fp16_inputs",
                     "use_bfloat16_as_blocked_nodes_dtype",
+                    "num_threads",
+                    "cast_report",
                 ]
                 if key in kwargs
             }
@@ -847,7 +1111,7 @@ class OnnxModel:
 
     def get_parent_subgraph_nodes(self, node, stop_nodes, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         unique_nodes = []
 
@@ -892,13 +1156,12 @@ class OnnxModel:
         return -1
 
     def remove_unused_constant(self):
-        input_name_to_nodes = self.input_name_to_nodes()
+        input_name_to_nodes = self._get_input_name_to_nodes()
 
         # remove unused constant
         unused_nodes = []
-        nodes = self.nodes()
-        for node in nodes:
-            if node.op_type == "Constant" and node.output[0] not in input_name_to_nodes:
+        for node in self.get_nodes_by_op_type("Constant"):
+            if node.output[0] not in input_name_to_nodes:
                 unused_nodes.append(node)
 
         self.remove_nodes(unused_nodes)
@@ -925,7 +1188,7 @@ class OnnxModel:
 
         keep_outputs = [output.name for output in self.model.graph.output] if outputs is None else outputs
 
-        output_name_to_node = self.output_name_to_node()
+        output_name_to_node = self._get_output_name_to_node()
 
         def get_first_output(node):
             if node.output[0]:
@@ -950,20 +1213,17 @@ class OnnxModel:
                         dq.appendleft(output_name_to_node[name])
 
         # Keep only those nodes in the output_to_node dictionary.
-        nodes_to_keep = []
-        num_nodes_removed = 0
+        nodes_to_remove = []
         for node in self.model.graph.node:
             first_output = get_first_output(node)
             kept_node = output_to_node.get(first_output)
 
             # Need double check the node since fused node might reuse output name of some nodes to be removed.
-            # It is slow to compare whole node, so we compare op_type first to avoid comparing node in most cases.
-            if kept_node and kept_node.op_type == node.op_type and kept_node == node:
-                nodes_to_keep.append(node)
-            else:
-                num_nodes_removed += 1
-        self.model.graph.ClearField("node")
-        self.model.graph.node.extend(nodes_to_keep)
+            # Nodes from the index are the objects stored in graph, so we can compare identity instead of content.
+            if kept_node is not node:
+                nodes_to_remove.append(node)
+        num_nodes_removed = len(nodes_to_remove)
+        self.remove_nodes(nodes_to_remove)
 
         # Remove graph outputs not in list
         output_to_remove = []
@@ -977,7 +1237,7 @@ class OnnxModel:
         # Remove graph inputs not used by any node.
         input_to_remove = []
         if allow_remove_graph_inputs:
-            input_name_to_nodes = self.input_name_to_nodes()
+            input_name_to_nodes = self._get_input_name_to_nodes()
             input_to_remove = [input for input in self.model.graph.input if input.name not in input_name_to_nodes]
             for name in input_to_remove:
                 self.model.graph.input.remove(name)
@@ -997,16 +1257,16 @@ class OnnxModel:
     def update_graph(self, verbose=False, allow_remove_graph_inputs=False):
         graph = self.model.graph
 
-        remaining_input_names = []
-        for node in graph.node:
-            if node.op_type in ["Loop", "Scan", "If"]:
+        for op_type in ["Loop", "Scan", "If"]:
+            if any(self.get_graph_by_node(node) is graph for node in self.get_nodes_by_op_type(op_type)):
                 # TODO: handle inner graph
-                logger.debug(f"Skip update_graph since graph has operator: {node.op_type}")
+                logger.debug(f"Skip update_graph since graph has operator: {op_type}")
                 return
+
+        remaining_input_names = set()
+        for node in graph.node:
             if node.op_type != "Constant":
-                for input_name in node.input:
-                    if input_name not in remaining_input_names:
-                        remaining_input_names.append(input_name)
+                remaining_input_names.update(node.input)
         if verbose:
             logger.debug(f"remaining input names: {remaining_input_names}")
 
@@ -1025,13 +1285,17 @@ class OnnxModel:
         # remove weights that are not used
         weights_to_remove = []
         weights_to_keep = []
+        graph_output_names = {output.name for output in graph.output}
         for initializer in graph.initializer:
-            if initializer.name not in remaining_input_names and not self.find_graph_output(initializer.name):
+            if initializer.name not in remaining_input_names and initializer.name not in graph_output_names:
                 weights_to_remove.append(initializer)
             else:
                 weights_to_keep.append(initializer.name)
-        for initializer in weights_to_remove:
-            graph.initializer.remove(initializer)
+        if weights_to_remove:
+            remove_ids = {id(initializer) for initializer in weights_to_remove}
+            graph.initializer.sort(key=lambda t: id(t) in remove_ids)
+            del graph.initializer[len(graph.initializer) - len(weights_to_remove) :]
+            self._name_to_initializer = None
 
         names_to_remove = [initializer.name for initializer in weights_to_remove]
         logger.debug(f"remove {len(weights_to_remove)} unused initializers: {names_to_remove}")
@@ -1058,67 +1322,145 @@ class OnnxModel:
         return True
 
     @staticmethod
-    def graph_topological_sort(graph, is_deterministic=False):
-        deps_set = set()  # dependency set of all node
-        sorted_node_set = set()  # sorted node set
-        sorted_nodes = []  # initialize sorted_nodes
-
-        initializer_names = [init.name for init in graph.initializer]
-        graph_input_names = [input.name for input in graph.input]
-        input_names = initializer_names + graph_input_names
-
-        if is_deterministic:
-            input_names.sort()
-
-        for input_name in input_names:
-            deps_set.add(input_name)
-
-        sorted_node_set_len = -1
-        graph_nodes = graph.node if not is_deterministic else sorted(graph.node, key=lambda x: x.name)
-
-        last_node_name = None
-        while len(sorted_node_set) != len(graph_nodes):
-            if len(sorted_node_set) == sorted_node_set_len:
-                break
-            sorted_node_set_len = len(sorted_node_set)
-            for node_idx, node in enumerate(graph_nodes):
-                if node_idx in sorted_node_set:
+    def _get_subgraph_outer_inputs(node) -> List[str]:
+        """Names that subgraphs of a node (like If or Loop) read from enclosing scopes."""
+        outer_inputs = []
+        for attr in node.attribute:
+            if attr.type == AttributeProto.AttributeType.GRAPH:
+                subgraphs = [attr.g]
+            elif attr.type == AttributeProto.AttributeType.GRAPHS:
+                subgraphs = list(attr.graphs)
+            else:
+                continue
+            for subgraph in subgraphs:
+                local_names = {init.name for init in subgraph.initializer}
+                local_names.update(input.name for input in subgraph.input)
+                for subgraph_node in subgraph.node:
+                    local_names.update(subgraph_node.output)
+                for subgraph_node in subgraph.node:
+                    for input_name in itertools.chain(
+                        subgraph_node.input, OnnxModel._get_subgraph_outer_inputs(subgraph_node)
+                    ):
+                        if input_name and input_name not in local_names:
+                            outer_inputs.append(input_name)
+                for output in subgraph.output:
+                    if output.name not in local_names:
+                        outer_inputs.append(output.name)
+        return outer_inputs
+
+    @staticmethod
+    def graph_topological_sort(graph, is_deterministic=False, is_subgraph=False):
+        """Sort nodes of a graph in topological order with Kahn's algorithm.
+
+        Among the nodes that are ready, the one appearing first in the graph (or with the smallest name when
+        is_deterministic is True) is emitted first, so a graph that is already sorted keeps its node order.
+
+        Args:
+            graph (GraphProto): the graph to sort in place.
+            is_deterministic (bool): order ready nodes by name instead of by their position in the graph.
+            is_subgraph (bool): whether the graph is a subgraph. Inputs of a subgraph that are not produced
+                inside it are treated as values of enclosing graphs instead of missing inputs.
+        """
+        graph_nodes = list(graph.node) if not is_deterministic else sorted(graph.node, key=lambda x: x.name)
+        num_nodes = len(graph_nodes)
+
+        available_names = {init.name for init in graph.initializer}
+        available_names.update(input.name for input in graph.input)
+
+        output_to_producers = {}
+        for node_idx, node in enumerate(graph_nodes):
+            for output in node.output:
+                if output:
+                    output_to_producers.setdefault(output, []).append(node_idx)
+
+        # For each node, the indices of nodes consuming its outputs (one entry per edge).
+        consumers = [[] for _ in range(num_nodes)]
+        in_degree = [0] * num_nodes
+        missing_inputs = {}
+        for node_idx, node in enumerate(graph_nodes):
+            for input_name in node.input:
+                if not input_name or input_name in available_names:
                     continue
-                input_count = sum(1 for _ in node.input if _)
-                if input_count == 0:
-                    sorted_nodes.append(node)
-                    sorted_node_set.add(node_idx)
-                    for output in node.output:
-                        if output:
-                            deps_set.add(output)
+                producers = output_to_producers.get(input_name)
+                if producers is None:
+                    if not is_subgraph:
+                        missing_inputs.setdefault(node_idx, input_name)
                     continue
-                failed = False
-                for input_name in node.input:
-                    if input_name and input_name not in deps_set:
-                        failed = True
-                        last_node_name = node.name
-                if not failed:
-                    sorted_nodes.append(node)
-                    sorted_node_set.add(node_idx)
-                    for output in node.output:
-                        if output:
-                            deps_set.add(output)
-                else:
+                for producer_idx in producers:
+                    consumers[producer_idx].append(node_idx)
+                in_degree[node_idx] += len(producers)
+
+            # Values used by subgraphs of this node need to be computed before the node.
+            for input_name in OnnxModel._get_subgraph_outer_inputs(node):
+                if input_name in available_names:
                     continue
+                for producer_idx in output_to_producers.get(input_name, []):
+                    consumers[producer_idx].append(node_idx)
+                    in_degree[node_idx] += 1
+
+        ready = [
+            node_idx for node_idx in range(num_nodes) if in_degree[node_idx] == 0 and node_idx not in missing_inputs
+        ]
+        heapq.heapify(ready)
+        sorted_nodes = []
+        is_sorted = [False] * num_nodes
+        while ready:
+            node_idx = heapq.heappop(ready)
+            sorted_nodes.append(graph_nodes[node_idx])
+            is_sorted[node_idx] = True
+            for consumer_idx in consumers[node_idx]:
+                in_degree[consumer_idx] -= 1
+                if in_degree[consumer_idx] == 0 and consumer_idx not in missing_inputs:
+                    heapq.heappush(ready, consumer_idx)
+
+        if len(sorted_nodes) != num_nodes:
+            if missing_inputs:
+                node_idx, input_name = min(missing_inputs.items())
+                raise RuntimeError(
+                    f"Graph {graph.name} is not a DAG: input {input_name} of node {graph_nodes[node_idx].name} "
+                    f"is not a graph input, initializer or output of any node"
+                )
 
-        if len(sorted_node_set) != len(graph.node):
+            # Each remaining node has at least one unsorted producer, so walking from any remaining node to one
+            # of its unsorted producers must eventually revisit a node, and the revisited part is a cycle.
+            unsorted_producers = [[] for _ in range(num_nodes)]
+            for node_idx in range(num_nodes):
+                if not is_sorted[node_idx]:
+                    for consumer_idx in consumers[node_idx]:
+                        unsorted_producers[consumer_idx].append(node_idx)
+
+            node_idx = next(i for i in range(num_nodes) if not is_sorted[i])
+            path = []
+            position_in_path = {}
+            while node_idx not in position_in_path:
+                position_in_path[node_idx] = len(path)
+                path.append(node_idx)
+                node_idx = unsorted_producers[node_idx][0]
+            cycle_start = position_in_path[node_idx]
+            cycle = [graph_nodes[i].name for i in [node_idx, *reversed(path[cycle_start + 1 :])]]
             raise RuntimeError(
-                f"Graph is not a DAG: len(sorted_node_set)={len(sorted_node_set)}, len(graph.node)={len(graph.node)}, failed at node {last_node_name}"
+                f"Graph {graph.name} is not a DAG: {num_nodes - len(sorted_nodes)} of {num_nodes} nodes cannot be"
+                f" sorted because of cycle {' -> '.join([*cycle, cycle[0]])}"
             )
 
         graph.ClearField("node")
         graph.node.extend(sorted_nodes)
 
     def topological_sort(self, is_deterministic=False):
-        # TODO: support graph_topological_sort() in subgraphs
-        # for graph in self.graphs():
-        #    self.graph_topological_sort(graph)
-        OnnxModel.graph_topological_sort(self.model.graph, is_deterministic)
+        def sort_graph(graph, is_subgraph):
+            # Subgraphs are sorted before their parent graph since sorting copies nodes of the parent graph.
+            for node in graph.node:
+                for attr in node.attribute:
+                    if attr.type == AttributeProto.AttributeType.GRAPH:
+                        sort_graph(attr.g, True)
+                    elif attr.type == AttributeProto.AttributeType.GRAPHS:
+                        for g in attr.graphs:
+                            sort_graph(g, True)
+            OnnxModel.graph_topological_sort(graph, is_deterministic, is_subgraph)
+
+        sort_graph(self.model.graph, False)
+        # Nodes are copied when sorting, so indexes need to be rebuilt.
+        self.invalidate_indexes()
 
     @staticmethod
     def save(
@@ -1223,32 +1565,79 @@ class OnnxModel:
         return op_count
 
     @staticmethod
-    def to_data_hash(tensor: TensorProto, base_dir: str = "") -> int:
-        """Converts a tensor def object to a hash for data comparison purposes.
+    def _external_data_digest(tensor: TensorProto, base_dir: str = "", chunk_size: int = 64 * 1024 * 1024):
+        """Computes digest of data of an external tensor. The file is memory mapped and digested in chunks, so that
+        the data is not loaded into memory.
+        """
+        info = ExternalDataInfo(tensor)
+        file_path = os.path.join(base_dir, info.location)
+        hasher = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            offset = info.offset or 0
+            end = file_size if info.length is None else offset + info.length
+            if end > file_size:
+                raise ValueError(f"External data of tensor {tensor.name} is out of the range of file {file_path}")
+            if end > offset:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for start in range(offset, end, chunk_size):
+                            hasher.update(view[start : min(start + chunk_size, end)])
+                    finally:
+                        view.release()
+        return hasher.digest()
+
+    @staticmethod
+    def to_data_digest(tensor: TensorProto, base_dir: str = "") -> bytes:
+        """Computes a SHA-256 digest of tensor data. The digest is the same for raw_data, typed fields and external
+        data when they store the same values. External data is digested without loading it into memory.
         Args:
             tensor: a TensorProto object.
             base_dir: if external tensor exists, base_dir can help to find the path to it
         Returns:
-            hash: a hash of the data.
+            digest: SHA-256 digest of the data.
         """
         if tensor.HasField("segment"):
             raise ValueError("Currently not supporting loading segments.")
         if tensor.data_type == TensorProto.UNDEFINED:
             raise TypeError("The element type in the input tensor is not defined.")
-        tensor_dtype = tensor.data_type
-        storage_field = helper.tensor_dtype_to_field(tensor_dtype)
 
         if tensor.data_type == TensorProto.STRING:
-            utf8_strings = getattr(tensor, storage_field)
-            return hash(tuple(s.decode("utf-8") for s in utf8_strings))
-        # Load raw data from external tensor if it exists
+            hasher = hashlib.sha256()
+            for s in tensor.string_data:
+                hasher.update(len(s).to_bytes(8, "little"))
+                hasher.update(s)
+            return hasher.digest()
         if uses_external_data(tensor):
-            load_external_data_for_tensor(tensor, base_dir)
+            return OnnxModel._external_data_digest(tensor, base_dir)
         if tensor.HasField("raw_data"):
-            return hash(tensor.raw_data)
-        else:
-            np_data = numpy_helper.to_array(tensor)
-            return hash(np_data.tobytes())
+            return hashlib.sha256(tensor.raw_data).digest()
+        np_data = numpy_helper.to_array(tensor)
+        return hashlib.sha256(np_data.tobytes()).digest()
+
+    @staticmethod
+    def to_data_hash(tensor: TensorProto, base_dir: str = "") -> int:
+        """Converts a tensor def object to a hash for data comparison purposes.
+        Args:
+            tensor: a TensorProto object.
+            base_dir: if external tensor exists, base_dir can help to find the path to it
+        Returns:
+            hash: a hash of the data.
+        """
+        return int.from_bytes(OnnxModel.to_data_digest(tensor, base_dir), "little")
+
+    @staticmethod
+    def get_data_size(tensor: TensorProto) -> int:
+        """Returns number of bytes of tensor data, including the data stored in external file."""
+        if tensor.data_type == TensorProto.STRING:
+            return sum(len(s) for s in tensor.string_data)
+        if uses_external_data(tensor):
+            info = ExternalDataInfo(tensor)
+            if info.length is not None:
+                return info.length
+        element_size = helper.tensor_dtype_to_np_dtype(tensor.data_type).itemsize
+        return int(np.prod(tensor.dims, dtype=np.int64)) * element_size
 
     @staticmethod
     def has_same_value(
@@ -1268,6 +1657,9 @@ class OnnxModel:
         Returns:
             bool: True when two initializers has same value.
         """
+        if tensor1.data_type != tensor2.data_type or tensor1.dims != tensor2.dims:
+            return False
+
         sig1 = (
             signature_cache1[tensor1.name]
             if signature_cache1 and tensor1.name in signature_cache1
@@ -1282,48 +1674,90 @@ class OnnxModel:
             signature_cache1[tensor1.name] = sig1
         if signature_cache2 is not None:
             signature_cache2[tensor2.name] = sig2
-        if sig1 == sig2 and tensor1.data_type == tensor2.data_type and tensor1.dims == tensor2.dims:
-            # Same signature, now do the expensive check to confirm the data is the same
-            return (numpy_helper.to_array(tensor1) == numpy_helper.to_array(tensor2)).all()
 
-        return False
+        # The signature is a SHA-256 digest of the data, so there is no need to compare the data.
+        return sig1 == sig2
 
-    def remove_duplicated_initializer(self, cache: Optional[dict] = None):
+    def remove_duplicated_initializer(self, cache: Optional[dict] = None, base_dir: str = "") -> Dict[str, int]:
         """Remove initializers with duplicated values, and only keep the first one.
         It could help reduce size of models (like ALBert) with shared weights.
-        If require_raw_data passed, method will only compare raw_data initializers to speed runtime
-        Note: this function does not process subgraph.
-        """
-        if len(self.graphs()) > 1:
-            logger.warning("remove_duplicated_initializer does not process subgraphs.")
 
-        initializer_count = len(self.model.graph.initializer)
+        Initializers are grouped by data type, shape and digest of data, so each initializer is read only once.
+        An initializer in subgraph could be replaced by a duplicated one in the same graph or an outer graph.
+        Initializers that are also graph inputs are skipped since they could be overridden.
 
-        same = [-1] * initializer_count
-        for i in range(initializer_count - 1):
-            if same[i] >= 0:
-                continue
-            for j in range(i + 1, initializer_count):
-                if OnnxModel.has_same_value(
-                    self.model.graph.initializer[i],
-                    self.model.graph.initializer[j],
-                    cache,
-                    cache,
-                ):
-                    same[j] = i
+        Args:
+            cache (dict, optional): dictionary to store data signatures of initializers by name.
+            base_dir (str, optional): directory to find the files of external data.
 
+        Returns:
+            Dict[str, int]: number of removed initializers ("removed_initializers") and their total size
+                            in bytes ("bytes_saved").
+        """
+        graph_input_names = set(self.get_graphs_input_names())
+        removed = {}  # graph id -> names of initializers to remove in the graph
+        graphs = {}  # graph id -> graph
         count = 0
-        for i in range(initializer_count):
-            if same[i] >= 0:
-                count += 1
-                self.replace_input_of_all_nodes(
-                    self.model.graph.initializer[i].name,
-                    self.model.graph.initializer[same[i]].name,
-                )
+        bytes_saved = 0
+
+        def get_signature(tensor):
+            if cache is not None and tensor.name in cache:
+                return cache[tensor.name]
+            signature = OnnxModel.to_data_hash(tensor, base_dir)
+            if cache is not None:
+                cache[tensor.name] = signature
+            return signature
+
+        # Traverse graphs in depth-first order. Initializers of outer graphs are visible to subgraphs, and the inputs
+        # of nodes are renamed in the scope of the removed initializer: its graph and the subgraphs that do not define
+        # a value of the same name.
+        stack = [(self.model.graph, {}, {})]
+        while stack:
+            graph, visible, renames = stack.pop()
+            defined_names = {graph_input.name for graph_input in graph.input}
+            defined_names.update(tensor.name for tensor in graph.initializer)
+            defined_names.update(output for node in graph.node for output in node.output)
+            visible = {key: name for key, name in visible.items() if name not in defined_names}
+            renames = {
+                old: new for old, new in renames.items() if old not in defined_names and new not in defined_names
+            }
+            graph_output_names = {output.name for output in graph.output}
+            for tensor in graph.initializer:
+                if tensor.name in graph_input_names:
+                    continue
+                key = (tensor.data_type, tuple(tensor.dims), get_signature(tensor))
+                kept_name = visible.get(key)
+                if kept_name is None:
+                    visible[key] = tensor.name
+                elif kept_name != tensor.name and tensor.name not in graph_output_names:
+                    renames[tensor.name] = kept_name
+                    count += 1
+                    graphs[id(graph)] = graph
+                    removed.setdefault(id(graph), set()).add(tensor.name)
+                    bytes_saved += OnnxModel.get_data_size(tensor)
+
+            for node in graph.node:
+                for old_name in {name for name in node.input if name in renames}:
+                    self.replace_node_input(node, old_name, renames[old_name])
+                for attr in node.attribute:
+                    if attr.type == AttributeProto.AttributeType.GRAPH:
+                        stack.append((attr.g, visible, renames))
+                    elif attr.type == AttributeProto.AttributeType.GRAPHS:
+                        stack.extend((g, visible, renames) for g in attr.graphs)
+
+        for graph_id, names in removed.items():
+            graph = graphs[graph_id]
+            num_removed = sum(1 for t in graph.initializer if t.name in names)
+            graph.initializer.sort(key=lambda t, names=names: t.name in names)
+            del graph.initializer[len(graph.initializer) - num_removed :]
+        if removed:
+            self._name_to_initializer = None
 
         if count > 0:
             self.update_graph()
-            print(f"Removed {count} initializers with duplicated value")
+            logger.info("Removed %d initializers with duplicated value, saved %d bytes", count, bytes_saved)
+
+        return {"removed_initializers": count, "bytes_saved": bytes_saved}
 
     def add_prefix_to_names(self, prefix: str):
         """Add prefix to initializer or intermediate outputs in graph. Main graph inputs and outputs are excluded.
@@ -1359,6 +1793,8 @@ class OnnxModel:
             if value_info.name not in excluded:
                 value_info.name = prefix + value_info.name
 
+        self.invalidate_indexes()
+
     def clean_shape_infer(self):
         self.model.graph.ClearField("value_info")
 
@@ -1432,7 +1868,7 @@ class OnnxModel:
         new_cast_node = None
         nodes_to_remove = []
 
-        input_name_to_nodes = self.input_name_to_nodes()
+        input_name_to_nodes = self._get_input_name_to_nodes()
         if graph_input.name in input_name_to_nodes:
             nodes = input_name_to_nodes[graph_input.name]
 
@@ -1451,10 +1887,10 @@ class OnnxModel:
                     to=int(graph_input.type.tensor_type.elem_type),
                     name=node_name,
                 )
-                graph.node.extend([new_cast_node])
+                self.add_node(new_cast_node)
 
                 for node in nodes_not_cast:
-                    OnnxModel.replace_node_input(node, graph_input.name, output_name)
+                    self.replace_node_input(node, graph_input.name, output_name)
 
             # For children that is Cast node, no need to insert Cast.
             # When the children is Cast to int32, we can remove that Cast node since input type is int32 now.
@@ -1507,12 +1943,12 @@ class OnnxModel:
             to=int(new_type),
             name=node_name,
         )
-        graph.node.extend([cast_node])
+        self.add_node(cast_node)
         graph_output.type.tensor_type.elem_type = int(new_type)
         return cast_node
 
     def rename_graph_output(self, old_name: str, new_name: str):
-        if new_name in self.output_name_to_node():
+        if new_name in self._get_output_name_to_node():
             raise RuntimeError("{new_name} exists in graph")
 
         graph = self.graph()
@@ -227,7 +227,7 @@ class BertOnnxModelKeras(BertOnnxModelTF):
         for reshape_node in reshape_nodes:
             parent = self.get_parent(reshape_node, 0)
             if parent is not None and parent.op_type == "Reshape":
-                reshape_node.input[0] = parent.input[0]
+                self.set_node_input(reshape_node, 0, parent.input[0])
                 count += 1
 
         if count > 0:
@@ -406,11 +406,11 @@ class BertOnnxModelKeras(BertOnnxModelTF):
                 matmul_2,
                 skiplayernorm,
             ) = path
-            add_2.input[0] = matmul_2.output[0]
+            self.set_node_input(add_2, 0, matmul_2.output[0])
             self.remove_node(reshape_3)
-            matmul_1.input[0] = gelu.output[0]
+            self.set_node_input(matmul_1, 0, gelu.output[0])
             self.remove_node(reshape_2)
-            add_1.input[0] = matmul_1.output[0]
+            self.set_node_input(add_1, 0, matmul_1.output[0])
             self.remove_node(reshape_1)
             reshape_removed += 3
 
@@ -452,16 +452,16 @@ class BertOnnxModelKeras(BertOnnxModelTF):
                 skiplayernorm,
             ) = path
 
-            matmul_2.input[0] = skiplayernorm.output[0]
+            self.set_node_input(matmul_2, 0, skiplayernorm.output[0])
             self.remove_node(reshape_4)
 
-            add_2.input[0] = matmul_2.output[0]
+            self.set_node_input(add_2, 0, matmul_2.output[0])
             self.remove_node(reshape_3)
 
-            matmul_1.input[0] = gelu.output[0]
+            self.set_node_input(matmul_1, 0, gelu.output[0])
             self.remove_node(reshape_2)
 
-            add_1.input[0] = matmul_1.output[0]
+            self.set_node_input(add_1, 0, matmul_1.output[0])
             self.remove_node(reshape_1)
 
             reshape_removed += 4
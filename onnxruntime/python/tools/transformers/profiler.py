@@ -186,52 +186,42 @@ def load_profile_json(profile_file):
     return sess_time
 
 
-def parse_kernel_results(sess_time, threshold=0):
-    """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
-
-    Args:
-        sess_time (List[Dict]): profile data
-        kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
-        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
+def load_profile_aggregates(profile_file):
+    """Aggregate the profile data in a single pass over the file, without loading it in memory.
 
     Returns:
-        List[str]: lines of string for output.
+        ProfileAggregates: profile data accepted by parse_kernel_results, parse_node_results and group_node_results.
     """
-    kernel_name_to_op_name = {}
-    kernel_time = {}
-    kernel_freq = {}
-    total = 0
-    session_init = False
-    for item in sess_time:
-        # Skip all MemcpyHostToDevice before session_initialization
-        if item["cat"] == "Session" and item["name"] == "session_initialization":
-            session_init = True
-        if not session_init:
-            continue
+    # Imported here since onnxruntime shall not be imported before OMP_NUM_THREADS is set in run().
+    from onnxruntime.tools.profile_trace import aggregate_profile, iter_trace_events
+
+    print(f"loading profile output {profile_file} ...")
+    return aggregate_profile(iter_trace_events(profile_file), skip_op_types=NODES_TYPE_CONTAINING_SUBGRAPH)
 
-        if item["cat"] == "Kernel" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            kernel_name = item["name"]
 
-            op_name = item["args"]["op_name"]
-            if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
-                continue
+def _get_aggregates(sess_time):
+    from onnxruntime.tools.profile_trace import ProfileAggregates, aggregate_profile
 
-            # Handle MemcpyHostToDevice and MemcpyDeviceToHost here
-            if not op_name:
-                op_name = f"({kernel_name})"
+    if isinstance(sess_time, ProfileAggregates):
+        return sess_time
+    return aggregate_profile(sess_time, skip_op_types=NODES_TYPE_CONTAINING_SUBGRAPH)
 
-            if kernel_name in kernel_time:
-                kernel_time[kernel_name] += item["dur"]
-                kernel_freq[kernel_name] += 1
-            else:
-                kernel_time[kernel_name] = item["dur"]
-                kernel_freq[kernel_name] = 1
-                kernel_name_to_op_name[kernel_name] = op_name
 
-            total += item["dur"]
+def parse_kernel_results(sess_time, threshold=0):
+    """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
 
+    Args:
+        sess_time (List[Dict] | ProfileAggregates): profile data
+        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
+
+    Returns:
+        List[str]: lines of string for output.
+    """
+    aggregates = _get_aggregates(sess_time)
+    kernel_time = aggregates.kernel_time
     if not kernel_time:
         return ["No kernel record found!"]
+    total = sum(kernel_time.values())
 
     # Output items with run time ratio > thresholds, and sorted by duration in the descending order.
     lines = []
@@ -243,18 +233,14 @@ def parse_kernel_results(sess_time, threshold=0):
         if ratio < threshold:
             continue
 
-        calls = kernel_freq[kernel_name]
+        calls = aggregates.kernel_calls[kernel_name]
         avg_time = duration / float(calls)
         lines.append(f"{duration:10d}\t{ratio * 100.0:5.2f}\t{calls:5d}\t{avg_time:8.1f}\t{kernel_name}")
 
     # Group by operator
     op_time = {}
-    for kernel_name, op_name in kernel_name_to_op_name.items():
-        duration = kernel_time[kernel_name]
-        if op_name in op_time:
-            op_time[op_name] += duration
-        else:
-            op_time[op_name] = duration
+    for kernel_name, op_name in aggregates.kernel_op_name.items():
+        op_time[op_name] = op_time.get(op_name, 0) + kernel_time[kernel_name]
 
     lines.append("\nGroup kernel time by operator:")
     lines.append("-" * 64)
@@ -270,52 +256,15 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
     """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
 
     Args:
-        sess_time (List[Dict]): profile data
+        sess_time (List[Dict] | ProfileAggregates): profile data
         kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
         threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
 
     Returns:
         List[str]: lines of string for output.
     """
-    node_name_list = []
-    node_time = {}
-    node_freq = {}
-    node_provider = {}
-    total = 0
-    for item in sess_time:
-        if item["cat"] == "Node" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            node_name = (
-                item["name"].replace("_kernel_time", "").replace("_fence_before", "").replace("_fence_after", "")
-            )
-
-            if "provider" in item["args"]:
-                if item["args"]["provider"] == "CPUExecutionProvider":
-                    device = "CPU"
-                elif item["args"]["provider"] == "CUDAExecutionProvider":
-                    device = "CUDA"
-                elif item["args"]["provider"] == "DmlExecutionProvider":
-                    device = "DML"
-
-                if node_name not in node_provider:
-                    node_provider[node_name] = device
-                else:
-                    assert node_provider[node_name] == device
-            elif kernel_time_only:
-                continue
-
-            op_name = item["args"]["op_name"]
-            if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
-                continue
-
-            if node_name in node_time:
-                node_time[node_name] += item["dur"]
-                node_freq[node_name] += 1
-            else:
-                node_time[node_name] = item["dur"]
-                node_freq[node_name] = 1
-                node_name_list.append(node_name)
-
-            total += item["dur"]
+    node_results = _get_aggregates(sess_time).node_results(kernel_time_only)
+    total = sum(duration for _, duration, _, _ in node_results)
 
     # Output items in the original order.
     lines = [
@@ -324,12 +273,9 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
         "Total(μs)\tTime%\tAcc %\tAvg(μs)\tCalls\tProvider\tNode",
     ]
     before_percentage = 0.0
-    for node_name in node_name_list:
-        duration = node_time[node_name]
-        calls = node_freq[node_name]
+    for node_name, duration, calls, provider in node_results:
         avg_time = duration / float(calls)
         percentage = (duration / total) * 100.0
-        provider = node_provider.get(node_name, "")
         before_percentage += percentage
         lines.append(
             f"{duration:10d}\t{percentage:5.2f}\t{before_percentage:5.2f}\t{avg_time:8.1f}\t{calls:5d}\t{provider:8s}\t{node_name}"
@@ -339,15 +285,13 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
     lines.append(f"\nTop expensive nodes with Time% >= {threshold*100:.2f}:")
     lines.append("-" * 64)
     lines.append("Total(μs)\tTime%\tAvg(μs)\tCalls\tProvider\tNode")
-    for node_name, duration in sorted(node_time.items(), key=lambda x: x[1], reverse=True):
+    for node_name, duration, calls, provider in sorted(node_results, key=lambda x: x[1], reverse=True):
         ratio = duration / total
         if ratio < threshold:
             continue
 
-        calls = node_freq[node_name]
         avg_time = duration / float(calls)
         percentage = (duration / total) * 100.0
-        provider = node_provider.get(node_name, "")
         lines.append(f"{duration:10d}\t{percentage:5.2f}\t{avg_time:8.1f}\t{calls:5d}\t{provider:8s}\t{node_name}")
 
     return lines
@@ -357,69 +301,18 @@ def group_node_results(sess_time, kernel_time_only, use_gpu):
     """Group results by operator name.
 
     Args:
-        sess_time (List[Dict]): profile data
+        sess_time (List[Dict] | ProfileAggregates): profile data
         kernel_time_only (bool): Only include items for kernel time.
         use_gpu (bool): GPU is used in profiling or not.
 
     Returns:
         List[str]: lines of string for output.
     """
-    op_kernel_time = {}
-    op_kernel_records = {}
-    total_kernel_time = 0
-
-    provider_op_kernel_time = {}
-    provider_op_kernel_records = {}
-    provider_kernel_time = {}
-
-    op_fence_time = {}
-    total_fence_time = 0
-
-    provider_counter = {}
-    for item in sess_time:
-        if item["cat"] == "Node" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            op_name = item["args"]["op_name"]
-
-            # TODO: shall we have a separated group for nodes with subgraph?
-            if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
-                continue
-
-            if "provider" not in item["args"]:
-                if "fence" in item["name"]:
-                    if op_name in op_fence_time:
-                        op_fence_time[op_name] += item["dur"]
-                    else:
-                        op_fence_time[op_name] = item["dur"]
-                    total_fence_time += item["dur"]
-                continue
-
-            provider = item["args"].get("provider", "")
-            if provider in provider_counter:
-                provider_counter[provider] += 1
-            else:
-                provider_counter[provider] = 1
-
-            key = f"{provider}:{op_name}"
-            if key in provider_op_kernel_time:
-                provider_op_kernel_time[key] += item["dur"]
-                provider_op_kernel_records[key] += 1
-            else:
-                provider_op_kernel_time[key] = item["dur"]
-                provider_op_kernel_records[key] = 1
-
-            if provider in provider_kernel_time:
-                provider_kernel_time[provider] += item["dur"]
-            else:
-                provider_kernel_time[provider] = item["dur"]
-
-            if op_name in op_kernel_time:
-                op_kernel_time[op_name] += item["dur"]
-                op_kernel_records[op_name] += 1
-            else:
-                op_kernel_time[op_name] = item["dur"]
-                op_kernel_records[op_name] = 1
-
-            total_kernel_time += item["dur"]
+    aggregates = _get_aggregates(sess_time)
+    op_kernel_time = aggregates.op_kernel_time
+    total_kernel_time = sum(op_kernel_time.values())
+    op_fence_time = aggregates.op_fence_time
+    total_fence_time = sum(op_fence_time.values())
 
     lines = ["", "Grouped by operator"]
     lines.append("-" * 64)
@@ -429,7 +322,7 @@ def group_node_results(sess_time, kernel_time_only, use_gpu):
         kernel_time_ratio = kernel_time / total_kernel_time
         total_time = kernel_time + fence_time
         time_ratio = total_time / (total_kernel_time + total_fence_time)
-        kernel_calls = op_kernel_records[op_name]
+        kernel_calls = aggregates.op_kernel_calls[op_name]
         avg_kernel_time = kernel_time / kernel_calls
         lines.append(
             f"{total_time:10d}\t{time_ratio * 100.0:5.2f}\t{kernel_time:11d}\t{kernel_time_ratio * 100.0:5.2f}\t{kernel_calls:5d}\t{avg_kernel_time:14.1f}\t{fence_time:10d}\t{op_name}"
@@ -438,14 +331,14 @@ def group_node_results(sess_time, kernel_time_only, use_gpu):
     lines += ["", "Grouped by provider + operator"]
     lines.append("-" * 64)
     lines.append("Kernel(μs)\tProvider%\tCalls\tAvgKernel(μs)\tProvider\tOperator")
-    for key, kernel_time in sorted(provider_op_kernel_time.items(), key=lambda x: x[1], reverse=True):
+    for key, kernel_time in sorted(aggregates.provider_op_kernel_time.items(), key=lambda x: x[1], reverse=True):
         parts = key.split(":")
         provider = parts[0]
         op_name = parts[1]
         short_ep = provider.replace("ExecutionProvider", "")
-        calls = provider_op_kernel_records[key]
+        calls = aggregates.provider_op_kernel_calls[key]
         avg_kernel_time = kernel_time / calls
-        provider_time_ratio = kernel_time / provider_kernel_time[provider]
+        provider_time_ratio = kernel_time / aggregates.provider_kernel_time[provider]
         lines.append(
             f"{kernel_time:10d}\t{provider_time_ratio * 100.0:9.2f}\t{calls:5d}\t{avg_kernel_time:14.1f}\t{short_ep:8s}\t{op_name}"
         )
@@ -640,7 +533,7 @@ def create_longformer_inputs(onnx_model, batch_size, sequence_length, global_len
 
 
 def process_results(profile_file, args):
-    profile_records = load_profile_json(profile_file)
+    profile_records = load_profile_aggregates(profile_file)
 
     lines = parse_kernel_results(profile_records, args.threshold)
 
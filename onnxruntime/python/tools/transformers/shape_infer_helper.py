@@ -21,8 +21,8 @@ logger = logging.getLogger(__name__)
 
 
 class SymbolicShapeInferenceHelper(SymbolicShapeInference):
-    def __init__(self, model, verbose=0, int_max=2**31 - 1, auto_merge=True, guess_output_rank=False):
-        super().__init__(int_max, auto_merge, guess_output_rank, verbose)
+    def __init__(self, model, verbose=0, int_max=2**31 - 1, auto_merge=True, guess_output_rank=False, fast=False):
+        super().__init__(int_max, auto_merge, guess_output_rank, verbose, fast=fast)
         self.model_ = model
         self.all_shapes_inferred_: bool = False
         self.is_inferred_: bool = False
@@ -2,6 +2,7 @@
 # Licensed under the MIT License.
 from __future__ import annotations
 
+import asyncio
 import copy
 import ctypes
 import gc
@@ -11,6 +12,7 @@ import platform
 import queue
 import sys
 import threading
+import time
 import unittest
 
 import numpy as np
@@ -720,6 +722,130 @@ class TestInferenceSession(unittest.TestCase):
         event.wait(10)  # timeout in 10 sec
         self.assertTrue(event.is_set())
 
+    def test_prepare_run(self):
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), providers=available_providers)
+        x = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        output_expected = np.array([[1.0, 4.0], [9.0, 16.0], [25.0, 36.0]], dtype=np.float32)
+
+        run = sess.prepare_run()
+        self.assertEqual(run.input_names, ["X"])
+        self.assertEqual(run.output_names, ["Y"])
+        np.testing.assert_allclose(output_expected, run(x)[0], rtol=1e-05, atol=1e-08)
+        np.testing.assert_allclose(output_expected, run(x, run_options=RunOptions())[0], rtol=1e-05, atol=1e-08)
+
+        with self.assertRaises(ValueError):
+            run(x, x)
+        with self.assertRaises(ValueError):
+            sess.prepare_run(["Z"])
+        with self.assertRaises(ValueError):
+            sess.prepare_run(["Y"], ["X", "Z"])
+        with self.assertRaises(ValueError):
+            sess.prepare_run(["Y"], [])
+
+    def test_prepare_run_overhead_benchmark(self):
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), providers=["CPUExecutionProvider"])
+        x = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        run = sess.prepare_run(["Y"], ["X"])
+        num_calls = 20000
+
+        def per_call_us(call):
+            call()
+            start = time.perf_counter()
+            for _ in range(num_calls):
+                call()
+            return (time.perf_counter() - start) / num_calls * 1e6
+
+        run_us = per_call_us(lambda: sess.run(None, {"X": x}))
+        prepared_us = per_call_us(lambda: run(x))
+        native_us = per_call_us(lambda: sess._sess.run(["Y"], {"X": x}, None))
+        print(
+            f"mul_1.onnx per call: run {run_us:.2f}us, prepared run {prepared_us:.2f}us, "
+            f"C++ binding alone {native_us:.2f}us"
+        )
+
+    def test_run_coro(self):
+        so = onnxrt.SessionOptions()
+        so.intra_op_num_threads = 2
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), so, providers=available_providers)
+        x = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        output_expected = np.array([[1.0, 4.0], [9.0, 16.0], [25.0, 36.0]], dtype=np.float32)
+
+        res = asyncio.run(sess.run_coro(["Y"], {"X": x}, timeout=10))
+        np.testing.assert_allclose(output_expected, res[0], rtol=1e-05, atol=1e-08)
+
+        # the results are delivered through the event loop, they cannot be available before it runs again
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(sess.run_coro(["Y"], {"X": x}, timeout=0))
+
+        with self.assertRaises(Fail):
+            asyncio.run(sess.run_coro(["Y"], {"X": x.reshape(2, 3)}))
+
+    def test_run_coro_timed_out(self):
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), providers=available_providers)
+        x = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        pending = []
+
+        def deferred_run_async(output_names, input_feed, callback, user_data, run_options=None):
+            pending.append((callback, run_options))
+
+        sess.run_async = deferred_run_async
+        sess.set_max_concurrent_async_runs(1)
+        run_options = onnxrt.RunOptions()
+
+        async def timed_out_then_next():
+            with self.assertRaises(asyncio.TimeoutError):
+                await sess.run_coro(["Y"], {"X": x}, run_options, timeout=0)
+            # only the timed out run is terminated
+            self.assertTrue(pending[0][1].terminate)
+            self.assertFalse(run_options.terminate)
+
+            # the next run waits for the terminated run to complete
+            next_run = asyncio.ensure_future(sess.run_coro(["Y"], {"X": x}, run_options))
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(pending), 1)
+            pending[0][0](None, None, "terminated")
+            while len(pending) < 2:
+                await asyncio.sleep(0.001)
+            pending[1][0](["Y value"], None, None)
+            return await next_run
+
+        self.assertEqual(asyncio.run(timed_out_then_next()), ["Y value"])
+
+    def test_run_coro_batch(self):
+        so = onnxrt.SessionOptions()
+        so.intra_op_num_threads = 4
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), so, providers=available_providers)
+        feeds = [{"X": np.full((3, 2), i, dtype=np.float32)} for i in range(32)]
+
+        in_flight, max_in_flight = 0, 0
+        lock = threading.Lock()
+        run_async = sess.run_async
+
+        def counting_run_async(output_names, input_feed, callback, user_data, run_options=None):
+            nonlocal in_flight, max_in_flight
+
+            def counting_callback(res, data, err):
+                nonlocal in_flight
+                with lock:
+                    in_flight -= 1
+                callback(res, data, err)
+
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            run_async(output_names, input_feed, counting_callback, user_data, run_options)
+
+        sess.run_async = counting_run_async
+        sess.set_max_concurrent_async_runs(3)
+        results = asyncio.run(sess.run_coro_batch(["Y"], feeds, timeout=10))
+
+        self.assertEqual(len(results), len(feeds))
+        # mul_1.onnx multiplies X by a constant equal to the X of test_run_coro
+        weight = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        for i, res in enumerate(results):
+            np.testing.assert_allclose(i * weight, res[0])
+        self.assertLessEqual(max_in_flight, 3)
+
     def test_run_model_from_bytes(self):
         with open(get_name("mul_1.onnx"), "rb") as f:
             content = f.read()
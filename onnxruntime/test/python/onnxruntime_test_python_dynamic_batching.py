@@ -0,0 +1,190 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# pylint: disable=C0115,W0212,C0103,C0114
+
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper
+
+import onnxruntime as onnxrt
+from onnxruntime import datasets
+
+
+def make_masked_model() -> bytes:
+    # Y = X * mask, with X and mask of shape [batch, seq]
+    graph = helper.make_graph(
+        [
+            helper.make_node("Cast", ["mask"], ["mask_float"], to=TensorProto.FLOAT),
+            helper.make_node("Mul", ["X", "mask_float"], ["Y"]),
+        ],
+        "masked",
+        [
+            helper.make_tensor_value_info("X", TensorProto.FLOAT, ["batch", "seq"]),
+            helper.make_tensor_value_info("mask", TensorProto.INT64, ["batch", "seq"]),
+        ],
+        [helper.make_tensor_value_info("Y", TensorProto.FLOAT, ["batch", "seq"])],
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]).SerializeToString()
+
+
+def make_dynamic_batch_logreg_iris() -> bytes:
+    # the example model has a fixed batch dimension
+    model = onnx.load(datasets.get_example("logreg_iris.onnx"))
+    for value_info in [*model.graph.input, *model.graph.output]:
+        if value_info.type.HasField("tensor_type"):
+            value_info.type.tensor_type.shape.dim[0].dim_param = "batch"
+    return model.SerializeToString()
+
+
+class TestDynamicBatcher(unittest.TestCase):
+    def test_padding_and_mask(self):
+        sess = onnxrt.InferenceSession(make_masked_model(), providers=["CPUExecutionProvider"])
+        rng = np.random.default_rng(0)
+        feeds = [{"X": rng.standard_normal((1, 1 + i % 5)).astype(np.float32)} for i in range(16)]
+
+        with onnxrt.DynamicBatcher(sess, max_batch_size=8, max_latency_ms=100, pad_value=5.0, mask_input="mask") as b:
+            futures = [b.submit(feed) for feed in feeds]
+            results = [future.result(10) for future in futures]
+            metrics = b.get_metrics()
+
+        for feed, res in zip(feeds, results):
+            self.assertEqual(len(res), 1)
+            np.testing.assert_array_equal(res[0], feed["X"])
+        self.assertEqual(metrics["requests"], 16)
+        self.assertGreaterEqual(metrics["batches"], 2)
+        self.assertLess(metrics["batches"], 16)
+
+    def test_sequence_outputs(self):
+        model = make_dynamic_batch_logreg_iris()
+        sess = onnxrt.InferenceSession(model, providers=["CPUExecutionProvider"])
+        x = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        labels, probabilities = sess.run(None, {"float_input": x})
+
+        with onnxrt.DynamicBatcher(sess, max_batch_size=3, max_latency_ms=100) as batcher:
+            futures = [batcher.submit({"float_input": x[i : i + 1]}) for i in range(3)]
+            for i, future in enumerate(futures):
+                label, probability = future.result(10)
+                np.testing.assert_array_equal(label, labels[i : i + 1])
+                self.assertEqual(probability, probabilities[i : i + 1])
+
+    def test_errors(self):
+        sess = onnxrt.InferenceSession(make_masked_model(), providers=["CPUExecutionProvider"])
+        with self.assertRaises(ValueError):
+            onnxrt.DynamicBatcher(sess, mask_input="X_missing")
+
+        with onnxrt.DynamicBatcher(sess, max_latency_ms=1) as batcher:
+            with self.assertRaises(ValueError):
+                batcher.submit({"X": np.zeros((1, 2), dtype=np.float32)})
+            # every request of a batch must have the same inputs
+            with self.assertRaises(ValueError):
+                batcher.submit({"X": np.zeros((1, 2), dtype=np.float32), "mask": np.zeros((1, 2)), "Z": np.zeros(1)})
+            # mask has the wrong type, the failure of the run is reported to the caller
+            with self.assertRaises(onnxrt.capi.onnxruntime_pybind11_state.InvalidArgument):
+                batcher.run({"X": np.zeros((1, 2), dtype=np.float32), "mask": np.zeros((1, 2), dtype=np.float32)}, 10)
+
+        with self.assertRaises(RuntimeError):
+            batcher.submit({"X": np.zeros((1, 2), dtype=np.float32), "mask": np.zeros((1, 2), dtype=np.int64)})
+
+        # a fixed batch dimension cannot be batched
+        with self.assertRaises(ValueError):
+            onnxrt.DynamicBatcher(onnxrt.InferenceSession(datasets.get_example("logreg_iris.onnx")))
+
+    def test_invalid_requests(self):
+        sess = onnxrt.InferenceSession(make_masked_model(), providers=["CPUExecutionProvider"])
+        x = np.zeros((1, 2), dtype=np.float32)
+        mask = np.ones((1, 2), dtype=np.int64)
+        with onnxrt.DynamicBatcher(sess, max_batch_size=8, max_latency_ms=100) as batcher:
+            # no batch dimension
+            with self.assertRaises(ValueError):
+                batcher.submit({"X": np.zeros(2, dtype=np.float32), "mask": mask})
+            with self.assertRaises(ValueError):
+                batcher.submit({"X": np.zeros((2, 2), dtype=np.float32), "mask": mask})
+
+            # a request of other types is not concatenated with the others, and only its own run fails
+            futures = [
+                batcher.submit({"X": x, "mask": mask}),
+                batcher.submit({"X": x.astype(np.float64), "mask": mask}),
+            ]
+            futures.append(batcher.submit({"X": x, "mask": mask}))
+            np.testing.assert_array_equal(futures[0].result(10)[0], x)
+            with self.assertRaises(onnxrt.capi.onnxruntime_pybind11_state.InvalidArgument):
+                futures[1].result(10)
+            np.testing.assert_array_equal(futures[2].result(10)[0], x)
+
+            # an unexpected error of the batcher fails the requests of the batch, and the next batches still run
+            split = batcher._split
+
+            def failing_split(*args):
+                raise RuntimeError("split failed")
+
+            batcher._split = failing_split
+            with self.assertRaisesRegex(RuntimeError, "split failed"):
+                batcher.run({"X": x, "mask": mask}, 10)
+            batcher._split = split
+            np.testing.assert_array_equal(batcher.run({"X": x, "mask": mask}, 10)[0], x)
+
+    def test_submit_while_closing(self):
+        sess = onnxrt.InferenceSession(make_masked_model(), providers=["CPUExecutionProvider"])
+        batcher = onnxrt.DynamicBatcher(sess, max_latency_ms=1, mask_input="mask")
+        x = np.ones((1, 3), dtype=np.float32)
+        futures = []
+
+        def submit_until_closed():
+            while True:
+                try:
+                    futures.append(batcher.submit({"X": x}))
+                except RuntimeError:
+                    return
+
+        with ThreadPoolExecutor(4) as executor:
+            submitters = [executor.submit(submit_until_closed) for _ in range(4)]
+            while len(futures) < 64:
+                time.sleep(0.001)
+            batcher.close()
+            for submitter in submitters:
+                submitter.result(10)
+
+        # every accepted request is run before the worker stops
+        for future in futures:
+            np.testing.assert_array_equal(future.result(0)[0], x)
+
+    def test_throughput_latency_benchmark(self):
+        model = make_dynamic_batch_logreg_iris()
+        so = onnxrt.SessionOptions()
+        so.intra_op_num_threads = 1
+        sess = onnxrt.InferenceSession(model, so, providers=["CPUExecutionProvider"])
+        samples = np.random.default_rng(0).standard_normal((4096, 2)).astype(np.float32)
+        num_clients = 32
+
+        def serve(run):
+            latencies = []
+
+            def request(i):
+                start = time.perf_counter()
+                run({"float_input": samples[i : i + 1]})
+                latencies.append(time.perf_counter() - start)
+
+            with ThreadPoolExecutor(num_clients) as executor:
+                start = time.perf_counter()
+                list(executor.map(request, range(len(samples))))
+                throughput = len(samples) / (time.perf_counter() - start)
+            return throughput, np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+        throughput, p50, p99 = serve(lambda feed: sess.run(None, feed))
+        print(f"unbatched: {throughput:.0f} requests/s, latency p50 {p50:.3f}ms p99 {p99:.3f}ms")
+        for max_batch_size, max_latency_ms in [(8, 0.5), (32, 1), (32, 5)]:
+            with onnxrt.DynamicBatcher(sess, max_batch_size=max_batch_size, max_latency_ms=max_latency_ms) as batcher:
+                throughput, p50, p99 = serve(batcher.run)
+                mean_batch_size = batcher.get_metrics()["mean_batch_size"]
+            print(
+                f"max_batch_size {max_batch_size}, max_latency_ms {max_latency_ms}: {throughput:.0f} requests/s, "
+                f"latency p50 {p50:.3f}ms p99 {p99:.3f}ms, mean batch size {mean_batch_size:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=1)
@@ -0,0 +1,165 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# pylint: disable=C0115,W0212,C0103,C0114
+
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from helper import get_name
+from onnx import TensorProto, helper, numpy_helper
+
+import onnxruntime as onnxrt
+
+
+def make_matmul_layers_model(num_layers: int, hidden_size: int) -> bytes:
+    rng = np.random.default_rng(7)
+    nodes, initializers = [], []
+    for i in range(num_layers):
+        initializers.append(
+            numpy_helper.from_array(
+                (rng.standard_normal((hidden_size, hidden_size)) / np.sqrt(hidden_size)).astype(np.float32),
+                name=f"W{i}",
+            )
+        )
+        nodes.append(helper.make_node("MatMul", ["X" if i == 0 else f"H{i}", f"W{i}"], [f"M{i}"]))
+        nodes.append(helper.make_node("Tanh", [f"M{i}"], ["Y" if i == num_layers - 1 else f"H{i + 1}"]))
+    graph = helper.make_graph(
+        nodes,
+        "matmul_layers",
+        [helper.make_tensor_value_info("X", TensorProto.FLOAT, ["batch", hidden_size])],
+        [helper.make_tensor_value_info("Y", TensorProto.FLOAT, ["batch", hidden_size])],
+        initializer=initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]).SerializeToString()
+
+
+class TestInferenceSessionPool(unittest.TestCase):
+    def test_default_providers(self):
+        pool = onnxrt.InferenceSessionPool(get_name("mul_1.onnx"), num_sessions=2)
+        self.assertEqual(pool.get_providers(), ["CPUExecutionProvider"])
+        self.assertEqual(len(pool._shared_initializers), 1)
+
+    def test_run_from_many_threads(self):
+        pool = onnxrt.InferenceSessionPool(get_name("mul_1.onnx"), num_sessions=2, providers=["CPUExecutionProvider"])
+        self.assertEqual(pool.num_sessions, 2)
+        self.assertEqual(pool.get_inputs()[0].name, "X")
+        # the weights of the model are loaded once for all the sessions
+        self.assertEqual(len(pool._shared_initializers), 1)
+
+        x = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: pool.run(["Y"], {"X": x})[0], range(64)))
+        for res in results:
+            np.testing.assert_allclose(res, x * x, rtol=1e-05, atol=1e-08)
+
+        metrics = pool.get_metrics()
+        self.assertEqual(metrics["completed"], 64)
+        self.assertEqual(metrics["idle_sessions"], 2)
+        self.assertEqual(metrics["waiting"], 0)
+        self.assertEqual(metrics["rejected"], 0)
+        self.assertLessEqual(metrics["run_ms"]["p50"], metrics["run_ms"]["p99"])
+
+    def test_model_from_bytes(self):
+        model = make_matmul_layers_model(2, 16)
+        pool = onnxrt.InferenceSessionPool(model, num_sessions=2, providers=["CPUExecutionProvider"])
+        self.assertEqual(len(pool._shared_initializers), 2)
+
+        x = np.random.default_rng(0).standard_normal((4, 16)).astype(np.float32)
+        expected = onnxrt.InferenceSession(model, providers=["CPUExecutionProvider"]).run(None, {"X": x})[0]
+        for _ in range(4):
+            np.testing.assert_allclose(pool.run(None, {"X": x})[0], expected, rtol=1e-05, atol=1e-06)
+
+    def test_session_options_unchanged(self):
+        model = make_matmul_layers_model(1, 4)
+        so = onnxrt.SessionOptions()
+        so.intra_op_num_threads = 1
+        pool = onnxrt.InferenceSessionPool(model, num_sessions=2, sess_options=so, providers=["CPUExecutionProvider"])
+        self.assertEqual(len(pool._shared_initializers), 1)
+        # the shared initializers were added to a copy, the name is still free in the given options
+        so.add_initializer("W0", onnxrt.OrtValue.ortvalue_from_numpy(np.eye(4, dtype=np.float32)))
+
+    def test_bfloat16_initializer(self):
+        bits = np.array([0x3F80, 0x4000, 0xC040, 0x3E80], dtype=np.uint16)  # 1, 2, -3, 0.25
+        weight = helper.make_tensor("W", TensorProto.BFLOAT16, [4], bits.tobytes(), raw=True)
+        graph = helper.make_graph(
+            [
+                helper.make_node("Cast", ["W"], ["W_float"], to=TensorProto.FLOAT),
+                helper.make_node("Mul", ["X", "W_float"], ["Y"]),
+            ],
+            "bfloat16_weight",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [4])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [4])],
+            initializer=[weight],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]).SerializeToString()
+
+        pool = onnxrt.InferenceSessionPool(model, num_sessions=2, providers=["CPUExecutionProvider"])
+        self.assertEqual(pool._shared_initializers["W"].element_type(), TensorProto.BFLOAT16)
+        x = np.array([1.0, 1.0, 2.0, 4.0], dtype=np.float32)
+        np.testing.assert_allclose(pool.run(None, {"X": x})[0], [1.0, 2.0, -6.0, 1.0])
+
+    def test_back_pressure(self):
+        pool = onnxrt.InferenceSessionPool(get_name("mul_1.onnx"), num_sessions=1, providers=["CPUExecutionProvider"])
+        with pool.session() as sess:
+            self.assertIsInstance(sess, onnxrt.InferenceSession)
+            self.assertEqual(pool.get_metrics()["idle_sessions"], 0)
+            with self.assertRaises(TimeoutError):
+                pool.acquire(timeout=0.01)
+
+            waiter = threading.Thread(target=lambda: pool.release(pool.acquire()))
+            waiter.start()
+            while pool.get_metrics()["waiting"] == 0:
+                time.sleep(0.001)
+        waiter.join()
+        self.assertEqual(pool.get_metrics()["max_waiting"], 1)
+
+        pool = onnxrt.InferenceSessionPool(
+            get_name("mul_1.onnx"), num_sessions=1, providers=["CPUExecutionProvider"], max_waiting=0
+        )
+        with pool.session(), self.assertRaises(RuntimeError):
+            pool.acquire()
+        self.assertEqual(pool.get_metrics()["rejected"], 1)
+        # sessions are available again once released
+        pool.release(pool.acquire())
+
+    def test_throughput_benchmark(self):
+        num_cores = os.cpu_count() or 1
+        if num_cores < 4:
+            self.skipTest("benchmark requires 4 cores")
+
+        model = make_matmul_layers_model(8, 512)
+        x = np.random.default_rng(0).standard_normal((8, 512)).astype(np.float32)
+        num_requests, num_clients = 256, 2 * num_cores
+
+        def serve(run):
+            with ThreadPoolExecutor(num_clients) as executor:
+                start = time.perf_counter()
+                list(executor.map(lambda _: run(None, {"X": x}), range(num_requests)))
+                return num_requests / (time.perf_counter() - start)
+
+        so = onnxrt.SessionOptions()
+        so.intra_op_num_threads = num_cores
+        sess = onnxrt.InferenceSession(model, so, providers=["CPUExecutionProvider"])
+        sess.run(None, {"X": x})
+        single_session = serve(sess.run)
+
+        pool = onnxrt.InferenceSessionPool(model, num_sessions=num_cores // 2, providers=["CPUExecutionProvider"])
+        for _ in range(pool.num_sessions):
+            pool.run(None, {"X": x})
+        pooled = serve(pool.run)
+
+        metrics = pool.get_metrics()
+        print(
+            f"{num_requests} requests from {num_clients} threads: {single_session:.1f} requests/s with 1 session of "
+            f"{num_cores} threads, {pooled:.1f} requests/s with {pool.num_sessions} sessions "
+            f"({pooled / single_session:.2f}x), wait p99 {metrics['wait_ms']['p99']:.2f}ms, "
+            f"run p99 {metrics['run_ms']['p99']:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=1)
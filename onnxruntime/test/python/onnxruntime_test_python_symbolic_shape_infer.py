@@ -27,6 +27,7 @@ if os.path.exists(
 else:
     from onnxruntime.tools.symbolic_shape_infer import SymbolicShapeInference
 
+import time
 import unittest
 from pathlib import Path
 
@@ -717,5 +718,131 @@ class TestSymbolicShapeInferenceForSlice(unittest.TestCase):
         self.assertEqual(output_dims[0].dim_param, "N")
 
 
+def create_repeated_block_model(num_layers, hidden_size=16):
+    """Create a model with repeated blocks of MatMul, Add, Softmax, Erf, Relu and Tanh."""
+    nodes = []
+    initializers = []
+    x = "input"
+    for i in range(num_layers):
+        initializers.append(
+            numpy_helper.from_array(numpy.ones([hidden_size, hidden_size], dtype=numpy.float32), f"weight_{i}")
+        )
+        initializers.append(numpy_helper.from_array(numpy.ones([hidden_size], dtype=numpy.float32), f"bias_{i}"))
+        nodes.extend(
+            [
+                helper.make_node("MatMul", [x, f"weight_{i}"], [f"matmul_{i}"]),
+                helper.make_node("Add", [f"matmul_{i}", f"bias_{i}"], [f"add_{i}"]),
+                helper.make_node("Softmax", [f"add_{i}"], [f"softmax_{i}"], axis=-1),
+                helper.make_node("Erf", [f"softmax_{i}"], [f"erf_{i}"]),
+                helper.make_node("Relu", [f"erf_{i}"], [f"relu_{i}"]),
+                helper.make_node("Tanh", [f"relu_{i}"], [f"layer_{i}"]),
+            ]
+        )
+        x = f"layer_{i}"
+    nodes.append(helper.make_node("Identity", [x], ["output"]))
+
+    graph = helper.make_graph(
+        nodes,
+        "RepeatedBlocks",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", "seq", hidden_size])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, None)],
+        initializer=initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+
+class TestSymbolicShapeInferenceFastMode(unittest.TestCase):
+    def _check_same_shapes(self, expected, actual):
+        expected_vi = {vi.name: vi for vi in list(expected.graph.value_info) + list(expected.graph.output)}
+        actual_vi = {vi.name: vi for vi in list(actual.graph.value_info) + list(actual.graph.output)}
+        self.assertEqual(expected_vi.keys(), actual_vi.keys())
+        for name, vi in expected_vi.items():
+            self.assertEqual(vi, actual_vi[name], name)
+
+    def test_fast_mode_parity(self):
+        model = create_repeated_block_model(4)
+        expected = SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+        actual = SymbolicShapeInference.infer_shapes(model, auto_merge=True, fast=True)
+        self._check_same_shapes(expected, actual)
+        output_dims = unique_element(actual.graph.output).type.tensor_type.shape.dim
+        self.assertEqual([d.dim_param or d.dim_value for d in output_dims], ["batch", "seq", 16])
+
+    def test_fast_mode_replay_repeated_layers(self):
+        model = create_repeated_block_model(4)
+        symbolic_shape_inference = SymbolicShapeInference(2**31 - 1, True, False, 0, fast=True)
+        replayed = []
+        replay_node = symbolic_shape_inference._replay_node
+
+        def record_replay(node, outputs):
+            replayed.append(node.output[0])
+            replay_node(node, outputs)
+
+        symbolic_shape_inference._replay_node = record_replay
+        symbolic_shape_inference._preprocess(model)
+        while symbolic_shape_inference.run_:
+            self.assertTrue(symbolic_shape_inference._infer_impl())
+
+        # Nodes after the first layer have the same signature as those in the first layer.
+        self.assertNotIn("matmul_0", replayed)
+        self.assertIn("matmul_1", replayed)
+        self.assertIn("layer_3", replayed)
+
+    def test_fast_mode_unknown_dim(self):
+        # ONNX shape inference cannot get the output dim of Unique, so a new dim is created for the following nodes
+        nodes = [
+            helper.make_node("Relu", ["input"], ["relu"]),
+            helper.make_node("Unique", ["relu"], ["unique"]),
+            helper.make_node("Erf", ["unique"], ["erf"]),
+            helper.make_node("Abs", ["erf"], ["output"]),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "UnknownDim",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", 4])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, None)],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+        expected = SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+        actual = SymbolicShapeInference.infer_shapes(model, auto_merge=True, fast=True)
+        self._check_same_shapes(expected, actual)
+
+    def test_fast_mode_data_dependent_dims(self):
+        # Dim of the first NonZero is merged to p in the rerun, which shall not be replayed for the second NonZero.
+        nodes = [
+            helper.make_node("NonZero", ["x"], ["c"]),
+            helper.make_node("NonZero", ["y"], ["d"]),
+            helper.make_node("Max", ["c", "p"], ["output"]),
+            helper.make_node("Abs", ["d"], ["output2"]),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "DataDependentDims",
+            [
+                helper.make_tensor_value_info("x", TensorProto.FLOAT, ["n"]),
+                helper.make_tensor_value_info("y", TensorProto.FLOAT, ["n"]),
+                helper.make_tensor_value_info("p", TensorProto.INT64, [1, "p"]),
+            ],
+            [
+                helper.make_tensor_value_info("output", TensorProto.INT64, None),
+                helper.make_tensor_value_info("output2", TensorProto.INT64, None),
+            ],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+        expected = SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+        actual = SymbolicShapeInference.infer_shapes(model, auto_merge=True, fast=True)
+        self._check_same_shapes(expected, actual)
+        output_dims = actual.graph.output[1].type.tensor_type.shape.dim
+        self.assertEqual([d.dim_param or d.dim_value for d in output_dims], [1, "NonZero_1_o0__d1"])
+
+    def test_fast_mode_benchmark(self):
+        model = create_repeated_block_model(48)
+        latency = {}
+        for fast in [False, True]:
+            start_time = time.time()
+            SymbolicShapeInference.infer_shapes(model, auto_merge=True, fast=fast)
+            latency[fast] = time.time() - start_time
+        print(f"symbolic shape inference of 48 layers: {latency[False]:.3f} s, fast mode: {latency[True]:.3f} s")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -6,6 +6,8 @@
 # --------------------------------------------------------------------------
 
 import tempfile
+import time
+import tracemalloc
 import unittest
 from pathlib import Path
 
@@ -14,7 +16,15 @@ import onnx
 from onnx import TensorProto, helper, numpy_helper
 
 import onnxruntime
-from onnxruntime.quantization.calibrate import CalibrationDataReader, create_calibrator
+from onnxruntime.quantization.calibrate import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    HistogramCollector,
+    create_calibrator,
+    entropy,
+    get_entropy_threshold,
+)
+from onnxruntime.quantization.quant_utils import smooth_distribution
 
 
 def generate_input_initializer(tensor_shape, tensor_dtype, input_name):
@@ -457,5 +467,219 @@ class TestCalibrateMinMaxCalibrator(unittest.TestCase):
             self.assertTrue(output in augmented_model_outputs)
 
 
+class RandomDataReader(CalibrationDataReader):
+    """Generates inputs on the fly, so that only the calibrater holds data."""
+
+    def __init__(self, count, shape, seed=0):
+        self.count = count
+        self.shape = shape
+        self.seed = seed
+        self.rewind()
+
+    def get_next(self):
+        if self.index >= self.count:
+            return None
+        self.index += 1
+        return {"input": self.rng.normal(0, 0.33, self.shape).astype(np.float32)}
+
+    def rewind(self):
+        self.index = 0
+        self.rng = np.random.default_rng(self.seed)
+
+
+class TestCalibrateStreaming(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp_model_dir = tempfile.TemporaryDirectory(prefix="test_calibration_streaming.")
+        cls.shape = [1, 64, 256]
+        cls.model_path = Path(cls._tmp_model_dir.name).joinpath("streaming_model.onnx").as_posix()
+        #  (input) -> Relu -> Mul -> (output)
+        graph = helper.make_graph(
+            [
+                helper.make_node("Relu", ["input"], ["X1"], name="Relu"),
+                helper.make_node("Mul", ["X1", "scale"], ["output"], name="Mul"),
+            ],
+            "streaming_graph",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, cls.shape)],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, cls.shape)],
+            initializer=[numpy_helper.from_array(np.array(3.0, dtype=np.float32), "scale")],
+        )
+        onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]), cls.model_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp_model_dir.cleanup()
+
+    def calibrate(self, method, count, max_intermediate_outputs=None, num_sessions=1, **extra_options):
+        augmented_model_path = Path(self._tmp_model_dir.name).joinpath(f"augmented_{method.name}.onnx").as_posix()
+        calibrater = create_calibrator(
+            self.model_path,
+            augmented_model_path=augmented_model_path,
+            calibrate_method=method,
+            extra_options={
+                "max_intermediate_outputs": max_intermediate_outputs,
+                "num_sessions": num_sessions,
+                **extra_options,
+            },
+        )
+        calibrater.collect_data(RandomDataReader(count, self.shape))
+        self.assertLessEqual(len(calibrater.intermediate_outputs), max_intermediate_outputs or count)
+        return calibrater.compute_data()
+
+    def test_min_max_range_is_same(self):
+        expected = self.calibrate(CalibrationMethod.MinMax, 10)
+        actual = self.calibrate(CalibrationMethod.MinMax, 10, max_intermediate_outputs=3)
+        for name in ["input", "X1", "output"]:
+            self.assertEqual(expected[name].range_value, actual[name].range_value)
+
+    def test_min_max_moving_average_in_chunks(self):
+        # The averages of chunks are merged with the averaging constant, so the second chunk is ignored with 0.
+        expected = self.calibrate(CalibrationMethod.MinMax, 2, moving_average=True)
+        actual = self.calibrate(
+            CalibrationMethod.MinMax, 4, max_intermediate_outputs=2, moving_average=True, averaging_constant=0.0
+        )
+        for name in ["input", "X1", "output"]:
+            self.assertEqual(expected[name].range_value, actual[name].range_value)
+
+    def test_histogram_is_same_with_one_chunk(self):
+        for method in [CalibrationMethod.Entropy, CalibrationMethod.Percentile]:
+            expected = self.calibrate(method, 8)
+            actual = self.calibrate(method, 8, max_intermediate_outputs=8)
+            for name in ["input", "X1", "output"]:
+                self.assertEqual(expected[name].range_value, actual[name].range_value)
+                np.testing.assert_array_equal(expected[name].hist, actual[name].hist)
+
+    def test_min_max_in_parallel(self):
+        expected = self.calibrate(CalibrationMethod.MinMax, 10)
+        actual = self.calibrate(CalibrationMethod.MinMax, 10, num_sessions=3)
+        for name in ["input", "X1", "output"]:
+            self.assertEqual(expected[name].range_value, actual[name].range_value)
+
+    def test_histogram_in_parallel(self):
+        for method in [CalibrationMethod.Entropy, CalibrationMethod.Percentile]:
+            expected = self.calibrate(method, 12)
+            actual = self.calibrate(method, 12, max_intermediate_outputs=2, num_sessions=3)
+            for name in ["input", "X1", "output"]:
+                np.testing.assert_allclose(expected[name].range_value, actual[name].range_value, rtol=0.05)
+
+    def test_merge_histogram_collectors(self):
+        rng = np.random.default_rng(0)
+        data = [rng.normal(0, scale, [1000]).astype(np.float32) for scale in [0.5, 1.0, 2.0]]
+        for method, symmetric in [("entropy", False), ("percentile", True)]:
+            collectors = []
+            for arr in data:
+                collector = HistogramCollector(method, symmetric, 128, 128, 99.999, "same")
+                collector.collect({"x": [arr]})
+                collectors.append(collector)
+            collectors[0].merge(collectors[1])
+            collectors[0].merge(collectors[2])
+            histogram = collectors[0].get_histogram_dict()["x"]
+
+            # All values are counted, and the range is the one of the widest histogram.
+            self.assertEqual(histogram[0].sum(), 3000)
+            np.testing.assert_array_equal(histogram[1], collectors[2].get_histogram_dict()["x"][1])
+            self.assertEqual(histogram[2], min(arr.min() for arr in data))
+            self.assertEqual(histogram[3], max(arr.max() for arr in data))
+
+    def test_memory_benchmark(self):
+        peaks = {}
+        for count in [8, 64]:
+            tracemalloc.start()
+            self.calibrate(CalibrationMethod.Entropy, count, max_intermediate_outputs=4)
+            peaks[count] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"Peak memory of entropy calibration with {count} samples: {peaks[count] / 1024 / 1024:.2f} MB")
+        self.assertLess(peaks[64], 2 * peaks[8])
+
+
+def reference_entropy_threshold(histogram, num_quantized_bins):
+    """Computes each candidate threshold separately, used to check the batched implementation."""
+    hist, hist_edges = histogram[0], histogram[1]
+    num_bins = hist.size
+    zero_bin_index = num_bins // 2
+    num_half_quantized_bin = num_quantized_bins // 2
+    dtype = hist_edges.dtype
+    kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
+    thresholds = []
+    for i in range(num_half_quantized_bin, zero_bin_index + 1):
+        start_index = zero_bin_index - i
+        end_index = min(zero_bin_index + i + 1, num_bins)
+        thresholds.append((hist_edges[start_index], hist_edges[end_index]))
+        sliced_distribution = hist[start_index:end_index].copy()
+        p = sliced_distribution.copy()
+        p[0] += sum(hist[:start_index])
+        p[-1] += sum(hist[end_index:])
+        nonzeros = (p != 0).astype(np.int64)
+        quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
+        num_merged_bins = sliced_distribution.size // num_quantized_bins
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            quantized_bins[index] = sum(sliced_distribution[start : start + num_merged_bins])
+        quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
+        q = np.zeros(p.size, dtype=np.int64)
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            end = start + num_merged_bins
+            norm = sum(nonzeros[start:end])
+            if norm != 0:
+                q[start:end] = quantized_bins[index] / norm
+        p = smooth_distribution(p)
+        q = smooth_distribution(q)
+        if p is None or q is None:
+            kl_divergence[i - num_half_quantized_bin] = np.array(np.inf, dtype=dtype)
+        else:
+            kl_divergence[i - num_half_quantized_bin] = np.array(entropy(p, q), dtype=dtype)
+    optimal_threshold = thresholds[np.argmin(kl_divergence)]
+    if optimal_threshold[0] < histogram[2]:
+        optimal_threshold = (histogram[2], optimal_threshold[1])
+    if optimal_threshold[1] > histogram[3]:
+        optimal_threshold = (optimal_threshold[0], histogram[3])
+    return optimal_threshold
+
+
+class TestEntropyThreshold(unittest.TestCase):
+    def create_histograms(self, num_bins, count=4):
+        rng = np.random.default_rng(1)
+        histograms = []
+        for index in range(count):
+            data = rng.standard_t(index + 2, [20000]).astype(np.float32)
+            collector = HistogramCollector("entropy", False, num_bins, 128, 99.999, "same")
+            collector.collect({"x": [data]})
+            # Merged histograms have sparse bins on both sides.
+            collector.collect({"x": [data * 4]})
+            histograms.append(collector.get_histogram_dict()["x"])
+        return histograms
+
+    def test_same_as_reference(self):
+        for num_bins, num_quantized_bins in [(128, 128), (255, 128), (512, 128), (1001, 3), (64, 1)]:
+            for histogram in self.create_histograms(num_bins):
+                expected = reference_entropy_threshold(histogram, num_quantized_bins)
+                actual = get_entropy_threshold(histogram, num_quantized_bins)
+                self.assertEqual(expected, actual)
+                self.assertEqual(expected[0].dtype, actual[0].dtype)
+
+    def test_compute_entropy_in_processes(self):
+        collectors = []
+        for num_processes in [1, 2]:
+            collector = HistogramCollector("entropy", False, 512, 128, 99.999, "same", num_processes=num_processes)
+            rng = np.random.default_rng(2)
+            collector.collect({f"x{i}": [rng.normal(0, i + 1, [5000]).astype(np.float32)] for i in range(4)})
+            collectors.append(collector.compute_collection_result())
+        self.assertEqual(collectors[0].keys(), collectors[1].keys())
+        for name, expected in collectors[0].items():
+            self.assertEqual(expected[:2], collectors[1][name][:2])
+
+    def test_benchmark(self):
+        histogram = self.create_histograms(2048, count=1)[0]
+        start = time.perf_counter()
+        expected = reference_entropy_threshold(histogram, 128)
+        reference_time = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = get_entropy_threshold(histogram, 128)
+        batched_time = time.perf_counter() - start
+        print(f"Entropy threshold of {histogram[0].size} bins: {reference_time:.3f}s -> {batched_time:.3f}s")
+        self.assertEqual(expected, actual)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -26,6 +26,10 @@ def generate_input_initializer(tensor_shape, tensor_dtype, input_name):
     return init
 
 
+def find_initializer(onnx_model, name):
+    return next((init for init in onnx_model.initializer() if init.name == name), None)
+
+
 def construct_model_for_topo_sort(model_path):
     #    (input)
     #       |
@@ -168,6 +172,48 @@ class TestONNXModel(unittest.TestCase):
         onnx_model.topological_sort()
         check_op_type_order(self, onnx_model.model, ["Op1", "Op1", "Op2", "Op3"])
 
+    def test_initializer_index(self):
+        #  (input) -> Gemm(transB=1) -> Add -> (output)
+        graph = helper.make_graph(
+            [
+                helper.make_node("Gemm", ["input", "W", "B"], ["gemm"], name="Gemm", transB=1),
+                helper.make_node("Add", ["gemm", "C"], ["output"], name="Add"),
+            ],
+            "initializer_index",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, [2, 4])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2, 3])],
+            initializer=[
+                generate_input_initializer([3, 4], np.float32, "W"),
+                generate_input_initializer([3], np.float32, "B"),
+                generate_input_initializer([3], np.float32, "C"),
+            ],
+        )
+        onnx_model = ONNXModel(helper.make_model(graph))
+        self.assertEqual(onnx_model.get_initializer("W").dims, [3, 4])
+        self.assertIsNone(onnx_model.get_initializer("D"))
+
+        # Initializers added by ONNXModel, or directly to the graph, can be found.
+        onnx_model.add_initializer(generate_input_initializer([1], np.float32, "D"))
+        onnx_model.initializer_extend([generate_input_initializer([1], np.float32, "E")])
+        onnx_model.graph().initializer.extend([generate_input_initializer([1], np.float32, "F")])
+        for name in ["D", "E", "F"]:
+            self.assertEqual(onnx_model.get_initializer(name), find_initializer(onnx_model, name))
+        self.assertEqual(onnx_model.get_initializer_name_set(), {"W", "B", "C", "D", "E", "F"})
+
+        # Adding an existing name keeps the first initializer.
+        onnx_model.add_initializer(generate_input_initializer([5], np.float32, "D"))
+        self.assertEqual(onnx_model.get_initializer("D").dims, [1])
+
+        onnx_model.remove_initializer(onnx_model.get_initializer("D"))
+        self.assertIsNone(onnx_model.get_initializer("D"))
+        onnx_model.clean_initializers()
+        self.assertEqual(onnx_model.get_initializer_name_set(), {"W", "B", "C"})
+
+        # The transposed weight replaces the original one in the index.
+        onnx_model.replace_gemm_with_matmul()
+        self.assertEqual(onnx_model.get_initializer("W").dims, [4, 3])
+        self.assertEqual(onnx_model.get_initializer("W"), find_initializer(onnx_model, "W"))
+
 
 if __name__ == "__main__":
     unittest.main()
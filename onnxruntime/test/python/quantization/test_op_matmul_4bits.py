@@ -6,6 +6,8 @@
 # --------------------------------------------------------------------------
 
 import tempfile
+import time
+import tracemalloc
 import unittest
 from importlib.util import find_spec
 from pathlib import Path
@@ -110,6 +112,35 @@ class TestOpMatMul4Bits(unittest.TestCase):
 
         onnx.save(model, output_model_path)
 
+    def construct_model_matmul_layers(self, output_model_path: str, num_layers: int, hidden_size: int) -> None:
+        #      (input)
+        #         |
+        #       MatMul
+        #         |
+        #        ...
+        #         |
+        #       MatMul
+        #         |
+        #      (output)
+        nodes = []
+        initializers = []
+        output_name = "input"
+        for i in range(num_layers):
+            weight_data = np.random.randn(hidden_size, hidden_size).astype(np.float32)
+            initializers.append(onnx.numpy_helper.from_array(weight_data, name=f"linear{i}.weight"))
+            nodes.append(
+                onnx.helper.make_node("MatMul", [output_name, f"linear{i}.weight"], [f"out{i}"], f"MatMul_{i}")
+            )
+            output_name = f"out{i}"
+
+        input_tensor = helper.make_tensor_value_info("input", TensorProto.FLOAT, [-1, hidden_size])
+        output_tensor = helper.make_tensor_value_info(output_name, TensorProto.FLOAT, [-1, hidden_size])
+        graph = helper.make_graph(nodes, "matmul_4bits_layers_test", [input_tensor], [output_tensor], initializers)
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 7  # use stable onnx ir version
+
+        onnx.save(model, output_model_path)
+
     def quant_test(
         self,
         model_fp32_path: str,
@@ -244,6 +275,99 @@ class TestOpMatMul4Bits(unittest.TestCase):
         data_reader = self.input_feeds(1, {"input": [100, 52]})
         self.quant_test_with_algo("HQQ", model_fp32_path, data_reader, 32, False)
 
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_in_parallel(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        np.random.seed(13)
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_layers.onnx").absolute())
+        self.construct_model_matmul_layers(model_fp32_path, num_layers=8, hidden_size=256)
+
+        quantized_models = []
+        for num_workers in [1, 4]:
+            quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                onnx.load(model_fp32_path), block_size=32, is_symmetric=False, num_workers=num_workers
+            )
+            quant.process()
+            quantized_models.append(quant.model.model)
+
+        self.assertEqual(sum(node.op_type == "MatMulNBits" for node in quantized_models[0].graph.node), 8)
+        # The graph is updated in node order, whatever the order weights are quantized in.
+        self.assertEqual(quantized_models[0], quantized_models[1])
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_in_parallel_benchmark(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        np.random.seed(13)
+        num_layers, hidden_size = 16, 2048
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_large_layers.onnx").absolute())
+        self.construct_model_matmul_layers(model_fp32_path, num_layers, hidden_size)
+        model = onnx.load(model_fp32_path)
+
+        node_quantizer = matmul_4bits_quantizer.DefaultWeightOnlyQuantizer(
+            matmul_4bits_quantizer.DefaultWeightOnlyQuantConfig(block_size=32)
+        )
+        for initializer in model.graph.initializer[:4]:
+            start = time.perf_counter()
+            node_quantizer.quantize_weight(onnx.numpy_helper.to_array(initializer))
+            print(f"{initializer.name} [{hidden_size}, {hidden_size}]: {time.perf_counter() - start:.3f}s")
+
+        process_times = {}
+        for num_workers in [1, 4]:
+            quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                onnx.load(model_fp32_path), block_size=32, num_workers=num_workers
+            )
+            start = time.perf_counter()
+            quant.process()
+            process_times[num_workers] = time.perf_counter() - start
+            self.assertEqual(sum(node.op_type == "MatMulNBits" for node in quant.model.graph().node), num_layers)
+        print(
+            f"4b quantization of {num_layers} MatMul weights: {process_times[1]:.2f}s with 1 worker, "
+            f"{process_times[4]:.2f}s with 4 workers ({process_times[1] / process_times[4]:.2f}x)"
+        )
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_out_of_core(self):
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        np.random.seed(13)
+        num_layers, hidden_size = 16, 512
+        model_dir = Path(self._tmp_model_dir.name) / "out_of_core"
+        model_dir.mkdir()
+        model_fp32_path = str(model_dir / "matmul_fp32_layers.onnx")
+        self.construct_model_matmul_layers(model_fp32_path, num_layers, hidden_size)
+        onnx.save(onnx.load(model_fp32_path), model_fp32_path, save_as_external_data=True, location="weights.bin")
+
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, block_size=32, is_symmetric=False)
+        quant.process()
+        expected = quant.model.model
+
+        model_int4_path = str(model_dir / "matmul_int4_layers.onnx")
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, block_size=32, is_symmetric=False)
+        tracemalloc.start()
+        quant.process_out_of_core(model_int4_path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Weights are memory-mapped and quantized one by one.
+        weight_size = hidden_size * hidden_size * 4
+        self.assertLess(peak, 2 * weight_size)
+        self.assertTrue(all(t.data_location == TensorProto.EXTERNAL for t in quant.model.initializer()))
+
+        actual = onnx.load(model_int4_path)
+        self.assertEqual(actual.graph.node, expected.graph.node)
+        self.assertEqual(
+            {t.name: onnx.numpy_helper.to_array(t).tobytes() for t in actual.graph.initializer},
+            {t.name: onnx.numpy_helper.to_array(t).tobytes() for t in expected.graph.initializer},
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -21,8 +21,12 @@ from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
 from onnxruntime.quantization.calibrate import CalibrationDataReader
 from onnxruntime.quantization.qdq_loss_debug import (
     QUANT_INPUT_SUFFIX,
+    ActivationStore,
+    ErrorAccumulator,
     collect_activations,
     compute_activation_error,
+    compute_activation_error_streaming,
+    compute_signal_to_quantization_noice_ratio,
     compute_weight_error,
     create_activation_matching,
     create_weight_matching,
@@ -309,6 +313,84 @@ class TestSaveActivations(unittest.TestCase):
             dq_array = matched_weights[weight_name]["dequantized"]
             self.assertEqual(float_array.shape, dq_array.shape)
 
+    def test_collect_activations_to_store(self):
+        test_model_path = str(Path(self._tmp_model_dir.name) / "test_model5.onnx")
+        construct_test_model1(test_model_path, activations_as_outputs=False)
+        data_reader = TestDataReader()
+
+        augmented_model_path = str(Path(self._tmp_model_dir.name).joinpath("augmented_test_model_5.onnx"))
+        expected = augment_model_collect_activations(test_model_path, augmented_model_path, data_reader)
+
+        data_reader.rewind()
+        store = ActivationStore(Path(self._tmp_model_dir.name) / "activations5")
+        actual = collect_activations(augmented_model_path, data_reader, activation_store=store)
+        self.assertEqual(set(actual), set(expected))
+        for tensor_name, tensors in expected.items():
+            self.assertEqual(len(actual[tensor_name]), len(tensors))
+            for expected_tensor, actual_tensor in zip(tensors, actual[tensor_name]):
+                self.assertIsInstance(actual_tensor, np.memmap)
+                np.testing.assert_equal(expected_tensor, actual_tensor)
+        store.close()
+
+    def test_error_accumulator(self):
+        x = [np.random.normal(0, 1, [4, 5]).astype(np.float32) for _ in range(3)]
+        y = [a + np.random.normal(0, 0.01, a.shape).astype(np.float32) for a in x]
+        accumulator = ErrorAccumulator()
+        for a, b in zip(x, y):
+            accumulator.update(a, b)
+
+        self.assertAlmostEqual(accumulator.sqnr(), compute_signal_to_quantization_noice_ratio(x, y), places=4)
+        diff = np.concatenate(x).astype(np.float64) - np.concatenate(y)
+        self.assertAlmostEqual(accumulator.mse(), float(np.mean(diff * diff)))
+        self.assertAlmostEqual(accumulator.max_abs_error, float(np.abs(diff).max()))
+
+    def test_compute_activation_error_streaming(self):
+        float_model_path = str(Path(self._tmp_model_dir.name) / "float_model6.onnx")
+        construct_test_model1(float_model_path, activations_as_outputs=False)
+        data_reader = TestDataReader()
+
+        qdq_model_path = str(Path(self._tmp_model_dir.name) / "qdq_model6.onnx")
+        quantize_static(
+            float_model_path,
+            qdq_model_path,
+            data_reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=False,
+            reduce_range=False,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8,
+        )
+
+        data_reader.rewind()
+        augmented_float_model_path = str(Path(self._tmp_model_dir.name).joinpath("augmented_float_model6.onnx"))
+        float_activations = augment_model_collect_activations(float_model_path, augmented_float_model_path, data_reader)
+
+        data_reader.rewind()
+        augmented_qdq_model_path = str(Path(self._tmp_model_dir.name).joinpath("augmented_qdq_model6.onnx"))
+        qdq_activations = augment_model_collect_activations(qdq_model_path, augmented_qdq_model_path, data_reader)
+
+        expected = compute_activation_error(create_activation_matching(qdq_activations, float_activations))
+
+        data_reader.rewind()
+        qdq_store = ActivationStore(Path(self._tmp_model_dir.name) / "qdq_activations6")
+        actual = compute_activation_error_streaming(
+            augmented_float_model_path, augmented_qdq_model_path, data_reader, qdq_activation_store=qdq_store
+        )
+        qdq_store.close()
+
+        self.assertEqual(set(actual), set(expected))
+        for tensor_name, errors in expected.items():
+            self.assertAlmostEqual(actual[tensor_name]["qdq_err"], errors["qdq_err"], places=3)
+            self.assertAlmostEqual(actual[tensor_name]["xmodel_err"], errors["xmodel_err"], places=3)
+            self.assertGreaterEqual(actual[tensor_name]["xmodel_mse"], 0.0)
+            self.assertGreaterEqual(actual[tensor_name]["xmodel_max_abs_err"], 0.0)
+
+        # The spilled activations are the ones collect_activations returns.
+        self.assertEqual(set(qdq_store.names()), set(qdq_activations))
+        for tensor_name, tensors in qdq_activations.items():
+            for expected_tensor, actual_tensor in zip(tensors, qdq_store.get(tensor_name)):
+                np.testing.assert_equal(expected_tensor, actual_tensor)
+
     def test_none_test(self):
         a = np.array([2, 3, 4])
         b = np.array([7, 8, 9])
@@ -6,13 +6,14 @@
 # --------------------------------------------------------------------------
 
 import tempfile
+import time
 import unittest
 from importlib.util import find_spec
 from pathlib import Path
 
 import numpy as np
 import onnx
-from onnx import TensorProto, helper
+from onnx import TensorProto, helper, numpy_helper
 from op_test_utils import check_model_correctness, generate_random_initializer, input_feeds_neg_one_zero_one
 
 from onnxruntime.quantization import QuantType, StaticQuantConfig, quantize, quantize_static
@@ -118,6 +119,42 @@ class TestStaticQuantization(unittest.TestCase):
         model = onnx.load(quant_model_path)
         self.assertIn("Mul", [i.op_type for i in model.graph.node])
 
+    def test_many_layers_benchmark(self):
+        # (input) -> MatMul -> Add -> ... -> MatMul -> Add -> (output), with a weight and a bias per layer.
+        num_layers, hidden_size = 1000, 8
+        nodes = []
+        initializers = []
+        output_name = "input"
+        for i in range(num_layers):
+            nodes.append(helper.make_node("MatMul", [output_name, f"W{i}"], [f"matmul{i}"], name=f"MatMul{i}"))
+            nodes.append(helper.make_node("Add", [f"matmul{i}", f"B{i}"], [f"add{i}"], name=f"Add{i}"))
+            initializers.append(generate_random_initializer(f"W{i}", [hidden_size, hidden_size], np.float32))
+            initializers.append(numpy_helper.from_array(np.zeros([hidden_size], dtype=np.float32), f"B{i}"))
+            output_name = f"add{i}"
+        graph = helper.make_graph(
+            nodes,
+            "many_layers",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, hidden_size])],
+            [helper.make_tensor_value_info(output_name, TensorProto.FLOAT, [1, hidden_size])],
+            initializer=initializers,
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model_fp32_path = str(Path(self._tmp_model_dir.name) / "many_layers.fp32.onnx")
+        onnx.save(model, model_fp32_path)
+
+        quant_model_path = str(Path(self._tmp_model_dir.name) / "many_layers.quant.onnx")
+        data_reader = input_feeds_neg_one_zero_one(2, {"input": [1, hidden_size]})
+        start = time.perf_counter()
+        quantize_static(model_fp32_path, quant_model_path, data_reader)
+        print(f"quantize_static of {num_layers} MatMul layers takes {time.perf_counter() - start:.2f}s")
+
+        quant_model = onnx.load(quant_model_path)
+        self.assertEqual(sum(node.op_type == "MatMul" for node in quant_model.graph.node), num_layers)
+        # Input and weight of each MatMul are dequantized.
+        self.assertGreaterEqual(
+            sum(node.op_type == "DequantizeLinear" for node in quant_model.graph.node), 2 * num_layers
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,179 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import functools
+import math
+import os
+import tempfile
+import time
+import unittest
+
+import numpy
+import pytest
+from onnx import TensorProto, helper
+
+import onnxruntime
+
+try:
+    from affinity_helper import CpuCore, parse_cpu_list, plan_placement
+    from benchmark_helper import LatencyHistogram, run_load_benchmark, run_placed_benchmark
+except ImportError:
+    from onnxruntime.transformers.affinity_helper import CpuCore, parse_cpu_list, plan_placement
+    from onnxruntime.transformers.benchmark_helper import LatencyHistogram, run_load_benchmark, run_placed_benchmark
+
+
+def create_matmul_model():
+    graph = helper.make_graph(
+        [helper.make_node("MatMul", ["X", "X"], ["Y"])],
+        "matmul",
+        [helper.make_tensor_value_info("X", TensorProto.FLOAT, [64, 64])],
+        [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [64, 64])],
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        latencies = numpy.random.default_rng(0).lognormal(13, 1, 100000).astype(numpy.int64)
+        histogram = LatencyHistogram(significant_figures=2)
+        for latency in latencies.tolist():
+            histogram.record(latency)
+
+        self.assertEqual(histogram.count, len(latencies))
+        self.assertAlmostEqual(histogram.mean_ms, latencies.mean() / 1e6)
+        sorted_latencies = numpy.sort(latencies)
+        for percentile in [0, 1, 50, 90, 99, 99.9, 99.99, 100]:
+            expected = sorted_latencies[max(1, math.ceil(percentile / 100 * len(latencies))) - 1] / 1e6
+            self.assertLessEqual(abs(histogram.percentile(percentile) - expected), expected * 0.01)
+
+        # buckets of the histogram cover all the values, once
+        end = -1
+        for index in range(len(histogram._counts)):
+            low, high = histogram._bucket_range(index)
+            self.assertEqual(low, end + 1)
+            self.assertEqual(histogram._index(low), index)
+            self.assertEqual(histogram._index(high), index)
+            end = high
+
+    def test_merge_and_curve(self):
+        histogram = LatencyHistogram.from_latencies([0.001, 0.002, 0.003, 0.004])
+        merged = LatencyHistogram()
+        merged.merge(histogram)
+        merged.merge(LatencyHistogram.from_latencies([0.1]))
+        self.assertEqual(merged.count, 5)
+        self.assertAlmostEqual(merged.percentile(0), 1.0, delta=0.01)
+        self.assertEqual(merged.percentile(100), 100.0)
+
+        curve = merged.percentile_curve()
+        self.assertEqual(curve[0][0], 0.0)
+        self.assertEqual(curve[-1], (100.0, 100.0))
+        self.assertEqual([latency for _, latency in curve], sorted(latency for _, latency in curve))
+
+        with self.assertRaises(ValueError):
+            merged.merge(LatencyHistogram(significant_figures=3))
+
+
+class TestLoadBenchmark(unittest.TestCase):
+    def test_closed_loop(self):
+        model = create_matmul_model()
+        session = onnxruntime.InferenceSession(model.SerializeToString(), providers=["CPUExecutionProvider"])
+        inputs = {"X": numpy.ones((64, 64), dtype=numpy.float32)}
+
+        result = run_load_benchmark(
+            lambda: session.run(None, inputs), concurrency=2, duration_s=0.5, max_warmup_s=2, window_s=0.05
+        )
+        self.assertGreater(result.histogram.count, 0)
+        self.assertAlmostEqual(result.throughput_qps, result.histogram.count / result.duration_s)
+        self.assertLessEqual(result.warmup_s, 3)
+
+    def test_open_loop_includes_waiting_time(self):
+        calls = []
+
+        def run():
+            calls.append(None)
+            # one slow request delays the requests scheduled while it runs
+            time.sleep(0.2 if len(calls) == 100 else 0.001)
+
+        result = run_load_benchmark(
+            run, concurrency=1, target_qps=100, duration_s=2, max_warmup_s=0.5, window_s=0.05, stable_windows=1
+        )
+        self.assertAlmostEqual(result.throughput_qps, 100, delta=20)
+        self.assertLess(result.histogram.percentile(50), 20)
+        # the requests waiting for the slow one have latencies of up to 200ms
+        self.assertGreater(result.histogram.percentile(95), 50)
+
+    def test_errors(self):
+        def run():
+            raise KeyError("failed run")
+
+        with self.assertRaises(KeyError):
+            run_load_benchmark(run, duration_s=0.1)
+        with self.assertRaises(ValueError):
+            run_load_benchmark(run, target_qps=0)
+
+    def test_processes(self):
+        result = run_load_benchmark(
+            functools.partial(time.sleep, 0.002), concurrency=2, duration_s=0.5, max_warmup_s=1, num_processes=2
+        )
+        self.assertEqual(result.num_processes, 2)
+        self.assertEqual(result.concurrency, 4)
+        self.assertAlmostEqual(result.histogram.percentile(50), 2, delta=2)
+
+    def test_benchmark_record(self):
+        pytest.importorskip("pandas")
+        result = run_load_benchmark(
+            functools.partial(time.sleep, 0.001), concurrency=2, target_qps=200, duration_s=0.5, max_warmup_s=1
+        )
+        record = result.to_benchmark_record("sleep", "fp32", "cpu").to_dict()
+        self.assertEqual(record["config"]["concurrency"], 2)
+        self.assertEqual(record["config"]["target_qps"], 200)
+        self.assertEqual(record["metrics"]["throughput_qps"], result.throughput_qps)
+        self.assertLessEqual(record["metrics"]["latency_ms_p50"], record["metrics"]["latency_ms_p99.9"])
+        self.assertEqual(record["metrics"]["latency_ms_percentile_curve"][-1][0], 100.0)
+
+
+class TestPlacement(unittest.TestCase):
+    def setUp(self):
+        # two sockets of a NUMA node each, with 8 cores of 2 hardware threads
+        self.cores = [
+            CpuCore(socket, socket, core, [socket * 8 + core, 16 + socket * 8 + core])
+            for socket in range(2)
+            for core in range(8)
+        ]
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(parse_cpu_list("0-3,8,10-11\n"), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(parse_cpu_list(""), [])
+
+    def test_plan_placement(self):
+        self.assertEqual(plan_placement(2, cores=self.cores), [list(range(8)), list(range(8, 16))])
+        # processes alternate between the NUMA nodes
+        self.assertEqual(
+            plan_placement(4, 2, cores=self.cores, use_hyperthreads=True),
+            [[0, 16, 1, 17], [8, 24, 9, 25], [2, 18, 3, 19], [10, 26, 11, 27]],
+        )
+        # the last process does not fit in a NUMA node
+        self.assertEqual(
+            plan_placement(3, 5, cores=self.cores), [[0, 1, 2, 3, 4], [8, 9, 10, 11, 12], [5, 6, 7, 13, 14]]
+        )
+        with self.assertRaises(ValueError):
+            plan_placement(3, 6, cores=self.cores)
+        with self.assertRaises(ValueError):
+            plan_placement(0, cores=self.cores)
+
+    def test_run_placed_benchmark(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            model_path = os.path.join(temp_dir, "matmul.onnx")
+            with open(model_path, "wb") as f:
+                f.write(create_matmul_model().SerializeToString())
+
+            feeds = [{"X": numpy.ones((64, 64), dtype=numpy.float32)}]
+            result = run_placed_benchmark(model_path, feeds, 1, 1, duration_s=0.5, max_warmup_s=1, window_s=0.05)
+        self.assertEqual(result.num_processes, 1)
+        self.assertEqual(result.intra_op_num_threads, 1)
+        self.assertGreater(result.throughput_qps, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from float16 import convert_float_to_float16, convert_np_to_float16
+else:
+    from onnxruntime.transformers.float16 import convert_float_to_float16, convert_np_to_float16
+
+
+def create_matmul_model(num_layers: int = 2, hidden_size: int = 64) -> onnx.ModelProto:
+    rng = np.random.default_rng(0)
+    nodes = []
+    initializers = []
+    for i in range(num_layers):
+        weight = rng.standard_normal((hidden_size, hidden_size)).astype(np.float32)
+        # values that are clamped in float16
+        weight[0, :3] = [1e-9, -1e5, 7e4]
+        initializers.append(numpy_helper.from_array(weight, f"W{i}"))
+        matmul_input = "X" if i == 0 else f"H{i}"
+        nodes.append(helper.make_node("MatMul", [matmul_input, f"W{i}"], [f"H{i + 1}"], name=f"MatMul{i}"))
+    nodes.append(helper.make_node("Relu", [f"H{num_layers}"], ["Y"], name="Relu"))
+    graph = helper.make_graph(
+        nodes,
+        "matmul",
+        [helper.make_tensor_value_info("X", TensorProto.FLOAT, ["batch", hidden_size])],
+        [helper.make_tensor_value_info("Y", TensorProto.FLOAT, ["batch", hidden_size])],
+        initializer=initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+
+class TestFloat16Conversion(unittest.TestCase):
+    def test_convert_np_to_float16(self):
+        values = np.array(
+            [0.0, -0.0, np.inf, -np.inf, np.nan, 1e-9, -1e-9, 1e5, -1e5, 1.5, -2.25, 5.96e-08], dtype=np.float32
+        )
+        converted = convert_np_to_float16(values)
+        self.assertEqual(converted.dtype, np.float16)
+        expected = np.array(
+            [0.0, -0.0, np.inf, -np.inf, np.nan, 5.96e-08, -5.96e-08, 65504, -65504, 1.5, -2.25, 5.96e-08],
+            dtype=np.float16,
+        )
+        np.testing.assert_array_equal(converted, expected)
+        self.assertTrue(np.signbit(converted[1]))
+
+        converted = convert_np_to_float16(values.reshape(3, 4), min_positive_val=1e-4, max_finite_val=1000.0)
+        self.assertEqual(converted.shape, (3, 4))
+        np.testing.assert_array_equal(converted.reshape(-1)[5:9], np.array([1e-4, -1e-4, 1000, -1000], np.float16))
+
+    def test_convert_initializers(self):
+        model = create_matmul_model(num_layers=4)
+        weights = [numpy_helper.to_array(initializer) for initializer in model.graph.initializer]
+        # initializers in float_data are converted as well as the ones in raw_data
+        model.graph.initializer[1].CopyFrom(
+            helper.make_tensor("W1", TensorProto.FLOAT, weights[1].shape, weights[1].reshape(-1).tolist())
+        )
+
+        fp16_model = convert_float_to_float16(model, keep_io_types=True, num_threads=2)
+        for initializer, weight in zip(fp16_model.graph.initializer, weights):
+            self.assertEqual(initializer.data_type, TensorProto.FLOAT16)
+            np.testing.assert_array_equal(numpy_helper.to_array(initializer), convert_np_to_float16(weight))
+
+    def test_convert_external_data(self):
+        model = create_matmul_model()
+        expected = convert_float_to_float16(create_matmul_model(), keep_io_types=True)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            model_path = os.path.join(temp_dir, "model.onnx")
+            onnx.save(model, model_path, save_as_external_data=True, location="model.data", size_threshold=0)
+
+            fp16_model = convert_float_to_float16(
+                model_path, keep_io_types=True, float16_external_data="model_fp16.data"
+            )
+            for initializer in fp16_model.graph.initializer:
+                self.assertEqual(initializer.data_type, TensorProto.FLOAT16)
+                self.assertEqual(initializer.data_location, TensorProto.EXTERNAL)
+                self.assertFalse(initializer.HasField("raw_data"))
+            fp16_path = os.path.join(temp_dir, "model_fp16.onnx")
+            onnx.save(fp16_model, fp16_path)
+            fp16_model = onnx.load(fp16_path)
+
+            with self.assertRaises(ValueError):
+                convert_float_to_float16(model_path, keep_io_types=True, float16_external_data="model.data")
+            # the external data of the model is left unchanged
+            original_model = create_matmul_model()
+            for initializer, expected_initializer in zip(
+                onnx.load(model_path).graph.initializer, original_model.graph.initializer
+            ):
+                self.assertEqual(initializer.raw_data, expected_initializer.raw_data)
+
+        for initializer, expected_initializer in zip(fp16_model.graph.initializer, expected.graph.initializer):
+            np.testing.assert_array_equal(
+                numpy_helper.to_array(initializer), numpy_helper.to_array(expected_initializer)
+            )
+
+    def test_inserted_casts(self):
+        model = create_matmul_model()
+        model.graph.node.insert(1, helper.make_node("Softmax", ["H1"], ["S1"], name="Softmax"))
+        model.graph.node[2].input[0] = "S1"
+        # the nodes of subgraphs are converted too
+        branches = {
+            name: helper.make_graph(
+                [helper.make_node("Relu", ["Y"], [name], name=f"{name}Relu")],
+                name,
+                [],
+                [helper.make_tensor_value_info(name, TensorProto.FLOAT, None)],
+            )
+            for name in ["then", "else"]
+        }
+        model.graph.node.append(
+            helper.make_node(
+                "If", ["cond"], ["Z"], name="If", then_branch=branches["then"], else_branch=branches["else"]
+            )
+        )
+        model.graph.input.append(helper.make_tensor_value_info("cond", TensorProto.BOOL, []))
+        model.graph.output[0].CopyFrom(helper.make_tensor_value_info("Z", TensorProto.FLOAT, ["batch", 64]))
+
+        cast_report = {}
+        with self.assertLogs("float16", level="DEBUG") as logs:
+            fp16_model = convert_float_to_float16(
+                model, keep_io_types=True, op_block_list=["Softmax"], cast_report=cast_report
+            )
+        casts = {node.name: node for node in fp16_model.graph.node if node.op_type == "Cast"}
+        self.assertEqual(
+            sorted(casts), ["Softmax_input_cast0", "Softmax_output_cast0", "graph_input_cast0", "graph_output_cast0"]
+        )
+        self.assertEqual(casts["Softmax_input_cast0"].input[0], "H1")
+        self.assertEqual(casts["Softmax_input_cast0"].attribute[0].i, TensorProto.FLOAT)
+        self.assertEqual(casts["Softmax_output_cast0"].output[0], "S1")
+        self.assertEqual(casts["Softmax_output_cast0"].attribute[0].i, TensorProto.FLOAT16)
+        self.assertIn("Inserted 4 Cast nodes", "\n".join(logs.output))
+        self.assertEqual(
+            cast_report,
+            {
+                "graph input": ["graph_input_cast0"],
+                "graph output": ["graph_output_cast0"],
+                "float input": [],
+                "blocked node": ["Softmax_input_cast0", "Softmax_output_cast0"],
+            },
+        )
+
+        if_node = next(node for node in fp16_model.graph.node if node.op_type == "If")
+        for attr in if_node.attribute:
+            self.assertEqual(attr.g.output[0].type.tensor_type.elem_type, TensorProto.FLOAT16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,578 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.  See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pytest
+from onnx import TensorProto, helper, numpy_helper
+from onnx.external_data_helper import set_external_data
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from fusion_utils import FusionUtils
+    from onnx_model import OnnxModel
+    from optimizer import optimize_model
+else:
+    from onnxruntime.transformers.fusion_utils import FusionUtils
+    from onnxruntime.transformers.onnx_model import OnnxModel
+    from onnxruntime.transformers.optimizer import optimize_model
+
+
+def create_chain_model(num_nodes: int = 4):
+    nodes = []
+    for i in range(num_nodes):
+        input_name = "input" if i == 0 else f"x{i}"
+        output_name = "output" if i == num_nodes - 1 else f"x{i + 1}"
+        nodes.append(helper.make_node("Relu" if i % 2 == 0 else "Neg", [input_name], [output_name], name=f"n{i}"))
+    initializer = numpy_helper.from_array(np.ones([2], dtype=np.float32), "w")
+    graph = helper.make_graph(
+        nodes,
+        "chain",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [2])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2])],
+        initializer=[initializer],
+    )
+    return helper.make_model(graph)
+
+
+def get_node(model: OnnxModel, name: str):
+    return next((node for node in model.nodes() if node.name == name), None)
+
+
+def create_subgraph_model():
+    # input -> Relu -> If(then: Relu -> Neg, else: Neg) -> Relu -> output
+    then_branch = helper.make_graph(
+        [
+            helper.make_node("Relu", ["x1"], ["t1"], name="then_relu"),
+            helper.make_node("Neg", ["t1"], ["then_out"], name="then_neg"),
+        ],
+        "then_branch",
+        [],
+        [helper.make_tensor_value_info("then_out", TensorProto.FLOAT, [2])],
+    )
+    else_branch = helper.make_graph(
+        [helper.make_node("Neg", ["x1"], ["else_out"], name="else_neg")],
+        "else_branch",
+        [],
+        [helper.make_tensor_value_info("else_out", TensorProto.FLOAT, [2])],
+    )
+    graph = helper.make_graph(
+        [
+            helper.make_node("Relu", ["input"], ["x1"], name="relu0"),
+            helper.make_node("If", ["cond"], ["x2"], name="if", then_branch=then_branch, else_branch=else_branch),
+            helper.make_node("Relu", ["x2"], ["output"], name="relu1"),
+        ],
+        "main",
+        [
+            helper.make_tensor_value_info("input", TensorProto.FLOAT, [2]),
+            helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+        ],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2])],
+    )
+    return helper.make_model(graph)
+
+
+class TestOnnxModelIndexes(unittest.TestCase):
+    def assert_indexes_consistent(self, model: OnnxModel):
+        expected_consumers = {}
+        expected_producers = {}
+        for node in model.nodes():
+            for input_name in node.input:
+                if input_name:
+                    expected_consumers.setdefault(input_name, []).append(node.name)
+            for output_name in node.output:
+                if output_name:
+                    expected_producers[output_name] = node.name
+
+        consumers = {name: [n.name for n in nodes] for name, nodes in model.input_name_to_nodes().items() if nodes}
+        self.assertEqual(
+            {k: sorted(v) for k, v in consumers.items()}, {k: sorted(v) for k, v in expected_consumers.items()}
+        )
+        producers = {name: node.name for name, node in model.output_name_to_node().items()}
+        self.assertEqual(producers, expected_producers)
+
+        for op_type in {node.op_type for node in model.nodes()}:
+            self.assertEqual(
+                sorted(n.name for n in model.get_nodes_by_op_type(op_type)),
+                sorted(n.name for n in model.nodes() if n.op_type == op_type),
+            )
+
+        # The incrementally updated indexes are the same as the ones built from scratch, and hold the node objects
+        # stored in graph.
+        rebuilt = OnnxModel(model.model)
+        self.assertEqual(
+            {name: sorted(id(n) for n in nodes) for name, nodes in model.input_name_to_nodes().items()},
+            {name: sorted(id(n) for n in nodes) for name, nodes in rebuilt.input_name_to_nodes().items()},
+        )
+        self.assertEqual(
+            {name: id(node) for name, node in model.output_name_to_node().items()},
+            {name: id(node) for name, node in rebuilt.output_name_to_node().items()},
+        )
+        for op_type in {node.op_type for node in model.nodes()}:
+            self.assertEqual(
+                [id(n) for n in model.get_nodes_by_op_type(op_type)],
+                [id(n) for n in rebuilt.get_nodes_by_op_type(op_type)],
+            )
+        for node in model.nodes():
+            self.assertIs(model.get_graph_by_node(node), rebuilt.get_graph_by_node(node))
+        for graph in model.graphs():
+            for tensor in graph.initializer:
+                self.assertIs(model.get_initializer(tensor.name), rebuilt.get_initializer(tensor.name))
+
+    def test_add_and_remove_nodes(self):
+        model = OnnxModel(create_chain_model())
+        self.assert_indexes_consistent(model)
+
+        model.add_node(helper.make_node("Relu", ["x1"], ["y"], name="extra"))
+        self.assertEqual(len(model.get_children(get_node(model, "n0"))), 2)
+        self.assert_indexes_consistent(model)
+
+        model.remove_nodes([get_node(model, "extra"), get_node(model, "n1")])
+        self.assertIsNone(get_node(model, "n1"))
+        self.assertEqual(len(model.get_nodes_by_op_type("Neg")), 1)
+        self.assert_indexes_consistent(model)
+
+    def test_replace_node_input_and_output(self):
+        model = OnnxModel(create_chain_model())
+        node = get_node(model, "n2")
+        model.replace_node_input(node, "x2", "input")
+        self.assertEqual(len(model.input_name_to_nodes()["input"]), 2)
+        self.assert_indexes_consistent(model)
+
+        model.replace_node_output(node, "x3", "z")
+        self.assertIs(model.find_graph_input("input"), model.model.graph.input[0])
+        self.assertEqual(model.output_name_to_node()["z"].name, "n2")
+        self.assert_indexes_consistent(model)
+
+    def test_set_node_input_and_output(self):
+        model = OnnxModel(create_chain_model())
+        model.add_node(helper.make_node("Add", ["x1", "x1"], ["y"], name="add"))
+        model.add_node(helper.make_node("Resize", ["x2", "", "", "w"], ["z"], name="resize"))
+        self.assert_indexes_consistent(model)
+
+        # Only the input at the index is changed, unlike replace_node_input.
+        add = get_node(model, "add")
+        model.set_node_input(add, 1, "input")
+        self.assertEqual(list(add.input), ["x1", "input"])
+        self.assertEqual([n.name for n in model.input_name_to_nodes()["x1"]], ["n1", "add"])
+        self.assert_indexes_consistent(model)
+
+        # Optional inputs are empty names, which are not in the indexes.
+        resize = get_node(model, "resize")
+        model.set_node_input(resize, 2, "x3")
+        model.set_node_input(resize, 3, "")
+        self.assertEqual(list(resize.input), ["x2", "", "x3", ""])
+        self.assert_indexes_consistent(model)
+
+        model.set_node_output(add, 0, "y2")
+        self.assertIs(model.output_name_to_node()["y2"], add)
+        self.assertNotIn("y", model.output_name_to_node())
+        self.assert_indexes_consistent(model)
+
+    def test_replace_output_of_all_nodes(self):
+        model = OnnxModel(create_subgraph_model())
+        model.replace_output_of_all_nodes("x1", "y1")
+        self.assertEqual(model.output_name_to_node()["y1"].name, "relu0")
+        self.assert_indexes_consistent(model)
+
+        # Every node of the main graph with the output is renamed, even when the graph has several producers.
+        model.add_node(helper.make_node("Neg", ["input"], ["y1"], name="neg"))
+        model.replace_output_of_all_nodes("y1", "z1")
+        self.assertEqual([n.name for n in model.nodes() if "z1" in n.output], ["relu0", "neg"])
+
+    def test_static_replace_node_input(self):
+        node = helper.make_node("Add", ["a", "a"], ["b"])
+        OnnxModel.replace_node_input(node, "a", "c")
+        OnnxModel.replace_node_output(node, "b", "d")
+        self.assertEqual(list(node.input), ["c", "c"])
+        self.assertEqual(list(node.output), ["d"])
+
+    def test_nodes_by_op_type_in_graph_order(self):
+        model = OnnxModel(create_subgraph_model())
+        self.assertEqual([n.name for n in model.get_nodes_by_op_type("Relu")], ["relu0", "relu1", "then_relu"])
+
+        # Nodes are inserted before their consumers in subgraph, and appended to main graph.
+        model.add_node(helper.make_node("Relu", ["x1"], ["t0"], name="then_relu0"), "then_branch")
+        model.add_node(helper.make_node("Relu", ["t0"], ["t3"], name="then_relu1"), "then_branch")
+        model.add_node(helper.make_node("Relu", ["x2"], ["y"], name="relu2"))
+        model.remove_node(get_node(model, "relu0"))
+        expected = [n.name for n in model.nodes() if n.op_type == "Relu"]
+        self.assertEqual(expected, ["relu1", "relu2", "then_relu", "then_relu0", "then_relu1"])
+        self.assertEqual([n.name for n in model.get_nodes_by_op_type("Relu")], expected)
+        self.assert_indexes_consistent(model)
+
+    def test_random_changes(self):
+        model = OnnxModel(create_subgraph_model())
+        rng = np.random.default_rng(0)
+        for step in range(200):
+            nodes = model.nodes()
+            node = nodes[rng.integers(len(nodes))]
+            names = sorted({name for n in nodes for name in [*n.input, *n.output]})
+            name = names[rng.integers(len(names))]
+            operation = step % 6
+            if operation == 0:
+                graph_name = model.get_graph_by_node(node).name
+                new_node = helper.make_node(["Relu", "Neg"][step % 2], [name], [f"y{step}"], name=f"new{step}")
+                model.add_node(new_node, graph_name)
+            elif operation == 1 and node.op_type != "If":
+                model.remove_node(node)
+            elif operation == 2 and len(node.input) > 0:
+                model.set_node_input(node, int(rng.integers(len(node.input))), name)
+            elif operation == 3 and len(node.input) > 0:
+                model.replace_node_input(node, node.input[0], name)
+            elif operation == 4:
+                model.set_node_output(node, 0, f"z{step}")
+            elif operation == 5:
+                model.replace_input_of_all_nodes(name, f"w{step}")
+            self.assert_indexes_consistent(model)
+
+    def test_skip_parent(self):
+        model = OnnxModel(create_chain_model())
+        n2 = get_node(model, "n2")
+        can_be_removed = FusionUtils.skip_parent(model, n2, get_node(model, "n1"), model.input_name_to_nodes())
+        self.assertTrue(can_be_removed)
+        self.assertEqual(n2.input[0], "x1")
+        self.assert_indexes_consistent(model)
+
+    def test_snapshot_is_not_mutated(self):
+        model = OnnxModel(create_chain_model())
+        snapshot = model.input_name_to_nodes()
+        model.replace_input_of_all_nodes("x1", "input")
+        self.assertEqual([n.name for n in snapshot["x1"]], ["n1"])
+        self.assertNotIn("x1", {k for k, v in model.input_name_to_nodes().items() if v})
+
+    def test_prune_graph(self):
+        model = OnnxModel(create_chain_model())
+        model.add_node(helper.make_node("Relu", ["x1"], ["dangling"], name="extra"))
+        model.prune_graph()
+        self.assertIsNone(get_node(model, "extra"))
+        self.assertIsNone(model.get_initializer("w"))
+        self.assert_indexes_consistent(model)
+
+    def test_initializer_index(self):
+        model = OnnxModel(create_chain_model())
+        self.assertIsNotNone(model.get_initializer("w"))
+        model.add_initializer(numpy_helper.from_array(np.zeros([1], dtype=np.float32), "b"))
+        self.assertIsNotNone(model.get_initializer("b"))
+        model.update_graph()
+        self.assertIsNone(model.get_initializer("b"))
+        self.assertIsNone(model.get_initializer("w"))
+
+
+def create_fan_out_model(num_nodes: int):
+    """A graph with a long chain of Relu nodes, each with a Neg branch that feeds the final Sum."""
+    nodes = []
+    branch_outputs = []
+    num_layers = num_nodes // 2
+    for i in range(num_layers):
+        input_name = "input" if i == 0 else f"relu_{i - 1}"
+        nodes.append(helper.make_node("Relu", [input_name], [f"relu_{i}"], name=f"relu_{i}"))
+        nodes.append(helper.make_node("Neg", [f"relu_{i}"], [f"neg_{i}"], name=f"neg_{i}"))
+        branch_outputs.append(f"neg_{i}")
+    nodes.append(helper.make_node("Sum", branch_outputs, ["output"], name="sum"))
+    graph = helper.make_graph(
+        nodes,
+        "fan_out",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [2])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2])],
+    )
+    return helper.make_model(graph)
+
+
+def create_shared_weights_model():
+    weight = np.arange(12, dtype=np.float32).reshape(3, 4)
+    then_branch = helper.make_graph(
+        [helper.make_node("MatMul", ["input", "w3"], ["then_out"], name="then_matmul")],
+        "then_branch",
+        [],
+        [helper.make_tensor_value_info("then_out", TensorProto.FLOAT, [2, 4])],
+        initializer=[numpy_helper.from_array(weight, "w3")],
+    )
+    else_branch = helper.make_graph(
+        [helper.make_node("MatMul", ["input", "w0"], ["else_out"], name="else_matmul")],
+        "else_branch",
+        [],
+        [helper.make_tensor_value_info("else_out", TensorProto.FLOAT, [2, 4])],
+    )
+    nodes = [
+        helper.make_node("MatMul", ["input", "w0"], ["y0"], name="matmul0"),
+        helper.make_node("MatMul", ["input", "w1"], ["y1"], name="matmul1"),
+        helper.make_node("MatMul", ["input", "w2"], ["y2"], name="matmul2"),
+        helper.make_node("If", ["cond"], ["y3"], name="if", then_branch=then_branch, else_branch=else_branch),
+        helper.make_node("Sum", ["y0", "y1", "y2", "y3"], ["output"], name="sum"),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "shared_weights",
+        [
+            helper.make_tensor_value_info("input", TensorProto.FLOAT, [2, 3]),
+            helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+        ],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2, 4])],
+        initializer=[
+            numpy_helper.from_array(weight, "w0"),
+            helper.make_tensor("w1", TensorProto.FLOAT, [3, 4], weight.flatten().tolist()),
+            numpy_helper.from_array(weight.reshape(4, 3).T.copy(), "w2"),
+        ],
+    )
+    return helper.make_model(graph)
+
+
+class TestRemoveDuplicatedInitializer(unittest.TestCase):
+    def test_remove_duplicated_initializer(self):
+        model = OnnxModel(create_shared_weights_model())
+        report = model.remove_duplicated_initializer()
+
+        # w1 stores the same value in float_data instead of raw_data, and w3 is in subgraph.
+        self.assertEqual(report, {"removed_initializers": 2, "bytes_saved": 2 * 12 * 4})
+        self.assertEqual(sorted(t.name for t in model.model.graph.initializer), ["w0", "w2"])
+        self.assertEqual(get_node(model, "matmul1").input[1], "w0")
+        self.assertEqual(get_node(model, "matmul2").input[1], "w2")
+        self.assertEqual(get_node(model, "then_matmul").input[1], "w0")
+        self.assertEqual(len(model.get_graph_by_name("then_branch").initializer), 0)
+
+    def test_same_name_in_sibling_subgraphs(self):
+        # Each branch has an initializer named w, equal to a different initializer of main graph.
+        weights = {"then": np.ones([2], dtype=np.float32), "else": np.full([2], 2, dtype=np.float32)}
+        branches = {
+            name: helper.make_graph(
+                [helper.make_node("Add", ["input", "w"], [f"{name}_out"], name=f"{name}_add")],
+                f"{name}_branch",
+                [],
+                [helper.make_tensor_value_info(f"{name}_out", TensorProto.FLOAT, [2])],
+                initializer=[numpy_helper.from_array(weight, "w")],
+            )
+            for name, weight in weights.items()
+        }
+        graph = helper.make_graph(
+            [
+                helper.make_node("If", ["cond"], ["y"], then_branch=branches["then"], else_branch=branches["else"]),
+                helper.make_node("Sum", ["y", "ones", "twos"], ["output"], name="sum"),
+            ],
+            "main",
+            [
+                helper.make_tensor_value_info("input", TensorProto.FLOAT, [2]),
+                helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+            ],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2])],
+            initializer=[
+                numpy_helper.from_array(weights["then"], "ones"),
+                numpy_helper.from_array(weights["else"], "twos"),
+            ],
+        )
+        model = OnnxModel(helper.make_model(graph))
+        report = model.remove_duplicated_initializer()
+
+        self.assertEqual(report["removed_initializers"], 2)
+        self.assertEqual(get_node(model, "then_add").input[1], "ones")
+        self.assertEqual(get_node(model, "else_add").input[1], "twos")
+
+    def test_external_data(self):
+        weight = np.arange(12, dtype=np.float32).reshape(3, 4)
+        with tempfile.TemporaryDirectory() as base_dir:
+            with open(os.path.join(base_dir, "weights.bin"), "wb") as f:
+                f.write(b"\0" * 16 + weight.tobytes() + weight.tobytes())
+
+            model = create_shared_weights_model()
+            for i, initializer in enumerate(model.graph.initializer[:2]):
+                # set_external_data requires raw_data, which is cleared afterwards like in onnx.save_model.
+                initializer.CopyFrom(numpy_helper.from_array(weight, initializer.name))
+                set_external_data(initializer, "weights.bin", offset=16 + i * weight.nbytes, length=weight.nbytes)
+                initializer.ClearField("raw_data")
+                initializer.data_location = TensorProto.EXTERNAL
+
+            cache = {}
+            onnx_model = OnnxModel(model)
+            report = onnx_model.remove_duplicated_initializer(cache, base_dir=base_dir)
+            self.assertEqual(report["removed_initializers"], 2)
+            self.assertEqual(cache["w0"], cache["w3"])
+            self.assertFalse(onnx_model.get_initializer("w0").HasField("raw_data"))
+
+
+class TestTopologicalSort(unittest.TestCase):
+    def assert_topologically_sorted(self, graph):
+        available = {init.name for init in graph.initializer} | {input.name for input in graph.input}
+        for node in graph.node:
+            for input_name in node.input:
+                self.assertTrue(not input_name or input_name in available, f"{node.name} is not sorted")
+            available.update(node.output)
+
+    def test_sorted_graph_is_unchanged(self):
+        model = OnnxModel(create_chain_model(8))
+        names = [node.name for node in model.nodes()]
+        model.topological_sort()
+        self.assertEqual([node.name for node in model.nodes()], names)
+
+    def test_reversed_graph(self):
+        model = OnnxModel(create_fan_out_model(100))
+        model.model.graph.node.reverse()
+        model.topological_sort()
+        self.assert_topologically_sorted(model.model.graph)
+        self.assertEqual(len(model.nodes()), 101)
+
+    def test_deterministic(self):
+        model = OnnxModel(create_fan_out_model(10))
+        model.model.graph.node.reverse()
+        model.topological_sort(is_deterministic=True)
+        names = [node.name for node in model.nodes()]
+        self.assertEqual(names[:4], ["relu_0", "neg_0", "relu_1", "neg_1"])
+        self.assertEqual(names[-1], "sum")
+
+    def test_subgraph(self):
+        then_nodes = [
+            helper.make_node("Neg", ["then_relu"], ["then_out"], name="then_neg"),
+            helper.make_node("Relu", ["x"], ["then_relu"], name="then_relu"),
+        ]
+        then_branch = helper.make_graph(
+            then_nodes, "then", [], [helper.make_tensor_value_info("then_out", TensorProto.FLOAT, [2])]
+        )
+        else_branch = helper.make_graph(
+            [helper.make_node("Identity", ["x"], ["else_out"], name="else_identity")],
+            "else",
+            [],
+            [helper.make_tensor_value_info("else_out", TensorProto.FLOAT, [2])],
+        )
+        nodes = [
+            helper.make_node("If", ["cond"], ["output"], name="if", then_branch=then_branch, else_branch=else_branch),
+            # x is only used inside the subgraphs of If node, so it still needs to be computed before If node.
+            helper.make_node("Relu", ["input"], ["x"], name="relu"),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "main",
+            [
+                helper.make_tensor_value_info("input", TensorProto.FLOAT, [2]),
+                helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+            ],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2])],
+        )
+        model = OnnxModel(helper.make_model(graph))
+        model.topological_sort()
+        self.assertEqual([node.name for node in model.model.graph.node], ["relu", "if"])
+        sorted_then_branch = OnnxModel.get_node_attribute(model.model.graph.node[1], "then_branch")
+        self.assertEqual([node.name for node in sorted_then_branch.node], ["then_relu", "then_neg"])
+        self.assertEqual(len(model.get_nodes_by_op_type("Neg")), 1)
+
+    def test_cycle(self):
+        model = create_chain_model(4)
+        model.graph.node.append(helper.make_node("Add", ["x3", "x1"], ["y"], name="add"))
+        model.graph.node[1].input[0] = "y"
+        with self.assertRaisesRegex(RuntimeError, "cycle n1 -> n2 -> add -> n1"):
+            OnnxModel(model).topological_sort()
+
+    def test_missing_input(self):
+        model = create_chain_model(4)
+        model.graph.node[2].input[0] = "unknown"
+        with self.assertRaisesRegex(RuntimeError, "input unknown of node n2"):
+            OnnxModel(model).topological_sort()
+
+    @pytest.mark.slow
+    def test_benchmark_200k_nodes(self):
+        model = OnnxModel(create_fan_out_model(200000))
+        nodes = list(model.model.graph.node)
+        model.model.graph.ClearField("node")
+        model.model.graph.node.extend(reversed(nodes))
+        for is_deterministic in [False, True]:
+            start_time = time.time()
+            model.topological_sort(is_deterministic=is_deterministic)
+            latency = time.time() - start_time
+            print(
+                f"topological_sort of {len(model.nodes())} nodes (is_deterministic={is_deterministic}): {latency:.2f} s"
+            )
+            self.assert_topologically_sorted(model.model.graph)
+
+
+def create_decoder_model(num_layers: int, hidden_size: int = 8):
+    """Layers of unfused LayerNormalization, MatMul, Add, Gelu, MatMul, Add and residual Add, like an exported decoder."""
+    nodes = []
+    initializers = []
+
+    def add_constant(name, value):
+        initializers.append(numpy_helper.from_array(np.asarray(value, dtype=np.float32), name))
+        return name
+
+    add_constant("two", 2.0)
+    add_constant("epsilon", 1e-5)
+    add_constant("one", 1.0)
+    add_constant("half", 0.5)
+    add_constant("sqrt2", np.sqrt(2.0))
+    weight = np.ones([hidden_size, hidden_size], dtype=np.float32)
+    residual = "input"
+    for i in range(num_layers):
+        gamma = add_constant(f"gamma{i}", np.ones([hidden_size]))
+        beta = add_constant(f"beta{i}", np.zeros([hidden_size]))
+        w1 = add_constant(f"w1_{i}", weight)
+        b1 = add_constant(f"b1_{i}", np.zeros([hidden_size]))
+        w2 = add_constant(f"w2_{i}", weight)
+        b2 = add_constant(f"b2_{i}", np.zeros([hidden_size]))
+        layer_nodes = [
+            ("ReduceMean", [residual], ["mean"], {"axes": [-1]}),
+            ("Sub", [residual, "mean"], ["centered"], {}),
+            ("Pow", ["centered", "two"], ["squared"], {}),
+            ("ReduceMean", ["squared"], ["variance"], {"axes": [-1]}),
+            ("Add", ["variance", "epsilon"], ["variance_eps"], {}),
+            ("Sqrt", ["variance_eps"], ["std"], {}),
+            ("Div", ["centered", "std"], ["normalized"], {}),
+            ("Mul", ["normalized", gamma], ["scaled"], {}),
+            ("Add", ["scaled", beta], ["ln"], {}),
+            ("MatMul", ["ln", w1], ["fc1"], {}),
+            ("Add", ["fc1", b1], ["fc1_bias"], {}),
+            ("Div", ["fc1_bias", "sqrt2"], ["gelu_div"], {}),
+            ("Erf", ["gelu_div"], ["gelu_erf"], {}),
+            ("Add", ["gelu_erf", "one"], ["gelu_add"], {}),
+            ("Mul", ["fc1_bias", "gelu_add"], ["gelu_mul"], {}),
+            ("Mul", ["gelu_mul", "half"], ["gelu"], {}),
+            ("MatMul", ["gelu", w2], ["fc2"], {}),
+            ("Add", ["fc2", b2], ["fc2_bias"], {}),
+            ("Add", ["fc2_bias", residual], ["residual"], {}),
+        ]
+        local_names = {output for _, _, outputs, _ in layer_nodes for output in outputs}
+        for j, (op_type, inputs, outputs, attributes) in enumerate(layer_nodes):
+            layer_inputs = [f"{name}_{i}" if name in local_names else name for name in inputs]
+            nodes.append(
+                helper.make_node(op_type, layer_inputs, [f"{outputs[0]}_{i}"], name=f"{op_type}_{i}_{j}", **attributes)
+            )
+        residual = f"residual_{i}"
+
+    graph = helper.make_graph(
+        nodes,
+        "decoder",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", "seq", hidden_size])],
+        [helper.make_tensor_value_info(residual, TensorProto.FLOAT, ["batch", "seq", hidden_size])],
+        initializer=initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+
+class TestOptimizeModel(unittest.TestCase):
+    def test_fusions(self):
+        optimized = optimize_model(create_decoder_model(2), model_type="bert", opt_level=0)
+        op_types = [node.op_type for node in optimized.nodes()]
+        self.assertEqual(op_types.count("LayerNormalization") + op_types.count("SkipLayerNormalization"), 2)
+        self.assertEqual(op_types.count("BiasGelu") + op_types.count("Gelu"), 2)
+        self.assertNotIn("Erf", op_types)
+
+    @pytest.mark.slow
+    def test_benchmark_fusions(self):
+        # The fusions use the indexes of OnnxModel. The time per layer still grows with the number of layers because of
+        # the symbolic shape inference run by some fusions, whose topological sort is quadratic.
+        for num_layers in [64, 256, 1024]:
+            model = create_decoder_model(num_layers)
+            start_time = time.time()
+            optimize_model(model, model_type="bert", opt_level=0)
+            latency = time.time() - start_time
+            print(
+                f"optimize_model fusions of {num_layers} layers ({len(model.graph.node)} nodes): {latency:.2f} s, "
+                f"{latency / num_layers * 1000:.2f} ms per layer"
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
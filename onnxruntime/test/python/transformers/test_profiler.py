@@ -8,6 +8,9 @@
 # For live logging, use the command: pytest -o log_cli=true --log-cli-level=DEBUG
 
 import os
+import tempfile
+import time
+import tracemalloc
 import unittest
 
 import pytest
@@ -39,6 +42,112 @@ class TestBertProfiler(unittest.TestCase):
         self.run_profile(f"--model {input_model_path} --batch_size 1 --sequence_length 7 --dummy_inputs default")
 
 
+def write_synthetic_trace(path, num_runs, nodes_per_run, trace_events_object=False):
+    """Write a trace like the one of a session with CUDA: per node, fences, a kernel time event and a GPU kernel."""
+    with open(path, "w") as f:
+        f.write('{"otherData": {"version": 1}, "traceEvents": [\n' if trace_events_object else "[\n")
+        f.write('{"cat": "Session", "name": "session_initialization", "dur": 1000, "ts": 0, "args": {}}')
+        op_types = ["MatMul", "Add", "LayerNormalization", "Gelu", "If"]
+        for run in range(num_runs):
+            events = []
+            for i in range(nodes_per_run):
+                op_name = op_types[i % len(op_types)]
+                provider = "CUDAExecutionProvider" if i % 3 else "CPUExecutionProvider"
+                shape = '[{"float": [1, 128, 768]}]'
+                args = f'"op_name": "{op_name}", "input_type_shape": {shape}, "output_type_shape": {shape}'
+                node = f'{{"cat": "Node", "name": "node{i}'
+                fence_args = f'"ts": {run}, "args": {{"op_name": "{op_name}"}}}}'
+                events.append(f'{node}_fence_before", "dur": {i % 2}, {fence_args}')
+                events.append(
+                    f'{node}_kernel_time", "dur": {10 + (i * 7 + run) % 50}, "ts": {run}, '
+                    f'"args": {{{args}, "provider": "{provider}"}}}}'
+                )
+                events.append(f'{node}_fence_after", "dur": {i % 3}, {fence_args}')
+                events.append(
+                    f'{{"cat": "Kernel", "name": "kernel{i % 7}", "dur": {5 + (i + run) % 20}, "ts": {run}, '
+                    f'"args": {{"op_name": "{op_name}", "block_x": 128, "grid_x": {i % 4}}}}}'
+                )
+            events.append(f'{{"cat": "Session", "name": "model_run", "dur": 100, "ts": {run}, "args": {{}}}}')
+            f.write(",\n" + ",\n".join(events))
+        f.write("\n]}" if trace_events_object else "\n]")
+
+
+class TestProfileTrace(unittest.TestCase):
+    def test_streaming_matches_json_load(self):
+        from onnxruntime.tools.profile_trace import aggregate_profile, iter_trace_events
+        from onnxruntime.transformers.profiler import (
+            group_node_results,
+            load_profile_aggregates,
+            load_profile_json,
+            parse_kernel_results,
+            parse_node_results,
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "profile.json")
+            write_synthetic_trace(path, num_runs=5, nodes_per_run=40)
+            events = load_profile_json(path)
+            self.assertEqual(list(iter_trace_events(path, chunk_size=100)), events)
+
+            object_path = os.path.join(tmp_dir, "profile_object.json")
+            write_synthetic_trace(object_path, num_runs=5, nodes_per_run=40, trace_events_object=True)
+            self.assertEqual(list(iter_trace_events(object_path, chunk_size=100)), events)
+
+            aggregates = load_profile_aggregates(path)
+            self.assertEqual(parse_kernel_results(aggregates, 0.01), parse_kernel_results(events, 0.01))
+            for kernel_time_only in [False, True]:
+                self.assertEqual(
+                    parse_node_results(aggregates, kernel_time_only, 0.01),
+                    parse_node_results(events, kernel_time_only, 0.01),
+                )
+                self.assertEqual(
+                    group_node_results(aggregates, kernel_time_only, True),
+                    group_node_results(aggregate_profile(events), kernel_time_only, True),
+                )
+            # "If" nodes contain subgraphs and are skipped
+            self.assertNotIn("If", aggregates.op_kernel_time)
+            self.assertEqual(aggregates.op_kernel_calls["MatMul"], 5 * 8)
+
+    def test_columnar_table(self):
+        from onnxruntime.tools.profile_trace import ColumnarTable
+
+        table = ColumnarTable(["duration"], ["name", "op_name"])
+        table.append(duration=3, name="a", op_name=None)
+        table.append(duration=5, name="b", op_name="Add")
+        table.append(duration=7, name="a", op_name="Add")
+        self.assertEqual(len(table), 3)
+        columns = table.to_numpy()
+        self.assertEqual(columns["duration"].tolist(), [3, 5, 7])
+        self.assertEqual(columns["name"].tolist(), ["a", "b", "a"])
+        self.assertEqual(columns["op_name"].tolist(), [None, "Add", "Add"])
+
+    @pytest.mark.slow
+    def test_streaming_benchmark(self):
+        from onnxruntime.tools.profile_trace import aggregate_profile, iter_trace_events
+
+        # 10M events
+        num_runs, nodes_per_run = 5000, 500
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "profile.json")
+            write_synthetic_trace(path, num_runs, nodes_per_run)
+            size_mb = os.path.getsize(path) / 1024**2
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            aggregates = aggregate_profile(iter_trace_events(path))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            num_events = num_runs * (4 * nodes_per_run + 1) + 1
+            print(
+                f"Aggregated {num_events} events ({size_mb:.0f} MB) in {elapsed:.1f}s "
+                f"({num_events / elapsed / 1e6:.2f}M events/s), peak memory {peak / 1024**2:.1f} MB"
+            )
+            self.assertEqual(sum(aggregates.kernel_calls.values()), num_runs * nodes_per_run * 4 // 5)
+            self.assertLess(peak, 64 * 1024**2)
+
+
 if __name__ == "__main__":
     import sys
 
@@ -0,0 +1,82 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+# _export_cache.py
+
+"""On-disk cache of exported models, enabled by ORTMODULE_CACHE_DIR.
+
+An exported model is stored as `<key>.onnx` with its tensors in `<key>.onnx.data`, where the key is a hash of
+everything the export depends on (see GraphExecutionManager._get_export_cache_path). A cache entry is never
+updated in place: any change of the module, parameters, input schema, versions or options gives a new key.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import onnx
+
+
+def get_cached_model_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, f"{key}.onnx")
+
+
+def can_cache_model(model: onnx.ModelProto) -> bool:
+    """Returns False if the export has side effects that loading a cached model would miss.
+
+    Exporting PythonOp registers the torch.autograd.Function to run, so such models are always exported.
+    """
+    return not any(node.domain == "com.microsoft" and node.op_type == "PythonOp" for node in model.graph.node)
+
+
+def load_cached_model(path: str, logger: logging.Logger) -> Optional[onnx.ModelProto]:
+    """Loads the cached model, or returns None if it is not cached or cannot be loaded."""
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        model = onnx.load(path)
+    except Exception as e:
+        logger.warning(f"Failed to load cached model {path}, it will be exported again: {e}")
+        return None
+
+    logger.warning(
+        f"Cached model detected! Cached model will be used to save export and initialization time."
+        f"If you want the model to be re-exported then DELETE {path}."
+    )
+    return model
+
+
+def save_cached_model(model: onnx.ModelProto, path: str, logger: logging.Logger):
+    """Saves the model with external data. Files are written to a temporary directory and moved into the cache
+    directory, so that concurrent processes never load a partially written model."""
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    file_name = os.path.basename(path)
+    data_file_name = f"{file_name}.data"
+
+    # Saving with external data modifies the tensors of the model, so save a copy.
+    model_copy = onnx.ModelProto()
+    model_copy.CopyFrom(model)
+
+    logger.info(f"Caching model for future runs to {path}.")
+    temp_dir = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        onnx.save(
+            model_copy,
+            os.path.join(temp_dir, file_name),
+            save_as_external_data=True,
+            all_tensors_to_one_file=True,
+            location=data_file_name,
+            size_threshold=1024,
+        )
+        if os.path.isfile(os.path.join(temp_dir, data_file_name)):
+            os.replace(os.path.join(temp_dir, data_file_name), os.path.join(cache_dir, data_file_name))
+        os.replace(os.path.join(temp_dir, file_name), path)
+    except OSError as e:
+        logger.warning(f"Failed to cache model to {path}: {e}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -21,7 +21,7 @@ from onnxruntime.capi import _pybind_state as C
 from onnxruntime.tools.symbolic_shape_infer import SymbolicShapeInference
 from onnxruntime.training.utils import ORTModelInputOutputSchemaType, PTable, onnx_dtype_to_pytorch_dtype
 
-from . import _are_deterministic_algorithms_enabled, _io, _logger, _onnx_models, _utils, export_context
+from . import _are_deterministic_algorithms_enabled, _export_cache, _io, _logger, _onnx_models, _utils, export_context
 from ._fallback import (
     ORTModuleDeviceException,
     ORTModuleONNXModelException,
@@ -50,6 +50,43 @@ class _RunStateInfo:
         self.output_info = output_info
 
 
+class _ExportedGraphCache:
+    """LRU cache of the states built for input schemas other than the current one.
+
+    A state is what GraphExecutionManager builds for an input schema: onnx models, graph builder, graph info and
+    execution agent. Switching back to a cached schema restores its state instead of exporting the model again.
+    The state of the current schema lives in the GraphExecutionManager, so at most `capacity - 1` states are cached.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        # Least recently used entry is the first one.
+        self._entries: List[Tuple[ORTModelInputOutputSchemaType, Dict]] = []
+
+    def is_enabled(self) -> bool:
+        return self.capacity > 1
+
+    def pop(self, schema: ORTModelInputOutputSchemaType) -> Optional[Dict]:
+        """Removes and returns the state of the schema, or None if it is not cached."""
+        for index, (cached_schema, state) in enumerate(self._entries):
+            if cached_schema == schema:
+                del self._entries[index]
+                self.hits += 1
+                return state
+        self.misses += 1
+        return None
+
+    def push(self, schema: ORTModelInputOutputSchemaType, state: Dict):
+        self._entries.append((schema, state))
+        while len(self._entries) >= self.capacity:
+            self._entries.pop(0)
+
+    def clear(self):
+        self._entries.clear()
+
+
 class GraphExecutionManager(GraphExecutionInterface):
     def __init__(
         self,
@@ -166,6 +203,13 @@ class GraphExecutionManager(GraphExecutionInterface):
         # Be noted, we will never enable this feature for inference mode.
         self._mem_efficient_grad_management_is_enabled = False
 
+        # Path of the exported model in ORTMODULE_CACHE_DIR, and whether it was loaded from there.
+        self._export_cache_path = ""
+        self._exported_model_is_cached = False
+
+        # States of recently used input schemas, so that switching between a few schemas does not re-export.
+        self._exported_graph_cache = _ExportedGraphCache(self._runtime_options.export_cache_size)
+
     def _get_torch_gpu_allocator_function_addresses(self):
         if self._runtime_options.use_external_gpu_allocator and torch.cuda.is_available():
             # CPP extension to get torch GPU allocator's alloc and free function addresses
@@ -305,6 +349,19 @@ class GraphExecutionManager(GraphExecutionInterface):
         ):
             # All required models have already been exported previously
             return False
+
+        if self._exported_graph_cache.is_enabled():
+            if self._original_model_has_changed:
+                self._exported_graph_cache.clear()
+            elif self._onnx_models.exported_model:
+                cached_state = self._exported_graph_cache.pop(schema)
+                self._exported_graph_cache.push(self._input_info.schema, self._pop_schema_state())
+                if cached_state is not None:
+                    self._logger.info("Reusing the exported model of a previous input schema.")
+                    self._restore_schema_state(cached_state)
+                    _utils.set_random_states(random_states)
+                    return False
+
         self._set_device_from_module(inputs, kwargs)
         # TODO: move it into runtime_inspector
         embedding_hook_handles = self._add_check_embedding_sparsity_hook()
@@ -323,16 +380,54 @@ class GraphExecutionManager(GraphExecutionInterface):
                 self._export_mode,
             )
 
-        if self._runtime_options.run_symbolic_shape_infer:
+        # A cached model is saved after shape inference.
+        if self._runtime_options.run_symbolic_shape_infer and not self._exported_model_is_cached:
             self._onnx_models.exported_model = SymbolicShapeInference.infer_shapes(
                 self._onnx_models.exported_model, auto_merge=True, guess_output_rank=True
             )
 
+        # Cache model for future runs
+        if (
+            self._export_cache_path
+            and not self._exported_model_is_cached
+            and _export_cache.can_cache_model(self._onnx_models.exported_model)
+        ):
+            _export_cache.save_cached_model(self._onnx_models.exported_model, self._export_cache_path, self._logger)
+
         # Restore the recorded random states
         _utils.set_random_states(random_states)
 
         return True
 
+    # Attributes built for an input schema, they are swapped as a whole when the input schema changes.
+    _SCHEMA_STATE_ATTRIBUTES = (
+        "_onnx_models",
+        "_graph_builder",
+        "_graph_info",
+        "_graph_initializer_names",
+        "_graph_initializer_names_to_train",
+        "_graph_initializers",
+        "_execution_agent",
+        "_input_info",
+        "_module_output_schema",
+        "_mem_efficient_grad_management_is_enabled",
+        "_gradient_accumulation_manager",
+        "_gradient_map",
+    )
+
+    def _pop_schema_state(self) -> Dict:
+        """Returns the state of the current input schema, and resets the mutable ones for a new export."""
+        state = {name: getattr(self, name) for name in self._SCHEMA_STATE_ATTRIBUTES if hasattr(self, name)}
+        self._onnx_models = _onnx_models.ONNXModels()
+        self._gradient_accumulation_manager = GradientAccumulationManager()
+        return state
+
+    def _restore_schema_state(self, state: Dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+        # FlattenedModule needs _InputInfo to expand user input from *args to *args + **kwargs
+        self._flattened_module._input_info = self._input_info
+
     def _get_exported_model(self, input_schema: ORTModelInputOutputSchemaType, *inputs, **kwargs) -> onnx.ModelProto:
         """Exports PyTorch `self._flattened_module` to ONNX for inferencing or training,
           using `*inputs` and `**kwargs` as input
@@ -382,17 +477,12 @@ class GraphExecutionManager(GraphExecutionInterface):
         self._logger.info("Exporting the PyTorch model to ONNX...")
 
         # Leverage cached model if available
-        cache_dir = self._runtime_options.ortmodule_cache_dir
-        if cache_dir:
-            filename = os.path.join(
-                cache_dir, f"{hash_fn(str(self._flattened_module).encode()).hexdigest()}_{get_rank()}.onnx"
-            )
-            if os.path.exists(cache_dir) and os.path.isfile(filename):
-                self._logger.warning(
-                    f"Cached model detected! Cached model will be used to save export and initialization time."
-                    f"If you want the model to be re-exported then DELETE {filename}."
-                )
-                exported_model = onnx.load(filename)
+        self._export_cache_path = self._get_export_cache_path(input_schema)
+        self._exported_model_is_cached = False
+        if self._export_cache_path:
+            exported_model = _export_cache.load_cached_model(self._export_cache_path, self._logger)
+            if exported_model is not None:
+                self._exported_model_is_cached = True
                 return exported_model
 
         # Export torch.nn.Module to ONNX
@@ -512,18 +602,45 @@ class GraphExecutionManager(GraphExecutionInterface):
             # find input info mismatch, will re-initialize the graph builder.
             # self._input_info.require_grad_names.append(STAGE3_PULL_WEIGHT_TRIGGER_NAME)
 
-        # Cache model for future runs
-        if cache_dir:
-            if not os.path.exists(cache_dir):
-                os.makedirs(cache_dir, exist_ok=True)
-            filename = os.path.join(
-                cache_dir, f"{hash_fn(str(self._flattened_module).encode()).hexdigest()}_{get_rank()}.onnx"
-            )
-            self._logger.info(f"Caching model for future runs to {filename}.")
-            onnx.save(exported_model, filename)
-
         return exported_model
 
+    def _get_export_cache_path(self, input_schema: ORTModelInputOutputSchemaType) -> str:
+        """Returns the path of the exported model in ORTMODULE_CACHE_DIR, or "" if it cannot be cached.
+
+        The file name is a hash of everything the exported model depends on, so a cached model is used only if the
+        module structure, parameter and buffer shapes/dtypes, input schema, export mode, versions and the options
+        affecting export are all the same.
+        """
+        cache_dir = self._runtime_options.ortmodule_cache_dir
+        if not cache_dir or self._runtime_options.enable_zero_stage3_support:
+            # ZeRO stage3 post-processing collects the parameter map while processing the exported model.
+            return ""
+
+        # Embedding hooks add FlagPaddingElimination during export if the density of the sample input is low.
+        padding_eliminated_embeddings = sorted(
+            name
+            for name, density in self._runtime_inspector._embedding_module_to_padding_density_map.values()
+            if density != -1
+        )
+        key_items = [
+            onnxruntime.__version__,
+            onnx.__version__,
+            torch.__version__,
+            str(self._export_mode),
+            get_rank(),
+            self._device.type,
+            str(self._flattened_module),
+            [(name, tuple(p.shape), str(p.dtype)) for name, p in self._flattened_module.named_parameters()],
+            [(name, tuple(b.shape), str(b.dtype)) for name, b in self._flattened_module.named_buffers()],
+            repr(input_schema),
+            self._runtime_options.onnx_opset_version,
+            self._runtime_options.enable_custom_autograd_function,
+            self._runtime_options.run_symbolic_shape_infer,
+            sorted(self._export_extra_kwargs.items()),
+            padding_eliminated_embeddings,
+        ]
+        return _export_cache.get_cached_model_path(cache_dir, hash_fn(repr(key_items).encode()).hexdigest())
+
     def _set_device_from_module(self, inputs, kwargs):
         """Get the device from the module and save it to self._device"""
 
@@ -662,6 +779,7 @@ class GraphExecutionManager(GraphExecutionInterface):
             "_graph_builder",
             "_graph_info",
             "_execution_agent",
+            "_exported_graph_cache",
             "_torch_alloc",
             "_torch_free",
             "_torch_empty_cache",
@@ -675,6 +793,7 @@ class GraphExecutionManager(GraphExecutionInterface):
         self.__dict__.update(state)
 
         _utils.reinitialize_graph_execution_manager(self)
+        self._exported_graph_cache = _ExportedGraphCache(self._runtime_options.export_cache_size)
 
     def _add_check_embedding_sparsity_hook(self):
         """
@@ -973,6 +1092,20 @@ class GraphExecutionManager(GraphExecutionInterface):
 
         triton_row.append_annotation_table(triton_annotation_tbl)
 
+        export_cache = self._exported_graph_cache
+        _add_record(
+            tbl,
+            [
+                "Export Cache",
+                export_cache.is_enabled(),
+                (
+                    f"Keep {export_cache.capacity} input schemas, {export_cache.hits} hits, {export_cache.misses} misses"
+                    if export_cache.is_enabled()
+                    else "Enable with env ORTMODULE_EXPORT_CACHE_SIZE=<number of input schemas>"
+                ),
+            ],
+        )
+
         _add_record(
             tbl,
             [
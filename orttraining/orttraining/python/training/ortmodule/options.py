@@ -311,6 +311,9 @@ class _RuntimeOptions:
         # Cache exported model
         self.ortmodule_cache_dir = ""
 
+        # Number of input schemas whose exported model, graph and execution agent are kept in memory.
+        self.export_cache_size = 1
+
         # Experimental features.
         self.enable_zero_stage3_support = False  # Once enabled, cannot be disabled.
 
@@ -407,6 +410,13 @@ class _RuntimeOptions:
             self._logger.warning("ORTModule optimization for caching exported model is ON.")
             self.ortmodule_cache_dir = os.getenv("ORTMODULE_CACHE_DIR")
 
+        if "ORTMODULE_EXPORT_CACHE_SIZE" in os.environ:
+            export_cache_size = int(os.getenv("ORTMODULE_EXPORT_CACHE_SIZE"))
+            if export_cache_size < 1:
+                self._logger.warning("Invalid value of env ORTMODULE_EXPORT_CACHE_SIZE. Must be a positive integer.")
+            else:
+                self.export_cache_size = export_cache_size
+
         # Experimental features.
         if "ORTMODULE_ENABLE_ZERO_STAGE3" in os.environ and int(os.getenv("ORTMODULE_ENABLE_ZERO_STAGE3")) == 1:
             self.enable_zero_stage3_support = True
@@ -3,7 +3,9 @@
 # sampler.py
 
 import math
-from typing import Callable, Iterator, Optional
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, Tuple
 
 import numpy as np
 import torch
@@ -78,6 +80,11 @@ class LoadBalancingDistributedSampler:
             the data evenly divisible across the shards. Default: ``False``.
         random_level (float, optional): A float varies from 0 and 1 that controls the extent
             of load balance. 0 means the best load balance, while 1 means the opposite.
+        num_workers (int, optional): Number of threads calling :attr:`complexity_fn` on
+            chunks of the dataset, e.g. when loading a sample is I/O bound. Default: 1.
+        complexity_cache_path (str, optional): If provided, the sample complexities are loaded
+            from this file if it exists and matches the dataset length, and saved to it otherwise.
+            Default: ```None```
     .. warning::
         In distributed mode, calling the :meth:`set_epoch` method at
         the beginning of each epoch **before** creating the `torch.utils.data.DataLoader` iterator
@@ -113,6 +120,8 @@ class LoadBalancingDistributedSampler:
         seed: int = 0,
         drop_last: bool = False,
         random_level: float = 0,
+        num_workers: int = 1,
+        complexity_cache_path: Optional[str] = None,
     ) -> None:
         if world_size is None:
             if not dist.is_available():
@@ -146,6 +155,8 @@ class LoadBalancingDistributedSampler:
         self.seed = seed
 
         self.complexity_fn = complexity_fn
+        self.num_workers = num_workers
+        self.complexity_cache_path = complexity_cache_path
         self.sample_complexities = None
         self.ordered_sample_complexities = None
 
@@ -155,39 +166,70 @@ class LoadBalancingDistributedSampler:
         self.random_level = random_level
         self.random_number = None
 
-    def _sort_shard_and_shuffle_dataset(self):
-        # This method returns a list of dataset sample indices after
-        # the dataset has been sorted, sharded and shuffled.
+    def _compute_complexities(self) -> np.ndarray:
+        """Compute the complexity of each sample with complexity_fn, or load them from complexity_cache_path."""
+        dataset_len = len(self.dataset)
+        if self.complexity_cache_path is not None and os.path.isfile(self.complexity_cache_path):
+            complexities = np.load(self.complexity_cache_path)
+            if complexities.shape == (dataset_len,):
+                return complexities.astype(np.int64, copy=False)
+
+        def compute_range(begin, end):
+            return np.fromiter(
+                (self.complexity_fn(self.dataset[sample_index]) for sample_index in range(begin, end)),
+                dtype=np.int64,
+                count=end - begin,
+            )
+
+        if self.num_workers > 1 and dataset_len > 0:
+            # Many chunks per worker, so that a slow chunk doesn't hold up the others.
+            chunk_size = max(1, dataset_len // (self.num_workers * 16))
+            chunk_begins = range(0, dataset_len, chunk_size)
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                chunks = executor.map(
+                    lambda begin: compute_range(begin, min(begin + chunk_size, dataset_len)), chunk_begins
+                )
+                complexities = np.concatenate(list(chunks))
+        else:
+            complexities = compute_range(0, dataset_len)
+
+        if self.complexity_cache_path is not None:
+            # Write to a temporary file first, so that other processes never load a partially written cache.
+            temp_path = f"{self.complexity_cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                np.save(f, complexities)
+            os.replace(temp_path, self.complexity_cache_path)
+
+        return complexities
+
+    def _sort_shard_and_shuffle_dataset(self) -> Tuple[np.ndarray, np.ndarray]:
+        # This method returns the dataset sample indices of each chunk of world_size samples, after
+        # the dataset has been sorted, sharded and shuffled, along with the order of the chunks.
         # The sorting of the dataset happens based on the group_size and complexities
         # of each sample.
         # Sharding happens across the number of workers.
         # Shuffling is done either before sharding on the group indices (if group_size is provided)
         # or on the dataset sample indices if the group_size is not provided.
+        # Every step works on whole arrays, since datasets can have tens of millions of samples.
 
         def sort_in_groups(sample_complexities, group_size):
             """Sort the dataset samples indices inside each group of size group_size."""
             # If the group_size is None, the entire dataset is considered as a single group
             if group_size is None:
-                group_size = len(sample_complexities)
-            # Sort the dataset samples inside each group of the dataset based on sample complexity.
-            for group_begin_index in range(0, len(sample_complexities), group_size):
-                group_end_index = min(group_begin_index + group_size, len(sample_complexities))
-                sorted_indices = group_begin_index + np.argsort(
-                    sample_complexities[group_begin_index:group_end_index, 1]
-                )
-                sample_complexities[group_begin_index:group_end_index, :] = sample_complexities[sorted_indices]
-            return sample_complexities
+                return sample_complexities[np.argsort(sample_complexities[:, 1], kind="stable")]
+            # Sort the dataset samples by group, then by sample complexity inside each group.
+            group_ids = np.arange(len(sample_complexities)) // group_size
+            return sample_complexities[np.lexsort((sample_complexities[:, 1], group_ids))]
 
         # Get the samples and their complexities from the complexity_fn
-        if not self.sample_complexities:
-            self.sample_complexities = np.empty((len(self.dataset), 2), dtype=np.int64)
-            for sample_index in range(len(self.dataset)):
-                self.sample_complexities[sample_index][0] = sample_index
-                self.sample_complexities[sample_index][1] = self.complexity_fn(self.dataset[sample_index])
+        if self.sample_complexities is None:
+            self.sample_complexities = np.stack(
+                [np.arange(len(self.dataset), dtype=np.int64), self._compute_complexities()], axis=1
+            )
 
         if self.random_number is None:
-            max_complexity = max(self.sample_complexities, key=lambda t: t[1])[1]
-            min_complexity = min(self.sample_complexities, key=lambda t: t[1])[1]
+            max_complexity = self.sample_complexities[:, 1].max()
+            min_complexity = self.sample_complexities[:, 1].min()
             self.random_number = int((max_complexity - min_complexity) * self.random_level + 1)
 
         sample_complexities = self.sample_complexities.copy()
@@ -198,12 +240,9 @@ class LoadBalancingDistributedSampler:
         g = g.manual_seed(self.seed + self.epoch)
 
         if self.random_number > 1:
-            complexity_random_ints = torch.randint(
+            sample_complexities[:, 1] += torch.randint(
                 self.random_number, (len(sample_complexities),), generator=g
-            ).tolist()
-
-            for index, random_int in enumerate(complexity_random_ints):
-                sample_complexities[index][1] += random_int
+            ).numpy()
 
         # Sort the data based on the computed complexities and group sizes.
         # Sort only once if random_number <= 1 else sort everytime
@@ -215,43 +254,28 @@ class LoadBalancingDistributedSampler:
         # of shuffling the data indices.
         if self.shuffle and self.group_size is not None:
             num_groups = (len(self.sample_complexities) + self.group_size - 1) // self.group_size
-            group_order = torch.randperm(num_groups, generator=g).tolist()
-            end = 0
-            sample_complexities_copy = ordered_sample_complexities.copy()
-            for group_index in group_order:
-                original_list_begin_index = self.group_size * group_index
-                original_list_end_index = min(original_list_begin_index + self.group_size, len(sample_complexities))
-                begin = end
-                end = begin + (original_list_end_index - original_list_begin_index)
-                sample_complexities_copy[begin:end, :] = sample_complexities[
-                    original_list_begin_index:original_list_end_index, :
-                ]
-            ordered_sample_complexities = sample_complexities_copy
-
-        # Shard the data across the different workers.
-        index_chunks = list(
-            _shard_wrapped_indices_across_workers(
-                [index_complexity_tuple[0] for index_complexity_tuple in ordered_sample_complexities],
-                self.world_size,
-                self.num_samples,
-            )
+            group_order = torch.randperm(num_groups, generator=g).numpy()
+            # Move the samples of each group to the position of the group in group_order, keeping their order.
+            group_positions = np.empty(num_groups, dtype=np.int64)
+            group_positions[group_order] = np.arange(num_groups)
+            sample_group_positions = group_positions[np.arange(len(ordered_sample_complexities)) // self.group_size]
+            ordered_sample_complexities = ordered_sample_complexities[np.argsort(sample_group_positions, kind="stable")]
+
+        # Shard the data across the different workers: chunk i holds the (i * world_size + rank)-th
+        # sample for each rank, wrapping around the dataset.
+        ordered_indices = ordered_sample_complexities[:, 0]
+        num_chunks = max(1, self.num_samples)
+        index_chunks = ordered_indices[np.arange(num_chunks * self.world_size) % len(ordered_indices)].reshape(
+            num_chunks, self.world_size
         )
 
         # Shuffle the sharded data indices deterministically based on epoch and seed.
-        chunk_indices = list(range(len(index_chunks)))
+        chunk_indices = np.arange(num_chunks)
         if self.shuffle and self.group_size is None:
-            chunk_indices = torch.randperm(len(index_chunks), generator=g).tolist()
-
-        if not self.drop_last:
-            # Add extra samples to make it evenly divisible
-            padding_size = self.num_samples - len(chunk_indices)
-            if padding_size <= len(chunk_indices):
-                chunk_indices += chunk_indices[:padding_size]
-            else:
-                chunk_indices += (chunk_indices * math.ceil(padding_size / len(chunk_indices)))[:padding_size]
-        else:
-            # Remove tail of data to make it evenly divisible.
-            chunk_indices = chunk_indices[: self.num_samples]
+            chunk_indices = torch.randperm(num_chunks, generator=g).numpy()
+
+        # Repeat the chunks to make it evenly divisible if not drop_last, or remove the tail of data.
+        chunk_indices = np.resize(chunk_indices, self.num_samples)
 
         assert len(chunk_indices) == self.num_samples
         return index_chunks, chunk_indices
@@ -259,7 +283,7 @@ class LoadBalancingDistributedSampler:
     def __iter__(self) -> Iterator:
         index_chunks, chunk_indices = self._sort_shard_and_shuffle_dataset()
         # Extract indices based on current rank.
-        indices = [index_chunks[i][self.rank] for i in chunk_indices]
+        indices = index_chunks[chunk_indices, self.rank].tolist()
         assert len(indices) == self.num_samples
 
         return iter(indices)
@@ -327,7 +351,7 @@ class LoadBalancingDistributedBatchSampler(Sampler):
 
         batches = []
         for rank in range(self.world_size):
-            sub_indices = [index_chunks[i][rank] for i in chunk_indices]
+            sub_indices = index_chunks[chunk_indices, rank].tolist()
             batches.append(self.batch_fn(sub_indices))
 
         self.total_batch = max([len(b) for b in batches]) if not self.drop_last else min([len(b) for b in batches])
@@ -0,0 +1,122 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Binary format of the activation statistics dumped by `StatisticsSubscriber` with `dump_format="binary"`.
+
+Each step directory holds one append-only file, `statistics.bin`, with a record per summarized activation, in the
+order the activations were summarized. A record is laid out as (little endian):
+    u32 name length, name (utf-8), u8 is_forward, i32 depth, u32 dtype length, dtype (utf-8),
+    u32 rank, i64 dims[rank], u32 sample count, f64 values[len(STATISTICS_COLUMNS) + sample count]
+where values are the statistics in the order of STATISTICS_COLUMNS, followed by the sampled elements.
+"""
+
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+STATISTICS_FILE_NAME = "statistics.bin"
+STATISTICS_COLUMNS = ("nan", "inf", "neg", "pos", "zero", "min", "max", "mean", "std")
+
+_U32 = struct.Struct("<I")
+_HEADER = struct.Struct("<Bi")
+
+
+@dataclass
+class ActivationStatistics:
+    name: str
+    is_forward: bool
+    depth: int
+    dtype: str
+    shape: Tuple[int, ...]
+    statistics: Dict[str, float]
+    samples: List[float]
+
+    @property
+    def file_name(self) -> str:
+        """Name of the summary file of the activation in the text format."""
+        return self.name + ("_forward" if self.is_forward else "_backward")
+
+    @property
+    def display_name(self) -> str:
+        return self.name + (" forward run" if self.is_forward else " backward run")
+
+
+def _write_str(f: BinaryIO, value: str):
+    data = value.encode("utf-8")
+    f.write(_U32.pack(len(data)))
+    f.write(data)
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError("Truncated activation statistics record.")
+    return data
+
+
+def _read_str(f: BinaryIO) -> str:
+    (length,) = _U32.unpack(_read_exact(f, _U32.size))
+    return _read_exact(f, length).decode("utf-8")
+
+
+def write_statistics(f: BinaryIO, record: ActivationStatistics):
+    _write_str(f, record.name)
+    f.write(_HEADER.pack(record.is_forward, record.depth))
+    _write_str(f, record.dtype)
+    f.write(_U32.pack(len(record.shape)))
+    f.write(struct.pack(f"<{len(record.shape)}q", *record.shape))
+    values = [record.statistics[column] for column in STATISTICS_COLUMNS] + list(record.samples)
+    f.write(_U32.pack(len(record.samples)))
+    f.write(struct.pack(f"<{len(values)}d", *values))
+
+
+def read_statistics(path: Path) -> Iterator[ActivationStatistics]:
+    """Read the records of a statistics file in the order they were written."""
+    with path.open(mode="rb") as f:
+        while True:
+            name_length = f.read(_U32.size)
+            if not name_length:
+                return
+            if len(name_length) != _U32.size:
+                raise EOFError("Truncated activation statistics record.")
+            name = _read_exact(f, _U32.unpack(name_length)[0]).decode("utf-8")
+            is_forward, depth = _HEADER.unpack(_read_exact(f, _HEADER.size))
+            dtype = _read_str(f)
+            (rank,) = _U32.unpack(_read_exact(f, _U32.size))
+            shape = struct.unpack(f"<{rank}q", _read_exact(f, 8 * rank))
+            (sample_count,) = _U32.unpack(_read_exact(f, _U32.size))
+            value_count = len(STATISTICS_COLUMNS) + sample_count
+            values = struct.unpack(f"<{value_count}d", _read_exact(f, 8 * value_count))
+            yield ActivationStatistics(
+                name=name,
+                is_forward=bool(is_forward),
+                depth=depth,
+                dtype=dtype,
+                shape=tuple(shape),
+                statistics=dict(zip(STATISTICS_COLUMNS, values)),
+                samples=list(values[len(STATISTICS_COLUMNS) :]),
+            )
+
+
+def format_statistics(record: ActivationStatistics) -> str:
+    """Format a record like the summary file of the text format."""
+    stats = record.statistics
+    size = 1
+    for dim in record.shape:
+        size *= dim
+    counts = {column: int(stats[column]) for column in ("nan", "inf", "neg", "pos", "zero")}
+    samples = ", ".join(f"{sample:.6f}" for sample in record.samples)
+    return (
+        f"{'>'*max(0, record.depth) + record.display_name} shape: {list(record.shape)} dtype: {record.dtype} "
+        f"size: {size} \n"
+        f"min: {stats['min']} max: {stats['max']}, mean: {stats['mean']}, "
+        f"std: {stats['std']} \n"
+        f"nan: {counts['nan']}, inf: {counts['inf']}\n"
+        f"samples(top {len(record.samples)}): [{samples}]\n"
+        f"neg: {counts['neg']}, pos: {counts['pos']}, zero: {counts['zero']},\n"
+        f"{'='*16}\n"
+    )
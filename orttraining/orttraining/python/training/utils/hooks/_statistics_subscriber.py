@@ -3,8 +3,11 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 
+import atexit
 import os
+import queue
 import shutil
+import threading
 import warnings
 from io import TextIOWrapper
 from pathlib import Path
@@ -13,6 +16,7 @@ from typing import List, Optional, Tuple, Union
 import onnx
 import torch
 
+from ._statistics_format import STATISTICS_COLUMNS, STATISTICS_FILE_NAME, ActivationStatistics, write_statistics
 from ._subscriber_base import RuntimeStates, SubscriberBase
 from ._subscriber_manager import ORT_NO_INCREASE_GLOBAL_STEP
 
@@ -119,6 +123,10 @@ class StatisticsSubscriber(SubscriberBase):
     > To be extended...
 
     `merge_activation_summary.py` can be used to merge the files into one file per training step.
+
+    With `dump_format="binary"`, the statistics are computed on the device without synchronizing with the host, and a
+    background thread appends them to one binary file per step instead, see `_statistics_format.py`. Call `flush()`
+    to wait for the files to be complete; `merge_activation_summary.py` reads them as well.
     """
 
     def __init__(
@@ -129,6 +137,7 @@ class StatisticsSubscriber(SubscriberBase):
         override_output_dir: bool = False,
         run_on_cpu: bool = False,
         bucket_size: int = 1024 * 1024 * 1024 // 2,
+        dump_format: str = "text",
     ):
         """
         Steps in [start_step, end_step) will run subscriber actions.
@@ -141,11 +150,16 @@ class StatisticsSubscriber(SubscriberBase):
             run_on_cpu: whether to run the subscriber actions on CPU, this should be the last resort when inserted
                 inspector node affects memory peak causing the original recipe run to fail with OOM.
             bucket_size: the size of the bucket to split the statistic calculation.
+            dump_format: "text" to write a summary file per activation, or "binary" to append the statistics of all
+                activations of a step to one binary file from a background thread.
         """
         super().__init__(start_step=start_step, end_step=end_step)
+        if dump_format not in ["text", "binary"]:
+            raise ValueError(f"Invalid dump format {dump_format}, should be 'text' or 'binary'.")
         self._output_dir = output_dir
         self._run_on_cpu = run_on_cpu
         self._bucket_size = bucket_size
+        self._writer = None
         if os.path.exists(self._output_dir):
             if override_output_dir:
                 warnings.warn(f"Output directory {self._output_dir} already exists, overriding it.")
@@ -155,6 +169,14 @@ class StatisticsSubscriber(SubscriberBase):
                     f"Output directory {self._output_dir} already exists. "
                     "Set override_output_dir=True for StatisticsSubscriber if this is the intention."
                 )
+        if dump_format == "binary":
+            self._writer = _StatisticsWriter()
+            atexit.register(self._writer.flush)
+
+    def flush(self):
+        """Wait until the statistics dumped so far are written to files, with dump_format="binary"."""
+        if self._writer is not None:
+            self._writer.flush()
 
     def post_forward_tensor_apply_impl(
         self, run_rtx: RuntimeStates, module: torch.nn.Module, tensor_index: int, tensor: torch.Tensor
@@ -183,6 +205,11 @@ class StatisticsSubscriber(SubscriberBase):
                 print(f"{display_name} not a torch tensor, value: {tensor}")
                 return
 
+            if self._writer is not None:
+                values = _compute_statistics(tensor.to("cpu") if self._run_on_cpu else tensor, self._bucket_size)
+                self._writer.put(step_folder, name, is_forward, depth, tensor, values)
+                return
+
             step_path = Path(step_folder)
             if not step_path.exists():
                 step_path.mkdir(parents=True, exist_ok=False)
@@ -196,6 +223,132 @@ class StatisticsSubscriber(SubscriberBase):
                 _summarize_tensor(display_name, tensor, f, depth, self._run_on_cpu, self._bucket_size)
 
 
+_SAMPLE_COUNT = 128
+
+
+def _compute_statistics(tensor: torch.Tensor, bucket_size: int) -> torch.Tensor:
+    """Compute the statistics of STATISTICS_COLUMNS on the device of the tensor, without synchronizing with the host.
+
+    The calculation is split in buckets of bucket_size elements to limit the peak memory, and the bucket results are
+    reduced on the device as well. Returns a float64 tensor of the statistics followed by the first _SAMPLE_COUNT
+    elements of the tensor.
+    """
+    flatten_array = tensor.detach().flatten()
+    element_count = flatten_array.numel()
+    device = flatten_array.device
+    if element_count == 0:
+        nan = float("nan")
+        return torch.tensor([0, 0, 0, 0, 0, nan, nan, nan, nan], dtype=torch.float64, device=device)
+
+    # Only calculate std for float types, otherwise it will throw exception.
+    is_float = flatten_array.is_floating_point()
+    bucket_statistics = []
+    for begin in range(0, element_count, bucket_size):
+        bucket = flatten_array[begin : begin + bucket_size]
+        bucket_statistics.append(
+            torch.stack(
+                [
+                    torch.isnan(bucket).sum().double(),
+                    torch.isinf(bucket).sum().double(),
+                    (bucket < 0).sum().double(),
+                    (bucket > 0).sum().double(),
+                    (bucket == 0).sum().double(),
+                    bucket.min().double(),
+                    bucket.max().double(),
+                    bucket.sum(dtype=torch.float64),
+                    # population variance, which is defined for single element buckets as well
+                    (
+                        bucket.var(unbiased=False).double()
+                        if is_float
+                        else torch.zeros((), dtype=torch.float64, device=device)
+                    ),
+                ]
+            )
+        )
+    bucket_statistics = torch.stack(bucket_statistics)
+
+    # Reduction across all buckets
+    counts = torch.full((len(bucket_statistics),), bucket_size, dtype=torch.float64, device=device)
+    counts[-1] = element_count - bucket_size * (len(bucket_statistics) - 1)
+    mean_value = bucket_statistics[:, 7].sum() / element_count
+    # Here we refer to
+    # https://math.stackexchange.com/questions/2971315/how-do-i-combine-standard-deviations-of-two-groups
+    # to calculate the combined standard deviation of all buckets.
+    s = counts * bucket_statistics[:, 8] + counts * ((bucket_statistics[:, 7] / counts - mean_value) ** 2)
+    std_value = torch.sqrt(s.sum() / (element_count - 1)) if is_float else bucket_statistics[0, 8]
+
+    return torch.cat(
+        [
+            bucket_statistics[:, :5].sum(dim=0),
+            torch.stack([bucket_statistics[:, 5].min(), bucket_statistics[:, 6].max(), mean_value, std_value]),
+            flatten_array[:_SAMPLE_COUNT].double(),
+        ]
+    )
+
+
+class _StatisticsWriter:
+    """Background thread appending activation statistics to the statistics file of their step.
+
+    The statistics are copied to pinned host memory without blocking, and the thread waits for the copy to finish,
+    so that dumping never synchronizes the training thread with the device.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="StatisticsWriter", daemon=True)
+        self._thread.start()
+
+    def put(
+        self, step_folder: str, name: str, is_forward: bool, depth: int, tensor: torch.Tensor, values: torch.Tensor
+    ):
+        event = None
+        if values.is_cuda:
+            host_values = torch.empty(values.shape, dtype=values.dtype, pin_memory=True)
+            host_values.copy_(values, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record()
+            values = host_values
+        self._queue.put((step_folder, name, is_forward, depth, str(tensor.dtype), tuple(tensor.shape), values, event))
+
+    def flush(self):
+        self._queue.join()
+
+    def _run(self):
+        step_folder = None
+        step_file = None
+        while True:
+            item = self._queue.get()
+            try:
+                folder, name, is_forward, depth, dtype, shape, values, event = item
+                if event is not None:
+                    event.synchronize()
+                if folder != step_folder:
+                    if step_file is not None:
+                        step_file.close()
+                    Path(folder).mkdir(parents=True, exist_ok=True)
+                    step_file = (Path(folder) / STATISTICS_FILE_NAME).open(mode="ab")
+                    step_folder = folder
+                values = values.tolist()
+                write_statistics(
+                    step_file,
+                    ActivationStatistics(
+                        name=name,
+                        is_forward=is_forward,
+                        depth=depth,
+                        dtype=dtype,
+                        shape=shape,
+                        statistics=dict(zip(STATISTICS_COLUMNS, values)),
+                        samples=values[len(STATISTICS_COLUMNS) :],
+                    ),
+                )
+                if self._queue.empty():
+                    step_file.flush()
+            except Exception as e:
+                warnings.warn(f"Failed to dump statistics of {item[1]}: {e}")
+            finally:
+                self._queue.task_done()
+
+
 def _summarize_tensor(
     display_name: str,
     tensor: torch.Tensor,
@@ -14,6 +14,8 @@ Since ORT and PyTorch run the compute in different orders (e.g. different typolo
 implementations), when we generate a per-step summary, we want the summary to be comparable between
 ORT and PyTorch run. So during the merge, the same typological order is used.
 
+Both the text dumps and the binary dumps (`StatisticsSubscriber(dump_format="binary")`) are supported.
+
 Example:
     python merge_activation_summary.py --pt_dir pt_out --ort_dir ort_out --output_dir /tmp/output
 
@@ -23,11 +25,38 @@ import argparse
 import logging
 import os
 import shutil
+import sys
 from pathlib import Path
+from typing import Dict, List
+
+try:
+    from onnxruntime.training.utils.hooks._statistics_format import (
+        STATISTICS_FILE_NAME,
+        format_statistics,
+        read_statistics,
+    )
+except ImportError:
+    sys.path.append(os.path.dirname(__file__))
+    from _statistics_format import STATISTICS_FILE_NAME, format_statistics, read_statistics
 
 logger = logging.getLogger(__name__)
 
 
+def read_topo_order(step_path: Path) -> List[str]:
+    """Returns the summary file names of the activations of a step, in the order they were dumped."""
+    statistics_file_path = step_path / STATISTICS_FILE_NAME
+    if statistics_file_path.exists():
+        return [record.file_name for record in read_statistics(statistics_file_path)]
+
+    with (step_path / "order.txt").open(mode="r", encoding="utf-8") as order_file:
+        return [line.rstrip("\n") for line in order_file.readlines()]
+
+
+def read_step_summaries(step_path: Path) -> Dict[str, str]:
+    """Returns the summary of each activation of a binary dump of a step, by summary file name."""
+    return {record.file_name: format_statistics(record) for record in read_statistics(step_path / STATISTICS_FILE_NAME)}
+
+
 def generate_summaries_per_step(args):
     pt_dir = args.pt_dir
     ort_dir = args.ort_dir
@@ -36,8 +65,9 @@ def generate_summaries_per_step(args):
     output_path.mkdir(parents=True, exist_ok=False)
 
     # We should use the order.txt generated by PyTorch run, which means, we follow the PyTorch typological order to compare
-    # activation results. Here we assume to get the order.txt from pt_dir/step_0/order.txt
-    topo_order_file_path = Path(f"{pt_dir}/step_0/order.txt")
+    # activation results. Here we assume to get the order.txt from pt_dir/step_0/order.txt, or the order of records in
+    # pt_dir/step_0/statistics.bin for binary dumps.
+    topo_order_step_path = Path(f"{pt_dir}/step_0")
 
     src_ort_path = Path(ort_dir)
     src_pt_path = Path(pt_dir)
@@ -45,14 +75,13 @@ def generate_summaries_per_step(args):
     merge_ort_path = output_path / "merge_ort"
     merge_pt_path = output_path / "merge_pt"
 
-    def generate_summary_per_step(topo_order_file_path: Path, dump_src_path: Path, merge_dest_path: Path):
+    def generate_summary_per_step(topo_order_step_path: Path, dump_src_path: Path, merge_dest_path: Path):
         logger.warning(
             "Start generating summary per step for [%s] following typological order in [%s]",
             dump_src_path.as_posix(),
-            topo_order_file_path.as_posix(),
+            topo_order_step_path.as_posix(),
         )
-        with topo_order_file_path.open(mode="r", encoding="utf-8") as order_file:
-            tensor_name_in_order = order_file.readlines()
+        tensor_name_in_order = read_topo_order(topo_order_step_path)
 
         if merge_dest_path.exists():
             shutil.rmtree(merge_dest_path.as_posix())
@@ -62,10 +91,20 @@ def generate_summaries_per_step(args):
             if dump_step_path.is_dir():
                 step_name = dump_step_path.name
                 merge_filename_for_sub_dir = merge_dest_path / f"{step_name}_.txt"
+                step_summaries = None
+                if (dump_step_path / STATISTICS_FILE_NAME).exists():
+                    step_summaries = read_step_summaries(dump_step_path)
                 # Open merge_filename_for_sub_dir in write mode
                 with merge_filename_for_sub_dir.open(mode="w", encoding="utf-8") as outfile:
                     for filename in tensor_name_in_order:
-                        filename = filename.rstrip("\n")  # noqa: PLW2901
+                        if step_summaries is not None:
+                            if filename not in step_summaries:
+                                logger.warning("tensor %s not exist in %s", filename, dump_step_path.as_posix())
+                                continue
+                            outfile.write(step_summaries[filename])
+                            outfile.write("\n")
+                            continue
+
                         full_filename = dump_step_path / filename
                         if not full_filename.exists():
                             # Be noted that some tensor handled in PyTorch might be missing in ORT graph
@@ -81,12 +120,12 @@ def generate_summaries_per_step(args):
         logger.warning(
             "Finish generating summary per step for [%s] following typological order in [%s], merged files are in [%s]",
             dump_src_path.as_posix(),
-            topo_order_file_path.as_posix(),
+            topo_order_step_path.as_posix(),
             merge_dest_path.as_posix(),
         )
 
-    generate_summary_per_step(topo_order_file_path, src_pt_path, merge_pt_path)
-    generate_summary_per_step(topo_order_file_path, src_ort_path, merge_ort_path)
+    generate_summary_per_step(topo_order_step_path, src_pt_path, merge_pt_path)
+    generate_summary_per_step(topo_order_step_path, src_ort_path, merge_ort_path)
 
 
 def parse_arguments():
@@ -3526,6 +3526,38 @@ def test_forward_dynamic_args():
     del os.environ["ORTMODULE_SKIPCHECK_POLICY"]
 
 
+def test_exported_graph_cache_reuses_builds_of_previous_schemas():
+    os.environ["ORTMODULE_SKIPCHECK_POLICY"] = "SKIP_CHECK_DISABLED"
+    os.environ["ORTMODULE_EXPORT_CACHE_SIZE"] = "2"
+
+    device = "cuda"
+    N, D_in, H, D_out = 64, 784, 500, 10  # noqa: N806
+    pt_model = NeuralNetPositionalArguments(input_size=D_in, hidden_size=H, num_classes=D_out).to(device)
+    ort_model = ORTModule(copy.deepcopy(pt_model))
+    args_size1 = [torch.randn(N, D_in, device=device)] * 4
+    args_size2 = [torch.randn(N, D_in, device=device)] * 3
+    args_size3 = [torch.randn(N, D_in, device=device)] * 5
+
+    execution_manager = ort_model._torch_module._execution_manager(ort_model._is_training())
+    agents = {}
+    for args in [args_size1, args_size2, args_size1, args_size2]:
+        _test_helpers.assert_values_are_close(ort_model(*args), pt_model(*args))
+        agents.setdefault(len(args), execution_manager._execution_agent)
+        # Switching between two schemas reuses the execution agent built for each of them.
+        assert execution_manager._execution_agent is agents[len(args)]
+    assert execution_manager._exported_graph_cache.hits == 2
+    assert execution_manager._exported_graph_cache.misses == 1
+
+    # The least recently used schema is evicted.
+    _test_helpers.assert_values_are_close(ort_model(*args_size3), pt_model(*args_size3))
+    _test_helpers.assert_values_are_close(ort_model(*args_size1), pt_model(*args_size1))
+    assert execution_manager._execution_agent is not agents[len(args_size1)]
+    assert execution_manager._exported_graph_cache.misses == 3
+
+    del os.environ["ORTMODULE_EXPORT_CACHE_SIZE"]
+    del os.environ["ORTMODULE_SKIPCHECK_POLICY"]
+
+
 def test_forward_dynamic_kwargs():
     os.environ["ORTMODULE_SKIPCHECK_POLICY"] = "SKIP_CHECK_DISABLED"
 
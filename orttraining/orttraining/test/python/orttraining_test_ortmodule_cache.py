@@ -1,5 +1,6 @@
 import os
 import tempfile
+import time
 import unittest.mock
 
 import torch
@@ -10,9 +11,9 @@ torch.distributed.init_process_group(backend="nccl")
 
 
 class Net(torch.nn.Module):
-    def __init__(self):
+    def __init__(self, hidden_size=1):
         super().__init__()
-        self.fc = torch.nn.Linear(10, 1)
+        self.fc = torch.nn.Linear(10, hidden_size)
 
     def forward(self, x):
         x = x.view(x.shape[0], -1)
@@ -43,4 +44,29 @@ with tempfile.TemporaryDirectory() as temporary_dir:
     torch.onnx.export.assert_not_called()
     torch.onnx.export.reset_mock()
 
+    # parameter shapes, input schema and mode are part of the cache key, so they are exported again
+    for model, inputs in [
+        (Net(hidden_size=2).train(), (data,)),
+        (Net().train(), (data.view(1, 2, 5),)),
+        (Net().eval(), (data,)),
+    ]:
+        model = ORTModule(model, DebugOptions(log_level=LogLevel.INFO))  # noqa: PLW2901
+        _ = model(*inputs)
+        torch.onnx.export.assert_called()
+        torch.onnx.export.reset_mock()
+
+    # startup benchmark: time of the first forward of a new process, with and without the cached export
+    def first_forward_time():
+        model = ORTModule(
+            torch.nn.Sequential(*[torch.nn.Linear(256, 256) for _ in range(24)]),
+            DebugOptions(log_level=LogLevel.WARNING),
+        )
+        start = time.perf_counter()
+        _ = model(torch.randn(8, 256))
+        return time.perf_counter() - start
+
+    cold_start = first_forward_time()
+    warm_start = first_forward_time()
+    print(f"ORTModule first forward: {cold_start:.2f}s cold start, {warm_start:.2f}s warm start")
+
     del os.environ["ORTMODULE_CACHE_DIR"]
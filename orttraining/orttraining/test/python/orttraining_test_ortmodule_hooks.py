@@ -1,14 +1,20 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import argparse
 import os
 import tempfile
+import time
+from pathlib import Path
 
 import pytest
 import torch
 
 from onnxruntime.training.ortmodule import ORTModule
 from onnxruntime.training.utils.hooks import GlobalSubscriberManager, StatisticsSubscriber, inspect_activation
+from onnxruntime.training.utils.hooks._statistics_format import STATISTICS_FILE_NAME, read_statistics
+from onnxruntime.training.utils.hooks._statistics_subscriber import _compute_statistics
+from onnxruntime.training.utils.hooks.merge_activation_summary import generate_summaries_per_step
 
 
 class NeuralNetSingleOutput(torch.nn.Module):
@@ -200,3 +206,118 @@ def test_statistic_subscriber_user_annotate_intermediate_tensors(device, backend
             step_dir = os.path.join(output_dir_path, f"step_{i}")
             for file in expected_files:
                 assert os.path.exists(os.path.join(step_dir, file))
+
+
+@pytest.mark.parametrize("device", ["cpu", "cuda"])
+@pytest.mark.parametrize("backend", ["torch", "ortmodule"])
+def test_statistic_subscriber_binary_dump(device, backend):
+    input_size = 8
+    hidden_size = 16
+    num_classes = 32
+    model = NeuralNetSingleOutput(input_size, hidden_size, num_classes)
+    model.to(device)
+    model.train()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        output_dir_path = os.path.join(temporary_dir, f"{backend}_out")
+        subscriber = StatisticsSubscriber(output_dir_path, override_output_dir=True, dump_format="binary")
+        GlobalSubscriberManager.subscribe(model, [subscriber])
+
+        if backend == "ortmodule":
+            model = ORTModule(model)
+
+        batch_size = 4
+        input1_tensor = torch.randn(batch_size, input_size, device=device)
+        input2_tensor = torch.randn(batch_size, input_size, device=device)
+        for _ in range(5):
+            y = model(input1_tensor, input2_tensor)
+            y.sum().backward()
+        subscriber.flush()
+
+        expected_names = {
+            "Linear_1_0th_output_forward",
+            "Linear_1_0th_output_backward",
+            "NeuralNetSingleOutput_0_0th_output_forward",
+            "NeuralNetSingleOutput_0_0th_output_backward",
+            "ReLU_2_0th_output_forward",
+            "ReLU_2_0th_output_backward",
+            "Linear_3_0th_output_forward",
+            "Linear_3_0th_output_backward",
+        }
+
+        for i in range(5):
+            step_path = Path(output_dir_path) / f"step_{i}"
+            assert sorted(os.listdir(step_path)) == [STATISTICS_FILE_NAME]
+            records = list(read_statistics(step_path / STATISTICS_FILE_NAME))
+            assert {record.file_name for record in records} == expected_names
+            for record in records:
+                assert len(record.shape) == 2 and record.shape[0] == batch_size
+                assert record.statistics["nan"] == 0
+                assert record.statistics["min"] <= record.statistics["mean"] <= record.statistics["max"]
+
+        merge_output_dir = os.path.join(temporary_dir, "merged")
+        generate_summaries_per_step(
+            argparse.Namespace(pt_dir=output_dir_path, ort_dir=output_dir_path, output_dir=merge_output_dir)
+        )
+        merged_summary = (Path(merge_output_dir) / "merge_ort" / "step_0_.txt").read_text(encoding="utf-8")
+        for name in expected_names:
+            assert name.replace("_forward", " forward run").replace("_backward", " backward run") in merged_summary
+
+
+def test_compute_statistics_in_buckets():
+    tensor = torch.randn(1000, dtype=torch.float32)
+    tensor[3] = 0
+    tensor[7] = float("inf")
+    finite = tensor[torch.isfinite(tensor)]
+
+    # The statistics of the finite values are combined across buckets as if there were only one.
+    for bucket_size in [1000, 64, 7, 2]:
+        values = _compute_statistics(finite, bucket_size)
+        assert values[5] == finite.min()
+        assert values[6] == finite.max()
+        assert torch.isclose(values[7], finite.double().mean())
+        assert torch.isclose(values[8], finite.double().std())
+        torch.testing.assert_close(values[9:], finite[:128].double())
+
+        values = _compute_statistics(tensor, bucket_size)
+        counts = [int(v) for v in values[:5]]
+        assert counts == [
+            0,
+            1,
+            int((tensor < 0).sum()),
+            int((tensor > 0).sum()),
+            1,
+        ]
+
+
+@pytest.mark.parametrize("device", ["cpu", "cuda"])
+def test_statistic_subscriber_slowdown_benchmark(device):
+    if device == "cuda" and not torch.cuda.is_available():
+        pytest.skip("CUDA is not available")
+
+    def run_steps(dump_format):
+        model = torch.nn.Sequential(*[torch.nn.Linear(1024, 1024) for _ in range(16)]).to(device)
+        subscriber = None
+        with tempfile.TemporaryDirectory() as temporary_dir:
+            if dump_format is not None:
+                subscriber = StatisticsSubscriber(
+                    os.path.join(temporary_dir, "out"), override_output_dir=True, dump_format=dump_format
+                )
+                GlobalSubscriberManager.subscribe(model, [subscriber])
+            data = torch.randn(256, 1024, device=device)
+            start = time.perf_counter()
+            for _ in range(10):
+                model(data).sum().backward()
+            if subscriber is not None:
+                subscriber.flush()
+            if device == "cuda":
+                torch.cuda.synchronize()
+            return time.perf_counter() - start
+
+    baseline = run_steps(None)
+    text = run_steps("text")
+    binary = run_steps("binary")
+    print(
+        f"10 steps on {device}: {baseline:.3f}s without subscriber, {text:.3f}s with text dump "
+        f"({text / baseline:.2f}x), {binary:.3f}s with binary dump ({binary / baseline:.2f}x)"
+    )
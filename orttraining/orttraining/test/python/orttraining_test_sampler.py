@@ -3,7 +3,9 @@
 # orttraining_test_sampler.py
 
 import random
+import time
 
+import numpy as np
 import torch
 
 from onnxruntime.training.utils.data import sampler
@@ -156,3 +158,100 @@ def test_load_balancing_batch_sampler_uses_data_sampler():
 
     for batch in batch_sampler:
         assert len(batch) == batch_size or len(batch) == len(samples_and_complexities) % batch_size
+
+
+def test_load_balancing_data_sampler_sorts_in_groups_every_epoch():
+    samples_and_complexities = [(torch.FloatTensor([val]), torch.randint(0, 100, (1,)).item()) for val in range(96)]
+    dataset = MyDataset(samples_and_complexities)
+
+    def complexity_fn(sample):
+        return sample[1]
+
+    group_size = 8
+    data_sampler = sampler.LoadBalancingDistributedSampler(
+        dataset, complexity_fn=complexity_fn, world_size=1, rank=0, shuffle=True, group_size=group_size
+    )
+
+    for epoch in range(3):
+        data_sampler.set_epoch(epoch)
+        complexities = [samples_and_complexities[index][1] for index in data_sampler]
+        assert sorted(complexities) == sorted(c for _, c in samples_and_complexities)
+        for begin_index in range(0, len(complexities), group_size):
+            group = complexities[begin_index : begin_index + group_size]
+            assert group == sorted(group)
+
+
+def test_load_balancing_data_sampler_computes_complexities_in_parallel_and_caches(tmp_path):
+    samples_and_complexities = [(torch.FloatTensor([val]), torch.randint(0, 100, (1,)).item()) for val in range(100)]
+    dataset = MyDataset(samples_and_complexities)
+
+    def complexity_fn(sample):
+        return sample[1]
+
+    cache_path = str(tmp_path / "complexities.npy")
+    expected = list(
+        sampler.LoadBalancingDistributedSampler(
+            dataset, complexity_fn=complexity_fn, world_size=2, rank=1, shuffle=True, random_level=0.5
+        )
+    )
+    actual = list(
+        sampler.LoadBalancingDistributedSampler(
+            dataset,
+            complexity_fn=complexity_fn,
+            world_size=2,
+            rank=1,
+            shuffle=True,
+            random_level=0.5,
+            num_workers=4,
+            complexity_cache_path=cache_path,
+        )
+    )
+    assert actual == expected
+
+    def failing_complexity_fn(sample):
+        raise AssertionError("complexities should be loaded from the cache")
+
+    cached = list(
+        sampler.LoadBalancingDistributedSampler(
+            dataset,
+            complexity_fn=failing_complexity_fn,
+            world_size=2,
+            rank=1,
+            shuffle=True,
+            random_level=0.5,
+            complexity_cache_path=cache_path,
+        )
+    )
+    assert cached == expected
+
+
+def test_load_balancing_data_sampler_epoch_start_benchmark(tmp_path):
+    num_samples = 10_000_000
+
+    class LargeDataset(torch.utils.data.Dataset):
+        def __getitem__(self, index):
+            raise AssertionError("complexities should be loaded from the cache")
+
+        def __len__(self):
+            return num_samples
+
+    cache_path = str(tmp_path / "complexities.npy")
+    with open(cache_path, "wb") as f:
+        np.save(f, np.random.randint(0, 1000, num_samples, dtype=np.int64))
+
+    data_sampler = sampler.LoadBalancingDistributedSampler(
+        LargeDataset(),
+        complexity_fn=len,
+        world_size=8,
+        rank=0,
+        shuffle=True,
+        group_size=1024,
+        random_level=0.1,
+        complexity_cache_path=cache_path,
+    )
+    for epoch in range(2):
+        data_sampler.set_epoch(epoch)
+        start = time.perf_counter()
+        indices = list(data_sampler)
+        print(f"Epoch {epoch} start of {num_samples} samples: {time.perf_counter() - start:.2f}s")
+        assert len(indices) == num_samples // 8
@@ -2075,6 +2075,8 @@ def run_onnxruntime_tests(args, source_dir, ctest_path, build_dir, configs):
             if not args.disable_contrib_ops:
                 run_subprocess([sys.executable, "onnxruntime_test_python_sparse_matmul.py"], cwd=cwd, dll_path=dll_path)
 
+            run_subprocess([sys.executable, "onnxruntime_test_python_session_pool.py"], cwd=cwd, dll_path=dll_path)
+
             if args.enable_symbolic_shape_infer_tests:
                 run_subprocess(
                     [sys.executable, "onnxruntime_test_python_symbolic_shape_infer.py"], cwd=cwd, dll_path=dll_path
@@ -2091,6 +2093,9 @@ def run_onnxruntime_tests(args, source_dir, ctest_path, build_dir, configs):
 
             if not args.disable_ml_ops and not args.use_tensorrt:
                 run_subprocess([sys.executable, "onnxruntime_test_python_mlops.py"], cwd=cwd, dll_path=dll_path)
+                run_subprocess(
+                    [sys.executable, "onnxruntime_test_python_dynamic_batching.py"], cwd=cwd, dll_path=dll_path
+                )
 
             if args.use_tensorrt:
                 run_subprocess(